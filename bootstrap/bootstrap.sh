@@ -1,5 +1,8 @@
 #!/bin/bash -x
 
+# Is the host-shared package cache mounted? Then keep the packages that yum or dnf download
+/bin/bash /dcluster/package-cache.sh
+
 # Do we have SSH server?
 SSH_EXEC=""
 if [ -f /sbin/sshd ]; then
@@ -0,0 +1,40 @@
+#!/bin/bash
+
+# Stores the packages downloaded by yum or dnf in the host-shared package cache, mounted at
+# $1 (default: $DCLUSTER_PACKAGE_CACHE). The nodes of other clusters write to the same volume,
+# so the yum and dnf commands take turns with a lock file in the volume.
+
+CACHE_DIR=${1:-$DCLUSTER_PACKAGE_CACHE}
+if [ x${CACHE_DIR} == "x" ] || ! grep -q " ${CACHE_DIR} " /proc/mounts; then
+    exit 0
+fi
+
+# keep the downloaded packages, under the mount instead of /var/cache/yum or /var/cache/dnf
+keep_packages() {
+    local conf=$1
+    local cachedir=$2
+    # on dnf systems, /etc/yum.conf may be a link to /etc/dnf/dnf.conf
+    if [ -f ${conf} ] && [ ! -L ${conf} ]; then
+        sed -i '/^keepcache=/d; /^cachedir=/d' ${conf}
+        sed -i "/^\[main\]/a keepcache=1\ncachedir=${cachedir}" ${conf}
+    fi
+}
+keep_packages /etc/yum.conf "${CACHE_DIR}/yum/\$basearch/\$releasever"
+keep_packages /etc/dnf/dnf.conf "${CACHE_DIR}/dnf"
+
+# one writer at a time: wrappers in /usr/local/bin come first in the PATH
+if ! which flock > /dev/null 2>&1; then
+    >&2 echo "flock not found, the package cache is not locked!"
+    exit 0
+fi
+
+mkdir -p /usr/local/bin
+for manager in yum dnf; do
+    if [ -x /usr/bin/${manager} ]; then
+        cat > /usr/local/bin/${manager} << WRAPPER
+#!/bin/bash
+exec flock ${CACHE_DIR}/.lock /usr/bin/${manager} "\$@"
+WRAPPER
+        chmod 755 /usr/local/bin/${manager}
+    fi
+done
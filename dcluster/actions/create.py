@@ -1,14 +1,28 @@
+import os
+import shutil
+import time
+
+from collections import namedtuple
+
 from . import display
 
 from dcluster import cluster, dansible, runtime
 
-from dcluster.config import main_config, dansible_config
-from dcluster.infra import networking
+from dcluster.cluster import admission, dns, instance, mpi, request, slurm, snapshot
+from dcluster.config import main_config, dansible_config, profile_config
+from dcluster.dansible import image_cache
+from dcluster.infra import caches, cgroups, ipam, netem, networking
+from dcluster.infra.docker_facade import DockerContainers
+from dcluster.node.planner import DefaultNodePlanner
 
 from dcluster.util import fs as fs_util
+from dcluster.util import lock, logger, parallel
 
+# outcome of creating one cluster of a batch: error is None on success, elapsed is in seconds
+BatchResult = namedtuple('BatchResult', 'name, error, elapsed')
 
-def create_default_cluster(creation_request):
+
+def create_default_cluster(creation_request, cluster_config=None):
     '''
     Creates a new default cluster, the request must have:
     - name
@@ -18,34 +32,195 @@ def create_default_cluster(creation_request):
     other optional arguments:
     - playbooks
     - extra_vars_list
+    - cgroup_limits
+    - admission_wait
+    - keep_on_failure: do not remove the partial cluster if creation fails
+    - images: override the images of the profile
+    - image_cache: reuse the images that result from the playbooks
+
+    The configuration of the profile is resolved here, unless it is supplied.
     '''
     # ensure that user-specified profile paths exist before attempting anything
     fs_util.check_directories_exist(creation_request.profile_paths)
 
+    # another process may be working on a cluster with the same name
+    with cluster.cluster_lock(creation_request.name):
+        return create_locked_cluster(creation_request, None, cluster_config)
+
+
+def create_locked_cluster(creation_request, cluster_network=None, cluster_config=None):
+    '''
+    Creates a cluster while its lock is held, see create_default_cluster. The network of the
+    cluster is created here, unless it is supplied (see create_many_clusters): a supplied network
+    must have been created under the lock, otherwise the garbage collector may remove it.
+    '''
+    if cluster_config is None:
+        cluster_config = profile_config.cluster_config_for_profile(
+            creation_request.profile, creation_request.profile_paths)
+
+    # start from cached images if the same playbooks already ran on the same base images
+    (creation_request, cache_keys) = apply_image_cache(creation_request, cluster_config)
+
+    # the playbooks connect from the host, fail before creating anything
+    if creation_request.playbooks:
+        driver = networking.network_driver(cluster_config.get('network'))
+        networking.check_reachable_from_host(driver, 'Playbooks')
+
+    cluster_name = creation_request.name
+    keep_on_failure = creation_request.keep_on_failure
+
+    # admission stage: wait until the host can take the cluster, before creating Docker objects
+    # (the footprint is reserved until the containers exist)
+    with admission.admitted_cluster(cluster_config, creation_request):
+
+        # every Docker object and file created from here on is undone if creation fails
+        with runtime.CreationTransaction(cluster_name, keep_on_failure) as transaction:
+            live_cluster = deploy_cluster(creation_request, transaction, cluster_network,
+                                          cluster_config)
+
+    # run requested Ansible playbooks with optional extra vars
+    inventory_file = dansible_config.default_inventory(cluster_name)
+    playbooks_ok = True
+    for playbook in creation_request.playbooks:
+        exit_code = dansible.run_playbook(cluster_name, playbook, inventory_file,
+                                          creation_request.extra_vars_list)
+        playbooks_ok = playbooks_ok and exit_code == 0
+
+    if cache_keys and playbooks_ok:
+        details = {'playbooks': creation_request.playbooks, 'profile': creation_request.profile}
+        image_cache.PlaybookImageCache.from_config().store(live_cluster, cache_keys, details)
+
+    return live_cluster
+
+
+def apply_image_cache(creation_request, cluster_config):
+    '''
+    If the image cache is enabled for a request with playbooks, looks for the images that result
+    from running the playbooks. Returns a pair (creation_request, cache_keys):
+    - on a hit, the request uses the cached images and has no playbooks, there are no keys
+    - on a miss, the request is unchanged and the keys are used to store the images later
+    '''
+    log = logger.logger_for_me(apply_image_cache)
+
+    enabled = creation_request.image_cache
+    if enabled is None:
+        enabled = main_config.get_config()['image_cache']['enabled']
+    if not enabled or not creation_request.playbooks:
+        return (creation_request, None)
+
+    cache = image_cache.PlaybookImageCache.from_config()
+    cache_keys = cache.keys_for(cluster_config, creation_request)
+    if cache_keys is None:
+        return (creation_request, None)
+
+    cached_images = cache.lookup(cache_keys)
+    if cached_images is None:
+        log.info('Playbook results not cached yet: {}'.format(creation_request.playbooks))
+        return (creation_request, cache_keys)
+
+    log.info('Using cached images, skipping playbooks: {}'.format(cached_images))
+    images = dict(creation_request.images or {})
+    images.update(cached_images)
+    return (creation_request._replace(images=images, playbooks=[]), None)
+
+
+def deploy_cluster(creation_request, transaction, cluster_network=None, cluster_config=None):
+    '''
+    Creates the Docker objects of a cluster and prepares its nodes, each step is recorded in the
+    transaction so that it can be rolled back. A network that is supplied is also rolled back.
+    '''
+    cluster_name = creation_request.name
+
     # go ahead and create the network using Docker
-    cluster_network = networking.create(creation_request.name)
+    if cluster_network is None:
+        profile_network = (cluster_config or {}).get('network')
+        cluster_network = networking.create(cluster_name,
+                                            networking.driver_options(profile_network),
+                                            networking.network_driver(profile_network),
+                                            creation_request.compute_count)
+    transaction.record('create network {}'.format(cluster_network.network_name),
+                       cluster_network.remove)
+
+    # the profile may ask for a network for bulk traffic, allocated from the data supernet
+    data_network = None
+    profile_data_network = (cluster_config or {}).get('data_network')
+    if profile_data_network:
+        if not isinstance(profile_data_network, dict):
+            # 'data_network: true' uses the networking configuration
+            profile_data_network = {}
+        data_network = networking.create_data(cluster_name,
+                                              networking.driver_options(profile_data_network),
+                                              networking.network_driver(profile_data_network),
+                                              creation_request.compute_count)
+        transaction.record('create network {}'.format(data_network.network_name),
+                           data_network.remove)
 
     # develop the cluster plan given request
-    cluster_plan = cluster.create_plan(creation_request, cluster_network)
+    cluster_plan = cluster.create_plan(creation_request, cluster_network, cluster_config,
+                                       data_network)
 
     # get the blueprints with plans for all nodes
     cluster_blueprints = cluster_plan.create_blueprints()
 
     # deploy the cluster
     renderer = runtime.get_renderer(creation_request)
-    composer_workpath = main_config.composer_workpath(creation_request.name)
+    composer_workpath = main_config.composer_workpath(cluster_name)
     deployer = runtime.DockerComposeDeployer(composer_workpath)
 
-    cluster_blueprints.deploy(renderer, deployer)
+    # the workpath may survive a previous cluster with the same name, only remove it if new
+    if not os.path.isdir(composer_workpath):
+        transaction.record('create workpath {}'.format(composer_workpath),
+                           lambda: shutil.rmtree(composer_workpath, ignore_errors=True))
+
+    # the parent cgroup is created by Docker along with the first container, and can only be
+    # removed after all the containers, so record it first
+    cluster_cgroup = None
+    if main_config.cgroups('enabled'):
+        cluster_cgroup = cgroups.ClusterCgroup.for_cluster(cluster_name)
+        transaction.record('create cgroup {}'.format(cluster_cgroup.name), cluster_cgroup.remove)
+
+    # shared caches are not rolled back, they outlive the clusters by design
+    external_volumes = cluster_blueprints.as_dict().get('external_volumes')
+    if external_volumes:
+        caches.create_cache_volumes(external_volumes)
+
+    # record before deploying, docker-compose may fail after creating some of the containers
+    transaction.record('create containers and volumes', deployer.teardown)
+
+    # MPI hostfiles, mounted on the head
+    cluster_specs = cluster_blueprints.as_dict()
+    mpi.write_mpi_files(cluster_specs, cluster_specs['mpi_dir'])
+
+    # records of the DNS responder, also mounted on the head
+    if 'dns' in cluster_specs:
+        dns.write_dns_files(cluster_specs, cluster_specs['dns']['dir'])
+
+    cluster_blueprints.deploy(renderer, deployer, lambda: prepare_nodes(cluster_specs, renderer))
+
+    # cap the whole cluster using its parent cgroup, now that the containers exist
+    cgroup_limits = cluster_blueprints.as_dict().get('cgroup_limits')
+    if cgroup_limits and cluster_cgroup is not None:
+        cluster_cgroup.apply_limits(cgroup_limits)
 
     # create the Ansible inventory now, too hard later
-    cluster_name = creation_request.name
     inventory_workpath = dansible_config.inventory_workpath(cluster_name)
-    (_, inventory_file) = dansible.create_inventory(cluster_blueprints.as_dict(),
-                                                    inventory_workpath)
+    dansible.create_inventory(cluster_blueprints.as_dict(), inventory_workpath)
+
+    # addresses and request are kept in the workpath, to scale the cluster later
+    compute_ips = [node.ip_address for node in cluster_specs['nodes'].values()
+                   if node.role != 'head']
+    ipam.save(cluster_name, ipam.ClusterIpam.for_nodes(cluster_network, compute_ips))
+    if data_network is not None:
+        data_ips = [node.data_ip_address for node in cluster_specs['nodes'].values()
+                    if node.role != 'head']
+        ipam.save(cluster_name, ipam.ClusterIpam.for_nodes(data_network, data_ips), data=True)
+    request.save_request(creation_request)
 
     # show newly created
-    live_cluster = display.show_cluster(creation_request.name)
+    live_cluster = display.show_cluster(cluster_name)
+
+    # the other nodes resolve the names of the cluster with the responder on the head
+    live_cluster.start_dns()
 
     if main_config.prefs('inject_ssh_public_keys_to_root'):
         # inject SSH public key to all containers for password-less SSH
@@ -59,7 +234,291 @@ def create_default_cluster(creation_request):
     # fix for containers running /sbin/init
     live_cluster.fix_init_if_needed()
 
-    # run requested Ansible playbooks with optional extra vars
-    for playbook in creation_request.playbooks:
-        dansible.run_playbook(cluster_name, playbook, inventory_file,
-                              creation_request.extra_vars_list)
+    # interconnect emulation, kept in the workpath to be applied again when starting
+    for (network_name, settings) in sorted(cluster_specs.get('emulation', {}).items()):
+        if settings:
+            live_cluster.emulate(network_name, settings)
+            netem.save_settings(cluster_name, network_name, settings)
+
+    if external_volumes and caches.PACKAGE_CACHE in external_volumes.values():
+        # keep the packages downloaded by yum in the shared cache
+        live_cluster.keep_package_cache()
+
+    return live_cluster
+
+
+def scale_cluster(cluster_name, compute_count, replace=None):
+    '''
+    Changes the number of compute nodes of a running cluster. The existing nodes keep their
+    addresses and are not recreated, the removed nodes release their addresses and new nodes
+    take the lowest free ones. Nodes in replace (hostnames) are removed and created again with
+    the same hostname. Returns the scaled cluster.
+
+    Raises ValueError if the cluster was not created with this version of dcluster (its request
+    was not recorded), or if a node to replace does not exist.
+    '''
+    log = logger.logger_for_me(scale_cluster)
+    replace = set(replace or [])
+
+    with cluster.cluster_lock(cluster_name):
+        creation_request = request.load_request(cluster_name)
+        if creation_request is None:
+            raise ValueError('Cannot scale {}: its creation request was not recorded'.format(
+                cluster_name))
+
+        live_cluster = instance.DeployedCluster.from_docker(cluster_name)
+        cluster_network = live_cluster.cluster_network
+        live_nodes = {node.hostname: node for node in live_cluster.ordered_nodes}
+        unknown = replace - set(live_nodes.keys())
+        if unknown:
+            raise ValueError('Not nodes of {}: {}'.format(cluster_name, ', '.join(sorted(unknown))))
+
+        cluster_config = profile_config.cluster_config_for_profile(creation_request.profile,
+                                                                   creation_request.profile_paths)
+        data_network = networking.find_data(cluster_name)
+
+        # clusters created before the record are rebuilt from their nodes
+        cluster_ipam = ipam.load(cluster_name)
+        if cluster_ipam is None:
+            compute_ips = [node.ip_address for node in live_nodes.values() if node.role != 'head']
+            cluster_ipam = ipam.ClusterIpam.for_nodes(cluster_network, compute_ips)
+
+        # the data addresses have their own record, rebuilt from the nodes in the same way
+        data_ipam = None
+        if data_network is not None:
+            data_ipam = ipam.load(cluster_name, data=True)
+            if data_ipam is None:
+                data_ips = [node.address_in(data_network.network_name)
+                            for node in live_nodes.values() if node.role != 'head']
+                data_ipam = ipam.ClusterIpam.for_nodes(data_network, [
+                    data_ip for data_ip in data_ips if data_ip is not None])
+
+        # removed and replaced nodes release their addresses first, so that they can be reused
+        node_planner = DefaultNodePlanner(cluster_network, data_network)
+        hostnames = [node_planner.create_compute_hostname(cluster_config, index)
+                     for index in range(compute_count)]
+        released = [node for node in live_nodes.values()
+                    if node.role != 'head' and
+                    (node.hostname not in hostnames or node.hostname in replace)]
+        for node in released:
+            cluster_ipam.release(node.ip_address)
+            if data_ipam is not None:
+                data_ip = node.address_in(data_network.network_name)
+                if data_ip is not None:
+                    data_ipam.release(data_ip)
+
+        kept = [hostname for hostname in hostnames
+                if hostname in live_nodes and hostname not in replace]
+        new_hostnames = [hostname for hostname in hostnames if hostname not in kept]
+        new_ips = dict(zip(new_hostnames, cluster_ipam.allocate_many(len(new_hostnames))))
+        compute_ips = [
+            live_nodes[hostname].ip_address if hostname in kept else new_ips[hostname]
+            for hostname in hostnames
+        ]
+        data_ips = None
+        if data_ipam is not None:
+            new_data_ips = dict(zip(new_hostnames, data_ipam.allocate_many(len(new_hostnames))))
+            data_ips = [
+                live_nodes[hostname].address_in(data_network.network_name) if hostname in kept
+                else new_data_ips[hostname]
+                for hostname in hostnames
+            ]
+
+        # replaced containers are created again by docker-compose
+        for hostname in sorted(replace):
+            log.info('Replacing {}'.format(hostname))
+            live_nodes[hostname].container.remove(force=True)
+
+        creation_request = creation_request._replace(compute_count=compute_count)
+        cluster_plan = cluster.create_plan(creation_request, cluster_network, cluster_config,
+                                           data_network, compute_ips, data_ips)
+        cluster_blueprints = cluster_plan.create_blueprints()
+        cluster_specs = cluster_blueprints.as_dict()
+
+        external_volumes = cluster_specs.get('external_volumes')
+        if external_volumes:
+            caches.create_cache_volumes(external_volumes)
+        mpi.write_mpi_files(cluster_specs, cluster_specs['mpi_dir'])
+
+        # the responder picks up the new records, the existing nodes learn the new names
+        if 'dns' in cluster_specs:
+            dns.write_dns_files(cluster_specs, cluster_specs['dns']['dir'])
+
+        # only the new nodes are created, nodes that are no longer planned are removed
+        renderer = runtime.get_renderer(creation_request)
+        deployer = runtime.DockerComposeDeployer(main_config.composer_workpath(cluster_name))
+        cluster_blueprints.deploy(renderer, deployer,
+                                  lambda: prepare_nodes(cluster_specs, renderer), recreate=False)
+
+        inventory_workpath = dansible_config.inventory_workpath(cluster_name)
+        dansible.create_inventory(cluster_specs, inventory_workpath)
+
+        ipam.save(cluster_name, cluster_ipam)
+        if data_ipam is not None:
+            ipam.save(cluster_name, data_ipam, data=True)
+        request.save_request(creation_request)
+
+        live_cluster = display.show_cluster(cluster_name)
+        live_cluster.start_dns()
+
+        if main_config.prefs('inject_ssh_public_keys_to_root'):
+            for public_key_path in main_config.paths('ssh_public_keys'):
+                live_cluster.inject_public_ssh_key(public_key_path, new_hostnames)
+
+        live_cluster.fix_init_if_needed()
+
+        # new nodes get the current emulation settings of the cluster
+        for (network_name, settings) in sorted(netem.saved_settings(cluster_name).items()):
+            live_cluster.emulate(network_name, settings)
+
+    return live_cluster
+
+
+def prepare_nodes(cluster_specs, renderer):
+    '''
+    Work on the containers of a cluster after they are created and before they start.
+    '''
+    # pin the nodes that have a cpuset
+    for node in cluster_specs['nodes'].values():
+        if node.resources and node.resources.get('cpuset') is not None:
+            DockerContainers.pin_cpus(node.container, node.resources['cpuset'])
+
+    # write slurm.conf and the munge key to the volumes before slurmctld and slurmd start
+    if 'slurm' in cluster_specs:
+        slurm.SlurmConfigurator(cluster_specs, renderer).configure()
+
+
+def create_many_clusters(creation_requests, max_parallel=None):
+    '''
+    Creates many clusters concurrently, at most max_parallel at the same time.
+
+    The profiles are resolved once for all the requests that use them. The lock of each cluster
+    is taken first, then the networks of all the clusters are allocated in a single pass, so that
+    the garbage collector does not take them for orphans. A failure only affects its own cluster
+    (which is rolled back), returns a BatchResult for each request, in order.
+    '''
+    log = logger.logger_for_me(create_many_clusters)
+    if max_parallel is None:
+        max_parallel = main_config.prefs('create_many_parallel')
+
+    # resolve each profile once, a bad profile only fails the clusters that use it
+    cluster_configs = {}
+    for creation_request in creation_requests:
+        key = (creation_request.profile, tuple(creation_request.profile_paths))
+        if key not in cluster_configs:
+            try:
+                fs_util.check_directories_exist(creation_request.profile_paths)
+                cluster_configs[key] = profile_config.cluster_config_for_profile(*key)
+            except Exception as e:
+                cluster_configs[key] = e
+
+    # an unsupported driver fails the clusters of the profile before any of them is deployed
+    for (key, cluster_config) in cluster_configs.items():
+        if not isinstance(cluster_config, Exception):
+            try:
+                networking.network_driver(cluster_config.get('network'))
+            except ValueError as e:
+                cluster_configs[key] = e
+
+    # failures before deploying and locks held, by position of the request
+    failures = {}
+    cluster_locks = {}
+    try:
+        # another process may be working on a cluster with the same name
+        locked_names = set()
+        for (index, creation_request) in enumerate(creation_requests):
+            cluster_config = cluster_configs[(creation_request.profile,
+                                              tuple(creation_request.profile_paths))]
+            if isinstance(cluster_config, Exception):
+                failures[index] = cluster_config
+                continue
+            if creation_request.name in locked_names:
+                failures[index] = ValueError('Cluster name repeated in the batch: {}'.format(
+                    creation_request.name))
+                continue
+
+            cluster_lock = cluster.cluster_lock(creation_request.name)
+            try:
+                cluster_lock.acquire()
+            except lock.LockTimeout as e:
+                failures[index] = e
+                continue
+            cluster_locks[index] = cluster_lock
+            locked_names.add(creation_request.name)
+
+        # allocate the subnets of the locked clusters in a single pass
+        locked_indexes = sorted(cluster_locks.keys())
+        profile_networks = [
+            cluster_configs[(creation_requests[index].profile,
+                             tuple(creation_requests[index].profile_paths))].get('network')
+            for index in locked_indexes
+        ]
+        cluster_networks = {}
+        if locked_indexes:
+            created_networks = networking.create_many(
+                [creation_requests[index].name for index in locked_indexes],
+                [networking.driver_options(profile_network)
+                 for profile_network in profile_networks],
+                [networking.network_driver(profile_network)
+                 for profile_network in profile_networks],
+                [creation_requests[index].compute_count for index in locked_indexes])
+            cluster_networks = dict(zip(locked_indexes, created_networks))
+
+        def create_one(indexed_request):
+            (index, creation_request) = indexed_request
+            if index in failures:
+                raise failures[index]
+
+            cluster_config = cluster_configs[(creation_request.profile,
+                                              tuple(creation_request.profile_paths))]
+            cluster_network = cluster_networks[index]
+            try:
+                if isinstance(cluster_network, Exception):
+                    raise cluster_network
+
+                start = time.time()
+                try:
+                    create_locked_cluster(creation_request, cluster_network, cluster_config)
+                except Exception:
+                    # the network is not rolled back if the failure happened before deploying
+                    if not creation_request.keep_on_failure:
+                        remove_network_quietly(cluster_network)
+                    raise
+
+                return time.time() - start
+            finally:
+                cluster_locks.pop(index).release()
+
+        log.info('Creating {} clusters, at most {} at a time'.format(len(creation_requests),
+                                                                     max_parallel))
+        task_results = parallel.run_concurrently(create_one, list(enumerate(creation_requests)),
+                                                 max_workers=max_parallel)
+    finally:
+        # the locks of the clusters that were not reached
+        for cluster_lock in cluster_locks.values():
+            cluster_lock.release()
+
+    return [
+        BatchResult(task_result.item[1].name, task_result.error, task_result.result)
+        for task_result in task_results
+    ]
+
+
+def remove_network_quietly(cluster_network):
+    '''
+    Removes the network of a cluster that could not be created, if it still exists.
+    '''
+    try:
+        cluster_network.remove()
+    except Exception:
+        pass
+
+
+def clone_cluster(tag, cluster_name, profile_paths=None):
+    '''
+    Creates a new cluster from the images of a snapshot, in a new network. The playbooks are
+    not run again. Raises SnapshotNotFound if there is no snapshot with the tag.
+    '''
+    manifest = snapshot.read_manifest(tag)
+    creation_request = snapshot.clone_request(manifest, cluster_name, profile_paths)
+    return create_default_cluster(creation_request)
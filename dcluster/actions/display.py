@@ -1,21 +1,63 @@
-from dcluster.cluster import instance, format
+from . import manage
 
+from dcluster.cluster import instance, format, state, watch
 
-def show_cluster(cluster_name):
+
+def show_cluster(cluster_name, from_state=False, refresh=False):
     '''
-    Shows information about an existing cluster.
+    Shows information about an existing cluster. The cluster is found in Docker (and its record
+    is updated), unless from_state is requested: then the record of a running cluster is shown
+    (see manage.get_recorded), unless refresh is also requested.
     Raises NotFromDcluster if the cluster is not found.
     '''
-    cluster = instance.DeployedCluster.from_docker(cluster_name)
+    if from_state:
+        cluster = manage.get_recorded(cluster_name, refresh=refresh)
+    else:
+        cluster = manage.refresh_state(cluster_name)
     formatter = format.TextFormatterBasic()
     output = cluster.format(formatter)
     print(output)
+
+    # recorded clusters know about the nodes that are not running
+    if getattr(cluster, 'health', None) not in (None, state.HEALTHY):
+        print(health_summary(cluster.cluster_state))
     return cluster
 
 
+def health_summary(cluster_state):
+    '''
+    The health of a recorded cluster and its nodes that are not running (or unhealthy).
+    '''
+    lines = ['Health: {}'.format(cluster_state['health'])]
+    for node in cluster_state['nodes']:
+        if node.get('status') != state.RUNNING or node.get('health') == 'unhealthy':
+            status = node.get('status')
+            if node.get('health'):
+                status = '{}, {}'.format(status, node['health'])
+            lines.append('  {}: {}'.format(node['hostname'], status))
+    return '\n'.join(lines)
+
+
 def list_clusters():
     '''
-    Outputs the names of the clusters that are currently online.
+    Outputs the names of the clusters that are currently online. While 'dcluster watch' is
+    running, the records are current and are read instead of inspecting the containers; the
+    clusters without a record (e.g. created by an older version) are listed from their networks.
     '''
     cluster_list = instance.DeployedCluster.list_all()
+    if watch.is_watching():
+        recorded = state.recorded_clusters()
+        cluster_list = sorted([cluster_name for cluster_name in cluster_list
+                               if cluster_name not in recorded or
+                               (state.load(cluster_name) or {}).get('status') == state.RUNNING])
     print('\n'.join(cluster_list))
+
+
+def show_stats(cluster_name):
+    '''
+    Shows the aggregate usage of an existing cluster, read from its parent cgroup.
+    Raises NotFromDcluster if the cluster is not found.
+    '''
+    cluster = instance.DeployedCluster.from_docker(cluster_name)
+    formatter = format.TextFormatterStats()
+    print(formatter.format(cluster.stats()))
@@ -1,4 +1,11 @@
+import sys
+
+from dcluster.cluster import admission, bench, cluster_lock, idle, snapshot, state, watch
 from dcluster.cluster import instance as cluster_instance
+from dcluster.config import main_config
+from dcluster.infra import gc, netem
+from dcluster.infra.docker_facade import DockerNaming
+from dcluster.util import lock, logger
 
 
 def get(cluster_name):
@@ -9,6 +16,45 @@ def get(cluster_name):
     return cluster_instance.DeployedCluster.from_docker(cluster_name)
 
 
+def get_recorded(cluster_name, hostname=None, refresh=False):
+    '''
+    Retrieves a handle for a running cluster from its record, without Docker (see cluster.state).
+    If there is no record, the record says that the cluster was stopped, the record does not
+    have the node with the hostname, or refresh is requested, the cluster is found in Docker and
+    its record is updated.
+    Raises NotFromDcluster if the cluster is not found.
+    '''
+    if not refresh:
+        cached_cluster = state.running_cluster(cluster_name)
+        if cached_cluster is not None:
+            if hostname is None or cached_cluster.has_node(hostname):
+                return cached_cluster
+
+    return refresh_state(cluster_name)
+
+
+def refresh_state(cluster_name):
+    '''
+    Finds a cluster in Docker and records it, if it has running containers.
+    Raises NotFromDcluster if the cluster is not found.
+    '''
+    cluster = get(cluster_name)
+    if cluster.ordered_nodes:
+        state.record(cluster)
+    return cluster
+
+
+def check_running(cluster_name, refresh=False):
+    '''
+    Raises ValueError if a cluster has no running nodes, only queries Docker if the record of
+    the cluster is missing or says otherwise (or if refresh is requested). Returns the cluster.
+    '''
+    cluster = get_recorded(cluster_name, refresh=refresh)
+    if not cluster.ordered_nodes:
+        raise ValueError('Cluster {} is not running'.format(cluster_name))
+    return cluster
+
+
 def start_cluster(cluster_name):
     '''
     Finds stopped containers belonging to a cluster and starts them (docker start <container>).
@@ -17,6 +63,13 @@ def start_cluster(cluster_name):
     cluster = get(cluster_name)
     cluster.start()
 
+    # the responder on the head and the emulation settings do not survive a stop
+    started_cluster = get(cluster_name)
+    state.record(started_cluster)
+    started_cluster.start_dns()
+    for (network_name, settings) in sorted(netem.saved_settings(cluster_name).items()):
+        started_cluster.emulate(network_name, settings)
+
 
 def stop_cluster(cluster_name):
     '''
@@ -27,6 +80,9 @@ def stop_cluster(cluster_name):
     cluster = get(cluster_name)
     cluster.stop()
 
+    # Docker will not find the stopped containers, record them now
+    state.record(cluster, state.STOPPED)
+
 
 def remove_cluster(cluster_name):
     '''
@@ -34,5 +90,195 @@ def remove_cluster(cluster_name):
     As a consequence, the Docker instances are no longer available.
     Raises NotFromDcluster if the cluster is not found.
     '''
+    with cluster_lock(cluster_name):
+        cluster = get(cluster_name)
+
+        # learn from the usage of this cluster for the admission of future clusters
+        admission.record_usage(cluster)
+
+        cluster.remove()
+        state.remove(cluster_name)
+
+
+def watch_clusters(once=False):
+    '''
+    Follows the events of Docker to keep the records of the clusters current, and prints the
+    transitions of the nodes and the health of the clusters (see cluster.watch). With once, only
+    reconciles the records with Docker.
+    Raises WatcherRunning if another watcher is running.
+    '''
+    def publish(transition):
+        watch.publish_transition(transition)
+        print(watch.describe(transition))
+        sys.stdout.flush()
+
+    watcher = watch.StateWatcher(publish=publish)
+    watcher.follow(once)
+
+
+def pause_cluster(cluster_name):
+    '''
+    Freezes all the containers of a deployed cluster given its name (docker pause).
+    Processes keep their in-memory state, the cluster can be resumed with unpause_cluster().
+    Raises NotFromDcluster if the cluster is not found.
+    '''
+    cluster = get(cluster_name)
+    return cluster.pause()
+
+
+def unpause_cluster(cluster_name):
+    '''
+    Thaws all the containers of a paused cluster given its name (docker unpause).
+    Raises NotFromDcluster if the cluster is not found.
+    '''
+    cluster = get(cluster_name)
+    return cluster.unpause()
+
+
+def pause_idle_clusters(cluster_names=None, threshold=None, window=None, interval=None):
+    '''
+    Pauses the clusters whose aggregate CPU usage stays under a threshold (percent of one CPU)
+    for a window of time (seconds), sampling every interval (seconds). Missing parameters are
+    taken from the configuration (prefs:idle_pause).
+
+    If no cluster names are given, all current clusters are considered.
+    Returns the names of the clusters that were paused.
+    '''
+    log = logger.logger_for_me(pause_idle_clusters)
+    idle_config = main_config.prefs('idle_pause')
+
+    if threshold is None:
+        threshold = idle_config['threshold']
+    if window is None:
+        window = idle_config['window']
+    if interval is None:
+        interval = idle_config['interval']
+
+    if not cluster_names:
+        cluster_names = cluster_instance.DeployedCluster.list_all()
+
+    # already paused clusters are not candidates
+    clusters = [get(cluster_name) for cluster_name in cluster_names]
+    candidates = [
+        cluster
+        for cluster in clusters
+        if cluster.ordered_nodes and not cluster.is_paused
+    ]
+
+    msg = 'Looking for idle clusters (<{}% CPU for {}s): {}'
+    log.info(msg.format(threshold, window, [c.name for c in candidates]))
+
+    detector = idle.IdleDetector(threshold, window, interval)
+    idle_clusters = detector.find_idle(candidates)
+
+    for cluster in idle_clusters:
+        cluster.pause()
+
+    return [cluster.name for cluster in idle_clusters]
+
+
+def collect_garbage(dry_run=False):
+    '''
+    Removes the networks, volumes, cgroups and workpath directories left behind by clusters that
+    no longer have containers. Returns a pair (removed, failed), see GarbageCollector.collect().
+    '''
+    collector = gc.GarbageCollector(is_busy=cluster_is_busy)
+    return collector.collect(dry_run)
+
+
+def cluster_is_busy(cluster_name):
+    '''
+    True iff another dcluster process holds the lock of the cluster, e.g. while the cluster is
+    being created its network has no containers yet.
+    '''
+    try:
+        with cluster_lock(cluster_name, timeout=0):
+            return False
+    except lock.LockTimeout:
+        return True
+
+
+def snapshot_cluster(cluster_name, tag):
+    '''
+    Commits each node of a deployed cluster to an image, and records the blueprint of the cluster
+    in a manifest so that it can be cloned. Returns the manifest.
+    Raises NotFromDcluster if the cluster is not found.
+    '''
+    cluster = get(cluster_name)
+    return snapshot.take_snapshot(cluster, tag)
+
+
+def emulation_network_name(cluster_name, data=False):
+    '''
+    Name of the network of a cluster where the interconnect is emulated.
+    '''
+    if data:
+        return DockerNaming.create_data_network_name(cluster_name)
+    return DockerNaming.create_network_name(cluster_name)
+
+
+def emulate_network(cluster_name, settings, data=False):
+    '''
+    Changes the interconnect emulation of a running cluster, in the management network or in
+    the data network. No settings remove the emulation. Returns the name of the network.
+    Raises NotFromDcluster if the cluster is not found.
+    '''
+    settings = netem.emulation_settings({'emulation': settings})
+    network_name = emulation_network_name(cluster_name, data)
     cluster = get(cluster_name)
-    cluster.remove()
+    cluster.emulate(network_name, settings)
+    netem.save_settings(cluster_name, network_name, settings)
+    return network_name
+
+
+def probe_network(cluster_name, data=False, pings=10, seconds=0):
+    '''
+    Measures the effective round trip time (and the throughput if seconds > 0) from the head to
+    each node of a running cluster. Returns a list of netem.ProbeResult.
+    Raises NotFromDcluster if the cluster is not found.
+    '''
+    cluster = get(cluster_name)
+    return cluster.probe_network(emulation_network_name(cluster_name, data), pings, seconds)
+
+
+def benchmark_network(cluster_name, pattern='head', sample=None, pings=1000, seconds=3,
+                      data=False):
+    '''
+    Measures the latency and throughput between pairs of nodes of a running cluster, in the
+    management network or in the data network. Returns a list of bench.NetResult.
+    Raises NotFromDcluster if the cluster is not found.
+    '''
+    cluster = get(cluster_name)
+    network_name = emulation_network_name(cluster_name, data)
+    benchmark = bench.ClusterBenchmark(cluster, network_name)
+    return benchmark.run_network(pattern, sample, pings, seconds)
+
+
+def benchmark_disks(cluster_name, paths=None, size='256m', seconds=3):
+    '''
+    Measures sequential and random I/O in the volumes of the nodes of a running cluster (or in
+    the given paths). Returns a list of bench.DiskResult.
+    Raises NotFromDcluster if the cluster is not found.
+    '''
+    cluster = get(cluster_name)
+    benchmark = bench.ClusterBenchmark(cluster, DockerNaming.create_network_name(cluster_name))
+    return benchmark.run_disk(paths, size, seconds)
+
+
+def exec_on_cluster(cluster_name, command, hostnames=None):
+    '''
+    Runs a command on the nodes of a running cluster concurrently (all nodes if no hostnames
+    are given). Returns a list of pairs (hostname, TaskResult), see parallel.run_concurrently.
+    Raises NotFromDcluster if the cluster is not found.
+    '''
+    cluster = get(cluster_name)
+    nodes = cluster.ordered_nodes
+    if hostnames:
+        unknown = set(hostnames) - set([node.hostname for node in nodes])
+        if unknown:
+            raise ValueError('Nodes not found in {}: {}'.format(cluster_name,
+                                                                ', '.join(sorted(unknown))))
+        nodes = [node for node in nodes if node.hostname in hostnames]
+
+    task_results = cluster.exec_on_nodes(command, nodes)
+    return [(node.hostname, task_result) for (node, task_result) in zip(nodes, task_results)]
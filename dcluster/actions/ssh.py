@@ -1,23 +1,49 @@
 from . import manage
 
+from dcluster.cluster import state
+from dcluster.util import logger
 
-def ssh(cluster_name, username, hostname):
+# exit code of ssh and scp when the connection fails
+CONNECTION_FAILED = 255
+
+
+def ssh(cluster_name, username, hostname, refresh=False):
     '''
     Performs SSH to a node in the cluster. The target can have username@hostname, or only hostname
-    (uses default ssh_user)
+    (uses default ssh_user). Returns the exit code of ssh.
     '''
     # delegate ssh to cluster object
     # TODO bring some SSH stuff here
-    cluster = manage.get(cluster_name)
-    cluster.ssh_to_node(username, hostname)
+    return with_current_node(cluster_name, hostname, refresh,
+                             lambda cluster: cluster.ssh_to_node(username, hostname))
 
 
-def scp(cluster_name, username, hostname, target_dir, files):
+def scp(cluster_name, username, hostname, target_dir, files, refresh=False):
     '''
     Performs SSH to a node in the cluster. The target can have username@hostname, or only hostname
-    (uses default ssh_user)
+    (uses default ssh_user). Returns the exit code of scp.
     '''
     # delegate scp to cluster object
     # TODO evaluate "-r" here
-    cluster = manage.get(cluster_name)
-    cluster.scp_to_node(username, hostname, target_dir, files)
+    return with_current_node(cluster_name, hostname, refresh,
+                             lambda cluster: cluster.scp_to_node(username, hostname, target_dir,
+                                                                 files))
+
+
+def with_current_node(cluster_name, hostname, refresh, connect):
+    '''
+    Connects to a node using the record of the cluster. If the connection fails and the record
+    of the node is stale (checked with Docker), the cluster is found in Docker and the
+    connection is attempted again. Returns the exit code of the connection.
+    '''
+    cluster = manage.get_recorded(cluster_name, hostname, refresh)
+    cluster.check_reachable('ssh')
+    exit_code = connect(cluster)
+
+    if exit_code == CONNECTION_FAILED and isinstance(cluster, state.CachedCluster):
+        if not cluster.is_current(hostname):
+            log = logger.logger_for_me(with_current_node)
+            log.info('Record of {} is stale, looking for the cluster in Docker'.format(hostname))
+            exit_code = connect(manage.refresh_state(cluster_name))
+
+    return exit_code
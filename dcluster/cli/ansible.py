@@ -16,6 +16,9 @@ def configure_ansible_parser(ansible_parser):
     help_msg = 'extra-vars passed to ansible-playbook as-is'
     ansible_parser.add_argument('-e', '--extra-vars', help=help_msg, nargs='+')
 
+    help_msg = 'find the cluster in Docker instead of using its recorded state'
+    ansible_parser.add_argument('--refresh', help=help_msg, action='store_true')
+
     # default function to call
     ansible_parser.set_defaults(func=process_ansible_cli_call)
 
@@ -27,6 +30,13 @@ def process_ansible_cli_call(args):
     if args.cluster is None:
         raise ValueError('Need to supply the cluster name!')
 
+    # to avoid chain of dependencies (docker!) before dcluster init
+    from dcluster.actions import manage as manage_action
+
+    # fail early instead of waiting for ansible to time out on every node
+    cluster = manage_action.check_running(args.cluster, args.refresh)
+    cluster.check_reachable('Ansible')
+
     inventory_file = dansible_config.default_inventory(args.cluster)
 
     # handle additional inventory data (variables)
@@ -3,7 +3,8 @@ Create a cluster via the command line.
 '''
 
 import logging
-
+import sys
+import yaml
 
 from dcluster.config import main_config
 
@@ -32,10 +33,80 @@ def configure_parser(create_parser):
     msg = 'extra-vars passed to ansible-playbook as-is'
     create_parser.add_argument('-e', '--extra-vars', help=msg, nargs='+')
 
+    msg = 'aggregate CPU limit for the whole cluster, in CPUs (overrides profile)'
+    create_parser.add_argument('--cpu-max', help=msg, type=float)
+
+    msg = 'aggregate memory limit for the whole cluster, e.g. 8g (overrides profile)'
+    create_parser.add_argument('--memory-max', help=msg)
+
+    msg = 'relative CPU weight of the whole cluster, 1-10000 (overrides profile)'
+    create_parser.add_argument('--cpu-weight', help=msg, type=int)
+
+    msg = 'seconds to wait for host capacity before giving up, 0 fails immediately ' + \
+        '(default: see configuration)'
+    create_parser.add_argument('--wait', help=msg, type=float)
+
+    msg = 'reuse the images that result from the playbooks, or cache them after running them ' + \
+        '(default: see configuration)'
+    create_parser.add_argument('--image-cache', help=msg, action='store_true', default=None)
+
+    msg = 'do not use the image cache for the playbooks'
+    create_parser.add_argument('--no-image-cache', help=msg, action='store_false',
+                               dest='image_cache')
+
+    msg = 'do not roll back the partial cluster if creation fails (for debugging)'
+    create_parser.add_argument('--keep-on-failure', help=msg, action='store_true')
+
     # default function to call
     create_parser.set_defaults(func=process_cli_call)
 
 
+def configure_create_many_parser(create_many_parser):
+    '''
+    Configure argument parser for create-many subcommand.
+    '''
+    msg = 'YAML file with the clusters to create, see README'
+    create_many_parser.add_argument('manifest', help=msg)
+
+    msg = 'maximum number of clusters deployed at the same time ' + \
+        '(default: from manifest, or see configuration)'
+    create_many_parser.add_argument('--parallel', help=msg, type=int)
+
+    msg = 'additional directories with profiles in YAML files (can be specified multiple times)'
+    create_many_parser.add_argument('--profile-path', help=msg, action='append')
+
+    # default function to call
+    create_many_parser.set_defaults(func=process_create_many_cli_call)
+
+
+def configure_clone_parser(clone_parser):
+    '''
+    Configure argument parser for clone subcommand.
+    '''
+    clone_parser.add_argument('tag', help='name of the snapshot')
+    clone_parser.add_argument('cluster_name', help='name of the new virtual cluster')
+
+    msg = 'additional directories with profiles in YAML files (can be specified multiple times)'
+    clone_parser.add_argument('--profile-path', help=msg, action='append')
+
+    # default function to call
+    clone_parser.set_defaults(func=process_clone_cli_call)
+
+
+def configure_scale_parser(scale_parser):
+    '''
+    Configure argument parser for scale subcommand.
+    '''
+    scale_parser.add_argument('cluster_name', help='name of the virtual cluster')
+    scale_parser.add_argument('compute_count', help='new number of compute nodes', type=int)
+
+    msg = 'remove this compute node and create it again (can be specified multiple times)'
+    scale_parser.add_argument('--replace', help=msg, action='append', metavar='HOSTNAME')
+
+    # default function to call
+    scale_parser.set_defaults(func=process_scale_cli_call)
+
+
 def process_cli_call(args):
     '''
     Process the creation request issued via the command line.
@@ -64,8 +135,79 @@ def process_cli_call(args):
     if extra_vars_list is None:
         extra_vars_list = []
 
+    # aggregate limits for the parent cgroup of the cluster, None means use profile
+    cgroup_limits = {
+        'cpu_max': args.cpu_max,
+        'memory_max': args.memory_max,
+        'weight': args.cpu_weight
+    }
+
     # dispatch a creation request
     # for now, all creation requests that pass through this CLI are 'default'
     creation_request = request.DefaultCreationRequest(cluster_name, count, profile, profile_paths,
-                                                      playbooks, extra_vars_list)
+                                                      playbooks, extra_vars_list,
+                                                      cgroup_limits=cgroup_limits,
+                                                      admission_wait=args.wait,
+                                                      keep_on_failure=args.keep_on_failure,
+                                                      image_cache=args.image_cache)
     create_action.create_default_cluster(creation_request)
+
+
+def process_create_many_cli_call(args):
+    '''
+    Process the batch creation request issued via the command line.
+    '''
+
+    # to avoid chain of dependencies (docker!) before dcluster init
+    from dcluster.actions import create as create_action
+    from dcluster.cluster import request
+
+    log = logging.getLogger()
+    log.debug('Got create-many parameters: {}'.format(args))
+
+    with open(args.manifest, 'r') as manifest_file:
+        manifest = yaml.safe_load(manifest_file)
+
+    creation_requests = request.requests_from_manifest(manifest, args.profile_path)
+
+    max_parallel = args.parallel
+    if max_parallel is None:
+        max_parallel = manifest.get('parallel')
+
+    results = create_action.create_many_clusters(creation_requests, max_parallel)
+
+    # per-cluster report
+    failed = 0
+    print('')
+    for result in results:
+        if result.error is None:
+            print('{:<24} created in {:.1f}s'.format(result.name, result.elapsed))
+        else:
+            failed += 1
+            print('{:<24} FAILED: {}'.format(result.name, result.error))
+
+    print('Created {} of {} clusters'.format(len(results) - failed, len(results)))
+    if failed:
+        sys.exit(1)
+
+
+def process_clone_cli_call(args):
+    '''
+    Process the clone request issued via the command line.
+    '''
+
+    # to avoid chain of dependencies (docker!) before dcluster init
+    from dcluster.actions import create as create_action
+
+    create_action.clone_cluster(args.tag, args.cluster_name, args.profile_path)
+
+
+def process_scale_cli_call(args):
+    '''
+    Process the scale request issued via the command line.
+    '''
+
+    # to avoid chain of dependencies (docker!) before dcluster init
+    from dcluster.actions import create as create_action
+
+    create_action.scale_cluster(args.cluster_name, args.compute_count, args.replace)
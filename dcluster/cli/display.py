@@ -5,6 +5,9 @@ def configure_show_parser(show_parser):
     '''
     show_parser.add_argument('cluster_name', help='name of the virtual cluster')
 
+    msg = 'find the cluster in Docker instead of using its recorded state'
+    show_parser.add_argument('--refresh', help=msg, action='store_true')
+
     # default function to call
     show_parser.set_defaults(func=process_show_cli_call)
 
@@ -16,6 +19,16 @@ def configure_list_parser(list_parser):
     list_parser.set_defaults(func=process_list_cli_call)
 
 
+def configure_stats_parser(stats_parser):
+    '''
+    Configure argument parser for stats subcommand.
+    '''
+    stats_parser.add_argument('cluster_name', help='name of the virtual cluster')
+
+    # default function to call
+    stats_parser.set_defaults(func=process_stats_cli_call)
+
+
 def process_show_cli_call(args):
     '''
     Process the show request issued via the command line.
@@ -23,7 +36,7 @@ def process_show_cli_call(args):
     # to avoid chain of dependencies (docker!) before dcluster init
     from dcluster.actions import display as display_action
 
-    display_action.show_cluster(args.cluster_name)
+    display_action.show_cluster(args.cluster_name, from_state=True, refresh=args.refresh)
 
 
 def process_list_cli_call(args):
@@ -34,3 +47,13 @@ def process_list_cli_call(args):
     from dcluster.actions import display as display_action
 
     display_action.list_clusters()
+
+
+def process_stats_cli_call(args):
+    '''
+    Process the stats request issued via the command line.
+    '''
+    # to avoid chain of dependencies (docker!) before dcluster init
+    from dcluster.actions import display as display_action
+
+    display_action.show_stats(args.cluster_name)
@@ -1,3 +1,32 @@
+import argparse
+import sys
+
+
+class ExecCommand(argparse.Action):
+    '''
+    The command of exec takes the rest of the arguments (argparse.REMAINDER), including the
+    options after the cluster name. The --node options before the command, or before '--', are
+    given back to the hostnames.
+    '''
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        command = list(values)
+        hostnames = list(getattr(namespace, 'hostnames', None) or [])
+        while command and (command[0] == '--node' or command[0].startswith('--node=')):
+            if command[0] == '--node':
+                if len(command) < 2:
+                    parser.error('argument --node: expected one argument')
+                hostnames.append(command[1])
+                command = command[2:]
+            else:
+                hostnames.append(command[0].split('=', 1)[1])
+                command = command[1:]
+
+        if command and command[0] == '--':
+            command = command[1:]
+
+        namespace.hostnames = hostnames or None
+        setattr(namespace, self.dest, command)
 
 
 def configure_stop_parser(stop_parser):
@@ -30,6 +59,152 @@ def configure_rm_parser(rm_parser):
     rm_parser.set_defaults(func=process_rm_cli_call)
 
 
+def configure_pause_parser(pause_parser):
+    '''
+    Configure argument parser for pause subcommand.
+    '''
+    msg = 'name of the virtual cluster (all clusters if omitted, requires --idle)'
+    pause_parser.add_argument('cluster_name', help=msg, nargs='?')
+
+    msg = 'only pause if the aggregate CPU usage stays under a threshold for a window of time'
+    pause_parser.add_argument('--idle', help=msg, action='store_true')
+
+    msg = 'idle threshold, in percent of one CPU (default: see configuration)'
+    pause_parser.add_argument('--threshold', help=msg, type=float)
+
+    msg = 'idle window, in seconds (default: see configuration)'
+    pause_parser.add_argument('--window', help=msg, type=float)
+
+    # default function to call
+    pause_parser.set_defaults(func=process_pause_cli_call)
+
+
+def configure_unpause_parser(unpause_parser):
+    '''
+    Configure argument parser for unpause subcommand.
+    '''
+    unpause_parser.add_argument('cluster_name', help='name of the virtual cluster')
+
+    # default function to call
+    unpause_parser.set_defaults(func=process_unpause_cli_call)
+
+
+def configure_gc_parser(gc_parser):
+    '''
+    Configure argument parser for gc subcommand.
+    '''
+    msg = 'only list the orphaned resources, do not remove them'
+    gc_parser.add_argument('--dry-run', help=msg, action='store_true')
+
+    # default function to call
+    gc_parser.set_defaults(func=process_gc_cli_call)
+
+
+def configure_snapshot_parser(snapshot_parser):
+    '''
+    Configure argument parser for snapshot subcommand.
+    '''
+    snapshot_parser.add_argument('cluster_name', help='name of the virtual cluster')
+    snapshot_parser.add_argument('tag', help='name of the snapshot, used to clone the cluster')
+
+    # default function to call
+    snapshot_parser.set_defaults(func=process_snapshot_cli_call)
+
+
+def configure_netem_parser(netem_parser):
+    '''
+    Configure argument parser for netem subcommand.
+    '''
+    netem_parser.add_argument('cluster_name', help='name of the virtual cluster')
+
+    netem_parser.add_argument('--delay', help='added latency in each direction, e.g. 50us')
+    netem_parser.add_argument('--jitter', help='variation of the delay, e.g. 10us')
+    netem_parser.add_argument('--rate', help='bandwidth of each node, e.g. 10gbit')
+    netem_parser.add_argument('--loss', help='packet loss, e.g. 0.01%%')
+
+    msg = 'remove the emulation'
+    netem_parser.add_argument('--clear', help=msg, action='store_true')
+
+    msg = 'work on the data network instead of the management network'
+    netem_parser.add_argument('--data', help=msg, action='store_true')
+
+    msg = 'measure the effective round trip time from the head to each node'
+    netem_parser.add_argument('--probe', help=msg, action='store_true')
+
+    msg = 'pings to each node when probing (default: %(default)s)'
+    netem_parser.add_argument('--pings', help=msg, type=int, default=10)
+
+    msg = 'also measure the throughput with iperf3 for this many seconds (needs iperf3)'
+    netem_parser.add_argument('--seconds', help=msg, type=int, default=0)
+
+    # default function to call
+    netem_parser.set_defaults(func=process_netem_cli_call)
+
+
+def configure_bench_parser(bench_parser):
+    '''
+    Configure argument parser for bench subcommand.
+    '''
+    bench_parser.add_argument('cluster_name', help='name of the virtual cluster')
+    bench_parser.add_argument('kind', help='what to measure', choices=('net', 'disk'))
+
+    msg = 'net: pairs of nodes to measure (default: %(default)s)'
+    bench_parser.add_argument('--pattern', help=msg, choices=('head', 'ring', 'all'),
+                              default='head')
+
+    msg = 'net: with --pattern all, measure a random sample of this many pairs'
+    bench_parser.add_argument('--sample', help=msg, type=int)
+
+    msg = 'net: round trips for the latency (default: %(default)s)'
+    bench_parser.add_argument('--pings', help=msg, type=int, default=1000)
+
+    msg = 'net: use the data network instead of the management network'
+    bench_parser.add_argument('--data', help=msg, action='store_true')
+
+    msg = 'disk: path to measure in each node, can be repeated (default: the volumes)'
+    bench_parser.add_argument('--path', help=msg, action='append', dest='paths')
+
+    msg = 'disk: size of the test file (default: %(default)s)'
+    bench_parser.add_argument('--size', help=msg, default='256m')
+
+    msg = ('seconds of each throughput or random I/O test, net: 0 only measures latency '
+           '(default: %(default)s)')
+    bench_parser.add_argument('--seconds', help=msg, type=float, default=3)
+
+    msg = 'print the results as JSON'
+    bench_parser.add_argument('--json', help=msg, action='store_true')
+
+    # default function to call
+    bench_parser.set_defaults(func=process_bench_cli_call)
+
+
+def configure_exec_parser(exec_parser):
+    '''
+    Configure argument parser for exec subcommand.
+    '''
+    exec_parser.add_argument('cluster_name', help='name of the virtual cluster')
+    msg = 'command to run, after the --node options and "--"'
+    exec_parser.add_argument('exec_command', help=msg, metavar='command', nargs=argparse.REMAINDER,
+                             action=ExecCommand)
+
+    msg = 'node where to run the command, can be repeated (default: all nodes)'
+    exec_parser.add_argument('--node', help=msg, action='append', dest='hostnames')
+
+    # default function to call
+    exec_parser.set_defaults(func=process_exec_cli_call)
+
+
+def configure_watch_parser(watch_parser):
+    '''
+    Configure argument parser for watch subcommand.
+    '''
+    msg = 'reconcile the recorded clusters with Docker and exit'
+    watch_parser.add_argument('--once', help=msg, action='store_true')
+
+    # default function to call
+    watch_parser.set_defaults(func=process_watch_cli_call)
+
+
 def process_stop_cli_call(args):
     '''
     Process the stop request through command line.
@@ -60,3 +235,175 @@ def process_rm_cli_call(args):
 
     manage_action.remove_cluster(args.cluster_name)
     print('Removed cluster: {}'.format(args.cluster_name))
+
+
+def process_pause_cli_call(args):
+    '''
+    Process the pause request through command line.
+    '''
+    # to avoid chain of dependencies (docker!) before dcluster init
+    from dcluster.actions import manage as manage_action
+
+    if args.idle:
+        cluster_names = None
+        if args.cluster_name is not None:
+            cluster_names = [args.cluster_name]
+
+        paused = manage_action.pause_idle_clusters(cluster_names, args.threshold, args.window)
+        for cluster_name in paused:
+            print('Paused idle cluster: {}'.format(cluster_name))
+
+    else:
+        if args.cluster_name is None:
+            raise ValueError('Need to supply the cluster name!')
+
+        manage_action.pause_cluster(args.cluster_name)
+        print('Paused cluster: {}'.format(args.cluster_name))
+
+
+def process_unpause_cli_call(args):
+    '''
+    Process the unpause request through command line.
+    '''
+    # to avoid chain of dependencies (docker!) before dcluster init
+    from dcluster.actions import manage as manage_action
+
+    manage_action.unpause_cluster(args.cluster_name)
+    print('Unpaused cluster: {}'.format(args.cluster_name))
+
+
+def process_gc_cli_call(args):
+    '''
+    Process the garbage collection request through command line.
+    '''
+    # to avoid chain of dependencies (docker!) before dcluster init
+    from dcluster.actions import manage as manage_action
+    from dcluster.infra import gc
+    from dcluster.util import units
+
+    (removed, failed) = manage_action.collect_garbage(args.dry_run)
+
+    action = 'Would remove' if args.dry_run else 'Removed'
+    for resource in removed:
+        print('{} {}: {} ({})'.format(action, resource.kind, resource.name,
+                                      units.format_size(resource.size)))
+
+    for (resource, error) in failed:
+        print('Failed to remove {}: {} ({})'.format(resource.kind, resource.name, error))
+
+    freed = units.format_size(gc.freed_size(removed))
+    if args.dry_run:
+        print('Orphaned resources: {}, would free {}'.format(len(removed), freed))
+    else:
+        print('Removed resources: {}, freed {}'.format(len(removed), freed))
+
+
+def process_snapshot_cli_call(args):
+    '''
+    Process the snapshot request through command line.
+    '''
+    # to avoid chain of dependencies (docker!) before dcluster init
+    from dcluster.actions import manage as manage_action
+
+    manifest = manage_action.snapshot_cluster(args.cluster_name, args.tag)
+    for hostname in sorted(manifest['nodes'].keys()):
+        print('{}: {}'.format(hostname, manifest['nodes'][hostname]['image']))
+    print('Saved snapshot: {}'.format(args.tag))
+
+
+def process_netem_cli_call(args):
+    '''
+    Process the interconnect emulation request through command line.
+    '''
+    # to avoid chain of dependencies (docker!) before dcluster init
+    from dcluster.actions import manage as manage_action
+    from dcluster.infra import netem
+
+    settings = {
+        key: getattr(args, key)
+        for key in netem.EMULATION_KEYS
+        if getattr(args, key) is not None
+    }
+
+    if settings or args.clear:
+        if settings and args.clear:
+            raise ValueError('Cannot change and clear the emulation at the same time')
+
+        network_name = manage_action.emulate_network(args.cluster_name, settings, args.data)
+        print('Emulation of {}: {}'.format(network_name, netem.describe(settings)))
+
+    elif not args.probe:
+        network_name = manage_action.emulation_network_name(args.cluster_name, args.data)
+        current = netem.saved_settings(args.cluster_name).get(network_name)
+        print('Emulation of {}: {}'.format(network_name, netem.describe(current)))
+
+    if args.probe:
+        results = manage_action.probe_network(args.cluster_name, args.data, args.pings,
+                                              args.seconds)
+        print(netem.format_probe(results))
+
+
+def process_bench_cli_call(args):
+    '''
+    Process the benchmark request through command line.
+    '''
+    # to avoid chain of dependencies (docker!) before dcluster init
+    from dcluster.actions import manage as manage_action
+    from dcluster.cluster import bench
+
+    if args.kind == 'net':
+        results = manage_action.benchmark_network(args.cluster_name, args.pattern, args.sample,
+                                                  args.pings, args.seconds, args.data)
+        text = bench.format_net_results(results)
+    else:
+        results = manage_action.benchmark_disks(args.cluster_name, args.paths, args.size,
+                                                args.seconds)
+        text = bench.format_disk_results(results)
+
+    if args.json:
+        print(bench.results_as_json(results))
+    else:
+        print(text)
+
+
+def process_exec_cli_call(args):
+    '''
+    Process the exec request through command line, exits with the highest exit code.
+    '''
+    # to avoid chain of dependencies (docker!) before dcluster init
+    from dcluster.actions import manage as manage_action
+
+    command = args.exec_command
+    if not command:
+        raise ValueError('Need to supply the command!')
+
+    worst = 0
+    for (hostname, task_result) in manage_action.exec_on_cluster(args.cluster_name, command,
+                                                                 args.hostnames):
+        if task_result.error is not None:
+            print('[{}] error: {}'.format(hostname, task_result.error))
+            worst = max(worst, 1)
+            continue
+
+        (exit_code, output) = task_result.result
+        for line in output.splitlines():
+            print('[{}] {}'.format(hostname, line))
+        if exit_code:
+            print('[{}] exit code: {}'.format(hostname, exit_code))
+            worst = max(worst, exit_code)
+
+    if worst:
+        sys.exit(worst)
+
+
+def process_watch_cli_call(args):
+    '''
+    Process the watch request through command line, runs until interrupted.
+    '''
+    # to avoid chain of dependencies (docker!) before dcluster init
+    from dcluster.actions import manage as manage_action
+
+    try:
+        manage_action.watch_clusters(args.once)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,358 @@
+'''
+A long-running dcluster process that runs the commands of the CLI for its callers.
+
+Each call of the CLI imports docker, yaml and jinja2, reads the configuration and the profiles, and
+connects to Docker before doing any work. 'dcluster serve' does this once and listens on a Unix
+socket that only its user can access (see main_config.service_socket). When the socket answers,
+the CLI sends these commands to the service instead of running them:
+
+    create, show, list, start, stop, rm, exec
+
+The protocol has one JSON document per line. A request has the arguments of the CLI and the
+working directory of the caller:
+
+    {"argv": ["show", "mycluster"], "cwd": "/home/user"}
+
+The service sends the output of the command as it is printed, then the exit code (and the error,
+if the command failed):
+
+    {"stdout": "..."}
+    {"stderr": "..."}
+    {"exit_code": 0}
+
+Each request is handled in its own thread, only the output of that thread (and of the workers of
+util.parallel that it starts) goes to the caller. If the caller goes away, the command still
+completes. The configuration is read once, restart the service after changing it; the profiles
+are read again when their files change. A creation with playbooks is run by the CLI itself,
+since the output of ansible-playbook is printed by other threads and its extra vars may name
+files of the caller.
+'''
+
+import contextlib
+import importlib
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+
+from dcluster.config import main_config
+from dcluster.util import lock, logger, parallel
+
+SERVED_COMMANDS = ('create', 'show', 'list', 'start', 'stop', 'rm', 'exec')
+
+# arguments with paths that are relative to the working directory of the caller
+PATH_ARGUMENTS = ('workpath', 'profile_path')
+
+# the connection of the request handled by each thread of the service
+_current = threading.local()
+
+
+def current_connection():
+    return getattr(_current, 'connection', None)
+
+
+def set_current_connection(connection):
+    _current.connection = connection
+
+
+# the output of the tasks that a request runs concurrently also goes to its caller
+parallel.register_thread_context(current_connection, set_current_connection)
+
+
+def configure_serve_parser(serve_parser):
+    '''
+    Configure argument parser for serve subcommand.
+    '''
+    msg = 'also follow the events of Docker to keep the records of the clusters current'
+    serve_parser.add_argument('--watch', help=msg, action='store_true')
+
+    # default function to call
+    serve_parser.set_defaults(func=process_serve_cli_call)
+
+
+def process_serve_cli_call(args):
+    '''
+    Process the serve request through command line, runs until interrupted.
+    '''
+    # the parser of the CLI runs the requests
+    from dcluster.main import build_parser
+
+    service = DclusterService(build_parser(), main_config.service_socket())
+    try:
+        service.serve(args.watch)
+    except KeyboardInterrupt:
+        pass
+
+
+def is_served(args):
+    '''
+    Whether the service can run a command of the CLI for the caller.
+    '''
+    if getattr(args, 'command', None) not in SERVED_COMMANDS:
+        return False
+    return not (args.command == 'create' and args.playbooks)
+
+
+def call_service(args, argv, socket_path=None):
+    '''
+    Sends a command of the CLI to the service, prints its output and returns its exit code.
+    Returns None if the command is not served or the service is not running, then the CLI runs
+    the command itself.
+    '''
+    if not is_served(args):
+        return None
+
+    if socket_path is None:
+        socket_path = main_config.service_socket()
+    if not os.path.exists(socket_path):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(socket_path)
+        except socket.error:
+            # the socket of a service that is gone
+            return None
+
+        request = {'argv': list(argv), 'cwd': os.getcwd()}
+        sock.sendall((json.dumps(request) + '\n').encode('utf-8'))
+
+        for line in sock.makefile('rb'):
+            message = json.loads(line.decode('utf-8'))
+            if 'stdout' in message:
+                sys.stdout.write(message['stdout'])
+                sys.stdout.flush()
+            elif 'stderr' in message:
+                sys.stderr.write(message['stderr'])
+            elif 'exit_code' in message:
+                if message.get('error'):
+                    sys.stderr.write('Error: {}\n'.format(message['error']))
+                return message['exit_code']
+
+        # do not run the command again, it may have been done
+        raise IOError('The dcluster service closed the connection: {}'.format(socket_path))
+    finally:
+        sock.close()
+
+
+def exit_code_of(system_exit):
+    '''
+    Exit code of sys.exit(code), a message is printed to stderr like the interpreter does.
+    '''
+    if system_exit.code is None:
+        return 0
+    if isinstance(system_exit.code, int):
+        return system_exit.code
+    sys.stderr.write('{}\n'.format(system_exit.code))
+    return 1
+
+
+def absolute_paths(args, cwd):
+    '''
+    Makes the path arguments of a request relative to the working directory of the caller.
+    '''
+    for name in PATH_ARGUMENTS:
+        value = getattr(args, name, None)
+        if isinstance(value, list):
+            setattr(args, name, [os.path.join(cwd, os.path.expanduser(v)) for v in value])
+        elif value is not None:
+            setattr(args, name, os.path.join(cwd, os.path.expanduser(value)))
+
+
+class RequestConnection(logger.LoggerMixin):
+    '''
+    The connection of a request. The output is dropped once the caller is gone, so that the
+    command completes anyway. The workers of the request send whole messages, one at a time.
+    '''
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.closed = False
+        # reentrant: the warning below is also sent through here
+        self.send_lock = threading.RLock()
+
+    def send(self, message):
+        with self.send_lock:
+            if self.closed:
+                return
+            try:
+                self.sock.sendall((json.dumps(message) + '\n').encode('utf-8'))
+            except (IOError, OSError) as e:
+                # first, the log records of the request are also sent through here
+                self.closed = True
+                self.logger.warning('Caller is gone, dropping its output: {}'.format(e))
+
+
+class ThreadStream(object):
+    '''
+    Replaces sys.stdout or sys.stderr in the service: what the thread of a request writes is
+    sent to its caller, the rest goes to the original stream.
+    '''
+
+    def __init__(self, name, original):
+        self.name = name
+        self.original = original
+
+    def write(self, text):
+        connection = current_connection()
+        if connection is None:
+            return self.original.write(text)
+        if text:
+            connection.send({self.name: text})
+
+    def flush(self):
+        if current_connection() is None:
+            self.original.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.original, name)
+
+
+class RequestLogHandler(logging.Handler):
+    '''
+    Sends the log records of the thread of a request to its caller, as the CLI would show them.
+    '''
+
+    def emit(self, record):
+        connection = current_connection()
+        if connection is not None:
+            connection.send({'stderr': self.format(record) + '\n'})
+
+
+@contextlib.contextmanager
+def routed_output():
+    '''
+    In this context, the output and the log records of the thread of a request go to its caller.
+    '''
+    (stdout, stderr) = (sys.stdout, sys.stderr)
+    sys.stdout = ThreadStream('stdout', stdout)
+    sys.stderr = ThreadStream('stderr', stderr)
+
+    log_handler = RequestLogHandler()
+    if logging.root.handlers:
+        log_handler.setFormatter(logging.root.handlers[0].formatter)
+    logging.root.addHandler(log_handler)
+
+    try:
+        yield
+    finally:
+        logging.root.removeHandler(log_handler)
+        (sys.stdout, sys.stderr) = (stdout, stderr)
+
+
+class DclusterService(logger.LoggerMixin):
+    '''
+    Runs the requests sent to a Unix socket with the parser of the CLI, each in its own thread.
+    '''
+
+    def __init__(self, parser, socket_path):
+        self.parser = parser
+        self.socket_path = socket_path
+
+    def warm_up(self):
+        '''
+        Does what each call of the CLI would do before its work: imports, profiles and Docker.
+        '''
+        from dcluster.config import profile_config
+        from dcluster.infra.docker_facade import get_client
+
+        for action_module in ('create', 'display', 'manage'):
+            importlib.import_module('dcluster.actions.' + action_module)
+
+        profile_config.all_available_profiles()
+        get_client().ping()
+
+    def run(self, request):
+        '''
+        Runs a request, returns the last message for the caller (exit code and error).
+        '''
+        try:
+            args = self.parser.parse_args(request['argv'])
+            if args.command not in SERVED_COMMANDS:
+                raise ValueError('Command is not served: {}'.format(args.command))
+
+            absolute_paths(args, request.get('cwd') or os.getcwd())
+            args.func(args)
+            return {'exit_code': 0}
+
+        except SystemExit as e:
+            return {'exit_code': exit_code_of(e)}
+
+        except Exception as e:
+            self.logger.error('Request {} failed: {}'.format(request.get('argv'), e))
+            return {'exit_code': 1, 'error': '{}: {}'.format(type(e).__name__, e)}
+
+    def handle(self, sock):
+        connection = RequestConnection(sock)
+        try:
+            line = sock.makefile('rb').readline()
+            request = json.loads(line.decode('utf-8'))
+
+            set_current_connection(connection)
+            try:
+                reply = self.run(request)
+            finally:
+                set_current_connection(None)
+
+            connection.send(reply)
+        except (ValueError, KeyError) as e:
+            connection.send({'exit_code': 2, 'error': 'Bad request: {}'.format(e)})
+        finally:
+            sock.close()
+
+    def watch_in_background(self):
+        # to avoid chain of dependencies (docker!) before dcluster init
+        from dcluster.actions import manage as manage_action
+
+        def follow():
+            try:
+                manage_action.watch_clusters()
+            except Exception as e:
+                self.logger.error('The watcher stopped: {}'.format(e))
+
+        watcher = threading.Thread(target=follow, name='Watcher')
+        watcher.daemon = True
+        watcher.start()
+
+    def listen(self):
+        '''
+        Binds the socket, only the user can connect to it.
+        '''
+        # the previous service is gone, its socket is not
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        previous_umask = os.umask(0o177)
+        try:
+            server.bind(self.socket_path)
+        finally:
+            os.umask(previous_umask)
+        server.listen(16)
+        return server
+
+    def serve(self, watch=False):
+        '''
+        Answers requests until interrupted. Raises LockTimeout if the service is already running.
+        '''
+        with lock.FileLock(main_config.lock_path('serve'), timeout=0):
+            self.warm_up()
+            server = self.listen()
+
+            if watch:
+                self.watch_in_background()
+
+            self.logger.info('Serving on {}'.format(self.socket_path))
+            try:
+                with routed_output():
+                    while True:
+                        (sock, _) = server.accept()
+                        worker = threading.Thread(target=self.handle, args=(sock,))
+                        worker.daemon = True
+                        worker.start()
+            finally:
+                server.close()
+                os.remove(self.socket_path)
@@ -1,3 +1,5 @@
+import sys
+
 from dcluster.config import main_config
 
 
@@ -8,6 +10,9 @@ def configure_ssh_parser(ssh_parser):
     ssh_parser.add_argument('cluster_name', help='name of the Docker cluster')
     ssh_parser.add_argument('target', help='hostname of the cluster node, can be user@hostname')
 
+    msg = 'find the cluster in Docker instead of using its recorded state'
+    ssh_parser.add_argument('--refresh', help=msg, action='store_true')
+
     # default function to call
     ssh_parser.set_defaults(func=process_ssh_cli_call)
 
@@ -20,6 +25,9 @@ def configure_scp_parser(scp_parser):
     scp_parser.add_argument('target', help='hostname of the cluster node, can be user@hostname')
     scp_parser.add_argument("files", nargs="*")
 
+    msg = 'find the cluster in Docker instead of using its recorded state'
+    scp_parser.add_argument('--refresh', help=msg, action='store_true')
+
     # default function to call
     scp_parser.set_defaults(func=process_scp_cli_call)
 
@@ -33,7 +41,9 @@ def process_ssh_cli_call(args):
     from dcluster.actions import ssh as ssh_action
 
     (cluster_name, username, hostname, _) = interpret_ssh_args(args)
-    ssh_action.ssh(cluster_name, username, hostname)
+    exit_code = ssh_action.ssh(cluster_name, username, hostname, args.refresh)
+    if exit_code:
+        sys.exit(exit_code)
 
 
 def process_scp_cli_call(args):
@@ -52,7 +62,9 @@ def process_scp_cli_call(args):
     if not isinstance(args.files, list):
         files = [args.files, ]
 
-    ssh_action.scp(cluster_name, username, hostname, target_dir, files)
+    exit_code = ssh_action.scp(cluster_name, username, hostname, target_dir, files, args.refresh)
+    if exit_code:
+        sys.exit(exit_code)
 
 
 def interpret_ssh_args(args):
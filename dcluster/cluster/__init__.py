@@ -1,7 +1,8 @@
 from .planner import DefaultClusterPlan
 # BasicClusterPlan, ExtendedClusterPlan
 
-from dcluster.config import profile_config
+from dcluster.config import main_config, profile_config
+from dcluster.util import lock
 
 
 # this matches the type to a plan
@@ -10,19 +11,36 @@ plans_by_type = {
 }
 
 
-def create_plan(creation_request, cluster_network):
+def create_plan(creation_request, cluster_network, cluster_config=None, data_network=None,
+                compute_ips=None, data_ips=None):
     '''
     Build plan based on user request, existing configuration and a existing network.
     The parameters in the user request are merged with existing configuration.
+    The configuration of the profile can be supplied if it was already resolved, and the data
+    network if the profile asks for one. The addresses of the compute nodes (and their data
+    addresses) can be given when scaling a cluster.
     '''
 
     # find the configuration given the profile
     # let the user specify additional places to look for profile files
-    cluster_config = profile_config.cluster_config_for_profile(creation_request.profile,
-                                                               creation_request.profile_paths)
+    if cluster_config is None:
+        cluster_config = profile_config.cluster_config_for_profile(creation_request.profile,
+                                                                   creation_request.profile_paths)
 
     # the configuration specifies the type of cluster, use plans_by_type to match
     plan_for_type = plans_by_type[cluster_config['cluster_type']]
 
     # call the factory method of the right class
-    return plan_for_type.create(creation_request, cluster_config, cluster_network)
+    return plan_for_type.create(creation_request, cluster_config, cluster_network, data_network,
+                                compute_ips, data_ips)
+
+
+def cluster_lock(cluster_name, timeout=None):
+    '''
+    Advisory lock held while a cluster is being created or removed, so that concurrent dcluster
+    processes do not work on the same cluster. Uses the configured timeout by default.
+    '''
+    if timeout is None:
+        timeout = main_config.prefs('lock_timeout')
+    lock_path = main_config.lock_path('cluster-{}'.format(cluster_name))
+    return lock.FileLock(lock_path, timeout)
@@ -0,0 +1,417 @@
+'''
+Host admission control for new clusters.
+
+Before any Docker object is created, the footprint of the requested cluster is estimated and
+compared with the capacity of the host, which includes the reservations of the clusters that
+already exist. The cluster is then either admitted, queued until capacity is available, or
+rejected.
+
+The footprint of a node is taken from the per-role limits of the profile, e.g.
+
+    compute:
+      resources:
+        cpus: 2
+        memory: 2g
+
+If a role has no memory limit, the memory usage measured for its image in previous clusters is
+used instead (see UsageHistory), and finally a default from the configuration.
+
+Concurrent creations are admitted one at a time under a host-wide lock. An admitted cluster
+reserves its footprint (see Reservations) until its containers exist and are counted by the
+probe, so that clusters admitted at the same time cannot overcommit the host together.
+'''
+
+import contextlib
+import errno
+import json
+import os
+import time
+
+from collections import namedtuple
+
+from dcluster.config import main_config
+from dcluster.infra.docker_facade import DockerContainers, DockerHost
+from dcluster.util import fs as fs_util
+from dcluster.util import lock, logger, parallel, units
+
+# possible verdicts of the admission stage
+ADMIT = 'admit'
+QUEUE = 'queue'
+REJECT = 'reject'
+
+# resources required by a cluster: memory in bytes, cpus as a (fractional) number of CPUs
+Footprint = namedtuple('Footprint', 'memory, cpus')
+
+# resources of the host, committed resources are the reservations of existing clusters
+HostCapacity = namedtuple('HostCapacity', 'memory_total, memory_available, cpus, \
+                          committed_memory, committed_cpus')
+
+Decision = namedtuple('Decision', 'verdict, reason')
+
+
+class AdmissionRejected(Exception):
+    '''
+    Expected to be raised when the host cannot take a new cluster.
+    Should inform the user and exit.
+    '''
+    pass
+
+
+def reservations_file():
+    '''
+    Where to store the footprints of the clusters that are admitted but not yet deployed.
+    '''
+    workpath = main_config.paths('work')
+    return os.path.join(workpath, 'admission', 'reservations.json')
+
+
+def history_file():
+    '''
+    Where to store the measured usage of previous clusters.
+    '''
+    workpath = main_config.paths('work')
+    return os.path.join(workpath, 'admission', 'history.json')
+
+
+class UsageHistory(logger.LoggerMixin):
+    '''
+    Measured memory usage of nodes, indexed by image and persisted as a JSON file.
+    Keeps an exponential moving average of the observed usage.
+    '''
+
+    # weight of the newest observation
+    ALPHA = 0.5
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.__entries = None
+
+    @property
+    def entries(self):
+        if self.__entries is None:
+            self.__entries = {}
+            if os.path.isfile(self.filename):
+                try:
+                    with open(self.filename, 'r') as hf:
+                        self.__entries = json.load(hf)
+                except ValueError:
+                    self.logger.warning('Ignoring corrupt usage history: {}'.format(self.filename))
+        return self.__entries
+
+    def estimate(self, image):
+        '''
+        Estimated memory usage in bytes for a node with the image, None if never measured.
+        '''
+        entry = self.entries.get(image)
+        if entry is None:
+            return None
+        return int(entry['memory'])
+
+    def record(self, image, memory):
+        '''
+        Adds an observation of the memory usage (bytes) of a node with the image.
+        '''
+        if not memory:
+            return
+
+        entry = self.entries.get(image)
+        if entry is None:
+            entry = {'memory': memory, 'samples': 0}
+        else:
+            entry['memory'] = self.ALPHA * memory + (1 - self.ALPHA) * entry['memory']
+
+        entry['samples'] += 1
+        self.entries[image] = entry
+
+    def save(self):
+        fs_util.create_dir_dont_complain(os.path.dirname(self.filename))
+        with open(self.filename, 'w') as hf:
+            json.dump(self.entries, hf, indent=2, sort_keys=True)
+
+
+def process_is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+class Reservations(logger.LoggerMixin):
+    '''
+    Footprints of the clusters that were admitted and are being deployed, persisted as a JSON
+    file and shared by dcluster processes. The reservations of processes that are gone are
+    ignored. The lock is held by the caller to check and reserve at once.
+    '''
+
+    def __init__(self, filename, lock_path, timeout=None):
+        self.filename = filename
+        self.lock = lock.FileLock(lock_path, timeout)
+
+    def read(self):
+        if not os.path.isfile(self.filename):
+            return {}
+        try:
+            with open(self.filename, 'r') as rf:
+                entries = json.load(rf)
+        except ValueError:
+            self.logger.warning('Ignoring corrupt reservations: {}'.format(self.filename))
+            return {}
+
+        return {
+            cluster_name: entry
+            for (cluster_name, entry) in entries.items()
+            if process_is_alive(entry['pid'])
+        }
+
+    def write(self, entries):
+        fs_util.create_dir_dont_complain(os.path.dirname(self.filename))
+        with open(self.filename, 'w') as rf:
+            json.dump(entries, rf, indent=2, sort_keys=True)
+
+    def pending(self):
+        '''
+        Sum of the reserved footprints.
+        '''
+        entries = self.read().values()
+        return Footprint(sum(entry['memory'] for entry in entries),
+                         sum(entry['cpus'] for entry in entries))
+
+    def add(self, cluster_name, footprint):
+        entries = self.read()
+        entries[cluster_name] = {'memory': footprint.memory, 'cpus': footprint.cpus,
+                                 'pid': os.getpid()}
+        self.write(entries)
+
+    def remove(self, cluster_name):
+        with self.lock:
+            entries = self.read()
+            entries.pop(cluster_name, None)
+            self.write(entries)
+
+
+def with_pending(capacity, pending):
+    '''
+    The capacity of the host once the pending reservations are deployed.
+    '''
+    return capacity._replace(memory_available=capacity.memory_available - pending.memory,
+                             committed_memory=capacity.committed_memory + pending.memory,
+                             committed_cpus=capacity.committed_cpus + pending.cpus)
+
+
+def node_memory(memory_limit, image, history, policy):
+    '''
+    Memory reservation of a single node: its limit, or what was measured for its image,
+    or the configured default.
+    '''
+    if memory_limit:
+        return units.parse_size(memory_limit)
+
+    measured = history.estimate(image)
+    if measured:
+        return measured
+
+    return units.parse_size(policy['default_node_memory'])
+
+
+def estimate_footprint(cluster_config, compute_count, history, policy):
+    '''
+    Footprint of a cluster given its profile configuration and the number of compute nodes.
+    '''
+    memory = 0
+    cpus = 0.0
+
+    for (role, count) in (('head', 1), ('compute', compute_count)):
+        role_config = cluster_config.get(role, {})
+        resources = role_config.get('resources') or {}
+
+        memory += count * node_memory(resources.get('memory'), role_config.get('image'),
+                                      history, policy)
+        cpus += count * float(resources.get('cpus') or policy['default_node_cpus'])
+
+    return Footprint(memory, cpus)
+
+
+def read_available_memory(meminfo='/proc/meminfo'):
+    '''
+    Memory available for new processes in bytes, from the kernel (MemAvailable).
+    Returns None if it cannot be read.
+    '''
+    try:
+        with open(meminfo, 'r') as mf:
+            for line in mf:
+                if line.startswith('MemAvailable:'):
+                    # value is in kB
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError):
+        pass
+
+    return None
+
+
+def probe_host(history, policy):
+    '''
+    Capacity of the host, asks Docker for its resources and for the existing dcluster containers.
+    The reservation of an existing container is its limit, or an estimate if it is not limited.
+    '''
+    info = DockerHost.info()
+    memory_total = info['MemTotal']
+    cpus = info['NCPU']
+
+    memory_available = read_available_memory()
+    if memory_available is None:
+        memory_available = memory_total
+
+    committed_memory = 0
+    committed_cpus = 0.0
+    for docker_container in DockerContainers.all_dcluster_containers():
+        image = docker_container.attrs['Config']['Image']
+        memory_limit = DockerContainers.memory_limit(docker_container)
+        committed_memory += node_memory(memory_limit, image, history, policy)
+
+        cpu_limit = DockerContainers.cpu_limit(docker_container)
+        committed_cpus += cpu_limit or float(policy['default_node_cpus'])
+
+    return HostCapacity(memory_total, memory_available, cpus, committed_memory, committed_cpus)
+
+
+class AdmissionController(logger.LoggerMixin):
+    '''
+    Decides whether a new cluster can be created on the host.
+
+    The policy is a dictionary with the 'admission' entries of the configuration, the probe is
+    a function that returns the current HostCapacity. With reservations, the pending footprints
+    are added to the capacity, and an admitted footprint is reserved.
+    '''
+
+    def __init__(self, policy, probe, clock=time.time, sleep=time.sleep, reservations=None):
+        self.policy = policy
+        self.probe = probe
+        self.clock = clock
+        self.sleep = sleep
+        self.reservations = reservations
+
+    def decide(self, footprint, capacity):
+        '''
+        Returns a Decision for the footprint of a new cluster given the capacity of the host.
+        The cluster is rejected if it would not fit even on an empty host.
+        '''
+        reserved_memory = units.parse_size(self.policy['reserved_memory'])
+        usable_memory = capacity.memory_total * self.policy['memory_overcommit'] - reserved_memory
+        usable_cpus = capacity.cpus * self.policy['cpu_overcommit']
+
+        if footprint.memory > usable_memory:
+            msg = 'cluster needs {} of memory, host can only offer {}'
+            return Decision(REJECT, msg.format(units.format_size(footprint.memory),
+                                               units.format_size(usable_memory)))
+
+        if footprint.cpus > usable_cpus:
+            msg = 'cluster needs {} CPUs, host can only offer {}'
+            return Decision(REJECT, msg.format(footprint.cpus, usable_cpus))
+
+        if capacity.committed_memory + footprint.memory > usable_memory:
+            msg = 'memory already committed to clusters: {} of {}'
+            return Decision(QUEUE, msg.format(units.format_size(capacity.committed_memory),
+                                              units.format_size(usable_memory)))
+
+        if footprint.memory > capacity.memory_available - reserved_memory:
+            msg = 'not enough free memory: {} available'
+            return Decision(QUEUE, msg.format(units.format_size(capacity.memory_available)))
+
+        if capacity.committed_cpus + footprint.cpus > usable_cpus:
+            msg = 'CPUs already committed to clusters: {} of {}'
+            return Decision(QUEUE, msg.format(capacity.committed_cpus, usable_cpus))
+
+        return Decision(ADMIT, 'enough capacity')
+
+    def try_admit(self, footprint, cluster_name):
+        '''
+        Decides once, and reserves the footprint if the cluster is admitted.
+        '''
+        if self.reservations is None:
+            return self.decide(footprint, self.probe())
+
+        with self.reservations.lock:
+            capacity = with_pending(self.probe(), self.reservations.pending())
+            decision = self.decide(footprint, capacity)
+            if decision.verdict == ADMIT:
+                self.reservations.add(cluster_name, footprint)
+            return decision
+
+    def admit(self, footprint, wait, cluster_name=None):
+        '''
+        Blocks until the footprint can be admitted, waiting for at most 'wait' seconds in the
+        queue. Raises AdmissionRejected if the cluster does not fit in time, or if it can never
+        fit in the host.
+        '''
+        deadline = self.clock() + wait
+
+        while True:
+            decision = self.try_admit(footprint, cluster_name)
+            self.logger.debug('Admission for {}: {}'.format(footprint, decision))
+
+            if decision.verdict == ADMIT:
+                return decision
+
+            if decision.verdict == REJECT:
+                raise AdmissionRejected('Cluster rejected: {}'.format(decision.reason))
+
+            remaining = deadline - self.clock()
+            if remaining <= 0:
+                msg = 'Cluster rejected after waiting {}s: {}'
+                raise AdmissionRejected(msg.format(wait, decision.reason))
+
+            self.logger.info('Cluster queued ({}), waiting...'.format(decision.reason))
+            self.sleep(min(self.policy['poll_interval'], remaining))
+
+
+@contextlib.contextmanager
+def admitted_cluster(cluster_config, creation_request):
+    '''
+    Admission stage for a creation request, using the configuration (admission entry).
+    Enters the context if the cluster is admitted, raises AdmissionRejected otherwise. The
+    footprint of the cluster stays reserved in the context, which should end once the containers
+    of the cluster exist (or failed to be created).
+    '''
+    policy = main_config.get_config()['admission']
+    if not policy['enabled']:
+        yield
+        return
+
+    wait = creation_request.admission_wait
+    if wait is None:
+        wait = policy['wait']
+
+    history = UsageHistory(history_file())
+    footprint = estimate_footprint(cluster_config, creation_request.compute_count, history, policy)
+
+    reservations = Reservations(reservations_file(), main_config.lock_path('admission'),
+                                main_config.prefs('lock_timeout'))
+    controller = AdmissionController(policy, lambda: probe_host(history, policy),
+                                     reservations=reservations)
+    controller.admit(footprint, wait, creation_request.name)
+    try:
+        yield
+    finally:
+        reservations.remove(creation_request.name)
+
+
+def record_usage(cluster):
+    '''
+    Measures the memory used by each node of a deployed cluster, and adds it to the usage
+    history. Meant to be called before the cluster is removed.
+    '''
+    policy = main_config.get_config()['admission']
+    if not policy['enabled']:
+        return
+
+    history = UsageHistory(history_file())
+    nodes = cluster.ordered_nodes
+    usages = parallel.run_concurrently(lambda node: node.memory_usage(), nodes)
+
+    for task_result in usages:
+        if task_result.error is None:
+            node = task_result.item
+            history.record(node.container.attrs['Config']['Image'], task_result.result)
+
+    history.save()
@@ -0,0 +1,279 @@
+'''
+Micro-benchmarks of a running cluster: what the network and the volumes actually deliver.
+
+The agent (bench_agent.py) is copied to each node and run with the Python of the image, so the
+images do not need any benchmark tool. The network test measures the round trip of 1 byte over
+TCP and the throughput of a stream between pairs of nodes:
+
+- head: each node to the head
+- ring: each node to the next one, in order of hostname
+- all: all ordered pairs, or a random sample of them
+
+The pairs run one at a time, so that they do not compete for the links. The disk test writes
+and reads a file in the volumes of each node (or given paths), one node at a time.
+'''
+
+import io
+import itertools
+import json
+import os
+import random
+import tarfile
+import time
+
+from collections import namedtuple
+
+from dcluster.util import logger, parallel
+
+from .mpi import MPI_MOUNT
+
+# where the agent is copied in the nodes
+AGENT_PATH = '/tmp/dcluster-bench.py'
+
+# runs a script with the first Python that the image has
+PYTHON_COMMAND = ('for py in python3 python /usr/libexec/platform-python; do '
+                  'if command -v $py >/dev/null 2>&1; then exec $py "$@"; fi; done; '
+                  'echo "No Python found" >&2; exit 127')
+
+PATTERNS = ('head', 'ring', 'all')
+
+DEFAULT_PORT = 7201
+
+# mounts that are not volumes of the cluster
+IGNORED_MOUNTS = ('/dcluster', '/sys/fs/cgroup', MPI_MOUNT)
+
+# latencies are in microseconds (round trip), throughput in Gbit/s
+NetResult = namedtuple('NetResult', 'source, target, latency_us, throughput_gbps, error')
+
+# sequential rates in MB/s, random operations of 4k per second
+DiskResult = namedtuple('DiskResult', 'hostname, path, seq_write_mbps, seq_read_mbps, '
+                                      'rand_read_iops, rand_write_iops, error')
+
+
+def node_pairs(hostnames, pattern, head='head', sample=None, seed=None):
+    '''
+    Pairs (source, target) of hostnames to measure, see the patterns above. With the 'all'
+    pattern, sample limits the number of pairs to a random subset.
+    '''
+    hostnames = sorted(hostnames)
+    if pattern == 'head':
+        return [(hostname, head) for hostname in hostnames if hostname != head]
+
+    if pattern == 'ring':
+        if len(hostnames) < 2:
+            return []
+        return [(hostnames[index], hostnames[(index + 1) % len(hostnames)])
+                for index in range(len(hostnames))]
+
+    if pattern == 'all':
+        pairs = list(itertools.permutations(hostnames, 2))
+        if sample is not None and sample < len(pairs):
+            pairs = sorted(random.Random(seed).sample(pairs, sample))
+        return pairs
+
+    raise ValueError('Unknown pattern: {} (expected one of {})'.format(pattern, PATTERNS))
+
+
+def agent_archive():
+    '''
+    A tar archive with the agent, to be extracted at the root of a node. Returns bytes.
+    '''
+    agent_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_agent.py')
+    with open(agent_file, 'rb') as af:
+        contents = af.read()
+
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode='w') as tar:
+        tarinfo = tarfile.TarInfo(AGENT_PATH.lstrip('/'))
+        tarinfo.size = len(contents)
+        tarinfo.mode = 0o755
+        tarinfo.mtime = int(time.time())
+        tar.addfile(tarinfo, io.BytesIO(contents))
+
+    return archive.getvalue()
+
+
+def python_command(script_path, *args):
+    '''
+    Command that runs a Python script in a node with the given arguments.
+    '''
+    return ['sh', '-c', PYTHON_COMMAND, 'dcluster', script_path] + [str(arg) for arg in args]
+
+
+def agent_command(*args):
+    '''
+    Command that runs the agent in a node with the given arguments.
+    '''
+    return python_command(AGENT_PATH, *args)
+
+
+def parse_agent_output(exit_code, output):
+    '''
+    The JSON document printed by the agent on its last line.
+    Raises ValueError if the agent failed.
+    '''
+    lines = output.strip().splitlines()
+    if exit_code != 0 or not lines:
+        raise ValueError('Agent failed ({}): {}'.format(exit_code, output.strip()))
+    return json.loads(lines[-1])
+
+
+def volume_paths(mounts):
+    '''
+    Destinations of the writable mounts of a container (from the Docker attributes), except
+    the ones that dcluster adds to every node.
+    '''
+    return sorted([
+        mount['Destination']
+        for mount in mounts or []
+        if mount.get('RW', True) and mount['Destination'] not in IGNORED_MOUNTS
+    ])
+
+
+def format_matrix(results, field, value_format='{:.1f}'):
+    '''
+    A matrix of one field of the network results, sources in rows and targets in columns.
+    Pairs that were not measured are empty, failed pairs are shown as 'x'.
+    '''
+    hostnames = sorted(set([r.source for r in results] + [r.target for r in results]))
+    width = max([len(hostname) for hostname in hostnames] + [9]) + 2
+    cells = {(r.source, r.target): r for r in results}
+
+    lines = [''.ljust(width) + ''.join([hostname.rjust(width) for hostname in hostnames])]
+    for source in hostnames:
+        line = source.ljust(width)
+        for target in hostnames:
+            cell = ''
+            result = cells.get((source, target))
+            if result is not None:
+                value = getattr(result, field)
+                cell = 'x' if value is None else value_format.format(value)
+            line += cell.rjust(width)
+        lines.append(line.rstrip())
+
+    return '\n'.join(lines)
+
+
+def format_net_results(results):
+    '''
+    Matrices of the latency (median round trip) and the throughput, and the failures.
+    '''
+    median_results = [r._replace(latency_us=(r.latency_us or {}).get('p50')) for r in results]
+    parts = ['Round trip, median (us):', format_matrix(median_results, 'latency_us')]
+    if any(r.throughput_gbps is not None for r in results):
+        parts.extend(['', 'Throughput (Gb/s):',
+                      format_matrix(results, 'throughput_gbps', '{:.2f}')])
+
+    failures = ['{} -> {}: {}'.format(r.source, r.target, r.error) for r in results if r.error]
+    if failures:
+        parts.extend([''] + failures)
+    return '\n'.join(parts)
+
+
+def format_disk_results(results):
+    '''
+    A table with a line for each volume of each node.
+    '''
+    line_format = '{:12}{:24}{:>12}{:>12}{:>12}{:>12}  {}'
+    lines = [line_format.format('node', 'path', 'write MB/s', 'read MB/s', 'rand r/s',
+                                'rand w/s', '').rstrip()]
+    for result in results:
+        values = [
+            '-' if value is None else '{:.0f}'.format(value)
+            for value in (result.seq_write_mbps, result.seq_read_mbps, result.rand_read_iops,
+                          result.rand_write_iops)
+        ]
+        values.append(result.error or '')
+        lines.append(line_format.format(result.hostname, result.path, *values).rstrip())
+    return '\n'.join(lines)
+
+
+def results_as_json(results):
+    return json.dumps([result._asdict() for result in results], indent=2, sort_keys=True)
+
+
+class ClusterBenchmark(logger.LoggerMixin):
+    '''
+    Runs the benchmarks on a deployed cluster, uses Docker through the nodes of the cluster.
+    '''
+
+    def __init__(self, cluster, network_name, port=DEFAULT_PORT):
+        self.cluster = cluster
+        self.network_name = network_name
+        self.port = port
+
+    def install_agent(self, nodes=None):
+        '''
+        Copies the agent to the nodes, concurrently.
+        '''
+        if nodes is None:
+            nodes = self.cluster.ordered_nodes
+        archive = agent_archive()
+        parallel.map_concurrently(lambda node: node.container.put_archive('/', archive), nodes)
+
+    def run_network(self, pattern='head', sample=None, pings=1000, seconds=3):
+        '''
+        Measures the pairs of the pattern, returns a list of NetResult. With seconds=0, only
+        the latency is measured.
+        '''
+        nodes = {node.hostname: node for node in self.cluster.ordered_nodes
+                 if node.address_in(self.network_name) is not None}
+        heads = sorted([hostname for (hostname, node) in nodes.items() if node.role == 'head'])
+        head = heads[0] if heads else min(nodes.keys())
+        pairs = node_pairs(nodes.keys(), pattern, head, sample)
+
+        targets = sorted(set([target for (_, target) in pairs]))
+        involved = sorted(set(targets + [source for (source, _) in pairs]))
+        self.install_agent([nodes[hostname] for hostname in involved])
+
+        # a server for each pair, it exits after the connections of the client (latency, then
+        # throughput), or when idle for longer than a measurement. A server started once per
+        # target would be idle while the other pairs are measured, e.g. with the 'all' pattern
+        timeout = max(30, 2 * seconds + 10)
+        connections = 2 if seconds > 0 else 1
+
+        results = []
+        for (source, target) in pairs:
+            self.logger.info('Measuring {} -> {}'.format(source, target))
+            command = agent_command('server', '--port', self.port, '--timeout', timeout,
+                                    '--connections', connections)
+            nodes[target].exec_command(command, detach=True)
+
+            target_ip = nodes[target].address_in(self.network_name)
+            command = agent_command('client', '--host', target_ip, '--port', self.port,
+                                    '--pings', pings, '--seconds', seconds)
+            try:
+                measured = parse_agent_output(*nodes[source].exec_command(command))
+                results.append(NetResult(source, target, measured['latency_us'],
+                                         measured.get('throughput_gbps'), None))
+            except Exception as e:
+                results.append(NetResult(source, target, None, None, str(e)))
+
+        return results
+
+    def run_disk(self, paths=None, size='256m', seconds=3):
+        '''
+        Measures the volumes of each node (or the given paths in all nodes), one at a time.
+        Returns a list of DiskResult.
+        '''
+        nodes = self.cluster.ordered_nodes
+        self.install_agent(nodes)
+
+        results = []
+        for node in nodes:
+            node_paths = paths or volume_paths(node.container.attrs.get('Mounts'))
+            for path in node_paths:
+                self.logger.info('Measuring {}:{}'.format(node.hostname, path))
+                command = agent_command('disk', '--path', path, '--size', size, '--seconds',
+                                        seconds)
+                try:
+                    measured = parse_agent_output(*node.exec_command(command))
+                    results.append(DiskResult(node.hostname, path, measured['seq_write_mbps'],
+                                              measured['seq_read_mbps'],
+                                              measured['rand_read_iops'],
+                                              measured['rand_write_iops'], None))
+                except Exception as e:
+                    results.append(DiskResult(node.hostname, path, None, None, None, None,
+                                              str(e)))
+
+        return results
@@ -0,0 +1,293 @@
+'''
+Agent of 'dcluster bench', copied to the nodes and run with the Python of the image.
+
+Only uses the standard library, and runs with Python 2.7 and 3.x, so that it works on any
+image with a Python interpreter. Each measurement prints a JSON document on the last line:
+
+    server --port 7201 --timeout 60 --connections 2
+        serves latency and throughput tests, one connection at a time, until idle (or until
+        the number of connections are served)
+    client --host node002 --port 7201 --pings 1000 --seconds 3
+        round trips of 1 byte (latency), then a stream of bytes (throughput)
+    disk --path /data --size 256m --seconds 3
+        sequential write and read of a file, then random 4k reads and writes
+'''
+
+import argparse
+import json
+import os
+import random
+import socket
+import sys
+import time
+
+LATENCY_MODE = b'L'
+THROUGHPUT_MODE = b'T'
+
+CHUNK_SIZE = 1024 * 1024
+IO_BLOCK = 4096
+
+SIZE_SUFFIXES = {'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+
+
+def parse_size(size):
+    size = str(size).strip().lower()
+    if size and size[-1] in SIZE_SUFFIXES:
+        return int(float(size[:-1]) * SIZE_SUFFIXES[size[-1]])
+    return int(size)
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def recv_exactly(conn, count):
+    data = b''
+    while len(data) < count:
+        received = conn.recv(count - len(data))
+        if not received:
+            raise IOError('Connection closed')
+        data += received
+    return data
+
+
+def serve_connection(conn):
+    mode = recv_exactly(conn, 1)
+    if mode == LATENCY_MODE:
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        while True:
+            data = conn.recv(1)
+            if not data:
+                break
+            conn.sendall(data)
+
+    elif mode == THROUGHPUT_MODE:
+        total = 0
+        while True:
+            data = conn.recv(CHUNK_SIZE)
+            if not data:
+                break
+            total += len(data)
+        conn.sendall('{}\n'.format(total).encode('ascii'))
+
+
+def listen(port, wait=5.0):
+    '''
+    Listens on a port that the previous server may still hold.
+    '''
+    deadline = time.time() + wait
+    while True:
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            listener.bind(('', port))
+            listener.listen(4)
+            return listener
+        except (IOError, OSError):
+            listener.close()
+            if time.time() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def serve(port, timeout, connections=0):
+    '''
+    Serves one connection at a time, exits when no connection arrives within the timeout, or
+    after serving the number of connections (if not 0).
+    '''
+    listener = listen(port)
+    listener.settimeout(timeout)
+
+    served = 0
+    while not connections or served < connections:
+        try:
+            (conn, _) = listener.accept()
+        except socket.timeout:
+            break
+
+        conn.settimeout(None)
+        try:
+            serve_connection(conn)
+            served += 1
+        except (IOError, OSError):
+            pass
+        finally:
+            conn.close()
+
+    listener.close()
+    return {'served': served}
+
+
+def connect(host, port, wait=5.0):
+    '''
+    Connects to a server that may still be starting.
+    '''
+    deadline = time.time() + wait
+    while True:
+        try:
+            return socket.create_connection((host, port), timeout=30)
+        except (IOError, OSError):
+            if time.time() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def measure_latency(host, port, pings):
+    conn = connect(host, port)
+    conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    try:
+        conn.sendall(LATENCY_MODE)
+        round_trips = []
+        for _ in range(pings):
+            start = time.time()
+            conn.sendall(b'x')
+            recv_exactly(conn, 1)
+            round_trips.append((time.time() - start) * 1e6)
+    finally:
+        conn.close()
+
+    round_trips.sort()
+    return {
+        'min': round_trips[0],
+        'avg': sum(round_trips) / len(round_trips),
+        'p50': percentile(round_trips, 0.5),
+        'p99': percentile(round_trips, 0.99)
+    }
+
+
+def measure_throughput(host, port, seconds):
+    conn = connect(host, port)
+    chunk = b'\0' * CHUNK_SIZE
+    try:
+        conn.sendall(THROUGHPUT_MODE)
+        start = time.time()
+        while time.time() - start < seconds:
+            conn.sendall(chunk)
+        conn.shutdown(socket.SHUT_WR)
+
+        # the server reports what it received, after draining the connection
+        reply = b''
+        while not reply.endswith(b'\n'):
+            data = conn.recv(64)
+            if not data:
+                break
+            reply += data
+        elapsed = time.time() - start
+    finally:
+        conn.close()
+
+    return int(reply.strip()) * 8 / elapsed / 1e9
+
+
+def client(host, port, pings, seconds):
+    result = {'latency_us': measure_latency(host, port, pings)}
+    if seconds > 0:
+        result['throughput_gbps'] = measure_throughput(host, port, seconds)
+    return result
+
+
+def drop_from_page_cache(fd):
+    # not available in Python 2, the read may come from the page cache
+    if hasattr(os, 'posix_fadvise'):
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def random_io(fd, size, seconds, write):
+    '''
+    4k operations at random aligned offsets for a number of seconds, returns the IOPS.
+    '''
+    blocks = max(1, size // IO_BLOCK)
+    block = b'\1' * IO_BLOCK
+    operations = 0
+    start = time.time()
+    while time.time() - start < seconds:
+        os.lseek(fd, random.randrange(blocks) * IO_BLOCK, os.SEEK_SET)
+        if write:
+            os.write(fd, block)
+            os.fsync(fd)
+        else:
+            os.read(fd, IO_BLOCK)
+        operations += 1
+    return operations / (time.time() - start)
+
+
+def disk(path, size, seconds):
+    '''
+    Sequential write (with fsync) and read of a file of the given size in a directory, then
+    random reads and writes of 4k blocks in the same file. The file is removed afterwards.
+    '''
+    filename = os.path.join(path, '.dcluster-bench-{}'.format(os.getpid()))
+    chunk = b'\1' * CHUNK_SIZE
+    result = {'path': path}
+    try:
+        start = time.time()
+        fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        written = 0
+        while written < size:
+            written += os.write(fd, chunk[:min(CHUNK_SIZE, size - written)])
+        os.fsync(fd)
+        os.close(fd)
+        result['seq_write_mbps'] = written / (time.time() - start) / 1e6
+
+        fd = os.open(filename, os.O_RDONLY)
+        drop_from_page_cache(fd)
+        start = time.time()
+        read = 0
+        while True:
+            data = os.read(fd, CHUNK_SIZE)
+            if not data:
+                break
+            read += len(data)
+        os.close(fd)
+        result['seq_read_mbps'] = read / (time.time() - start) / 1e6
+
+        fd = os.open(filename, os.O_RDWR)
+        drop_from_page_cache(fd)
+        result['rand_read_iops'] = random_io(fd, size, seconds / 2.0, False)
+        result['rand_write_iops'] = random_io(fd, size, seconds / 2.0, True)
+        os.close(fd)
+    finally:
+        if os.path.exists(filename):
+            os.remove(filename)
+
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='dcluster-bench')
+    subparsers = parser.add_subparsers(dest='command')
+
+    server_parser = subparsers.add_parser('server')
+    server_parser.add_argument('--port', type=int, default=7201)
+    server_parser.add_argument('--timeout', type=float, default=60)
+    server_parser.add_argument('--connections', type=int, default=0)
+
+    client_parser = subparsers.add_parser('client')
+    client_parser.add_argument('--host', required=True)
+    client_parser.add_argument('--port', type=int, default=7201)
+    client_parser.add_argument('--pings', type=int, default=1000)
+    client_parser.add_argument('--seconds', type=float, default=3)
+
+    disk_parser = subparsers.add_parser('disk')
+    disk_parser.add_argument('--path', required=True)
+    disk_parser.add_argument('--size', default='256m')
+    disk_parser.add_argument('--seconds', type=float, default=3)
+
+    args = parser.parse_args(argv)
+    if args.command == 'server':
+        result = serve(args.port, args.timeout, args.connections)
+    elif args.command == 'client':
+        result = client(args.host, args.port, args.pings, args.seconds)
+    elif args.command == 'disk':
+        result = disk(args.path, parse_size(args.size), args.seconds)
+    else:
+        parser.print_help()
+        return 2
+
+    print(json.dumps(result, sort_keys=True))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -19,13 +19,15 @@ class ClusterBlueprint(logger.LoggerMixin):
             in ordered_node_ips
         ]
 
-    def deploy(self, renderer, deployer):
+    def deploy(self, renderer, deployer, before_start=None, recreate=True):
         '''
         Deploys a planned cluster, based on a deployment template, e.g. docker-compose.
+        If given, before_start is called after the containers are created and before they start.
+        Without recreate, only the containers of new nodes are created (see the deployer).
         '''
         template = self.cluster_specs['template']
         cluster_definition = renderer.render_blueprint(self.as_dict(), template)
-        deployer.deploy(cluster_definition)
+        deployer.deploy(cluster_definition, before_start, recreate)
 
         # check for containers
         if deployer.a_container_has_exited():
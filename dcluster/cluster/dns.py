@@ -0,0 +1,143 @@
+'''
+Name resolution of a cluster with a DNS responder on the head, instead of static /etc/hosts.
+
+Without it, the nodes only know the names of the cluster from the extra_hosts written when the
+containers are created, so new nodes are unknown to the existing ones. A profile can ask for a
+responder with:
+
+    dns: true
+
+The records are written to the composer workpath of the cluster (dns/) and mounted read-only on
+the head at /etc/dcluster/dns, along with the responder (dns_agent.py), which runs with the Python
+of the head image. All nodes use the head as nameserver, with the domain of the cluster as search
+domain (e.g. node001.mycluster.dcluster). Other names are forwarded to the nameservers of the host.
+
+When the cluster is scaled, the hosts file is written again and the responder picks up the change
+on the next query, no container is restarted.
+'''
+
+import ipaddress
+import os
+import re
+import shutil
+
+from dcluster.config import main_config
+from dcluster.util import fs as fs_util
+
+from .bench import python_command
+
+# where the files are mounted on the head
+DNS_MOUNT = '/etc/dcluster/dns'
+
+DOMAIN = 'dcluster'
+
+AGENT_FILENAME = 'dns_agent.py'
+
+# Docker reads the second file when the first one only has the stub of systemd-resolved
+RESOLV_CONF_PATHS = ('/etc/resolv.conf', '/run/systemd/resolve/resolv.conf')
+
+
+def cluster_domain(cluster_name):
+    '''
+    Search domain of the nodes of a cluster, e.g. my_cluster -> my-cluster.dcluster
+    '''
+    label = re.sub(r'[^a-z0-9-]+', '-', cluster_name.lower()).strip('-')
+    return '{}.{}'.format(label, DOMAIN)
+
+
+def dns_dir(cluster_name):
+    return os.path.join(main_config.composer_workpath(cluster_name), 'dns')
+
+
+def has_dns(cluster_name):
+    '''
+    Whether a cluster was created with a DNS responder.
+    '''
+    return os.path.isfile(os.path.join(dns_dir(cluster_name), 'hosts'))
+
+
+def dns_records(cluster_specs):
+    '''
+    List of (ip_address, names) for the nodes of a cluster in order of IP address, including the
+    aliases, the data network addresses (e.g. node001-data) and the gateway.
+    '''
+    names_by_ip = {}
+    for node in cluster_specs['nodes'].values():
+        names = names_by_ip.setdefault(node.ip_address, [])
+        names.append(node.hostname)
+        if getattr(node, 'hostname_alias', None):
+            names.append(node.hostname_alias)
+
+        data_ip_address = getattr(node, 'data_ip_address', None)
+        if data_ip_address:
+            names_by_ip.setdefault(data_ip_address, []).append(node.hostname + '-data')
+
+    gateway_ip = cluster_specs['network'].get('gateway_ip')
+    if gateway_ip:
+        names_by_ip.setdefault(gateway_ip, []).append('gateway')
+
+    return sorted(names_by_ip.items(),
+                  key=lambda item: ipaddress.ip_address(u'{}'.format(item[0])))
+
+
+def hosts_file(cluster_specs):
+    return ''.join(['{} {}\n'.format(ip_address, ' '.join(names))
+                    for (ip_address, names) in dns_records(cluster_specs)])
+
+
+def upstream_nameservers(resolv_conf_paths=RESOLV_CONF_PATHS):
+    '''
+    Nameservers of the host that can be reached from the containers (not loopback addresses).
+    '''
+    for path in resolv_conf_paths:
+        if not os.path.isfile(path):
+            continue
+
+        with open(path, 'r') as resolv_conf:
+            nameservers = [
+                line.split()[1]
+                for line in resolv_conf.read().splitlines()
+                if line.startswith('nameserver') and len(line.split()) > 1
+            ]
+        nameservers = [ns for ns in nameservers if ':' not in ns and
+                       not ipaddress.ip_address(u'{}'.format(ns)).is_loopback]
+        if nameservers:
+            return nameservers
+
+    return []
+
+
+def write_atomically(path, contents):
+    '''
+    The responder may read the file at any time, never let it see a partial file.
+    '''
+    partial_path = path + '.tmp'
+    with open(partial_path, 'w') as partial_file:
+        partial_file.write(contents)
+    os.rename(partial_path, path)
+
+
+def write_dns_files(cluster_specs, dns_dir):
+    '''
+    Writes the records of a cluster, the upstream nameservers and the responder to a directory.
+    Returns the path of the hosts file.
+    '''
+    fs_util.create_dir_dont_complain(dns_dir)
+
+    agent_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), AGENT_FILENAME)
+    shutil.copy(agent_file, os.path.join(dns_dir, AGENT_FILENAME))
+
+    upstream = ''.join(['nameserver {}\n'.format(ns) for ns in upstream_nameservers()])
+    write_atomically(os.path.join(dns_dir, 'upstream'), upstream)
+
+    hosts_path = os.path.join(dns_dir, 'hosts')
+    write_atomically(hosts_path, hosts_file(cluster_specs))
+    return hosts_path
+
+
+def responder_command(domain):
+    '''
+    Command that runs the responder on the head, it exits if a responder is already running.
+    '''
+    return python_command(os.path.join(DNS_MOUNT, AGENT_FILENAME), '--dir', DNS_MOUNT,
+                          '--domain', domain)
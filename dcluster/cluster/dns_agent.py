@@ -0,0 +1,268 @@
+'''
+DNS responder of a cluster, run on the head with the Python of the image.
+
+Only uses the standard library, and runs with Python 2.7 and 3.x. Answers A and PTR queries for
+the names in a hosts file (same format as /etc/hosts), and forwards the other queries to the
+upstream nameservers listed in a resolv.conf file. Both files are in the same directory, which
+dcluster updates when the cluster is scaled:
+
+    dns_agent.py --dir /etc/dcluster/dns --domain mycluster.dcluster --port 53
+
+The hosts file is checked before each query (one stat) and read again when it changes, so the
+records are updated in place. Names of the cluster domain that are not in the file get NXDOMAIN.
+Exits if the port is taken, e.g. by a responder that is already running.
+'''
+
+import argparse
+import os
+import socket
+import struct
+import sys
+import threading
+
+TYPE_A = 1
+TYPE_PTR = 12
+TYPE_ANY = 255
+CLASS_IN = 1
+
+RCODE_SERVFAIL = 2
+RCODE_NXDOMAIN = 3
+
+# short, so that the records of replaced nodes are not cached for long
+TTL = 5
+
+FORWARD_TIMEOUT = 3
+
+
+def parse_hosts(contents):
+    '''
+    Dictionary name -> address and dictionary address -> name (the first name of each line).
+    '''
+    addresses = {}
+    names = {}
+    for line in contents.splitlines():
+        parts = line.split('#')[0].split()
+        if len(parts) < 2:
+            continue
+        names.setdefault(parts[0], parts[1].lower())
+        for name in parts[1:]:
+            addresses[name.lower()] = parts[0]
+    return (addresses, names)
+
+
+def parse_nameservers(contents):
+    return [line.split()[1] for line in contents.splitlines()
+            if line.startswith('nameserver') and len(line.split()) > 1]
+
+
+def reverse_name(ip_address):
+    return '.'.join(reversed(ip_address.split('.'))) + '.in-addr.arpa'
+
+
+def parse_question(query):
+    '''
+    Returns (name, qtype, end of the question) of a query, raises ValueError if malformed.
+    '''
+    if len(query) < 12 or struct.unpack('!H', query[4:6])[0] != 1:
+        raise ValueError('Expected one question')
+
+    labels = []
+    offset = 12
+    while True:
+        length = bytearray(query[offset:offset + 1])
+        if not length:
+            raise ValueError('Truncated question')
+        length = length[0]
+        offset += 1
+        if length == 0:
+            break
+        if length > 63:
+            raise ValueError('Compressed question')
+        labels.append(query[offset:offset + length].decode('ascii', 'replace'))
+        offset += length
+
+    (qtype, _) = struct.unpack('!HH', query[offset:offset + 4])
+    return ('.'.join(labels).lower(), qtype, offset + 4)
+
+
+def encode_name(name):
+    encoded = b''
+    for label in name.strip('.').split('.'):
+        encoded += struct.pack('!B', len(label)) + label.encode('ascii')
+    return encoded + b'\0'
+
+
+def build_response(query, question_end, rcode=0, answers=()):
+    '''
+    Response to a query with its question and the answers, each answer is (type, rdata).
+    '''
+    (query_id, flags) = struct.unpack('!HH', query[:4])
+    # response, authoritative, recursion available, keep opcode and recursion desired
+    flags = 0x8000 | (flags & 0x7900) | 0x0400 | 0x0080 | rcode
+    header = struct.pack('!HHHHHH', query_id, flags, 1, len(answers), 0, 0)
+
+    records = b''
+    for (rtype, rdata) in answers:
+        # the name is a pointer to the question
+        records += struct.pack('!HHHIH', 0xc00c, rtype, CLASS_IN, TTL, len(rdata)) + rdata
+
+    return header + query[12:question_end] + records
+
+
+class Records(object):
+    '''
+    The records of the hosts file, read again when the file changes.
+    '''
+
+    def __init__(self, dns_dir, domain):
+        self.hosts_path = os.path.join(dns_dir, 'hosts')
+        self.upstream_path = os.path.join(dns_dir, 'upstream')
+        self.domain = domain.lower().strip('.')
+        self.stamp = None
+        self.addresses = {}
+        self.names = {}
+        self.reverse = {}
+        self.upstreams = []
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        try:
+            stat = os.stat(self.hosts_path)
+            stamp = (stat.st_mtime, stat.st_size, stat.st_ino)
+        except OSError:
+            return
+
+        with self.lock:
+            if stamp == self.stamp:
+                return
+            with open(self.hosts_path, 'r') as hosts_file:
+                (self.addresses, self.names) = parse_hosts(hosts_file.read())
+            self.reverse = dict([(reverse_name(ip), name) for (ip, name) in self.names.items()])
+            if os.path.isfile(self.upstream_path):
+                with open(self.upstream_path, 'r') as upstream_file:
+                    self.upstreams = parse_nameservers(upstream_file.read())
+            self.stamp = stamp
+
+    def local_name(self, name):
+        '''
+        The name without the cluster domain, None if the name is outside the cluster.
+        '''
+        if name == self.domain:
+            return ''
+        if self.domain and name.endswith('.' + self.domain):
+            return name[:-len(self.domain) - 1]
+        if name in self.addresses:
+            return name
+        return None
+
+    def answer(self, query):
+        '''
+        Response to a query, None if it should be forwarded.
+        '''
+        (name, qtype, question_end) = parse_question(query)
+        self.refresh()
+
+        if name.endswith('.in-addr.arpa'):
+            if name not in self.reverse:
+                return None
+            if qtype not in (TYPE_PTR, TYPE_ANY):
+                return build_response(query, question_end)
+            hostname = self.reverse[name]
+            if self.domain:
+                hostname = '{}.{}'.format(hostname, self.domain)
+            return build_response(query, question_end, answers=[(TYPE_PTR,
+                                                                 encode_name(hostname))])
+
+        local_name = self.local_name(name)
+        if local_name is None:
+            return None
+
+        if local_name not in self.addresses:
+            if local_name == '':
+                return build_response(query, question_end)
+            return build_response(query, question_end, RCODE_NXDOMAIN)
+
+        if qtype not in (TYPE_A, TYPE_ANY):
+            # the name exists, but has no records of this type
+            return build_response(query, question_end)
+
+        rdata = socket.inet_aton(self.addresses[local_name])
+        return build_response(query, question_end, answers=[(TYPE_A, rdata)])
+
+
+def forward(query, upstreams):
+    '''
+    Response of the first upstream nameserver that answers, None if none does.
+    '''
+    for upstream in upstreams:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.settimeout(FORWARD_TIMEOUT)
+        try:
+            sock.sendto(query, (upstream, 53))
+            (response, _) = sock.recvfrom(4096)
+            return response
+        except (IOError, OSError):
+            continue
+        finally:
+            sock.close()
+    return None
+
+
+def forward_and_reply(server, records, query, client):
+    try:
+        response = forward(query, records.upstreams)
+        if response is None:
+            (_, _, question_end) = parse_question(query)
+            response = build_response(query, question_end, RCODE_SERVFAIL)
+        server.sendto(response, client)
+    except (ValueError, struct.error, IOError, OSError):
+        # malformed query, or the client is gone
+        pass
+
+
+def serve(dns_dir, domain, port=53, host='', max_queries=None):
+    '''
+    Answers queries until killed (or until max_queries are answered, for tests). Queries that
+    are forwarded are handled in a thread, so that a slow upstream does not block the cluster.
+    '''
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind((host, port))
+
+    records = Records(dns_dir, domain)
+    answered = 0
+    while max_queries is None or answered < max_queries:
+        (query, client) = server.recvfrom(512)
+        try:
+            response = records.answer(query)
+        except (ValueError, struct.error):
+            continue
+
+        if response is not None:
+            server.sendto(response, client)
+        else:
+            worker = threading.Thread(target=forward_and_reply,
+                                      args=(server, records, query, client))
+            worker.daemon = True
+            worker.start()
+        answered += 1
+
+    server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='dcluster-dns')
+    parser.add_argument('--dir', required=True)
+    parser.add_argument('--domain', default='')
+    parser.add_argument('--port', type=int, default=53)
+    args = parser.parse_args(argv)
+
+    try:
+        serve(args.dir, args.domain, args.port)
+    except socket.error as e:
+        sys.stderr.write('Cannot serve on port {}: {}\n'.format(args.port, e))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,7 @@
 from operator import attrgetter
 
+from dcluster.util import units
+
 
 class TextFormatterBasic(object):
     '''
@@ -24,7 +26,7 @@ class TextFormatterBasic(object):
 
         node_lines = [
             # format namedtuple contents
-            node_format.format(node.hostname, node.ip_address, node.container.name)
+            node_format.format(node.hostname, node.ip_address, container_name(node))
             for node
             in sorted_node_info
         ]
@@ -33,3 +35,65 @@ class TextFormatterBasic(object):
         lines.extend(node_lines)
         lines.append('')
         return '\n'.join(lines)
+
+
+class TextFormatterStats(object):
+    '''
+    Formats the aggregate usage of a cluster as text.
+    '''
+
+    def format(self, stats_dict):
+        usage = stats_dict['usage']
+
+        cpu_seconds = '-'
+        if usage['cpu_usage_usec'] is not None:
+            cpu_seconds = '{:.2f}s'.format(usage['cpu_usage_usec'] / 1000000.0)
+
+        lines = [
+            'Cluster: %s' % stats_dict['name'],
+            '-' * 24,
+            'Nodes: %s' % stats_dict['nodes'],
+            'cgroup: %s' % usage['cgroup'],
+            '',
+        ]
+
+        stat_format = '  {:20}{}'
+        stat_lines = [
+            stat_format.format('cpu usage', cpu_seconds),
+            stat_format.format('cpu max', value_or_dash(usage['cpu_max'])),
+            stat_format.format('cpu weight', value_or_dash(usage['cpu_weight'])),
+            stat_format.format('memory current', units.format_size(usage['memory_current'])),
+            stat_format.format('memory peak', units.format_size(usage['memory_peak'])),
+            stat_format.format('memory max', value_or_dash(usage['memory_max'])),
+            stat_format.format('pids', value_or_dash(usage['pids_current']))
+        ]
+
+        compiler_cache = stats_dict.get('compiler_cache')
+        if compiler_cache is not None:
+            hit_rate = '-'
+            if compiler_cache['hit_rate'] is not None:
+                hit_rate = '{:.1f}% ({} hits, {} misses)'.format(compiler_cache['hit_rate'],
+                                                                 compiler_cache['hits'],
+                                                                 compiler_cache['misses'])
+            stat_lines.append(stat_format.format('ccache hit rate', hit_rate))
+
+        lines.extend(stat_lines)
+        lines.append('')
+        return '\n'.join(lines)
+
+
+def container_name(node):
+    '''
+    Name of the container of a node, deployed nodes have a handle for the container and recorded
+    nodes only have the name (see cluster.state).
+    '''
+    return getattr(node.container, 'name', node.container)
+
+
+def value_or_dash(value):
+    '''
+    Show unavailable values as a dash.
+    '''
+    if value is None:
+        return '-'
+    return str(value)
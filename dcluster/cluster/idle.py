@@ -0,0 +1,67 @@
+'''
+Idle policy for clusters: find clusters whose aggregate CPU usage stays below a threshold during
+a window of time, so that they can be paused.
+'''
+
+import time
+
+from dcluster.util import logger
+
+
+class IdleDetector(logger.LoggerMixin):
+    '''
+    Samples the aggregate CPU usage of some clusters periodically.
+
+    A cluster is considered idle if, for every sample interval within the window, it used less
+    than threshold percent of one CPU. Clusters are discarded as soon as one interval goes above
+    the threshold, so sampling stops early if no cluster is idle.
+
+    The clusters only need to provide a name and cpu_usage_usec().
+    '''
+
+    def __init__(self, threshold, window, interval, clock=time.time, sleep=time.sleep):
+        self.threshold = float(threshold)
+        self.window = float(window)
+        self.interval = float(interval)
+        self.clock = clock
+        self.sleep = sleep
+
+    def cpu_percent(self, previous_usec, current_usec, elapsed):
+        '''
+        CPU usage as a percentage of one CPU, given two samples of consumed CPU time.
+        '''
+        if elapsed <= 0:
+            return 0.0
+        return (current_usec - previous_usec) / (elapsed * 1000000.0) * 100
+
+    def find_idle(self, clusters):
+        '''
+        Returns the subset of clusters that stayed idle during the whole window.
+        '''
+        candidates = list(clusters)
+        previous_usage = {c.name: c.cpu_usage_usec() for c in candidates}
+        previous_time = self.clock()
+        deadline = previous_time + self.window
+
+        while candidates and previous_time < deadline:
+            self.sleep(min(self.interval, deadline - previous_time))
+            now = self.clock()
+
+            still_idle = []
+            for cluster in candidates:
+                current_usage = cluster.cpu_usage_usec()
+                percent = self.cpu_percent(previous_usage[cluster.name], current_usage,
+                                           now - previous_time)
+                self.logger.debug('CPU usage of {}: {:.2f}%'.format(cluster.name, percent))
+
+                if percent < self.threshold:
+                    still_idle.append(cluster)
+                    previous_usage[cluster.name] = current_usage
+                else:
+                    self.logger.info('Cluster {} is not idle ({:.2f}% CPU)'.format(cluster.name,
+                                                                                   percent))
+
+            candidates = still_idle
+            previous_time = now
+
+        return candidates
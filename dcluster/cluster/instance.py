@@ -1,17 +1,73 @@
 import logging
 import os
 
+from . import dns
 from .blueprint import ClusterBlueprint
 from .format import TextFormatterBasic
 
+from dcluster.config import main_config
 from dcluster.node import instance as node_instance
 from dcluster.infra.docker_facade import DockerNaming, DockerNetworking
-from dcluster.infra import networking
+from dcluster.infra import caches, cgroups, netbench, netem, networking
 
-from dcluster.util import logger
+from dcluster.util import logger, parallel
 
 
-class RunningClusterMixin(logger.LoggerMixin):
+class SshMixin(logger.LoggerMixin):
+    '''
+    A mixin class to reach the nodes of a deployed cluster with SSH, it only needs the hostnames
+    and addresses of the nodes. The commands return the exit code of ssh/scp (255 if the
+    connection failed).
+    '''
+
+    def ssh_to_node(self, username, hostname):
+        '''
+        Connect to a cluster node via SSH.
+        TODO Refactor to someplace else, with configuration options.
+        '''
+        node = self.node_by_name(hostname)
+        ssh_command = '/usr/bin/ssh -o "StrictHostKeyChecking=no" -o "GSSAPIAuthentication=no" \
+-o "UserKnownHostsFile /dev/null" -o "LogLevel ERROR" %s'
+
+        target = '%s@%s' % (username, node.ip_address)
+        full_ssh_command = ssh_command % target
+        # subprocess.run(full_ssh_command, shell=True)
+        return exit_code(os.system(full_ssh_command))
+
+    def scp_to_node(self, username, hostname, target_dir, files):
+        '''
+        Send one or more files to a cluster node via SSH.
+        TODO Refactor to someplace else, with configuration options.
+        '''
+        node = self.node_by_name(hostname)
+
+        # determine if "-r" should be added
+        rflag = recursive_flag(files)
+
+        scp_command = '/usr/bin/scp -o "StrictHostKeyChecking=no" -o "GSSAPIAuthentication=no" \
+            %s %s %s'
+
+        target = '%s@%s:%s' % (username, node.ip_address, target_dir)
+        full_scp_command = scp_command % (rflag, ' '.join(files), target)
+
+        self.logger.debug(full_scp_command)
+        return exit_code(os.system(full_scp_command))
+
+    def check_reachable(self, purpose):
+        '''
+        Raises ValueError if the host cannot reach the nodes (macvlan or ipvlan network).
+        '''
+        driver = self.cluster_specs['network'].get('driver', 'bridge')
+        networking.check_reachable_from_host(driver, purpose)
+
+    def node_by_name(self, hostname):
+        '''
+        Search the nodes for the node that has the hostname.
+        '''
+        return next(a_node for a_node in self.ordered_nodes if a_node.hostname == hostname)
+
+
+class RunningClusterMixin(SshMixin):
     '''
     A mixin class that adds functionality applicable to clusters that have already been
     deployed (as opposed to planned clusters).
@@ -26,6 +82,48 @@ class RunningClusterMixin(logger.LoggerMixin):
         for n in self.ordered_nodes:
             n.container.stop()
 
+    def pause(self):
+        '''
+        Freezes the docker cluster, by pausing all its containers concurrently (cgroup freezer).
+        Processes keep their in-memory state and resume where they left when calling unpause().
+        Returns the number of nodes that were paused.
+        '''
+        running_nodes = [n for n in self.ordered_nodes if not n.is_paused]
+        parallel.map_concurrently(lambda node: node.pause(), running_nodes)
+        return len(running_nodes)
+
+    def unpause(self):
+        '''
+        Thaws a paused docker cluster, by unpausing all its containers concurrently.
+        Returns the number of nodes that were unpaused.
+        '''
+        paused_nodes = [n for n in self.ordered_nodes if n.is_paused]
+        parallel.map_concurrently(lambda node: node.unpause(), paused_nodes)
+        return len(paused_nodes)
+
+    @property
+    def is_paused(self):
+        '''
+        True iff the cluster has nodes and all of them are paused.
+        '''
+        return bool(self.ordered_nodes) and all(n.is_paused for n in self.ordered_nodes)
+
+    def cpu_usage_usec(self):
+        '''
+        Total CPU time consumed by the cluster in microseconds. Reads the parent cgroup if
+        possible, otherwise adds the usage reported by Docker for each node.
+        '''
+        usage = None
+        if main_config.cgroups('enabled'):
+            usage = self.cgroup.cpu_usage_usec()
+
+        if usage is None:
+            node_usages = parallel.map_concurrently(lambda node: node.cpu_usage_usec(),
+                                                    self.ordered_nodes)
+            usage = sum(node_usages)
+
+        return usage
+
     def start(self):
         self.logger.debug('Starting containers of cluster: {}'.format(self.name))
 
@@ -76,50 +174,117 @@ class RunningClusterMixin(logger.LoggerMixin):
             n.container.remove()
 
         self.cluster_network.remove()
+        networking.remove_data(self.name)
 
-    def ssh_to_node(self, username, hostname):
+        if main_config.cgroups('enabled'):
+            self.cgroup.remove()
+
+    @property
+    def cgroup(self):
         '''
-        Connect to a cluster node via SSH.
-        TODO Refactor to someplace else, with configuration options.
+        Handle for the parent cgroup of the cluster.
         '''
-        node = self.node_by_name(hostname)
-        ssh_command = '/usr/bin/ssh -o "StrictHostKeyChecking=no" -o "GSSAPIAuthentication=no" \
--o "UserKnownHostsFile /dev/null" -o "LogLevel ERROR" %s'
-
-        target = '%s@%s' % (username, node.ip_address)
-        full_ssh_command = ssh_command % target
-        # subprocess.run(full_ssh_command, shell=True)
-        os.system(full_ssh_command)
+        return cgroups.ClusterCgroup.for_cluster(self.name)
 
-    def scp_to_node(self, username, hostname, target_dir, files):
+    def stats(self):
         '''
-        Send one or more files to a cluster node via SSH.
-        TODO Refactor to someplace else, with configuration options.
+        Aggregate usage of the cluster, read from its parent cgroup.
         '''
-        node = self.node_by_name(hostname)
+        stats = {
+            'name': self.name,
+            'nodes': len(self.ordered_nodes),
+            'usage': self.cgroup.usage()
+        }
 
-        # determine if "-r" should be added
-        rflag = recursive_flag(files)
+        # the statistics of ccache are kept in the shared volume, any running node that mounts it
+        # will do (commands cannot run on paused or stopped nodes)
+        for node in self.ordered_nodes:
+            if not node.can_exec:
+                continue
+            if caches.COMPILER_CACHE in caches.mounted_caches(node.container.attrs.get('Mounts')):
+                stats['compiler_cache'] = node.compiler_cache_stats()
+                break
 
-        scp_command = '/usr/bin/scp -o "StrictHostKeyChecking=no" -o "GSSAPIAuthentication=no" \
-            %s %s %s'
+        return stats
 
-        target = '%s@%s:%s' % (username, node.ip_address, target_dir)
-        full_scp_command = scp_command % (rflag, ' '.join(files), target)
+    def exec_on_nodes(self, command, nodes=None):
+        '''
+        Runs a command on the nodes of the cluster concurrently (all nodes if not given).
+        Returns a list of TaskResult in the order of the nodes, each result is a pair
+        (exit_code, output).
+        '''
+        if nodes is None:
+            nodes = self.ordered_nodes
+        return parallel.run_concurrently(lambda node: node.exec_command(command), nodes)
 
-        self.logger.debug(full_scp_command)
-        os.system(full_scp_command)
+    def emulate(self, network_name, settings):
+        '''
+        Applies interconnect emulation settings to the nodes attached to a network of the
+        cluster, concurrently. No settings remove the emulation.
+        '''
+        nodes = [n for n in self.ordered_nodes if n.address_in(network_name) is not None]
+        parallel.map_concurrently(lambda node: node.emulate(network_name, settings), nodes)
 
-    def node_by_name(self, hostname):
+    def start_dns(self):
         '''
-        Search the nodes for the node that has the hostname.
+        Starts the DNS responder on the head, if the cluster has one (see cluster.dns). Nothing
+        happens if the responder is already running.
         '''
-        return next(a_node for a_node in self.ordered_nodes if a_node.hostname == hostname)
+        if not dns.has_dns(self.name):
+            return
+
+        heads = [n for n in self.ordered_nodes if n.role == 'head']
+        if heads:
+            self.logger.debug('Starting DNS responder on {}'.format(heads[0].hostname))
+            heads[0].exec_command(dns.responder_command(dns.cluster_domain(self.name)),
+                                  detach=True)
 
-    def inject_public_ssh_key(self, public_key_path):
+    def probe_network(self, network_name, pings=10, seconds=0):
+        '''
+        Measures the effective round trip time from the head to each other node in a network of
+        the cluster, and the throughput with iperf3 for the given number of seconds (0 to skip).
+        Returns a list of netem.ProbeResult. Raises netem.ProbeFailure if ping (or iperf3) is not
+        installed in the image.
         '''
-        Reads the public SSH key specified in the path, and injects it to each container.
-        For now, it will inject it to the root user.
+        heads = [n for n in self.ordered_nodes if n.role == 'head'] or self.ordered_nodes
+        targets = [n for n in self.ordered_nodes
+                   if n is not heads[0] and n.address_in(network_name) is not None]
+
+        # the output of a missing tool would be parsed as a measurement
+        required = [(heads[0], 'ping')]
+        if seconds:
+            required.extend([(node, 'iperf3') for node in [heads[0]] + targets])
+        for (node, command_name) in required:
+            if not node.has_command(command_name):
+                msg = '{} is not installed in {}, it is needed to probe the network'
+                raise netem.ProbeFailure(msg.format(command_name, node.hostname))
+
+        results = []
+        for target in targets:
+            # one at a time, so that the measurements do not compete for the links
+            target_ip = target.address_in(network_name)
+            (rtt, throughput, error) = (None, None, None)
+            try:
+                ping_cmd = 'ping -c {} -i 0.2 {}'.format(pings, target_ip)
+                (exit_code, ping_output) = heads[0].exec_command(ping_cmd)
+                if exit_code != 0:
+                    raise netem.ProbeFailure('ping failed: {}'.format(ping_output.strip()))
+                rtt = netbench.parse_ping(ping_output)
+                if seconds:
+                    # a server for a single test, in the background
+                    target.exec_command('iperf3 -s -1 -D')
+                    iperf_cmd = 'iperf3 -J -c {} -t {}'.format(target_ip, seconds)
+                    throughput = netbench.parse_iperf3(heads[0].exec_command(iperf_cmd)[1])
+            except Exception as e:
+                error = str(e)
+            results.append(netem.ProbeResult(target.hostname, rtt, throughput, error))
+
+        return results
+
+    def inject_public_ssh_key(self, public_key_path, hostnames=None):
+        '''
+        Reads the public SSH key specified in the path, and injects it to each container
+        (or to the nodes with the given hostnames). For now, it will inject it to the root user.
         '''
         # sanity check: key should exist
         if not os.path.exists(public_key_path):
@@ -134,7 +299,14 @@ class RunningClusterMixin(logger.LoggerMixin):
         self.logger.debug('Read public key: %s' % public_key)
 
         for n in self.ordered_nodes:
-            n.inject_public_ssh_key(ssh_target_path, public_key)
+            if hostnames is None or n.hostname in hostnames:
+                n.inject_public_ssh_key(ssh_target_path, public_key)
+
+    def keep_package_cache(self):
+        '''
+        Configures the package manager of all nodes to keep downloaded packages, concurrently.
+        '''
+        parallel.map_concurrently(lambda n: n.keep_package_cache(), self.ordered_nodes)
 
     def fix_init_if_needed(self):
         '''
@@ -187,6 +359,10 @@ class DeployedCluster(ClusterBlueprint, RunningClusterMixin):
             }
         }
 
+        # like the planned network, only tuned networks record their driver
+        if cluster_network.driver != 'bridge':
+            partial_cluster_specs['network']['driver'] = cluster_network.driver
+
         return DeployedCluster(cluster_network, partial_cluster_specs)
 
     @classmethod
@@ -198,6 +374,13 @@ class DeployedCluster(ClusterBlueprint, RunningClusterMixin):
         return [DockerNaming.deduce_cluster_name(network.name) for network in docker_networks]
 
 
+def exit_code(wait_status):
+    '''
+    Exit code of a command run with os.system().
+    '''
+    return wait_status >> 8
+
+
 def recursive_flag(files):
     '''
     Detects whether to add '-r' to scp to handle recursive copy.
@@ -0,0 +1,167 @@
+'''
+MPI hostfiles and rankfile generated from the blueprint of a cluster.
+
+The files are written to the composer workpath of the cluster (mpi/) and mounted read-only on the
+head at /etc/dcluster/mpi, so that launch scripts know the parallelism of the cluster:
+
+- hostfile.openmpi: 'node001 slots=2', for mpirun --hostfile (Open MPI)
+- hostfile.mpich: 'node001:2', for mpiexec -f (MPICH, Intel MPI)
+- rankfile: 'rank 0=node001 slot=0', one rank per slot (Open MPI), only if a cpuset is known
+- mpi.env: DCLUSTER_MPI_NP (total slots) and the paths of the hostfiles, to be sourced
+
+The slots of a node are the CPUs of its cpuset, else its CPU limit, else 1. The nodes are ordered
+by IP address, the ranks of a node follow the order of its cpuset (its NUMA placement). If the
+cluster has a data network, the nodes are named by their data addresses, e.g. node001-data.
+'''
+
+import ipaddress
+import math
+import os
+
+from dcluster.util import fs as fs_util
+
+# where the files are mounted on the head
+MPI_MOUNT = '/etc/dcluster/mpi'
+
+# roles that run MPI ranks, the head is used if a cluster has none of them
+MPI_ROLES = ('compute',)
+
+
+def parse_cpuset(cpuset):
+    '''
+    List of the CPUs of a cpuset, in order, e.g. '0-3,8' -> [0, 1, 2, 3, 8]
+    '''
+    cpus = []
+    for part in str(cpuset).split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            (first, last) = part.split('-')
+            cpus.extend(range(int(first), int(last) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def node_cpus(resources):
+    '''
+    The CPUs that a node can use according to its cpuset, None if it has no cpuset.
+    '''
+    if resources and resources.get('cpuset') is not None:
+        return parse_cpuset(resources['cpuset'])
+    return None
+
+
+def node_slots(resources):
+    '''
+    Number of MPI slots of a node: CPUs in its cpuset, else its CPU limit (at least 1), else 1.
+    '''
+    cpus = node_cpus(resources)
+    if cpus:
+        return len(cpus)
+
+    if resources and resources.get('cpus') is not None:
+        return max(1, int(math.floor(float(resources['cpus']))))
+
+    return 1
+
+
+def mpi_nodes(cluster_specs):
+    '''
+    The nodes that run MPI ranks, ordered by IP address.
+    '''
+    nodes = [node for node in cluster_specs['nodes'].values() if node.role in MPI_ROLES]
+    if not nodes:
+        nodes = [node for node in cluster_specs['nodes'].values() if node.role == 'head']
+
+    return sorted(nodes, key=lambda node: ipaddress.ip_address(u'{}'.format(node.ip_address)))
+
+
+def mpi_host(node):
+    '''
+    The name of a node for MPI, on the data network if the cluster has one.
+    '''
+    if getattr(node, 'data_ip_address', None):
+        return node.hostname + '-data'
+    return node.hostname
+
+
+def openmpi_hostfile(nodes):
+    lines = [
+        '{} slots={}'.format(mpi_host(node), node_slots(getattr(node, 'resources', None)))
+        for node in nodes
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+def mpich_hostfile(nodes):
+    lines = [
+        '{}:{}'.format(mpi_host(node), node_slots(getattr(node, 'resources', None)))
+        for node in nodes
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+def rankfile(nodes):
+    '''
+    An Open MPI rankfile that binds each rank to a CPU of the cpuset of its node.
+    Returns None unless all the nodes have a cpuset.
+    '''
+    lines = []
+    rank = 0
+    for node in nodes:
+        cpus = node_cpus(getattr(node, 'resources', None))
+        if not cpus:
+            return None
+
+        for cpu in cpus:
+            lines.append('rank {}={} slot={}'.format(rank, mpi_host(node), cpu))
+            rank += 1
+
+    return '\n'.join(lines) + '\n'
+
+
+def mpi_env(nodes, has_rankfile):
+    total_slots = sum([node_slots(getattr(node, 'resources', None)) for node in nodes])
+    lines = [
+        'DCLUSTER_MPI_NP={}'.format(total_slots),
+        'DCLUSTER_MPI_HOSTFILE={}/hostfile.openmpi'.format(MPI_MOUNT),
+        'DCLUSTER_MPICH_HOSTFILE={}/hostfile.mpich'.format(MPI_MOUNT)
+    ]
+    if has_rankfile:
+        lines.append('DCLUSTER_MPI_RANKFILE={}/rankfile'.format(MPI_MOUNT))
+    return '\n'.join(lines) + '\n'
+
+
+def mpi_files(cluster_specs):
+    '''
+    Contents of the MPI files of a cluster, as a dictionary filename -> text.
+    '''
+    nodes = mpi_nodes(cluster_specs)
+    files = {
+        'hostfile.openmpi': openmpi_hostfile(nodes),
+        'hostfile.mpich': mpich_hostfile(nodes)
+    }
+
+    ranks = rankfile(nodes)
+    if ranks is not None:
+        files['rankfile'] = ranks
+
+    files['mpi.env'] = mpi_env(nodes, ranks is not None)
+    return files
+
+
+def write_mpi_files(cluster_specs, mpi_dir):
+    '''
+    Writes the MPI files of a cluster to a directory, returns the paths of the files.
+    '''
+    fs_util.create_dir_dont_complain(mpi_dir)
+
+    paths = []
+    for (filename, contents) in sorted(mpi_files(cluster_specs).items()):
+        path = os.path.join(mpi_dir, filename)
+        with open(path, 'w') as mpi_file:
+            mpi_file.write(contents)
+        paths.append(path)
+    return paths
@@ -1,6 +1,11 @@
+import ipaddress
+import os
+
+from . import dns
 from .blueprint import ClusterBlueprint
 
 from dcluster.config import main_config
+from dcluster.infra import caches, cgroups, netem
 from dcluster.util import collection as collection_util
 from dcluster.util import logger
 
@@ -54,10 +59,13 @@ class DefaultClusterPlan(logger.LoggerMixin):
     }
     '''
 
-    def __init__(self, cluster_network, plan_data, node_planner):
+    def __init__(self, cluster_network, plan_data, node_planner, data_network=None,
+                 compute_ips=None):
         self.cluster_network = cluster_network
         self.plan_data = collection_util.defensive_copy(plan_data)
         self.node_planner = node_planner
+        self.data_network = data_network
+        self.compute_ips = compute_ips
 
     def create_blueprints(self):
         '''
@@ -126,12 +134,18 @@ class DefaultClusterPlan(logger.LoggerMixin):
         cluster_specs = collection_util.defensive_subset(plan_data, ('profile', 'name', 'template'))
         cluster_specs['network'] = cluster_network.as_dict()
 
+        # bulk traffic between the nodes can use a separate network
+        if self.data_network is not None:
+            cluster_specs['data_network'] = self.data_network.as_dict()
+
         # always have a head
         head_plan = node_planner.create_head_plan(plan_data)
         cluster_specs['nodes'] = {head_plan.ip_address: head_plan}
 
-        # create <compute_count> nodes
-        compute_ips = cluster_network.compute_ips(plan_data['compute_count'])
+        # create <compute_count> nodes, a cluster that is scaled keeps the addresses of its nodes
+        compute_ips = self.compute_ips
+        if compute_ips is None:
+            compute_ips = cluster_network.compute_ips(plan_data['compute_count'])
         for index, compute_ip in enumerate(compute_ips):
             compute_plan = node_planner.create_compute_plan(plan_data, index, compute_ip)
             cluster_specs['nodes'][compute_plan.ip_address] = compute_plan
@@ -140,6 +154,20 @@ class DefaultClusterPlan(logger.LoggerMixin):
         cluster_specs['bootstrap_dir'] = main_config.paths('bootstrap')
 
         self.__handle_volume_specs(cluster_specs)
+        self.__handle_cache_specs(cluster_specs)
+        self.__handle_cgroup_specs(cluster_specs)
+        self.__handle_cpuset_specs(cluster_specs)
+        self.__handle_emulation_specs(cluster_specs)
+
+        # MPI hostfiles are written here and mounted on the head
+        cluster_specs['mpi_dir'] = os.path.join(main_config.composer_workpath(plan_data['name']),
+                                                'mpi')
+
+        self.__handle_dns_specs(cluster_specs)
+
+        # Slurm configuration is generated from the specs when deploying
+        if self.plan_data.get('slurm'):
+            cluster_specs['slurm'] = self.plan_data['slurm']
 
         return cluster_specs
 
@@ -174,16 +202,104 @@ class DefaultClusterPlan(logger.LoggerMixin):
         ]
         cluster_specs['volumes'] = volumes_entry
 
+    def __handle_cache_specs(self, cluster_specs):
+        '''
+        The cache volumes are shared by clusters, so they are declared as external in the
+        'volumes' root item and created before deploying. Here we add them to cluster_specs as a
+        dictionary of volume name -> kind of cache, only if there are any.
+        '''
+        external_volumes = {}
+        for node_plan in cluster_specs['nodes'].values():
+            for cache_volume in caches.cache_volumes(self.plan_data, node_plan.image):
+                external_volumes[cache_volume.name] = cache_volume.kind
+
+        if external_volumes:
+            cluster_specs['external_volumes'] = external_volumes
+
+    def __handle_cgroup_specs(self, cluster_specs):
+        '''
+        Place all the containers of the cluster under a parent cgroup (cgroup_parent), so that
+        the whole cluster can be capped and accounted for in a single place.
+
+        The aggregate limits can be set in the profile ('cgroup' entry), and overridden by the
+        user request. They are only added to cluster_specs if present.
+        '''
+        if not main_config.cgroups('enabled'):
+            return
+
+        cluster_specs['cgroup_parent'] = cgroups.cgroup_parent_name(self.plan_data['name'])
+
+        limits = cgroups.merge_limits(self.plan_data.get('cgroup'),
+                                      self.plan_data.get('cgroup_limits'))
+        if limits:
+            cluster_specs['cgroup_limits'] = limits
+
+    def __handle_cpuset_specs(self, cluster_specs):
+        '''
+        The resources of a role can have a cpuset, e.g. '0-3', that applies to all its nodes,
+        or a list of cpusets that are assigned to its nodes in order of IP address (and reused
+        if there are more nodes than cpusets). Each node gets its own cpuset in its resources.
+        '''
+        nodes = cluster_specs['nodes']
+        for role in ('head', 'compute'):
+            resources = self.plan_data[role].get('resources') or {}
+            cpusets = resources.get('cpuset')
+            if not isinstance(cpusets, list) or not cpusets:
+                continue
+
+            role_ips = sorted([ip for (ip, node) in nodes.items() if node.role == role],
+                              key=lambda ip: ipaddress.ip_address(u'{}'.format(ip)))
+            for (index, ip) in enumerate(role_ips):
+                node_resources = dict(resources)
+                node_resources['cpuset'] = cpusets[index % len(cpusets)]
+                nodes[ip] = nodes[ip]._replace(resources=node_resources)
+
+    def __handle_emulation_specs(self, cluster_specs):
+        '''
+        The 'network' and 'data_network' entries of the profile can ask for interconnect
+        emulation (see infra.netem). The settings are added to cluster_specs as a dictionary of
+        network name -> settings, only if there are any. The nodes get NET_ADMIN.
+        '''
+        emulation = {}
+        networks = ((self.cluster_network, self.plan_data.get('network')),
+                    (self.data_network, self.plan_data.get('data_network')))
+        for (network, profile_network) in networks:
+            settings = netem.emulation_settings(profile_network)
+            if network is not None and settings is not None:
+                emulation[network.network_name] = settings
+
+        if emulation:
+            cluster_specs['emulation'] = emulation
+
+    def __handle_dns_specs(self, cluster_specs):
+        '''
+        The profile can ask for a DNS responder on the head (see cluster.dns). The nodes use the
+        head as nameserver, the records are written to the workpath when deploying.
+        '''
+        if not self.plan_data.get('dns'):
+            return
+
+        cluster_name = self.plan_data['name']
+        cluster_specs['dns'] = {
+            'dir': dns.dns_dir(cluster_name),
+            'server': self.cluster_network.head_ip(),
+            'domain': dns.cluster_domain(cluster_name)
+        }
+
     @classmethod
-    def create(cls, creation_request, default_config, cluster_network):
+    def create(cls, creation_request, default_config, cluster_network, data_network=None,
+               compute_ips=None, data_ips=None):
         '''
         Build plan based on user request, existing configuration and a existing network.
         The parameters in the user request are merged with existing configuration.
+        The addresses of the compute nodes and their data addresses can be given, in order of
+        hostname.
         '''
 
         plan_data = user_plan_data(default_config, creation_request)
-        node_planner = DefaultNodePlanner(cluster_network)
-        return DefaultClusterPlan(cluster_network, plan_data, node_planner)
+        node_planner = DefaultNodePlanner(cluster_network, data_network, data_ips)
+        return DefaultClusterPlan(cluster_network, plan_data, node_planner, data_network,
+                                  compute_ips)
 
 
 # class ExtendedClusterPlan(BasicClusterPlan):
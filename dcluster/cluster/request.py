@@ -1,7 +1,130 @@
+import os
+import yaml
+
 from collections import namedtuple
 
+from dcluster.config import main_config
+from dcluster.util import fs as fs_util
+
 
 # information expected from the user when building a 'default' cluster
 DefaultCreationRequest = namedtuple('DefaultCreationRequest',
                                     ['name', 'compute_count', 'profile', 'profile_paths',
-                                     'playbooks', 'extra_vars_list'])
+                                     'playbooks', 'extra_vars_list', 'cgroup_limits',
+                                     'admission_wait', 'keep_on_failure', 'images',
+                                     'image_cache'])
+
+# images: optional dictionary that overrides the image of the profile, keyed by hostname or role
+# image_cache: reuse the images that result from the playbooks, None to use the configuration
+
+# optional fields, keep them last so that requests can still be created with positional arguments
+DefaultCreationRequest.__new__.__defaults__ = (None, None, False, None, None)
+
+# keys of a cluster entry in a manifest for create-many, mapped to the fields of the request
+MANIFEST_KEYS = ('name', 'replicas', 'compute_count', 'profile', 'profile_paths', 'playbooks',
+                 'extra_vars', 'cpu_max', 'memory_max', 'cpu_weight', 'wait', 'keep_on_failure',
+                 'image_cache')
+
+
+def requests_from_manifest(manifest, profile_paths=None):
+    '''
+    Builds a DefaultCreationRequest for each cluster in a manifest (dictionary), e.g.
+
+    parallel: 4
+    defaults:
+      profile: simple
+      compute_count: 2
+    clusters:
+      - name: training
+        replicas: 10        # training-01 ... training-10
+      - name: ci
+        profile: slurm
+        compute_count: 4
+
+    Entries accept the same options as 'dcluster create', unset options are taken from
+    'defaults'. Additional profile paths apply to all the clusters.
+    Raises ValueError if the manifest cannot be understood.
+    '''
+    defaults = manifest.get('defaults') or {}
+    entries = manifest.get('clusters') or []
+    if not entries:
+        raise ValueError('Manifest has no clusters')
+
+    creation_requests = []
+    for entry in entries:
+        cluster_entry = dict(defaults)
+        cluster_entry.update(entry)
+
+        unknown_keys = set(cluster_entry.keys()) - set(MANIFEST_KEYS)
+        if unknown_keys:
+            raise ValueError('Unknown keys in manifest: {}'.format(sorted(unknown_keys)))
+        if 'name' not in entry:
+            raise ValueError('Manifest entry without a name: {}'.format(entry))
+
+        entry_profile_paths = list(cluster_entry.get('profile_paths') or [])
+        entry_profile_paths.extend(profile_paths or [])
+
+        cgroup_limits = {
+            'cpu_max': cluster_entry.get('cpu_max'),
+            'memory_max': cluster_entry.get('memory_max'),
+            'weight': cluster_entry.get('cpu_weight')
+        }
+
+        for cluster_name in replica_names(cluster_entry['name'], cluster_entry.get('replicas')):
+            creation_request = DefaultCreationRequest(
+                cluster_name, int(cluster_entry.get('compute_count', 1)),
+                cluster_entry.get('profile', 'simple'), entry_profile_paths,
+                list(cluster_entry.get('playbooks') or []),
+                list(cluster_entry.get('extra_vars') or []),
+                cgroup_limits=cgroup_limits,
+                admission_wait=cluster_entry.get('wait'),
+                keep_on_failure=bool(cluster_entry.get('keep_on_failure', False)),
+                image_cache=cluster_entry.get('image_cache'))
+            creation_requests.append(creation_request)
+
+    return creation_requests
+
+
+def replica_names(name, replicas=None):
+    '''
+    Names of the replicas of a cluster, e.g. ('train', 3) -> ['train-01', 'train-02', 'train-03'].
+    Without replicas, the name is used as-is.
+    '''
+    if replicas is None:
+        return [name]
+
+    width = max(2, len(str(replicas)))
+    return ['{}-{}'.format(name, str(index).zfill(width)) for index in range(1, replicas + 1)]
+
+
+def request_path(cluster_name):
+    '''
+    Where to keep the creation request of a cluster, used to plan the cluster again when it is
+    scaled.
+    '''
+    return os.path.join(main_config.composer_workpath(cluster_name), 'request.yml')
+
+
+def save_request(creation_request):
+    filename = request_path(creation_request.name)
+    fs_util.create_dir_dont_complain(os.path.dirname(filename))
+    with open(filename, 'w') as request_file:
+        yaml.safe_dump(dict(creation_request._asdict()), request_file, default_flow_style=False)
+
+
+def load_request(cluster_name):
+    '''
+    The creation request of a cluster, None if it was not recorded (e.g. clusters created by
+    older versions of dcluster).
+    '''
+    filename = request_path(cluster_name)
+    if not os.path.isfile(filename):
+        return None
+
+    with open(filename, 'r') as request_file:
+        request_dict = yaml.safe_load(request_file)
+
+    # ignore fields of other versions
+    fields = dict([(key, value) for (key, value) in request_dict.items()
+                   if key in DefaultCreationRequest._fields])
+    return DefaultCreationRequest(**fields)
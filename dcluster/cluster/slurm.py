@@ -0,0 +1,263 @@
+'''
+Slurm configuration generated from the blueprint of a cluster.
+
+Profiles with a 'slurm' entry get a slurm.conf that matches the planned nodes, and a new munge key.
+Both are written to the Docker volumes of the head (/etc/slurm and /etc/munge) after the containers
+are created and before they start, so that slurmctld and slurmd come up ready. Example entry:
+
+    slurm:
+      controller: head          # role of the node that runs slurmctld
+      node_roles: [compute]     # roles that run slurmd, one partition per role
+      options:                  # added to slurm.conf as Key=Value
+        SchedulerType: sched/backfill
+
+CPUs (cpuset or cpus) and RealMemory are taken from the resources of each role, if any.
+'''
+
+import io
+import math
+import os
+import re
+import tarfile
+import time
+
+from dcluster.config import main_config
+from dcluster.infra.docker_facade import get_client
+from dcluster.runtime import JinjaRenderer
+from dcluster.util import logger, units
+
+from . import mpi
+
+SLURM_CONF_TEMPLATE = 'slurm.conf.j2'
+
+# where the configuration is written, relative to the root of the head container
+SLURM_CONF_PATH = 'etc/slurm/slurm.conf'
+MUNGE_KEY_PATH = 'etc/munge/munge.key'
+
+# munge requires a key of at least 32 bytes, the default of create-munge-key is 1024
+MUNGE_KEY_SIZE = 1024
+
+# options of slurm.conf, the profile can override them or add more
+DEFAULT_OPTIONS = {
+    'SlurmUser': 'slurm',
+    'AuthType': 'auth/munge',
+    'SlurmctldPort': 6817,
+    'SlurmdPort': 6818,
+    'StateSaveLocation': '/var/spool/slurmctld',
+    'SlurmdSpoolDir': '/var/spool/slurmd',
+    'SlurmctldLogFile': '/var/log/slurm/slurmctld.log',
+    'SlurmdLogFile': '/var/log/slurm/slurmd.log',
+    'SwitchType': 'switch/none',
+    'MpiDefault': 'none',
+    'ProctrackType': 'proctrack/linuxproc',
+    'ReturnToService': 2,
+    'SchedulerType': 'sched/backfill',
+    'SelectType': 'select/cons_res',
+    'SelectTypeParameters': 'CR_Core_Memory'
+}
+
+DEFAULT_SETTINGS = {
+    'controller': 'head',
+    'node_roles': ['compute'],
+    'options': {}
+}
+
+
+def slurm_settings(profile_slurm):
+    '''
+    Settings of the profile ('slurm' entry) merged with the defaults.
+    '''
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update(profile_slurm or {})
+    return settings
+
+
+def compress_hostlist(hostnames):
+    '''
+    Compresses hostnames to a Slurm hostlist expression, e.g.
+    ['node001', 'node002', 'node003', 'node005'] -> 'node[001-003,005]'
+    Hostnames without a numeric suffix are listed as they are.
+    '''
+    by_prefix = {}
+    plain = []
+    for hostname in hostnames:
+        match = re.match(r'^(.*?)(\d+)$', hostname)
+        if match is None:
+            plain.append(hostname)
+        else:
+            (prefix, suffix) = match.groups()
+            by_prefix.setdefault((prefix, len(suffix)), []).append(int(suffix))
+
+    expressions = list(plain)
+    for ((prefix, width), numbers) in sorted(by_prefix.items()):
+        numbers = sorted(set(numbers))
+        if len(numbers) == 1:
+            expressions.append('{}{:0{}d}'.format(prefix, numbers[0], width))
+            continue
+
+        # group consecutive numbers into ranges
+        ranges = []
+        start = previous = numbers[0]
+        for number in numbers[1:] + [None]:
+            if number is not None and number == previous + 1:
+                previous = number
+                continue
+            if start == previous:
+                ranges.append('{:0{}d}'.format(start, width))
+            else:
+                ranges.append('{:0{}d}-{:0{}d}'.format(start, width, previous, width))
+            start = previous = number
+
+        expressions.append('{}[{}]'.format(prefix, ','.join(ranges)))
+
+    return ','.join(expressions)
+
+
+def node_hardware(resources):
+    '''
+    CPUs and RealMemory (in MB) for slurm.conf, given the resources of a node. None if unknown.
+    '''
+    resources = resources or {}
+
+    cpus = None
+    if resources.get('cpuset') is not None:
+        cpus = len(mpi.parse_cpuset(resources['cpuset']))
+    elif resources.get('cpus') is not None:
+        cpus = max(1, int(math.floor(float(resources['cpus']))))
+
+    real_memory = None
+    if resources.get('memory') is not None:
+        real_memory = units.parse_size(resources['memory']) // (1024 ** 2)
+
+    return (cpus, real_memory)
+
+
+def slurm_conf_specs(cluster_specs):
+    '''
+    The replacements for the slurm.conf template, given the specs of a cluster blueprint.
+    Nodes of a role with the same hardware are grouped in a single NodeName line.
+    '''
+    settings = slurm_settings(cluster_specs.get('slurm'))
+    nodes = sorted(cluster_specs['nodes'].values(), key=lambda node: node.hostname)
+
+    controller = [node for node in nodes if node.role == settings['controller']][0]
+
+    node_groups = {}
+    partitions = []
+    for role in settings['node_roles']:
+        role_nodes = [node for node in nodes if node.role == role]
+        if not role_nodes:
+            continue
+
+        for node in role_nodes:
+            hardware = node_hardware(getattr(node, 'resources', None))
+            node_groups.setdefault(hardware, []).append(node.hostname)
+
+        partitions.append({
+            'name': role,
+            'nodes': compress_hostlist([node.hostname for node in role_nodes]),
+            'default': not partitions
+        })
+
+    node_lines = [
+        {
+            'nodes': compress_hostlist(hostnames),
+            'cpus': cpus,
+            'real_memory': real_memory
+        }
+        for ((cpus, real_memory), hostnames) in sorted(node_groups.items(),
+                                                       key=lambda item: item[1][0])
+    ]
+
+    options = dict(DEFAULT_OPTIONS)
+    options.update(settings['options'] or {})
+
+    return {
+        'name': cluster_specs['name'],
+        'controller': controller,
+        'node_lines': node_lines,
+        'partitions': partitions,
+        'options': options
+    }
+
+
+def render_slurm_conf(cluster_specs, renderer=None):
+    '''
+    Renders the slurm.conf of a cluster.
+    '''
+    if renderer is None:
+        renderer = JinjaRenderer(main_config.paths('templates'))
+    return renderer.render_blueprint(slurm_conf_specs(cluster_specs), SLURM_CONF_TEMPLATE)
+
+
+def parse_passwd(passwd_contents):
+    '''
+    Dictionary of user -> (uid, gid) from the contents of /etc/passwd.
+    '''
+    users = {}
+    for line in passwd_contents.splitlines():
+        fields = line.split(':')
+        if len(fields) >= 4 and fields[2].isdigit() and fields[3].isdigit():
+            users[fields[0]] = (int(fields[2]), int(fields[3]))
+    return users
+
+
+def config_archive(slurm_conf, munge_key, users):
+    '''
+    A tar archive with slurm.conf and the munge key, owned by the slurm and munge users of the
+    image if they exist (else root). Returns the archive as bytes.
+    '''
+    entries = (
+        (SLURM_CONF_PATH, slurm_conf.encode('utf-8'), 'slurm', 0o644),
+        (MUNGE_KEY_PATH, munge_key, 'munge', 0o400)
+    )
+
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode='w') as tar:
+        for (path, contents, user, mode) in entries:
+            tarinfo = tarfile.TarInfo(path)
+            tarinfo.size = len(contents)
+            tarinfo.mode = mode
+            tarinfo.mtime = int(time.time())
+            (tarinfo.uid, tarinfo.gid) = users.get(user, (0, 0))
+            tar.addfile(tarinfo, io.BytesIO(contents))
+
+    return archive.getvalue()
+
+
+class SlurmConfigurator(logger.LoggerMixin):
+    '''
+    Writes the Slurm configuration of a cluster to the volumes of its controller, requires the
+    containers to exist (they do not need to be running).
+    '''
+
+    def __init__(self, cluster_specs, renderer=None):
+        self.cluster_specs = cluster_specs
+        self.renderer = renderer
+
+    def configure(self):
+        specs = slurm_conf_specs(self.cluster_specs)
+        container = get_client().containers.get(specs['controller'].container)
+
+        slurm_conf = render_slurm_conf(self.cluster_specs, self.renderer)
+        munge_key = os.urandom(MUNGE_KEY_SIZE)
+        archive = config_archive(slurm_conf, munge_key, self.__image_users(container))
+
+        if not container.put_archive('/', archive):
+            raise ValueError('Could not write Slurm configuration to {}'.format(container.name))
+
+        self.logger.info('Wrote slurm.conf and munge key to {}'.format(container.name))
+
+    def __image_users(self, container):
+        '''
+        Reads /etc/passwd of the container, the slurm and munge users depend on the image.
+        '''
+        try:
+            (stream, _) = container.get_archive('/etc/passwd')
+            tar_bytes = b''.join(stream)
+            with tarfile.open(fileobj=io.BytesIO(tar_bytes)) as tar:
+                passwd = tar.extractfile(tar.getmembers()[0]).read().decode('utf-8')
+            return parse_passwd(passwd)
+        except Exception as e:
+            self.logger.warning('Could not read users of {}: {}'.format(container.name, e))
+            return {}
@@ -0,0 +1,139 @@
+'''
+Snapshots of configured clusters.
+
+A snapshot commits the container of each node to an image, and records the blueprint of the
+cluster in a manifest under the work path, e.g. snapshots/mytag.yml:
+
+    tag: mytag
+    source: mycluster
+    created: '2019-11-04 10:20:00'
+    profile: slurm
+    compute_count: 2
+    nodes:
+      head: {role: head, image: 'dcluster-snapshot:mytag-head'}
+      node001: {role: compute, image: 'dcluster-snapshot:mytag-node001'}
+      node002: {role: compute, image: 'dcluster-snapshot:mytag-node002'}
+
+A clone is a new cluster that uses the images of the snapshot. The planner assigns the network,
+the IP addresses and the container names of the new cluster, the hostnames are kept.
+
+Docker volumes are not part of the images, the clone starts with new volumes.
+'''
+
+import os
+import time
+import yaml
+
+from dcluster.config import dansible_config, main_config
+from dcluster.util import fs as fs_util
+from dcluster.util import dyaml, logger, parallel
+
+from .request import DefaultCreationRequest
+
+# all snapshot images share a repository, the tag identifies the snapshot and the node
+SNAPSHOT_REPOSITORY = 'dcluster-snapshot'
+
+# label set on each snapshot image
+SNAPSHOT_LABEL = 'bull.com.dcluster.snapshot'
+
+
+class SnapshotNotFound(Exception):
+    '''
+    Raised when a snapshot manifest does not exist.
+    '''
+    pass
+
+
+def manifest_path(tag):
+    '''
+    Where to store the manifest of a snapshot.
+    '''
+    workpath = main_config.paths('work')
+    return os.path.join(workpath, 'snapshots', tag + '.yml')
+
+
+def image_tag(tag, hostname):
+    '''
+    Single place to define the tag of the image of a node in a snapshot.
+    '''
+    return '{}-{}'.format(tag, hostname)
+
+
+def take_snapshot(cluster, tag):
+    '''
+    Commits the containers of a deployed cluster concurrently, and writes the manifest.
+    Returns the manifest as a dictionary.
+    '''
+    log = logger.logger_for_me(take_snapshot)
+
+    def commit(node):
+        node_tag = image_tag(tag, node.hostname)
+        msg = 'Committing {} to {}:{}'
+        log.info(msg.format(node.container.name, SNAPSHOT_REPOSITORY, node_tag))
+        node.commit(SNAPSHOT_REPOSITORY, node_tag, {SNAPSHOT_LABEL: tag})
+        return '{}:{}'.format(SNAPSHOT_REPOSITORY, node_tag)
+
+    nodes = cluster.ordered_nodes
+    images = parallel.map_concurrently(commit, nodes)
+
+    manifest = {
+        'tag': tag,
+        'source': cluster.name,
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'profile': cluster_profile(cluster.name),
+        'compute_count': len([node for node in nodes if node.role == 'compute']),
+        'nodes': {
+            node.hostname: {'role': node.role, 'image': image}
+            for (node, image) in zip(nodes, images)
+        }
+    }
+
+    filename = manifest_path(tag)
+    fs_util.create_dir_dont_complain(os.path.dirname(filename))
+    dyaml.dump_to_filepath(manifest, filename)
+    return manifest
+
+
+def cluster_profile(cluster_name):
+    '''
+    The profile of a deployed cluster, as recorded in its Ansible inventory.
+    Returns None if the inventory is not available.
+    '''
+    inventory_file = dansible_config.default_inventory(cluster_name)
+    if not os.path.isfile(inventory_file):
+        return None
+
+    with open(inventory_file, 'r') as inf:
+        inventory_dict = yaml.load(inf, Loader=yaml.SafeLoader)
+    return inventory_dict['all']['vars'].get('cluster_profile')
+
+
+def read_manifest(tag):
+    '''
+    Reads the manifest of a snapshot, raises SnapshotNotFound if there is no such snapshot.
+    '''
+    filename = manifest_path(tag)
+    if not os.path.isfile(filename):
+        raise SnapshotNotFound('Snapshot not found: {} ({})'.format(tag, filename))
+
+    with open(filename, 'r') as mf:
+        return yaml.load(mf, Loader=yaml.SafeLoader)
+
+
+def clone_request(manifest, cluster_name, profile_paths=None):
+    '''
+    Builds a creation request for a clone of a snapshot. The images are given by hostname, and
+    also by role in case the planner needs more nodes than the snapshot has.
+    No playbooks are run, the images are already configured.
+    '''
+    if not manifest.get('profile'):
+        raise ValueError('Snapshot {} does not record a profile'.format(manifest['tag']))
+
+    images = {}
+    for hostname in sorted(manifest['nodes'].keys()):
+        node = manifest['nodes'][hostname]
+        images[hostname] = node['image']
+        images.setdefault(node['role'], node['image'])
+
+    return DefaultCreationRequest(cluster_name, manifest['compute_count'], manifest['profile'],
+                                  profile_paths or [], [], [], images=images)
@@ -0,0 +1,275 @@
+'''
+Compact record of a deployed cluster, so that frequent commands do not query Docker.
+
+Finding a cluster in Docker lists the networks and then the containers of the cluster, which is
+the bulk of the time of 'dcluster ssh'. The record (state.json in the workpath) is written when
+the cluster is created, scaled, started and stopped, and has what ssh, scp, show and ansible need:
+
+    {"version": 1, "name": "mycluster", "status": "running", "profile": "simple",
+     "network": {"name": "dcluster-mycluster", "subnet": "172.30.0.0/24", ...},
+     "nodes": [{"hostname": "head", "ip_address": "172.30.0.253", "role": "head",
+                "container": "mycluster-head", "container_id": "3f2a...", "image": "..."}, ...]}
+
+The record is trusted until it fails: a node that is not in it, a stopped cluster, or an SSH
+connection that fails. Then the container of the node is checked by its ID and the record is
+built again from Docker if needed (see actions.ssh). Changes made with Docker directly are not
+seen until then, or until a command is called with --refresh, unless 'dcluster watch' is running:
+it follows the events of Docker and updates the status of the nodes and the health of the
+cluster in the record (see cluster.watch).
+'''
+
+import json
+import os
+import time
+
+from collections import namedtuple
+
+from dcluster.config import main_config
+from dcluster.infra.docker_facade import DockerContainers
+from dcluster.util import lock
+
+from .blueprint import ClusterBlueprint
+from .instance import SshMixin
+from .request import load_request
+
+STATE_VERSION = 1
+
+# status of a cluster
+RUNNING = 'running'
+STOPPED = 'stopped'
+
+# status of a node, running is shared with the cluster
+PAUSED = 'paused'
+EXITED = 'exited'
+OOM_KILLED = 'oom-killed'
+DISCONNECTED = 'disconnected'
+
+# nodes that can be reached, as Docker lists them for a running cluster
+REACHABLE = (RUNNING, PAUSED)
+
+# health of a cluster
+HEALTHY = 'healthy'
+DEGRADED = 'degraded'
+DOWN = 'down'
+
+# a node as recorded, container is the name of the container, health is the result of the
+# healthcheck of the image (None without healthcheck)
+CachedNode = namedtuple('CachedNode', 'hostname, ip_address, role, container, container_id, '
+                                      'image, status, health')
+CachedNode.__new__.__defaults__ = (RUNNING, None)
+
+
+def state_path(cluster_name):
+    return os.path.join(main_config.composer_workpath(cluster_name), 'state.json')
+
+
+def from_cluster(deployed_cluster, status=RUNNING, profile=None):
+    '''
+    The record of a cluster found in Docker (see instance.DeployedCluster).
+    '''
+    network = deployed_cluster.as_dict()['network']
+    nodes = [
+        {
+            'hostname': node.hostname,
+            'ip_address': node.ip_address,
+            'role': node.role,
+            'container': node.container.name,
+            'container_id': node.container.id,
+            'image': node.planned.image,
+            'status': RUNNING if status == RUNNING else EXITED,
+            'health': None
+        }
+        for node in deployed_cluster.ordered_nodes
+    ]
+    cluster_state = {
+        'version': STATE_VERSION,
+        'name': deployed_cluster.name,
+        'status': status,
+        'profile': profile,
+        'network': {
+            'name': network['name'],
+            'subnet': str(network['subnet']),
+            'gateway_ip': deployed_cluster.cluster_network.gateway_ip()
+        },
+        'nodes': sorted(nodes, key=lambda node: node['hostname']),
+        'updated': time.time()
+    }
+    if network.get('driver'):
+        cluster_state['network']['driver'] = network['driver']
+    cluster_state['health'] = cluster_health(cluster_state)
+    return cluster_state
+
+
+def cluster_health(cluster_state):
+    '''
+    Healthy if all the nodes are running (and not unhealthy), down if none is.
+    '''
+    nodes = cluster_state['nodes']
+    running = [node for node in nodes if node.get('status', RUNNING) == RUNNING]
+    if not running:
+        return DOWN
+    if len(running) < len(nodes) or any(node.get('health') == 'unhealthy' for node in nodes):
+        return DEGRADED
+    return HEALTHY
+
+
+def summarize(cluster_state):
+    '''
+    Updates the status and health of a cluster from the status of its nodes.
+    '''
+    reachable = [node for node in cluster_state['nodes']
+                 if node.get('status', RUNNING) in REACHABLE]
+    cluster_state['status'] = RUNNING if reachable else STOPPED
+    cluster_state['health'] = cluster_health(cluster_state)
+
+
+def state_lock(cluster_name):
+    '''
+    Held while the record of a cluster is read and written, so that dcluster and the watcher
+    do not overwrite each other.
+    '''
+    lock_path = main_config.lock_path('state-{}'.format(cluster_name))
+    return lock.FileLock(lock_path, main_config.prefs('lock_timeout'))
+
+
+def save(cluster_state):
+    '''
+    Writes the record of a cluster, a reader never sees a partial file.
+    '''
+    filename = state_path(cluster_state['name'])
+    partial_filename = filename + '.tmp'
+    with open(partial_filename, 'w') as state_file:
+        json.dump(cluster_state, state_file, indent=1, sort_keys=True)
+    os.rename(partial_filename, filename)
+
+
+def load(cluster_name):
+    '''
+    The record of a cluster, None if there is no usable record.
+    '''
+    try:
+        with open(state_path(cluster_name), 'r') as state_file:
+            cluster_state = json.load(state_file)
+    except (IOError, OSError, ValueError):
+        return None
+
+    if cluster_state.get('version') != STATE_VERSION:
+        return None
+    return cluster_state
+
+
+def remove(cluster_name):
+    with state_lock(cluster_name):
+        try:
+            os.remove(state_path(cluster_name))
+        except OSError:
+            pass
+
+
+def update(cluster_name, change):
+    '''
+    Changes the record of a cluster in place: change is called with the record, and the status
+    and health of the cluster are updated afterwards. Returns the result of change, or None if
+    the cluster has no record (nothing is called).
+    '''
+    with state_lock(cluster_name):
+        cluster_state = load(cluster_name)
+        if cluster_state is None:
+            return None
+
+        result = change(cluster_state)
+        summarize(cluster_state)
+        cluster_state['updated'] = time.time()
+        save(cluster_state)
+        return result
+
+
+def recorded_clusters():
+    '''
+    Names of the clusters that have a record.
+    '''
+    clusters_dir = os.path.dirname(main_config.composer_workpath('any'))
+    if not os.path.isdir(clusters_dir):
+        return []
+    return sorted([cluster_name for cluster_name in os.listdir(clusters_dir)
+                   if os.path.isfile(state_path(cluster_name))])
+
+
+def running_cluster(cluster_name):
+    '''
+    The cluster as recorded (CachedCluster), None if there is no record or the cluster was
+    stopped.
+    '''
+    cluster_state = load(cluster_name)
+    if cluster_state is None or cluster_state['status'] != RUNNING:
+        return None
+    return CachedCluster(cluster_state)
+
+
+def record(deployed_cluster, status=RUNNING):
+    '''
+    Writes the record of a cluster found in Docker, keeping the profile of a previous record.
+    For a stopped cluster, pass the cluster as it was found before stopping it (Docker only
+    finds the running containers). Returns the record.
+    '''
+    if not os.path.isdir(os.path.dirname(state_path(deployed_cluster.name))):
+        # not created by dcluster, nothing to keep
+        return from_cluster(deployed_cluster, status)
+
+    with state_lock(deployed_cluster.name):
+        previous_state = load(deployed_cluster.name) or {}
+        profile = previous_state.get('profile')
+        if profile is None:
+            creation_request = load_request(deployed_cluster.name)
+            if creation_request is not None:
+                profile = creation_request.profile
+
+        cluster_state = from_cluster(deployed_cluster, status, profile)
+        save(cluster_state)
+        return cluster_state
+
+
+class CachedCluster(ClusterBlueprint, SshMixin):
+    '''
+    A deployed cluster as recorded, without Docker. Can be formatted and reached with SSH, the
+    nodes are CachedNode instances. Like a cluster found in Docker, only has the nodes that are
+    running (or paused).
+    '''
+
+    def __init__(self, cluster_state):
+        self.cluster_state = cluster_state
+        cluster_specs = {
+            'name': cluster_state['name'],
+            'network': cluster_state['network'],
+            'nodes': {
+                node['ip_address']: CachedNode(**node)
+                for node in cluster_state['nodes']
+                if node.get('status', RUNNING) in REACHABLE
+            }
+        }
+        super(CachedCluster, self).__init__(None, cluster_specs)
+
+    @property
+    def status(self):
+        return self.cluster_state['status']
+
+    @property
+    def health(self):
+        return self.cluster_state.get('health')
+
+    def has_node(self, hostname):
+        return any(node.hostname == hostname for node in self.ordered_nodes)
+
+    def is_current(self, hostname):
+        '''
+        Checks the recorded node against Docker, by the ID of its container: the container must
+        be running with the recorded address.
+        '''
+        node = self.node_by_name(hostname)
+        container = DockerContainers.find_by_id(node.container_id)
+        if container is None or container.status != 'running':
+            return False
+
+        networks = container.attrs['NetworkSettings']['Networks']
+        network = networks.get(self.cluster_state['network']['name']) or {}
+        return network.get('IPAddress') == node.ip_address
@@ -0,0 +1,364 @@
+'''
+Follows the events of Docker to keep the records of the clusters current (see cluster.state).
+
+'dcluster watch' subscribes to the container and network events of Docker, and updates the
+record of the cluster of each event in place:
+
+- start, unpause: the node is running (a new node of a recorded cluster is added)
+- pause: the node is paused
+- die: the node exited, or was killed by the OOM killer if an 'oom' event came first
+- destroy: the node is removed from the record
+- health_status: the result of the healthcheck of the image
+- disconnect, connect: the node left or joined the network of its cluster
+
+When the watcher starts, the records are reconciled with the containers of Docker, so that it
+can be started at any time. The changes of the nodes and the health of the clusters (healthy,
+degraded, down) are published as transitions, one JSON document per line in the workpath of the
+cluster (health.log), and in the output of the watcher.
+
+While a watcher is running, list and show read the records instead of inspecting the containers.
+'''
+
+import json
+import os
+import time
+
+from collections import namedtuple
+
+from dcluster.config import main_config
+from dcluster.infra.docker_facade import CLUSTER_LABEL, ROLE_LABEL, DockerContainers
+from dcluster.infra.docker_facade import DockerNaming, NotFromDcluster, get_client
+from dcluster.util import lock, logger
+
+from . import state
+
+CONTAINER_ACTIONS = ('start', 'unpause', 'pause', 'die', 'oom', 'destroy', 'health_status')
+NETWORK_ACTIONS = ('connect', 'disconnect')
+
+# the labels of the containers are not in the network events, they are filtered here
+EVENT_FILTERS = {
+    'type': ['container', 'network'],
+    'event': list(CONTAINER_ACTIONS + NETWORK_ACTIONS)
+}
+
+# status of a node that was destroyed, only used in transitions
+REMOVED = 'removed'
+
+# hostname is None for the health of the whole cluster
+HealthTransition = namedtuple('HealthTransition', 'time, cluster_name, hostname, previous, '
+                                                  'current, detail')
+
+
+class WatcherRunning(Exception):
+    '''
+    Raised when another watcher is already following the events of Docker.
+    '''
+    pass
+
+
+def watch_lock_path():
+    return main_config.lock_path('watch')
+
+
+def is_watching():
+    '''
+    Whether a watcher is running, then the records are current.
+    '''
+    return lock.is_held(watch_lock_path())
+
+
+def health_log_path(cluster_name):
+    return os.path.join(main_config.composer_workpath(cluster_name), 'health.log')
+
+
+def cluster_of_event(event):
+    '''
+    Name of the cluster of a Docker event, None if the event is not about a dcluster node or the
+    network of a cluster.
+    '''
+    attributes = event.get('Actor', {}).get('Attributes') or {}
+    if event.get('Type') == 'container':
+        if ROLE_LABEL not in attributes:
+            return None
+        return attributes.get(CLUSTER_LABEL)
+
+    if event.get('Type') == 'network':
+        try:
+            return DockerNaming.deduce_cluster_name(attributes.get('name', ''))
+        except NotFromDcluster:
+            return None
+
+    return None
+
+
+def node_status(container_attrs):
+    '''
+    Status of a node from the attributes of its container (docker inspect).
+    '''
+    container_state = container_attrs.get('State') or {}
+    if container_state.get('Paused'):
+        return state.PAUSED
+    if container_state.get('Running'):
+        return state.RUNNING
+    if container_state.get('OOMKilled'):
+        return state.OOM_KILLED
+    return state.EXITED
+
+
+def node_from_container(container_attrs, network_name):
+    '''
+    Record of a node from the attributes of its container, None if the container is not running
+    in the network of the cluster (its address is unknown).
+    '''
+    network = (container_attrs['NetworkSettings'].get('Networks') or {}).get(network_name)
+    if not network or not network.get('IPAddress'):
+        return None
+
+    config = container_attrs['Config']
+    return {
+        'hostname': config['Hostname'],
+        'ip_address': network['IPAddress'],
+        'role': (config.get('Labels') or {}).get(ROLE_LABEL),
+        'container': container_attrs['Name'].lstrip('/'),
+        'container_id': container_attrs['Id'],
+        'image': config['Image'],
+        'status': node_status(container_attrs),
+        'health': ((container_attrs.get('State') or {}).get('Health') or {}).get('Status')
+    }
+
+
+def inspect_container(container_id):
+    '''
+    Attributes of a container, None if it no longer exists.
+    '''
+    container = DockerContainers.find_by_id(container_id)
+    if container is None:
+        return None
+    return container.attrs
+
+
+def publish_transition(transition):
+    '''
+    Appends a transition to the health log of its cluster.
+    '''
+    with open(health_log_path(transition.cluster_name), 'a') as health_log:
+        health_log.write(json.dumps(transition._asdict(), sort_keys=True) + '\n')
+
+
+def describe(transition):
+    subject = transition.cluster_name
+    if transition.hostname is not None:
+        subject = '{}/{}'.format(transition.cluster_name, transition.hostname)
+
+    description = '{}: {} -> {}'.format(subject, transition.previous, transition.current)
+    if transition.detail:
+        description += ' ({})'.format(transition.detail)
+    return description
+
+
+class StateWatcher(logger.LoggerMixin):
+    '''
+    Applies the events of Docker to the records of the clusters. The functions to inspect a
+    container and to publish a transition can be replaced (for tests).
+    '''
+
+    def __init__(self, inspect=inspect_container, publish=publish_transition, clock=time.time):
+        self.inspect = inspect
+        self.publish = publish
+        self.clock = clock
+
+        # containers with an 'oom' event, until they die or start
+        self.oom_containers = set()
+
+    def handle(self, event):
+        '''
+        Updates the record of the cluster of an event, returns the transitions.
+        '''
+        cluster_name = cluster_of_event(event)
+        if cluster_name is None:
+            return []
+
+        transitions = state.update(cluster_name,
+                                   lambda cluster_state: self.apply(cluster_state, event))
+        for transition in transitions or []:
+            self.publish(transition)
+        return transitions or []
+
+    def apply(self, cluster_state, event):
+        '''
+        Applies an event to the record of a cluster, returns the transitions.
+        '''
+        attributes = event['Actor'].get('Attributes') or {}
+        action = event['Action'].split(':')[0]
+        if event['Type'] == 'network':
+            container_id = attributes.get('container')
+        else:
+            container_id = event['Actor']['ID']
+
+        if action == 'oom':
+            # the container may survive, e.g. if a child process was killed
+            self.oom_containers.add(container_id)
+            return []
+
+        nodes = {node['container_id']: node for node in cluster_state['nodes']}
+        node = nodes.get(container_id)
+        if node is None:
+            if action not in ('start', 'connect'):
+                return []
+            return self.add_node(cluster_state, container_id)
+
+        detail = None
+        status = node.get('status')
+        if action in ('start', 'unpause'):
+            status = state.RUNNING
+            self.oom_containers.discard(container_id)
+        elif action == 'pause':
+            status = state.PAUSED
+        elif action == 'die':
+            status = state.EXITED
+            if container_id in self.oom_containers:
+                self.oom_containers.discard(container_id)
+                status = state.OOM_KILLED
+            detail = 'exit code {}'.format(attributes.get('exitCode'))
+        elif action == 'destroy':
+            cluster_state['nodes'].remove(node)
+            return self.transitions(cluster_state, node, REMOVED)
+        elif action == 'health_status':
+            health = event['Action'].split(':', 1)[-1].strip()
+            return self.change_health(cluster_state, node, health)
+        elif action == 'disconnect':
+            status = state.DISCONNECTED
+        elif action == 'connect' and status == state.DISCONNECTED:
+            status = state.RUNNING
+
+        return self.transitions(cluster_state, node, status, detail)
+
+    def add_node(self, cluster_state, container_id):
+        container_attrs = self.inspect(container_id)
+        if container_attrs is None:
+            return []
+
+        node = node_from_container(container_attrs, cluster_state['network']['name'])
+        if node is None:
+            return []
+
+        previous_health = cluster_state.get('health')
+        cluster_state['nodes'].append(node)
+        cluster_state['nodes'].sort(key=lambda a_node: a_node['hostname'])
+        transitions = [self.transition(cluster_state, node['hostname'], None, node['status'],
+                                       'added')]
+        return transitions + self.health_transitions(cluster_state, previous_health)
+
+    def change_health(self, cluster_state, node, health):
+        previous = node.get('health')
+        if previous == health:
+            return []
+
+        previous_health = cluster_state.get('health')
+        node['health'] = health
+        transitions = [self.transition(cluster_state, node['hostname'], previous, health,
+                                       'healthcheck')]
+        return transitions + self.health_transitions(cluster_state, previous_health)
+
+    def transitions(self, cluster_state, node, status, detail=None):
+        '''
+        Changes the status of a node, returns the transitions of the node and the cluster.
+        '''
+        previous = node.get('status')
+        if previous == status:
+            return []
+
+        previous_health = cluster_state.get('health')
+        node['status'] = status
+        transitions = [self.transition(cluster_state, node['hostname'], previous, status,
+                                       detail)]
+        return transitions + self.health_transitions(cluster_state, previous_health)
+
+    def health_transitions(self, cluster_state, previous_health):
+        state.summarize(cluster_state)
+        if cluster_state['health'] == previous_health:
+            return []
+        return [self.transition(cluster_state, None, previous_health, cluster_state['health'])]
+
+    def transition(self, cluster_state, hostname, previous, current, detail=None):
+        return HealthTransition(self.clock(), cluster_state['name'], hostname, previous, current,
+                                detail)
+
+    def reconcile(self, cluster_state, containers_attrs):
+        '''
+        Brings the record of a cluster in line with the attributes of its containers, after
+        events may have been missed. Returns the transitions.
+        '''
+        by_id = {attrs['Id']: attrs for attrs in containers_attrs}
+        network_name = cluster_state['network']['name']
+
+        transitions = []
+        for node in list(cluster_state['nodes']):
+            container_attrs = by_id.pop(node['container_id'], None)
+            if container_attrs is None:
+                cluster_state['nodes'].remove(node)
+                transitions.extend(self.transitions(cluster_state, node, REMOVED))
+                continue
+
+            current = node_from_container(container_attrs, network_name)
+            if current is not None:
+                node['ip_address'] = current['ip_address']
+            transitions.extend(self.transitions(cluster_state, node,
+                                                node_status(container_attrs)))
+
+        for container_id in sorted(by_id):
+            if node_status(by_id[container_id]) == state.RUNNING:
+                transitions.extend(self.add_node(cluster_state, container_id))
+
+        return transitions
+
+    def sync(self):
+        '''
+        Reconciles the records of all the clusters with the containers of Docker.
+        '''
+        containers_by_cluster = {}
+        for container in DockerContainers.all_dcluster_containers(include_stopped=True):
+            cluster_name = (container.attrs['Config'].get('Labels') or {}).get(CLUSTER_LABEL)
+            containers_by_cluster.setdefault(cluster_name, []).append(container.attrs)
+
+        # new nodes are inspected from the same listing
+        attrs_by_id = {attrs['Id']: attrs
+                       for containers_attrs in containers_by_cluster.values()
+                       for attrs in containers_attrs}
+        inspect = self.inspect
+        self.inspect = attrs_by_id.get
+
+        try:
+            for cluster_name in state.recorded_clusters():
+                containers_attrs = containers_by_cluster.get(cluster_name, [])
+                transitions = state.update(
+                    cluster_name,
+                    lambda cluster_state: self.reconcile(cluster_state, containers_attrs))
+                for transition in transitions or []:
+                    self.publish(transition)
+        finally:
+            self.inspect = inspect
+
+    def follow(self, once=False):
+        '''
+        Reconciles the records, then applies the events of Docker until interrupted (or returns
+        after reconciling, with once). Raises WatcherRunning if another watcher is running.
+        '''
+        if is_watching():
+            raise WatcherRunning('Another watcher is running: {}'.format(watch_lock_path()))
+
+        with lock.FileLock(watch_lock_path(), timeout=0):
+            # subscribe first, the events during the reconciliation are applied afterwards
+            events = get_client().events(decode=True, filters=EVENT_FILTERS)
+            try:
+                self.sync()
+                if once:
+                    return
+
+                for event in events:
+                    try:
+                        self.handle(event)
+                    except Exception as e:
+                        self.logger.warning('Could not apply event {}: {}'.format(event, e))
+            finally:
+                events.close()
@@ -163,6 +163,13 @@ def prefs(key):
     return get_config()['prefs'][key]
 
 
+def cgroups(key):
+    '''
+    Configuration sub-element for the per-cluster parent cgroup.
+    '''
+    return get_config()['cgroups'][key]
+
+
 def paths(key):
     '''
     Configuration sub-element for paths. These paths may be prefixed by dcluster_install_prefix.
@@ -189,6 +196,24 @@ def composer_workpath(cluster_name):
     return os.path.join(workpath, 'clusters', cluster_name)
 
 
+def lock_path(lock_name):
+    '''
+    Where to store the file of an advisory lock shared by dcluster processes.
+    '''
+    workpath = paths('work')
+    return os.path.join(workpath, 'locks', lock_name + '.lock')
+
+
+def service_socket():
+    '''
+    Where the dcluster service listens for requests (dcluster serve). The service and its callers
+    use the DCLUSTER_SOCKET environment variable if it is set.
+    '''
+    if os.environ.get('DCLUSTER_SOCKET'):
+        return os.environ['DCLUSTER_SOCKET']
+    return os.path.join(paths('work'), 'dcluster.sock')
+
+
 if __name__ == '__main__':
     import pprint
     print('*** ALL ***')
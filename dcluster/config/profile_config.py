@@ -8,20 +8,36 @@ from dcluster.util import collection as collection_util
 from dcluster.util import fs
 from dcluster.util import logger as log_util
 
-# read profiles only once
+# read profiles only once, unless the profile files change
 __all_profiles__ = None
+__profiles_stamp__ = None
 
 
 def all_available_profiles(user_places_to_look=None):
     '''
-    Singleton pattern for available profiles.
+    Singleton pattern for available profiles. The profiles are read again if the places to look
+    or the profile files change, since the service (dcluster serve) outlives many requests.
     '''
-    global __all_profiles__
-    if __all_profiles__ is None:
+    global __all_profiles__, __profiles_stamp__
+    stamp = profiles_stamp(user_places_to_look)
+    if __all_profiles__ is None or stamp != __profiles_stamp__:
         __all_profiles__ = get_all_available_profiles(user_places_to_look)
+        __profiles_stamp__ = stamp
     return __all_profiles__
 
 
+def profiles_stamp(user_places_to_look=None):
+    '''
+    The candidate profile files with their modification times and sizes, without reading them.
+    '''
+    stamp = []
+    for location, candidates in find_candidate_yaml_files(user_places_to_look).items():
+        for candidate in candidates:
+            stat = os.stat(os.path.join(location, candidate))
+            stamp.append((location, candidate, stat.st_mtime, stat.st_size))
+    return stamp
+
+
 def get_all_available_profiles(user_places_to_look):
     '''
     Finds the YAML files with cluster information.
@@ -106,7 +122,9 @@ def cluster_config_for_profile(profile, user_places_to_look=None):
     Cluster properties given its profile name.
     '''
     available_profiles = all_available_profiles(user_places_to_look)
-    cluster_config = available_profiles[profile]
+
+    # the profiles are kept for later requests, do not let the caller change them
+    cluster_config = collection_util.defensive_copy(available_profiles[profile])
 
     # if the requested profile extends another, recursively extend
     if 'extend' in cluster_config.keys():
@@ -117,8 +135,7 @@ def cluster_config_for_profile(profile, user_places_to_look=None):
 
         # really bad if a more complex circular reference exists
         parent_profile = cluster_config['extend']
-        parent_config = cluster_config_for_profile(parent_profile)
-        parent_config = collection_util.defensive_copy(parent_config)
+        parent_config = cluster_config_for_profile(parent_profile, user_places_to_look)
 
         # merge parent with current config
         cluster_config = collection_util.update_recursively(parent_config, cluster_config)
@@ -1,10 +1,13 @@
 import os
+import shutil
+import tempfile
 
 from .inventory import AnsibleInventory
 from .playbook import execute_playbook
 
-from dcluster.config import dansible_config
+from dcluster.config import dansible_config, main_config
 from dcluster.util import fs as fs_util
+from dcluster.util import lock
 
 
 def create_inventory(cluster_specs, inventory_workpath):
@@ -16,20 +19,59 @@ def create_inventory(cluster_specs, inventory_workpath):
     return (ansible_inventory, inventory_file)
 
 
+def install_playbook(playbook_name, playbook_path):
+    '''
+    Copies a playbook directory to the work path, unless the installed copy has the same digest.
+    The copy is made in a temporary directory and renamed into place, the lock is only held while
+    the installed copy is checked and replaced. Returns the path of the installed copy.
+    '''
+    # to avoid chain of dependencies (docker!) before dcluster init
+    from .image_cache import playbook_digest
+
+    dansible_home = dansible_config.installed_playbook_path()
+    playbook_target = os.path.join(dansible_home, playbook_name)
+    digest_file = os.path.join(dansible_home, '.{}.digest'.format(playbook_name))
+
+    playbook_lock_path = main_config.lock_path('playbook-{}'.format(playbook_name))
+    with lock.FileLock(playbook_lock_path, main_config.prefs('lock_timeout')):
+        digest = playbook_digest(playbook_path)
+        if os.path.isfile(digest_file):
+            with open(digest_file) as df:
+                if df.read().strip() == digest:
+                    return playbook_target
+
+        fs_util.create_dir_dont_complain(dansible_home)
+        new_copy = tempfile.mkdtemp(prefix='.{}-'.format(playbook_name), dir=dansible_home)
+        fs_util.copytree(playbook_path, new_copy)
+
+        old_copy = None
+        if os.path.exists(playbook_target):
+            old_copy = new_copy + '-old'
+            os.rename(playbook_target, old_copy)
+        os.rename(new_copy, playbook_target)
+
+        with open(digest_file, 'w') as df:
+            df.write(digest + '\n')
+
+    if old_copy is not None:
+        shutil.rmtree(old_copy, ignore_errors=True)
+    return playbook_target
+
+
 def run_playbook(cluster_name, playbook_name, inventory_file, extra_vars=None):
+    '''
+    Installs a playbook in the work path and runs it on a cluster. Returns the exit code.
+    '''
 
     # find our playbook: it is inside a directory <playbook_name> in some paths, see dansible_config
     playbook_path = dansible_config.find_playbook_path(playbook_name)
 
-    # 'install' the playbook in dcluster working directory, oif it wasn't there already
-    dansible_home = dansible_config.installed_playbook_path()
-    playbook_target = os.path.join(dansible_home, playbook_name)
-
+    # 'install' the playbook in dcluster working directory, if it wasn't there already
+    playbook_target = os.path.join(dansible_config.installed_playbook_path(), playbook_name)
     if playbook_path != playbook_target:
-        fs_util.create_dir_dont_complain(playbook_target)
-        fs_util.copytree(playbook_path, playbook_target)
+        playbook_target = install_playbook(playbook_name, playbook_path)
 
-    # always run from working directory
+    # always run from working directory, no lock is held while the playbook runs
     playbook_filename = 'playbook.yml'
     playbook_file = os.path.join(playbook_target, playbook_filename)
-    execute_playbook(playbook_file, inventory_file, extra_vars)
+    return execute_playbook(playbook_file, inventory_file, extra_vars)
@@ -0,0 +1,253 @@
+'''
+Cache of the images that result from running playbooks on a cluster.
+
+Running the same playbooks with the same extra vars on the same base image always gives the same
+result, so after a successful run, a node of each role is committed to an image and the image is
+recorded in an index. The key of an entry is a hash of:
+
+- the content of each playbook directory (as found by find_playbook_path)
+- the extra vars
+- the role and the ID of the base image
+
+A later cluster with the same key for all its roles starts from the cached images and does not
+run the playbooks. The index is a JSON file in the work path, entries are evicted in LRU order
+when the total size of the images or the number of entries exceed the configured limits.
+'''
+
+import hashlib
+import json
+import os
+import time
+
+from dcluster.config import dansible_config, main_config
+from dcluster.infra.docker_facade import CACHE_LABEL, get_client
+from dcluster.util import fs as fs_util
+from dcluster.util import lock, logger, units
+
+# all cached images share a repository, the tag identifies the role and the key
+CACHE_REPOSITORY = 'dcluster-cache'
+
+# roles that are committed after running the playbooks
+CACHED_ROLES = ('head', 'compute')
+
+
+def playbook_digest(playbook_path):
+    '''
+    Hash of the content of a playbook directory: relative paths and contents of all its files.
+    '''
+    digest = hashlib.sha256()
+    for (dirpath, dirnames, filenames) in os.walk(playbook_path):
+        # walk in a stable order
+        dirnames.sort()
+        for filename in sorted(filenames):
+            full_path = os.path.join(dirpath, filename)
+            digest.update(os.path.relpath(full_path, playbook_path).encode('utf-8'))
+            with open(full_path, 'rb') as pf:
+                digest.update(pf.read())
+    return digest.hexdigest()
+
+
+def cache_key(playbook_digests, extra_vars_list, role, image_id):
+    '''
+    Key of a cache entry, the playbook digests are in the order in which the playbooks run.
+    '''
+    key_material = {
+        'playbooks': list(playbook_digests),
+        'extra_vars': list(extra_vars_list),
+        'role': role,
+        'image': image_id
+    }
+    key_json = json.dumps(key_material, sort_keys=True)
+    return hashlib.sha256(key_json.encode('utf-8')).hexdigest()
+
+
+def cached_image_name(role, key):
+    '''
+    Single place to define the name of a cached image.
+    '''
+    return '{}:{}-{}'.format(CACHE_REPOSITORY, role, key[:16])
+
+
+class ImageCacheIndex(logger.LoggerMixin):
+    '''
+    Index of the cached images, persisted as a JSON file. Each entry has the image, its size in
+    bytes and the time of its last use. Does not call Docker.
+    '''
+
+    def __init__(self, filename, max_size, max_entries, clock=time.time):
+        self.filename = filename
+        self.max_size = units.parse_size(max_size)
+        self.max_entries = max_entries
+        self.clock = clock
+        self.entries = {}
+
+        if os.path.isfile(self.filename):
+            try:
+                with open(self.filename, 'r') as index_file:
+                    self.entries = json.load(index_file)
+            except ValueError:
+                self.logger.warning('Ignoring corrupt image cache index: {}'.format(self.filename))
+
+    def lookup(self, key):
+        '''
+        Returns the image for the key and marks it as used, None if the key is not cached.
+        '''
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        entry['last_used'] = self.clock()
+        return entry['image']
+
+    def add(self, key, image, size, details=None):
+        '''
+        Adds an entry. Returns the images of the entries that were evicted to stay within limits,
+        the caller is responsible for removing them.
+        '''
+        now = self.clock()
+        self.entries[key] = {
+            'image': image,
+            'size': size or 0,
+            'created': now,
+            'last_used': now,
+            'details': details or {}
+        }
+        return self.evict(keep=key)
+
+    def remove(self, key):
+        self.entries.pop(key, None)
+
+    def total_size(self):
+        return sum([entry['size'] for entry in self.entries.values()])
+
+    def evict(self, keep=None):
+        '''
+        Evicts the least recently used entries until the index is within its limits, never the
+        entry with the key to keep. Returns the images of the evicted entries.
+        '''
+        by_last_use = sorted(self.entries.keys(), key=lambda k: self.entries[k]['last_used'])
+        candidates = [key for key in by_last_use if key != keep]
+
+        evicted = []
+        while candidates and self.__over_limits():
+            key = candidates.pop(0)
+            evicted.append(self.entries.pop(key)['image'])
+
+        return evicted
+
+    def save(self):
+        fs_util.create_dir_dont_complain(os.path.dirname(self.filename))
+        with open(self.filename, 'w') as index_file:
+            json.dump(self.entries, index_file, indent=2, sort_keys=True)
+
+    def __over_limits(self):
+        if self.max_entries is not None and len(self.entries) > self.max_entries:
+            return True
+        return self.max_size is not None and self.total_size() > self.max_size
+
+
+class PlaybookImageCache(logger.LoggerMixin):
+    '''
+    Looks up and stores the images of clusters after running playbooks, uses Docker.
+    '''
+
+    def __init__(self, workpath, max_size, max_entries):
+        self.workpath = workpath
+        self.max_size = max_size
+        self.max_entries = max_entries
+
+    @classmethod
+    def from_config(cls):
+        cache_config = main_config.get_config()['image_cache']
+        workpath = os.path.join(main_config.paths('work'), 'image_cache')
+        return PlaybookImageCache(workpath, cache_config['max_size'], cache_config['max_entries'])
+
+    def keys_for(self, cluster_config, creation_request):
+        '''
+        Cache keys for each role of a requested cluster, as a dictionary role -> key.
+        Returns None if a key cannot be computed (e.g. the base image is not available locally).
+        '''
+        playbook_digests = [
+            playbook_digest(dansible_config.find_playbook_path(playbook_name))
+            for playbook_name in creation_request.playbooks
+        ]
+        requested_images = creation_request.images or {}
+
+        keys = {}
+        for role in CACHED_ROLES:
+            image_name = requested_images.get(role, cluster_config[role]['image'])
+            try:
+                image_id = get_client().images.get(image_name).id
+            except Exception as e:
+                self.logger.debug('No image cache key for {}: {}'.format(image_name, e))
+                return None
+
+            keys[role] = cache_key(playbook_digests, creation_request.extra_vars_list, role,
+                                   image_id)
+        return keys
+
+    def lookup(self, keys):
+        '''
+        Returns a dictionary role -> cached image if all the roles are cached, else None.
+        Entries whose image was removed from Docker are dropped.
+        '''
+        with self.__lock():
+            index = self.__index()
+            images = {}
+            for (role, key) in keys.items():
+                image = index.lookup(key)
+                if image is not None and not self.__image_exists(image):
+                    self.logger.info('Cached image is gone: {}'.format(image))
+                    index.remove(key)
+                    image = None
+                images[role] = image
+            index.save()
+
+        if None in images.values():
+            return None
+        return images
+
+    def store(self, cluster, keys, details=None):
+        '''
+        Commits a node of each role of a configured cluster, and adds the images to the index.
+        Evicted images are removed from Docker.
+        '''
+        evicted = []
+        for role in CACHED_ROLES:
+            nodes = [node for node in cluster.ordered_nodes if node.role == role]
+            if not nodes:
+                continue
+
+            image_name = cached_image_name(role, keys[role])
+            (repository, tag) = image_name.split(':')
+            msg = 'Caching {} of {} as {}'
+            self.logger.info(msg.format(nodes[0].hostname, cluster.name, image_name))
+            image = nodes[0].commit(repository, tag, {CACHE_LABEL: 'playbooks'})
+
+            with self.__lock():
+                index = self.__index()
+                evicted.extend(index.add(keys[role], image_name, image.attrs.get('Size'),
+                                         details))
+                index.save()
+
+        for image_name in evicted:
+            self.logger.info('Evicting cached image {}'.format(image_name))
+            try:
+                get_client().images.remove(image_name)
+            except Exception as e:
+                self.logger.warning('Could not remove cached image {}: {}'.format(image_name, e))
+
+    def __index(self):
+        index_file = os.path.join(self.workpath, 'index.json')
+        return ImageCacheIndex(index_file, self.max_size, self.max_entries)
+
+    def __lock(self):
+        return lock.FileLock(main_config.lock_path('image-cache'),
+                             main_config.prefs('lock_timeout'))
+
+    def __image_exists(self, image_name):
+        try:
+            get_client().images.get(image_name)
+            return True
+        except Exception:
+            return False
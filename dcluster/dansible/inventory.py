@@ -127,6 +127,11 @@ class AnsibleInventory:
         }
         self.children = self.inventory_dict['all']['children']
 
+        # the data network is only there if the profile asks for it
+        data_network = self.cluster_specs.get('data_network')
+        if data_network:
+            self.inventory_dict['all']['vars']['cluster_data_network'] = data_network
+
         for node_ip, planned_node in self.cluster_specs['nodes'].items():
 
             # add node to hosts
@@ -7,7 +7,7 @@ from dcluster.util import runit
 def execute_playbook(playbook_file, inventory_file, extra_vars_list=[]):
     '''
     Run an Ansible playbook using a cluster as the inventory nodes.
-    This will call 'ansible-playbook' command and print the output.
+    This will call 'ansible-playbook' command and print the output. Returns the exit code.
     '''
     logger = logging.getLogger()
 
@@ -25,4 +25,5 @@ def execute_playbook(playbook_file, inventory_file, extra_vars_list=[]):
     cmd = 'ansible-playbook -i %s %s %s' % (inventory_file, playbook_file, extra_vars_str)
     # cwd = playbook_path
     logger.debug('executing from %s >>%s<<' % (cwd, cmd))
-    runit.execute(cmd, cwd=cwd, logger=logger, log_level=logging.INFO)
+    run = runit.execute(cmd, cwd=cwd, logger=logger, log_level=logging.INFO)
+    return run[2]
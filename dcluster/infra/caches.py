@@ -0,0 +1,159 @@
+'''
+Host-wide cache volumes, shared by clusters and kept after the clusters are removed.
+
+A cache volume is created for each kind of cache and each image family, e.g. the package cache of
+all the nodes that use 'centos:7.7.1908' or 'centos:7.7.1908-init' is 'dcluster-packages-centos'.
+The volumes are labelled as caches, so they are never collected as orphans.
+
+Kinds of caches:
+- packages: yum or dnf keep the downloaded packages in the volume, the nodes get
+  DCLUSTER_PACKAGE_CACHE in their environment (see bootstrap/package-cache.sh)
+- ccache: compiler cache, the nodes get CCACHE_DIR and CCACHE_MAXSIZE in their environment
+'''
+
+import re
+
+from collections import namedtuple
+
+from dcluster.config import main_config
+
+from .docker_facade import CACHE_LABEL, DockerVolumes
+
+# kinds of caches
+PACKAGE_CACHE = 'packages'
+COMPILER_CACHE = 'ccache'
+
+# each kind of cache is enabled in its configuration section, or in the profile with the same key
+CACHE_SECTIONS = {
+    PACKAGE_CACHE: 'package_cache',
+    COMPILER_CACHE: 'compiler_cache'
+}
+
+# a cache volume mounted on a node
+CacheVolume = namedtuple('CacheVolume', 'kind, name, mount')
+
+
+def image_family(image):
+    '''
+    Family of an image: its repository without registry and tag, e.g.
+    'registry:5000/centos7:build' -> 'centos7'
+    '''
+    repository = image.rsplit('/', 1)[-1].split(':')[0]
+    return re.sub(r'[^a-zA-Z0-9_.-]', '_', repository)
+
+
+def cache_volume_name(kind, image):
+    '''
+    Single place to define the name of a cache volume.
+    '''
+    return '-'.join((main_config.networking('prefix'), kind, image_family(image)))
+
+
+def cache_config(kind):
+    return main_config.get_config()[CACHE_SECTIONS[kind]]
+
+
+def cache_enabled(plan_data, kind):
+    '''
+    The profile can enable or disable a kind of cache (e.g. 'package_cache' entry), otherwise the
+    configuration decides.
+    '''
+    enabled = plan_data.get(CACHE_SECTIONS[kind])
+    if enabled is None:
+        enabled = cache_config(kind)['enabled']
+    return enabled
+
+
+def cache_volumes(plan_data, image):
+    '''
+    The cache volumes to mount on a node with the image, given the plan of its cluster.
+    '''
+    volumes = []
+    for kind in (PACKAGE_CACHE, COMPILER_CACHE):
+        if cache_enabled(plan_data, kind):
+            mount = cache_config(kind)['mount']
+            volumes.append(CacheVolume(kind, cache_volume_name(kind, image), mount))
+    return volumes
+
+
+def cache_environment(plan_data):
+    '''
+    Environment variables for the nodes that use the caches, as a dictionary.
+    '''
+    environment = {}
+    if cache_enabled(plan_data, PACKAGE_CACHE):
+        environment['DCLUSTER_PACKAGE_CACHE'] = cache_config(PACKAGE_CACHE)['mount']
+    if cache_enabled(plan_data, COMPILER_CACHE):
+        compiler_config = cache_config(COMPILER_CACHE)
+        environment['CCACHE_DIR'] = compiler_config['mount']
+        environment['CCACHE_MAXSIZE'] = str(compiler_config['max_size'])
+    return environment
+
+
+def add_environment(static, environment):
+    '''
+    Adds environment variables to the static specification of a node (docker-compose format,
+    'environment' can be a dictionary or a list of VAR=value). Returns a new dictionary.
+    '''
+    static = dict(static or {})
+    if not environment:
+        return static
+
+    current = static.get('environment') or {}
+    if isinstance(current, list):
+        current = current + ['{}={}'.format(key, environment[key])
+                             for key in sorted(environment.keys())]
+    else:
+        current = dict(current)
+        current.update(environment)
+
+    static['environment'] = current
+    return static
+
+
+def mounted_caches(container_mounts):
+    '''
+    Kinds of the cache volumes in the mounts of a container (as reported by Docker).
+    '''
+    prefix = main_config.networking('prefix') + '-'
+    kinds = []
+    for mount in container_mounts or []:
+        name = mount.get('Name') or ''
+        for kind in CACHE_SECTIONS:
+            if name.startswith(prefix + kind + '-'):
+                kinds.append(kind)
+    return kinds
+
+
+def parse_ccache_stats(output):
+    '''
+    Parses the output of 'ccache -s' (ccache 3.x, or 4.x with -v), returns a dictionary with hits,
+    misses and hit_rate (a percentage, None without compilations).
+    '''
+    hits = 0
+    misses = 0
+    for line in output.splitlines():
+        match = re.match(r'^\s*(cache hit \((?:direct|preprocessed)\)|cache miss)\s+(\d+)', line)
+        if match is None:
+            # ccache 4.x
+            match = re.match(r'^\s*(Hits|Misses):\s+(\d+)', line)
+        if match is None:
+            continue
+
+        if match.group(1) in ('cache miss', 'Misses'):
+            misses += int(match.group(2))
+        else:
+            hits += int(match.group(2))
+
+    hit_rate = None
+    if hits + misses > 0:
+        hit_rate = 100.0 * hits / (hits + misses)
+    return {'hits': hits, 'misses': misses, 'hit_rate': hit_rate}
+
+
+def create_cache_volumes(external_volumes):
+    '''
+    Creates the cache volumes that do not exist yet, given a dictionary name -> kind.
+    '''
+    for (volume_name, kind) in external_volumes.items():
+        DockerVolumes.create_if_missing(volume_name, labels={CACHE_LABEL: kind})
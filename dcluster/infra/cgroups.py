@@ -0,0 +1,308 @@
+'''
+Per-cluster parent cgroup.
+
+All the containers of a cluster are placed under a common parent cgroup (docker cgroup_parent),
+so that aggregate limits (cpu.max, memory.max, cpu.weight) can be applied to the whole cluster,
+and the usage of the whole cluster can be read from a single place.
+
+The name of the parent is a systemd slice, e.g. 'dcluster-mycluster.slice'. This name is valid
+for both cgroup drivers of Docker:
+- systemd: the slice is expanded by systemd, e.g. dcluster.slice/dcluster-mycluster.slice
+- cgroupfs: the name is used as a directory under the cgroup root.
+
+systemd nests a slice under the slice of each dash-separated prefix of its name, so the cluster
+name is escaped like systemd-escape does ('-' is '\\x2d'): otherwise the slice of cluster 'my'
+would be the parent of the slice of cluster 'my-cluster'.
+
+Only the unified hierarchy (cgroup v2) is supported for limits and accounting.
+'''
+
+import os
+import re
+
+from dcluster.config import main_config
+from dcluster.util import logger, runit, units
+
+from .docker_facade import DockerHost
+
+# default period for cpu.max, in microseconds
+CPU_PERIOD_USEC = 100000
+
+# keys that are understood as cluster-wide limits
+LIMIT_KEYS = ('cpu_max', 'memory_max', 'weight')
+
+
+def escape_unit_name(name):
+    '''
+    Escapes a string for a systemd unit name, like systemd-escape: 'my-cluster' -> 'my\\x2dcluster'
+    '''
+    escaped = []
+    for (index, char) in enumerate(name):
+        if re.match(r'[a-zA-Z0-9:_]', char) or (char == '.' and index > 0):
+            escaped.append(char)
+        else:
+            escaped.append('\\x{:02x}'.format(ord(char)))
+    return ''.join(escaped)
+
+
+def unescape_unit_name(escaped):
+    return re.sub(r'\\x([0-9a-f]{2})', lambda match: chr(int(match.group(1), 16)), escaped)
+
+
+def cgroup_parent_name(cluster_name):
+    '''
+    Single place to define the name of the parent cgroup of a cluster. The cluster name is
+    escaped, so that the slices of different clusters are never nested.
+    '''
+    return '{}-{}.slice'.format(main_config.cgroups('prefix'), escape_unit_name(cluster_name))
+
+
+def expand_slice(slice_name):
+    '''
+    Expands a systemd slice name to its path in the cgroup hierarchy, the same way systemd does.
+    E.g. 'dcluster-my-cluster.slice' -> 'dcluster.slice/dcluster-my.slice/dcluster-my-cluster.slice'
+    '''
+    suffix = '.slice'
+    if not slice_name.endswith(suffix) or '/' in slice_name:
+        raise ValueError('Invalid slice name: {}'.format(slice_name))
+
+    components = slice_name[:-len(suffix)].split('-')
+    path_parts = [
+        '-'.join(components[:index + 1]) + suffix
+        for index in range(len(components))
+    ]
+    return '/'.join(path_parts)
+
+
+def find_cluster_cgroups(driver, cgroup_root=None):
+    '''
+    Lists the parent cgroups of clusters that exist in the filesystem, as ClusterCgroup instances.
+    With the systemd driver, nested slices (of names with dashes, before they were escaped) are
+    also listed.
+    '''
+    if cgroup_root is None:
+        cgroup_root = main_config.cgroups('root')
+
+    prefix = main_config.cgroups('prefix') + '-'
+    suffix = '.slice'
+
+    search_root = cgroup_root
+    if driver == 'systemd':
+        search_root = os.path.join(cgroup_root, main_config.cgroups('prefix') + suffix)
+
+    if not os.path.isdir(search_root):
+        return []
+
+    found = []
+    for (dirpath, dirnames, _) in os.walk(search_root):
+        for dirname in sorted(dirnames):
+            if dirname.startswith(prefix) and dirname.endswith(suffix):
+                cluster_name = unescape_unit_name(dirname[len(prefix):-len(suffix)])
+                found.append(ClusterCgroup(cluster_name, driver, cgroup_root, dirname))
+
+        if driver != 'systemd':
+            # cgroupfs: parents are created directly under the root
+            break
+
+        # systemd: only nested slices can hold other parents, skip the container scopes
+        dirnames[:] = [dirname for dirname in dirnames if dirname.endswith(suffix)]
+
+    return found
+
+
+def merge_limits(profile_limits, user_limits):
+    '''
+    Merges the cgroup limits of a profile with the limits requested by the user.
+    The user limits take precedence, unless they are None.
+    '''
+    limits = {}
+    for source in (profile_limits, user_limits):
+        if not source:
+            continue
+        for key in LIMIT_KEYS:
+            if source.get(key) is not None:
+                limits[key] = source[key]
+    return limits
+
+
+class ClusterCgroup(logger.LoggerMixin):
+    '''
+    Handle for the parent cgroup of a cluster. Does not create anything when instantiated.
+    '''
+
+    def __init__(self, cluster_name, driver, cgroup_root=None, slice_name=None):
+        self.cluster_name = cluster_name
+        self.driver = driver
+
+        # a slice found in the filesystem keeps its name
+        if slice_name is None:
+            slice_name = cgroup_parent_name(cluster_name)
+        self.slice_name = slice_name
+        if cgroup_root is None:
+            cgroup_root = main_config.cgroups('root')
+        self.cgroup_root = cgroup_root
+
+    @property
+    def name(self):
+        '''
+        Name of the parent cgroup, as passed to docker (cgroup_parent).
+        '''
+        return self.slice_name
+
+    @property
+    def path(self):
+        '''
+        Path of the parent cgroup in the filesystem.
+        '''
+        if self.driver == 'systemd':
+            relative_path = expand_slice(self.name)
+        else:
+            relative_path = self.name
+        return os.path.join(self.cgroup_root, relative_path)
+
+    def is_unified(self):
+        '''
+        True iff the host uses the unified cgroup hierarchy (cgroup v2).
+        '''
+        return os.path.exists(os.path.join(self.cgroup_root, 'cgroup.controllers'))
+
+    def exists(self):
+        return os.path.isdir(self.path)
+
+    def apply_limits(self, limits):
+        '''
+        Applies aggregate limits to the parent cgroup. Expects the containers to have been
+        created, so that the parent cgroup already exists.
+
+        limits is a dictionary with optional keys:
+        - cpu_max: number of CPUs that the whole cluster can use, e.g. 4 or 0.5
+        - memory_max: memory for the whole cluster, e.g. '8g'
+        - weight: relative CPU weight of the cluster (1-10000, default 100)
+        '''
+        if not limits:
+            return
+
+        if not self.is_unified():
+            msg = 'cgroup limits require the unified hierarchy (cgroup v2), ignoring: {}'
+            self.logger.warning(msg.format(limits))
+            return
+
+        if self.driver == 'systemd':
+            self.__apply_limits_systemd(limits)
+        else:
+            self.__apply_limits_cgroupfs(limits)
+
+        self.logger.info('Applied cgroup limits to {}: {}'.format(self.name, limits))
+
+    def usage(self):
+        '''
+        Aggregate usage of the cluster, read from the parent cgroup. Returns a dictionary,
+        values are None when not available.
+        '''
+        cpu_stat = self.__read_keyed_file('cpu.stat')
+        usage_usec = cpu_stat.get('usage_usec')
+
+        return {
+            'cgroup': self.path,
+            'cpu_usage_usec': usage_usec,
+            'cpu_max': self.__read_file('cpu.max'),
+            'cpu_weight': self.__read_int('cpu.weight'),
+            'memory_current': self.__read_int('memory.current'),
+            'memory_peak': self.__read_int('memory.peak'),
+            'memory_max': self.__read_file('memory.max'),
+            'pids_current': self.__read_int('pids.current')
+        }
+
+    def cpu_usage_usec(self):
+        '''
+        Total CPU time consumed by the cluster, in microseconds. None if not available.
+        '''
+        return self.__read_keyed_file('cpu.stat').get('usage_usec')
+
+    def remove(self):
+        '''
+        Removes the parent cgroup, should be called after all containers have been removed.
+        '''
+        if self.driver == 'systemd':
+            # quoted, the escaped name has backslashes
+            cmd = "systemctl stop '{}'".format(self.name)
+            runit.execute(cmd, logger=self.logger)
+
+        elif self.exists():
+            try:
+                os.rmdir(self.path)
+            except OSError as e:
+                self.logger.warning('Could not remove cgroup {}: {}'.format(self.path, e))
+
+    def __apply_limits_cgroupfs(self, limits):
+        '''
+        Write the limits directly to the cgroup interface files.
+        '''
+        values = {}
+        if limits.get('cpu_max') is not None:
+            quota = int(float(limits['cpu_max']) * CPU_PERIOD_USEC)
+            values['cpu.max'] = '{} {}'.format(quota, CPU_PERIOD_USEC)
+        if limits.get('memory_max') is not None:
+            values['memory.max'] = str(units.parse_size(limits['memory_max']))
+        if limits.get('weight') is not None:
+            values['cpu.weight'] = str(int(limits['weight']))
+
+        for filename, value in values.items():
+            try:
+                with open(os.path.join(self.path, filename), 'w') as cgroup_file:
+                    cgroup_file.write(value)
+            except (IOError, OSError) as e:
+                msg = 'Could not set {}={} for {}: {}'
+                self.logger.warning(msg.format(filename, value, self.path, e))
+
+    def __apply_limits_systemd(self, limits):
+        '''
+        Let systemd apply the limits to the slice, writing to the files would be overridden.
+        '''
+        properties = []
+        if limits.get('cpu_max') is not None:
+            properties.append('CPUQuota={}%'.format(int(float(limits['cpu_max']) * 100)))
+        if limits.get('memory_max') is not None:
+            properties.append('MemoryMax={}'.format(units.parse_size(limits['memory_max'])))
+        if limits.get('weight') is not None:
+            properties.append('CPUWeight={}'.format(int(limits['weight'])))
+
+        cmd = "systemctl set-property --runtime '{}' {}".format(self.name, ' '.join(properties))
+        (_, stderr, rc) = runit.execute(cmd, logger=self.logger)
+        if rc != 0:
+            self.logger.warning('Could not set properties of {}: {}'.format(self.name, stderr))
+
+    def __read_file(self, filename):
+        try:
+            with open(os.path.join(self.path, filename), 'r') as cgroup_file:
+                return cgroup_file.read().strip()
+        except (IOError, OSError):
+            return None
+
+    def __read_int(self, filename):
+        value = self.__read_file(filename)
+        if value is None or not value.isdigit():
+            return None
+        return int(value)
+
+    def __read_keyed_file(self, filename):
+        '''
+        Reads files such as cpu.stat, with one 'key value' per line.
+        '''
+        contents = self.__read_file(filename)
+        if contents is None:
+            return {}
+
+        keyed = {}
+        for line in contents.splitlines():
+            parts = line.split()
+            if len(parts) == 2 and parts[1].isdigit():
+                keyed[parts[0]] = int(parts[1])
+        return keyed
+
+    @classmethod
+    def for_cluster(cls, cluster_name):
+        '''
+        Creates a handle for the parent cgroup of a cluster, asking Docker for its cgroup driver.
+        '''
+        return ClusterCgroup(cluster_name, DockerHost.cgroup_driver())
@@ -13,6 +13,15 @@ from dcluster.config import main_config
 
 __docker_client = None
 
+# label set on each node container by the deployment template, requires Docker 17.06.0+
+ROLE_LABEL = 'bull.com.dcluster.role'
+
+# label set on each node container and each named volume, holds the name of the cluster
+CLUSTER_LABEL = 'bull.com.dcluster.cluster'
+
+# label set on the volumes and images that are shared by clusters (caches), holds the kind of cache
+CACHE_LABEL = 'bull.com.dcluster.cache'
+
 
 def get_client():
     '''
@@ -63,6 +72,25 @@ class DockerNaming:
         # get the prefix from configuration file
         return '-'.join((main_config.networking('prefix'), cluster_name))
 
+    @classmethod
+    def create_data_network_name(cls, cluster_name):
+        '''
+        Single place to define the name of the data network of a cluster. It does not start with
+        the prefix and a dash, so it is never taken for the management network of a cluster.
+        '''
+        return '{}data-{}'.format(main_config.networking('prefix'), cluster_name)
+
+    @classmethod
+    def deduce_data_cluster_name(cls, network_name):
+        '''
+        Given the name of a data network, find the cluster name. Raises NotFromDcluster if the
+        network is not a data network of dcluster.
+        '''
+        prefix = '{}data-'.format(main_config.networking('prefix'))
+        if not network_name.startswith(prefix):
+            raise NotFromDcluster('Not a dcluster data network: %s' % network_name)
+        return network_name[len(prefix):]
+
     @classmethod
     def deduce_cluster_name(cls, network):
         '''
@@ -85,8 +113,8 @@ class DockerNaming:
         network_name_is_string = isinstance(network_name, str) or isinstance(network_name, unicode)
         assert network_name_is_string, 'Could not understand %s' % network_name
 
-        # now we have a string, dcluster networks are preceded by the prefix
-        prefix = main_config.networking('prefix')
+        # now we have a string, dcluster networks are preceded by the prefix and a dash
+        prefix = main_config.networking('prefix') + '-'
         cls.logger().debug('Looking in %s for %s' % (network_name, prefix))
 
         if network_name.find(prefix) != 0:
@@ -94,7 +122,7 @@ class DockerNaming:
             raise NotFromDcluster('Docker network not associated with dcluster: %s' % network_name)
 
         # this is a dcluster string
-        return network_name[(len(main_config.networking('prefix')) + 1):]
+        return network_name[len(prefix):]
 
     @classmethod
     def is_dcluster_network(cls, network):
@@ -127,6 +155,14 @@ class DockerContainers:
     TODO find a better place for these.
     '''
 
+    @classmethod
+    def pin_cpus(cls, container_name, cpuset):
+        '''
+        Restricts a container to a set of CPUs, e.g. '0-3'. Works on created containers before
+        they start.
+        '''
+        get_client().containers.get(container_name).update(cpuset_cpus=str(cpuset))
+
     @classmethod
     def hostname(cls, docker_container):
         '''
@@ -154,18 +190,124 @@ class DockerContainers:
         role = None
 
         # TODO make this configurable, probably change it
-        role_label = 'bull.com.dcluster.role'
-        if role_label in labels:
-            role = labels[role_label]
+        if ROLE_LABEL in labels:
+            role = labels[ROLE_LABEL]
 
         return role
 
+    @classmethod
+    def find_by_id(cls, container_id):
+        '''
+        The container with the ID, None if it no longer exists.
+        '''
+        try:
+            return get_client().containers.get(container_id)
+        except docker.errors.NotFound:
+            return None
+
+    @classmethod
+    def all_dcluster_containers(cls, include_stopped=False):
+        '''
+        Lists the containers of all dcluster clusters, identified by their role label.
+        '''
+        client = get_client()
+        return client.containers.list(all=include_stopped, filters={'label': ROLE_LABEL})
+
+    @classmethod
+    def memory_limit(cls, docker_container):
+        '''
+        Memory limit of a container in bytes, None if the container is not limited.
+        '''
+        memory = docker_container.attrs['HostConfig'].get('Memory')
+        return memory or None
+
+    @classmethod
+    def cpu_limit(cls, docker_container):
+        '''
+        CPU limit of a container in CPUs, None if the container is not limited.
+        '''
+        nano_cpus = docker_container.attrs['HostConfig'].get('NanoCpus')
+        if not nano_cpus:
+            return None
+        return nano_cpus / 1000000000.0
+
+    @classmethod
+    def memory_usage(cls, docker_container):
+        '''
+        Memory used by a running container in bytes, using a single sample of the docker stats API.
+        Prefers the peak usage when it is reported (cgroup v1).
+        '''
+        memory_stats = docker_container.stats(stream=False)['memory_stats']
+        return memory_stats.get('max_usage') or memory_stats.get('usage')
+
+    @classmethod
+    def is_paused(cls, docker_container):
+        '''
+        True iff the container has been frozen (docker pause).
+        '''
+        return docker_container.attrs['State'].get('Paused', False)
+
+    @classmethod
+    def can_exec(cls, docker_container):
+        '''
+        True iff commands can run in the container: it is running and not paused.
+        '''
+        container_state = docker_container.attrs['State']
+        return container_state.get('Running', False) and not container_state.get('Paused', False)
+
+    @classmethod
+    def cpu_usage_usec(cls, docker_container):
+        '''
+        Total CPU time consumed by a running container in microseconds, using a single sample of
+        the docker stats API (slow, requires a round-trip for each container).
+        '''
+        stats = docker_container.stats(stream=False)
+        return stats['cpu_stats']['cpu_usage']['total_usage'] // 1000
+
     @classmethod
     def has_sys_admin_cap(cls, docker_container):
         cap_adds = docker_container.attrs['HostConfig']['CapAdd']
         return isinstance(cap_adds, list) and 'SYS_ADMIN' in cap_adds
 
 
+class DockerVolumes:
+    '''
+    Some class methods regarding Docker volumes that are managed outside of docker-compose.
+    '''
+
+    @classmethod
+    def create_if_missing(cls, volume_name, labels=None):
+        '''
+        Creates a named volume unless it already exists, returns the volume.
+        '''
+        client = get_client()
+        try:
+            return client.volumes.get(volume_name)
+        except docker.errors.NotFound:
+            return client.volumes.create(name=volume_name, labels=labels or {})
+
+
+class DockerHost:
+    '''
+    Some class methods regarding the host where the Docker daemon runs.
+    '''
+
+    @classmethod
+    def info(cls):
+        '''
+        System-wide information of the Docker daemon, as reported by 'docker info'.
+        '''
+        client = get_client()
+        return client.info()
+
+    @classmethod
+    def cgroup_driver(cls):
+        '''
+        The cgroup driver used by the Docker daemon, either 'systemd' or 'cgroupfs'.
+        '''
+        return cls.info().get('CgroupDriver', 'cgroupfs')
+
+
 class DockerNetworking:
     '''
     Some class methods regarding actual Docker networks.
@@ -243,6 +385,19 @@ class DockerNetworking:
         subnet_str = docker_network.attrs['IPAM']['Config'][0]['Subnet']
         return ipaddress.ip_network(subnet_str)
 
+    @classmethod
+    def subnets_in_use(cls, docker_networks):
+        '''
+        Subnets of the Docker networks, as ipaddress objects. Networks without an IPAM
+        configuration (e.g. host, none) are ignored.
+        '''
+        subnets = []
+        for docker_network in docker_networks:
+            for ipam_config in docker_network.attrs['IPAM'].get('Config') or []:
+                if 'Subnet' in ipam_config:
+                    subnets.append(ipaddress.ip_network(ipam_config['Subnet']))
+        return subnets
+
     @classmethod
     def running_containers_for_network(cls, docker_network):
         '''
@@ -296,7 +451,8 @@ class DockerNetworking:
             ipam_pool = docker.types.IPAMPool(subnet=subnet, gateway=gateway_ip)
             ipam_config = docker.types.IPAMConfig(pool_configs=[ipam_pool])
             docker_network = client.networks.create(network_name,
-                                                    driver='bridge',
+                                                    driver=planned_network.driver,
+                                                    options=planned_network.driver_opts or None,
                                                     attachable=True,
                                                     ipam=ipam_config)
 
@@ -0,0 +1,274 @@
+'''
+Garbage collection of orphaned dcluster resources.
+
+Removing a cluster may leave resources behind, e.g. if the removal was interrupted or if the
+cluster was removed with Docker directly. Over time, the host accumulates dcluster networks without
+containers (taking subnets of the supernet), named volumes of removed clusters, parent cgroups and
+stale directories in the workpath.
+
+A snapshot of the networks, containers, volumes, cgroups and workpath directories is taken once,
+the orphans are found by cross-referencing the snapshot: a resource is an orphan if its cluster
+has no containers (running or stopped).
+'''
+
+import os
+import re
+import shutil
+
+from collections import namedtuple
+
+from dcluster.config import main_config
+from dcluster.util import logger, parallel
+
+from . import cgroups
+from .docker_facade import CLUSTER_LABEL, DockerHost, DockerNaming, NotFromDcluster, get_client
+
+# kinds of resources, also the order in which they are reported
+NETWORK = 'network'
+VOLUME = 'volume'
+CGROUP = 'cgroup'
+WORKPATH = 'workpath'
+
+# label that docker-compose sets on the volumes it creates
+COMPOSE_PROJECT_LABEL = 'com.docker.compose.project'
+
+# a resource that may belong to a cluster: the id identifies it for removal, size is in bytes
+# (None if unknown)
+Resource = namedtuple('Resource', 'kind, id, name, cluster_name, size')
+
+# live clusters are the ones with containers, used volumes are mounted by some container
+Snapshot = namedtuple('Snapshot', 'resources, live_clusters, used_volumes')
+
+
+def compose_project_name(cluster_name):
+    '''
+    The project name that docker-compose derives from the directory of a cluster, it is the
+    prefix of the volumes created for the cluster.
+    '''
+    return re.sub(r'[^-_a-z0-9]', '', cluster_name.lower())
+
+
+def cluster_of_network(network_name):
+    '''
+    Name of the cluster of a network, None if the network does not belong to dcluster.
+    '''
+    try:
+        return DockerNaming.deduce_cluster_name(network_name)
+    except NotFromDcluster:
+        pass
+
+    try:
+        return DockerNaming.deduce_data_cluster_name(network_name)
+    except NotFromDcluster:
+        return None
+
+
+def build_snapshot(docker_df, docker_networks, workpath_dirs, cluster_cgroups):
+    '''
+    Builds a snapshot from raw data:
+    - docker_df: output of the Docker API for 'docker system df' (containers and volumes)
+    - docker_networks: output of the Docker API for 'docker network ls'
+    - workpath_dirs: dictionary of cluster name -> (path, size) for the workpath directories
+    - cluster_cgroups: list of ClusterCgroup instances that exist
+    '''
+    resources = []
+    live_clusters = set()
+    used_volumes = set()
+
+    for container in docker_df.get('Containers') or []:
+        labels = container.get('Labels') or {}
+        if CLUSTER_LABEL in labels:
+            live_clusters.add(labels[CLUSTER_LABEL])
+
+        # containers created before the cluster label are recognized by their network
+        networks = (container.get('NetworkSettings') or {}).get('Networks') or {}
+        for network_name in networks:
+            cluster_name = cluster_of_network(network_name)
+            if cluster_name is not None:
+                live_clusters.add(cluster_name)
+
+        for mount in container.get('Mounts') or []:
+            if mount.get('Type') == 'volume':
+                used_volumes.add(mount['Name'])
+
+    for network in docker_networks:
+        cluster_name = cluster_of_network(network['Name'])
+        if cluster_name is not None:
+            resources.append(Resource(NETWORK, network['Id'], network['Name'], cluster_name, None))
+
+    for (cluster_name, (path, size)) in workpath_dirs.items():
+        resources.append(Resource(WORKPATH, path, path, cluster_name, size))
+
+    # volumes created before the cluster label are recognized by the compose project of a
+    # cluster that we know about
+    known_clusters = set(live_clusters)
+    known_clusters.update([resource.cluster_name for resource in resources])
+    projects = {compose_project_name(cluster_name): cluster_name
+                for cluster_name in known_clusters}
+
+    for volume in docker_df.get('Volumes') or []:
+        labels = volume.get('Labels') or {}
+        cluster_name = labels.get(CLUSTER_LABEL)
+        if cluster_name is None:
+            cluster_name = projects.get(labels.get(COMPOSE_PROJECT_LABEL))
+        if cluster_name is None:
+            # not from dcluster, or a cache that is shared by clusters
+            continue
+
+        size = (volume.get('UsageData') or {}).get('Size')
+        if size is not None and size < 0:
+            # not calculated by Docker
+            size = None
+        resources.append(Resource(VOLUME, volume['Name'], volume['Name'], cluster_name, size))
+
+    for cluster_cgroup in cluster_cgroups:
+        resources.append(Resource(CGROUP, cluster_cgroup, cluster_cgroup.path,
+                                  cluster_cgroup.cluster_name, None))
+
+    return Snapshot(resources, live_clusters, used_volumes)
+
+
+def find_orphans(snapshot):
+    '''
+    Returns the resources of the snapshot that do not belong to a live cluster, in the order of
+    removal.
+    '''
+    orphans = [
+        resource
+        for resource in snapshot.resources
+        if resource.cluster_name not in snapshot.live_clusters and
+        not (resource.kind == VOLUME and resource.id in snapshot.used_volumes)
+    ]
+
+    # a systemd slice also contains the slices of longer names (dcluster-my.slice contains
+    # dcluster-my-cluster.slice), never remove a slice that contains a live cluster
+    live_cgroup_paths = [
+        resource.name
+        for resource in snapshot.resources
+        if resource.kind == CGROUP and resource.cluster_name in snapshot.live_clusters
+    ]
+    orphans = [
+        resource
+        for resource in orphans
+        if resource.kind != CGROUP or
+        not any(path.startswith(resource.name + '/') for path in live_cgroup_paths)
+    ]
+
+    kind_order = (NETWORK, VOLUME, CGROUP, WORKPATH)
+    return sorted(orphans, key=lambda resource: (kind_order.index(resource.kind), resource.name))
+
+
+def directory_size(path):
+    '''
+    Total size of the files in a directory, in bytes.
+    '''
+    total = 0
+    for (dirpath, _, filenames) in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def find_workpath_dirs():
+    '''
+    Directories of the clusters in the workpath: dictionary of cluster name -> (path, size).
+    '''
+    clusters_dir = os.path.dirname(main_config.composer_workpath('any'))
+    if not os.path.isdir(clusters_dir):
+        return {}
+
+    workpath_dirs = {}
+    for cluster_name in os.listdir(clusters_dir):
+        path = os.path.join(clusters_dir, cluster_name)
+        if os.path.isdir(path):
+            workpath_dirs[cluster_name] = (path, directory_size(path))
+    return workpath_dirs
+
+
+def take_snapshot():
+    '''
+    Queries Docker and the filesystem once for all the resources that dcluster may leave behind.
+    '''
+    client = get_client()
+    docker_df = client.api.df()
+    docker_networks = client.api.networks()
+
+    cluster_cgroups = []
+    if main_config.cgroups('enabled'):
+        cluster_cgroups = cgroups.find_cluster_cgroups(DockerHost.cgroup_driver())
+
+    return build_snapshot(docker_df, docker_networks, find_workpath_dirs(), cluster_cgroups)
+
+
+def remove_resource(resource):
+    '''
+    Removes an orphaned resource from the host.
+    '''
+    if resource.kind == NETWORK:
+        get_client().api.remove_network(resource.id)
+
+    elif resource.kind == VOLUME:
+        get_client().api.remove_volume(resource.id)
+
+    elif resource.kind == CGROUP:
+        resource.id.remove()
+
+    elif resource.kind == WORKPATH:
+        shutil.rmtree(resource.id)
+
+    return resource
+
+
+class GarbageCollector(logger.LoggerMixin):
+    '''
+    Finds the orphaned resources of dcluster and removes them concurrently.
+    '''
+
+    def __init__(self, snapshot_func=take_snapshot, remove_func=remove_resource, is_busy=None):
+        self.snapshot_func = snapshot_func
+        self.remove_func = remove_func
+        self.is_busy = is_busy
+
+    def collect(self, dry_run=False):
+        '''
+        Removes the orphans, returns a pair (removed, failed) where removed is the list of
+        removed resources and failed is a list of (resource, error). With dry_run, nothing
+        is removed and all the orphans are returned as removed.
+        '''
+        orphans = find_orphans(self.snapshot_func())
+        self.logger.debug('Orphans: {}'.format(orphans))
+
+        if self.is_busy is not None:
+            # skip clusters that are being worked on by another process
+            busy = set([
+                cluster_name
+                for cluster_name in set([orphan.cluster_name for orphan in orphans])
+                if self.is_busy(cluster_name)
+            ])
+            orphans = [orphan for orphan in orphans if orphan.cluster_name not in busy]
+
+        if dry_run:
+            return (orphans, [])
+
+        removed = []
+        failed = []
+        for task_result in parallel.run_concurrently(self.remove_func, orphans):
+            if task_result.error is None:
+                removed.append(task_result.item)
+            else:
+                msg = 'Could not remove {} {}: {}'
+                self.logger.warning(msg.format(task_result.item.kind, task_result.item.name,
+                                               task_result.error))
+                failed.append((task_result.item, task_result.error))
+
+        return (removed, failed)
+
+
+def freed_size(resources):
+    '''
+    Total size in bytes of the resources, ignoring unknown sizes.
+    '''
+    return sum([resource.size for resource in resources if resource.size])
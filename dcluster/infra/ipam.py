@@ -0,0 +1,165 @@
+'''
+Address management inside the network of a cluster.
+
+The addresses of the subnet are tracked with a bitmap (an integer, bit i is the i-th host
+address of the subnet). The gateway and the head keep the last two addresses, compute nodes get
+the lowest free address, so that scaling in and out reuses the released addresses instead of
+fragmenting the subnet. Finding the lowest free address is a couple of integer operations, the
+addresses are not scanned.
+
+The record of each cluster is kept as JSON in its workpath (ipam.json), e.g.
+
+    {"subnet": "172.30.0.0/24", "used": "0x6000...0007", "reserved": ["172.30.0.253", ...]}
+
+The data network of a cluster, if any, has its own record (ipam-data.json).
+'''
+
+import ipaddress
+import json
+import os
+
+from dcluster.config import main_config
+from dcluster.util import fs as fs_util
+
+
+class AddressesExhausted(Exception):
+    '''
+    Raised when there are no free addresses left in the network of a cluster.
+    '''
+    pass
+
+
+def ipam_path(cluster_name, data=False):
+    '''
+    Where to keep the address record of a cluster, or of its data network.
+    '''
+    filename = 'ipam-data.json' if data else 'ipam.json'
+    return os.path.join(main_config.composer_workpath(cluster_name), filename)
+
+
+class ClusterIpam(object):
+    '''
+    Bitmap of the used addresses of a subnet. Reserved addresses (gateway, head) are never
+    allocated nor released.
+    '''
+
+    def __init__(self, subnet, used=0, reserved=()):
+        if hasattr(subnet, 'decode'):
+            subnet = subnet.decode('unicode-escape')
+        self.subnet = ipaddress.ip_network(u'{}'.format(subnet))
+        self.used = used
+        self.reserved = []
+
+        # host addresses are numbered from 0 (network address + 1)
+        self.first_host = int(self.subnet.network_address) + 1
+        self.host_count = self.subnet.num_addresses - 2
+
+        for ip_address in reserved:
+            self.reserve(ip_address, permanent=True)
+
+    @classmethod
+    def for_network(cls, cluster_network):
+        '''
+        New record for the network of a cluster, with its gateway and head reserved.
+        '''
+        return ClusterIpam(cluster_network.subnet, 0,
+                           (cluster_network.gateway_ip(), cluster_network.head_ip()))
+
+    @classmethod
+    def for_nodes(cls, cluster_network, ip_addresses):
+        '''
+        Record for the network of a cluster where the given addresses are used.
+        '''
+        cluster_ipam = ClusterIpam.for_network(cluster_network)
+        for ip_address in ip_addresses:
+            cluster_ipam.reserve(ip_address)
+        return cluster_ipam
+
+    def index_of(self, ip_address):
+        index = int(ipaddress.ip_address(u'{}'.format(ip_address))) - self.first_host
+        if index < 0 or index >= self.host_count:
+            raise ValueError('Address {} is not a host of {}'.format(ip_address, self.subnet))
+        return index
+
+    def address_at(self, index):
+        return str(ipaddress.ip_address(self.first_host + index))
+
+    def is_used(self, ip_address):
+        return bool(self.used >> self.index_of(ip_address) & 1)
+
+    def reserve(self, ip_address, permanent=False):
+        '''
+        Marks an address as used, e.g. the address of an existing node. Permanent addresses
+        cannot be released.
+        '''
+        self.used |= 1 << self.index_of(ip_address)
+        if permanent and str(ip_address) not in self.reserved:
+            self.reserved.append(str(ip_address))
+
+    def release(self, ip_address):
+        '''
+        Marks the address of a removed node as free.
+        '''
+        if str(ip_address) in self.reserved:
+            raise ValueError('Cannot release reserved address {}'.format(ip_address))
+        self.used &= ~(1 << self.index_of(ip_address))
+
+    def allocate(self):
+        '''
+        Takes the lowest free address. Raises AddressesExhausted if the subnet is full.
+        '''
+        # the lowest zero bit of used is the only bit set in (used + 1) & ~used
+        lowest_free = (self.used + 1) & ~self.used
+        index = lowest_free.bit_length() - 1
+        if index >= self.host_count:
+            raise AddressesExhausted('No free addresses in {}'.format(self.subnet))
+
+        self.used |= lowest_free
+        return self.address_at(index)
+
+    def allocate_many(self, count):
+        '''
+        Takes the count lowest free addresses, nothing is taken if there are not enough.
+        '''
+        if count > self.free_count():
+            msg = 'Not enough free addresses in {}: {} requested, {} free'
+            raise AddressesExhausted(msg.format(self.subnet, count, self.free_count()))
+        return [self.allocate() for _ in range(count)]
+
+    def free_count(self):
+        return self.host_count - bin(self.used).count('1')
+
+    def used_addresses(self):
+        return [self.address_at(index)
+                for index in range(self.used.bit_length()) if self.used >> index & 1]
+
+    def as_dict(self):
+        return {
+            'subnet': str(self.subnet),
+            'used': hex(self.used).rstrip('L'),
+            'reserved': list(self.reserved)
+        }
+
+    @classmethod
+    def from_dict(cls, ipam_dict):
+        return ClusterIpam(ipam_dict['subnet'], int(ipam_dict['used'], 16),
+                           ipam_dict.get('reserved') or ())
+
+
+def load(cluster_name, data=False):
+    '''
+    The address record of a cluster (or of its data network), None if there is no record.
+    '''
+    filename = ipam_path(cluster_name, data)
+    if not os.path.isfile(filename):
+        return None
+
+    with open(filename, 'r') as ipam_file:
+        return ClusterIpam.from_dict(json.load(ipam_file))
+
+
+def save(cluster_name, cluster_ipam, data=False):
+    filename = ipam_path(cluster_name, data)
+    fs_util.create_dir_dont_complain(os.path.dirname(filename))
+    with open(filename, 'w') as ipam_file:
+        json.dump(cluster_ipam.as_dict(), ipam_file, indent=2, sort_keys=True)
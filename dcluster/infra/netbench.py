@@ -0,0 +1,146 @@
+'''
+Local benchmark of the network drivers of dcluster.
+
+For each driver, a network is allocated from the supernet like a cluster network, and two
+containers are started on it: an iperf3 server and a client. The client measures the latency
+(ping) and the throughput (iperf3) to the server. The containers and the networks are removed
+afterwards.
+
+The image needs ping and iperf3, see scripts/network-benchmark.sh.
+'''
+
+import argparse
+import json
+import re
+import sys
+
+from collections import namedtuple
+
+from dcluster.util import logger
+
+from . import networking
+from .docker_facade import get_client
+
+# latency is the average round trip in milliseconds, throughput is in Gbit/s
+BenchResult = namedtuple('BenchResult', 'driver, latency_ms, throughput_gbps, error')
+
+DEFAULT_IMAGE = 'networkstatic/iperf3'
+
+
+def parse_ping(output):
+    '''
+    Average round trip time in milliseconds, from the summary of ping (iputils or busybox).
+    Returns None if there is no summary.
+    '''
+    match = re.search(r'(?:rtt|round-trip) min/avg/max(?:/mdev)? = [\d.]+/([\d.]+)/', output)
+    if match is None:
+        return None
+    return float(match.group(1))
+
+
+def parse_iperf3(json_output):
+    '''
+    Received throughput in Gbit/s, from the JSON output of an iperf3 client.
+    '''
+    report = json.loads(json_output)
+    if 'error' in report:
+        raise ValueError('iperf3 failed: {}'.format(report['error']))
+    return report['end']['sum_received']['bits_per_second'] / 1e9
+
+
+def format_results(results):
+    '''
+    A table with a line for each driver.
+    '''
+    line_format = '{:10}{:>14}{:>18}  {}'
+    lines = [line_format.format('driver', 'latency (ms)', 'throughput (Gb/s)', '')]
+    for result in results:
+        latency = '-' if result.latency_ms is None else '{:.3f}'.format(result.latency_ms)
+        throughput = '-'
+        if result.throughput_gbps is not None:
+            throughput = '{:.2f}'.format(result.throughput_gbps)
+        lines.append(line_format.format(result.driver, latency, throughput,
+                                        result.error or '').rstrip())
+    return '\n'.join(lines)
+
+
+class NetworkBenchmark(logger.LoggerMixin):
+    '''
+    Runs the benchmark for one driver at a time, uses Docker.
+    '''
+
+    def __init__(self, image=DEFAULT_IMAGE, pings=20, seconds=5, parent=None):
+        self.image = image
+        self.pings = pings
+        self.seconds = seconds
+        self.parent = parent
+
+    def run(self, driver):
+        '''
+        Returns a BenchResult, errors are reported in the result.
+        '''
+        network_name = 'netbench-{}'.format(driver)
+        cluster_network = None
+        containers = []
+        try:
+            profile_network = {'driver': driver, 'parent': self.parent}
+            cluster_network = networking.DockerClusterNetworkFactory().create(
+                network_name, networking.driver_options(profile_network), driver)
+
+            server = self.__start(cluster_network, 'server', ['iperf3', '-s'])
+            containers.append(server)
+            client = self.__start(cluster_network, 'client', ['sleep', '3600'])
+            containers.append(client)
+
+            server.reload()
+            server_ip = server.attrs['NetworkSettings']['Networks'][
+                cluster_network.network_name]['IPAddress']
+
+            ping_cmd = 'ping -c {} -i 0.2 {}'.format(self.pings, server_ip)
+            (_, ping_output) = client.exec_run(ping_cmd)
+            latency = parse_ping(ping_output.decode('utf-8', 'replace'))
+
+            iperf_cmd = 'iperf3 -J -c {} -t {}'.format(server_ip, self.seconds)
+            (_, iperf_output) = client.exec_run(iperf_cmd)
+            throughput = parse_iperf3(iperf_output.decode('utf-8', 'replace'))
+
+            return BenchResult(driver, latency, throughput, None)
+
+        except Exception as e:
+            self.logger.warning('Benchmark of {} failed: {}'.format(driver, e))
+            return BenchResult(driver, None, None, str(e))
+
+        finally:
+            for container in containers:
+                container.remove(force=True)
+            if cluster_network is not None:
+                cluster_network.remove()
+
+    def __start(self, cluster_network, role, command):
+        name = '{}-{}'.format(cluster_network.network_name, role)
+        return get_client().containers.run(self.image, entrypoint=command[0], command=command[1:],
+                                           name=name, network=cluster_network.network_name,
+                                           detach=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Latency and throughput between two nodes, '
+                                                 'for each network driver')
+    parser.add_argument('--drivers', nargs='+', default=list(networking.DRIVERS),
+                        choices=networking.DRIVERS)
+    parser.add_argument('--image', default=DEFAULT_IMAGE,
+                        help='image with ping and iperf3 (default: %(default)s)')
+    parser.add_argument('--pings', type=int, default=20)
+    parser.add_argument('--seconds', type=int, default=5, help='duration of iperf3')
+    parser.add_argument('--parent', help='parent interface for macvlan/ipvlan (default: dummy)')
+    args = parser.parse_args(argv)
+
+    benchmark = NetworkBenchmark(args.image, args.pings, args.seconds, args.parent)
+    results = [benchmark.run(driver) for driver in args.drivers]
+    print(format_results(results))
+
+    return 1 if any([result.error for result in results]) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
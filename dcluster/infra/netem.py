@@ -0,0 +1,211 @@
+'''
+Emulation of an interconnect on the networks of a cluster.
+
+The links between containers are bridges with almost no latency, which hides the problems that
+distributed software shows on real interconnects. A profile can ask for latency, jitter, loss and
+a bandwidth cap on each node, e.g.:
+
+    network:
+      emulation:
+        delay: 50us
+        jitter: 10us
+        rate: 10gbit
+        loss: 0.01%
+
+The settings are applied with tc in the network namespace of each node (netem for delay, jitter
+and loss, a tbf child for the rate), so the containers need NET_ADMIN and the tc tool (iproute).
+An empty 'emulation' entry adds NET_ADMIN so that the settings can be changed later
+(dcluster netem).
+
+The current settings of a cluster are kept in its workpath, so that they are applied again when
+the cluster is started.
+'''
+
+import os
+import re
+import yaml
+
+from collections import namedtuple
+
+from dcluster.config import main_config
+from dcluster.util import fs as fs_util
+from dcluster.util import dyaml
+
+EMULATION_KEYS = ('delay', 'jitter', 'rate', 'loss')
+
+# effective round trip from the head to a node in milliseconds, throughput is in Gbit/s
+ProbeResult = namedtuple('ProbeResult', 'hostname, rtt_ms, throughput_gbps, error')
+
+# handles of the qdiscs, tbf is the child of netem
+NETEM_HANDLE = '1:'
+TBF_HANDLE = '10:'
+
+# latency of tbf: how long a packet may wait for tokens before it is dropped
+TBF_LATENCY = '50ms'
+
+# rates understood by tc, in bits per second (bps suffixes are bytes per second)
+RATE_UNITS = {
+    'bit': 1,
+    'kbit': 10 ** 3,
+    'mbit': 10 ** 6,
+    'gbit': 10 ** 9,
+    'tbit': 10 ** 12,
+    'bps': 8,
+    'kbps': 8 * 10 ** 3,
+    'mbps': 8 * 10 ** 6,
+    'gbps': 8 * 10 ** 9,
+    'tbps': 8 * 10 ** 12
+}
+
+
+class EmulationFailure(Exception):
+    '''
+    Raised when the emulation settings could not be applied to a node.
+    '''
+    pass
+
+
+class ProbeFailure(Exception):
+    '''
+    Raised when the network of a cluster cannot be probed, e.g. a tool is missing in the image.
+    '''
+    pass
+
+
+def emulation_settings(profile_network):
+    '''
+    The emulation settings of the 'network' (or 'data_network') entry of a profile, None if the
+    profile does not ask for emulation. Raises ValueError for unknown settings.
+    '''
+    if not isinstance(profile_network, dict) or profile_network.get('emulation') is None:
+        return None
+
+    emulation = profile_network['emulation'] or {}
+    unknown = set(emulation.keys()) - set(EMULATION_KEYS)
+    if unknown:
+        raise ValueError('Unknown emulation settings: {}'.format(', '.join(sorted(unknown))))
+
+    settings = {
+        key: str(value)
+        for (key, value) in emulation.items()
+        if value is not None
+    }
+    if 'rate' in settings:
+        parse_rate(settings['rate'])
+    return settings
+
+
+def parse_rate(rate):
+    '''
+    Converts a tc rate, e.g. '10gbit' or '125mbps', to bits per second.
+    Raises ValueError if the rate cannot be understood.
+    '''
+    match = re.match(r'^([\d.]+)\s*([a-z]*)$', str(rate).strip().lower())
+    if match is None or match.group(2) not in RATE_UNITS:
+        raise ValueError('Could not understand rate: {}'.format(rate))
+    return float(match.group(1)) * RATE_UNITS[match.group(2)]
+
+
+def tbf_burst(rate):
+    '''
+    Bucket size of tbf in bytes: 10ms worth of traffic, at least a full Ethernet frame.
+    '''
+    return max(int(parse_rate(rate) / 8 / 100), 1540)
+
+
+def tc_commands(interface, settings):
+    '''
+    The tc commands that apply the settings to an interface, replacing any previous settings.
+    Without settings, the root qdisc is removed (back to the default of the interface).
+    '''
+    if not settings:
+        return ['tc qdisc del dev {} root'.format(interface)]
+
+    netem = ['tc qdisc replace dev {} root handle {} netem'.format(interface, NETEM_HANDLE)]
+    if settings.get('delay'):
+        netem.append('delay {}'.format(settings['delay']))
+        if settings.get('jitter'):
+            netem.append(settings['jitter'])
+    if settings.get('loss'):
+        netem.append('loss {}'.format(settings['loss']))
+    commands = [' '.join(netem)]
+
+    if settings.get('rate'):
+        tbf = 'tc qdisc replace dev {} parent {}1 handle {} tbf rate {} burst {} latency {}'
+        commands.append(tbf.format(interface, NETEM_HANDLE, TBF_HANDLE, settings['rate'],
+                                   tbf_burst(settings['rate']), TBF_LATENCY))
+
+    return commands
+
+
+def interface_for_address(ip_output, ip_address):
+    '''
+    Name of the interface that has an IPv4 address, from the output of 'ip -o -4 addr show'.
+    Returns None if no interface has the address.
+    '''
+    for line in ip_output.splitlines():
+        parts = line.split()
+        if len(parts) > 3 and parts[2] == 'inet' and parts[3].split('/')[0] == ip_address:
+            # e.g. 'eth0@if12'
+            return parts[1].split('@')[0]
+    return None
+
+
+def settings_path(cluster_name):
+    '''
+    Where to keep the current emulation settings of a cluster.
+    '''
+    return os.path.join(main_config.composer_workpath(cluster_name), 'netem.yml')
+
+
+def saved_settings(cluster_name):
+    '''
+    The current emulation settings of a cluster, as a dictionary network name -> settings.
+    '''
+    filename = settings_path(cluster_name)
+    if not os.path.isfile(filename):
+        return {}
+
+    with open(filename, 'r') as settings_file:
+        return yaml.load(settings_file, Loader=yaml.SafeLoader) or {}
+
+
+def save_settings(cluster_name, network_name, settings):
+    '''
+    Records the emulation settings of a network of a cluster, no settings remove the entry.
+    '''
+    all_settings = saved_settings(cluster_name)
+    if settings:
+        all_settings[network_name] = settings
+    else:
+        all_settings.pop(network_name, None)
+
+    filename = settings_path(cluster_name)
+    fs_util.create_dir_dont_complain(os.path.dirname(filename))
+    dyaml.dump_to_filepath(all_settings, filename)
+
+
+def describe(settings):
+    '''
+    One-line description of emulation settings.
+    '''
+    if not settings:
+        return 'none'
+    return ', '.join(['{}={}'.format(key, settings[key])
+                      for key in EMULATION_KEYS if key in settings])
+
+
+def format_probe(results):
+    '''
+    A table with a line for each probed node.
+    '''
+    line_format = '{:14}{:>10}{:>18}  {}'
+    lines = [line_format.format('node', 'rtt (ms)', 'throughput (Gb/s)', '').rstrip()]
+    for result in results:
+        rtt = '-' if result.rtt_ms is None else '{:.3f}'.format(result.rtt_ms)
+        throughput = '-'
+        if result.throughput_gbps is not None:
+            throughput = '{:.3f}'.format(result.throughput_gbps)
+        lines.append(line_format.format(result.hostname, rtt, throughput,
+                                        result.error or '').rstrip())
+    return '\n'.join(lines)
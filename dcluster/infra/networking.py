@@ -3,6 +3,17 @@ Creates a C-class named network for a Docker cluster.
 Two conditions for creation:
 - The name must not exist beforehand
 - The IP range must be available.
+
+The subnets are taken from pools, the 'supernet' of the networking configuration is either a
+single supernet (with 'cidr_bits') or an ordered list of pools, each with its own subnet size:
+
+    supernet:
+      - {supernet: '172.29.0.0/16', cidr_bits: 27}
+      - {supernet: '172.30.0.0/16', cidr_bits: 24}
+
+A cluster gets a subnet of the smallest size that fits its nodes and gateway, pools of the same
+size are used in order. The free space of each pool is indexed from the networks that exist in
+Docker, so that taken subnets are never tried.
 '''
 
 import ipaddress
@@ -12,18 +23,260 @@ import unittest
 from six.moves import input
 
 from dcluster.config import main_config
+from dcluster.util import lock
 
 from .docker_facade import DockerNaming, DockerNetworking, NetworkSubnetTaken
 
 SUPERNET = main_config.networking('supernet')
+DATA_SUPERNET = main_config.networking('data_supernet')
 CIDR_BITS = main_config.networking('cidr_bits')
 
+# addresses of a cluster besides the compute nodes: head and gateway
+RESERVED_ADDRESSES = 2
+
+# driver option of Docker for the MTU of a bridge network
+MTU_OPTION = 'com.docker.network.driver.mtu'
 
-def create(cluster_name):
+# supported network drivers, macvlan and ipvlan avoid the bridge and the veth pairs
+DRIVERS = ('bridge', 'macvlan', 'ipvlan')
+
+
+def create(cluster_name, driver_opts=None, driver='bridge', compute_count=None):
     '''
     Convenience function that uses the default configuration.
+    Concurrent dcluster processes take turns to choose a subnet and create the network.
+    '''
+    subnet_lock = lock.FileLock(main_config.lock_path('subnet'), main_config.prefs('lock_timeout'))
+    with subnet_lock:
+        return DockerClusterNetworkFactory().create(cluster_name, driver_opts, driver,
+                                                    address_count(compute_count))
+
+
+def create_many(cluster_names, driver_opts_list=None, drivers=None, compute_counts=None):
+    '''
+    Convenience function that uses the default configuration to create the networks of many
+    clusters, see DockerClusterNetworkFactory.create_many().
+    '''
+    counts = None
+    if compute_counts is not None:
+        counts = [address_count(compute_count) for compute_count in compute_counts]
+
+    subnet_lock = lock.FileLock(main_config.lock_path('subnet'), main_config.prefs('lock_timeout'))
+    with subnet_lock:
+        return DockerClusterNetworkFactory().create_many(cluster_names, driver_opts_list, drivers,
+                                                         counts)
+
+
+def create_data(cluster_name, driver_opts=None, driver='bridge', compute_count=None):
+    '''
+    Creates the data network of a cluster, with a subnet of the data supernet.
+    '''
+    subnet_lock = lock.FileLock(main_config.lock_path('subnet'), main_config.prefs('lock_timeout'))
+    with subnet_lock:
+        factory = DockerClusterNetworkFactory(DATA_SUPERNET, CIDR_BITS, data=True)
+        return factory.create(cluster_name, driver_opts, driver, address_count(compute_count))
+
+
+def address_count(compute_count):
+    '''
+    Addresses needed by a cluster: compute nodes, head and gateway. None if not known.
+    '''
+    if compute_count is None:
+        return None
+    return compute_count + RESERVED_ADDRESSES
+
+
+def supernet_pools(supernet, cidr_bits):
+    '''
+    The pools of a supernet configuration, as a list of SubnetPool in the configured order.
+    The configuration is a supernet string, or a list of pools (dictionaries with 'supernet'
+    and an optional 'cidr_bits', or supernet strings) where cidr_bits is the default size.
+    '''
+    if not isinstance(supernet, list):
+        supernet = [supernet]
+
+    pools = []
+    for pool_config in supernet:
+        if isinstance(pool_config, dict):
+            pools.append(SubnetPool(pool_config['supernet'],
+                                    pool_config.get('cidr_bits', cidr_bits)))
+        else:
+            pools.append(SubnetPool(pool_config, cidr_bits))
+    return pools
+
+
+def fitting_pools(pools, host_count=None):
+    '''
+    The pools with subnets that have room for host_count addresses, smallest subnets first and
+    in the configured order for the same size. All the pools in order if host_count is None.
+    Raises NetworkSubnetTooSmall if no pool fits.
     '''
-    return DockerClusterNetworkFactory().create(cluster_name)
+    if host_count is None:
+        return list(pools)
+
+    fitting = [pool for pool in pools if pool.host_count >= host_count]
+    if not fitting:
+        msg = 'No subnet is large enough for {} addresses, pools: {}'
+        raise NetworkSubnetTooSmall(msg.format(host_count, ', '.join([str(p) for p in pools])))
+
+    # sorted() is stable
+    return sorted(fitting, key=lambda pool: pool.host_count)
+
+
+class SubnetPool(object):
+    '''
+    A supernet that is split into subnets of the same size (cidr_bits).
+    '''
+
+    def __init__(self, supernet, cidr_bits):
+        # python2 wants unicode, python3 does not like using decode
+        if hasattr(supernet, 'decode'):
+            supernet = supernet.decode('unicode-escape')
+
+        self.network = ipaddress.ip_network(supernet)
+        self.cidr_bits = int(cidr_bits)
+        if self.cidr_bits < self.network.prefixlen:
+            msg = 'Subnets /{} do not fit in the supernet {}'
+            raise ValueError(msg.format(self.cidr_bits, self.network))
+
+    @property
+    def host_count(self):
+        '''
+        Usable addresses in each subnet of the pool.
+        '''
+        return 2 ** (self.network.max_prefixlen - self.cidr_bits) - 2
+
+    def __str__(self):
+        return '{}:/{}'.format(self.network, self.cidr_bits)
+
+
+class FreeSubnetIndex(object):
+    '''
+    Free space of a pool, as an ordered list of free CIDR blocks that can hold at least a subnet
+    of the pool. Built once from the subnets that are taken, and updated as subnets are taken,
+    so that finding a free subnet does not depend on how full the pool is.
+    '''
+
+    def __init__(self, pool, taken_subnets=()):
+        self.pool = pool
+        self.free_blocks = [pool.network]
+        for taken in taken_subnets:
+            self.take(taken)
+
+    def next_free(self):
+        '''
+        The first free subnet of the pool, None if the pool is full. Does not take it.
+        '''
+        if not self.free_blocks:
+            return None
+
+        block = self.free_blocks[0]
+        if block.prefixlen == self.pool.cidr_bits:
+            return block
+        return next(block.subnets(new_prefix=self.pool.cidr_bits))
+
+    def take(self, subnet):
+        '''
+        Marks a subnet (or any network that overlaps the pool) as taken.
+        '''
+        if subnet.version != self.pool.network.version:
+            return
+
+        free_blocks = []
+        for block in self.free_blocks:
+            if not block.overlaps(subnet):
+                free_blocks.append(block)
+            elif block.prefixlen < subnet.prefixlen:
+                # CIDR blocks are either nested or disjoint, split the block around the subnet
+                free_blocks.extend(block.address_exclude(subnet))
+            # else the whole block is taken
+
+        self.free_blocks = sorted([
+            block
+            for block in free_blocks
+            if block.prefixlen <= self.pool.cidr_bits
+        ])
+
+    def free_count(self):
+        '''
+        Number of free subnets in the pool.
+        '''
+        return sum([2 ** (self.pool.cidr_bits - block.prefixlen) for block in self.free_blocks])
+
+
+def remove_data(cluster_name):
+    '''
+    Removes the data network of a cluster, if it has one.
+    '''
+    network_name = DockerNaming.create_data_network_name(cluster_name)
+    for docker_network in DockerNetworking.all_docker_networks():
+        if docker_network.name == network_name:
+            docker_network.remove()
+
+
+def find_data(cluster_name):
+    '''
+    The data network of a cluster as a DockerClusterNetwork, None if the cluster has none.
+    '''
+    network_name = DockerNaming.create_data_network_name(cluster_name)
+    for docker_network in DockerNetworking.all_docker_networks():
+        if docker_network.name == network_name:
+            subnet = DockerNetworking.get_subnet(docker_network)
+            driver_opts = docker_network.attrs.get('Options') or {}
+            driver = docker_network.attrs.get('Driver') or 'bridge'
+            data_network = ClusterNetwork(subnet, cluster_name, driver_opts, driver, data=True)
+            return DockerClusterNetwork(data_network, docker_network)
+    return None
+
+
+def network_driver(profile_network=None):
+    '''
+    Driver of the network of a cluster: 'driver' of the networking configuration, overridden by
+    the 'network' entry of the profile. Raises ValueError for an unsupported driver.
+    '''
+    driver = (profile_network or {}).get('driver') or main_config.get_config()['networking'].get(
+        'driver', 'bridge')
+    if driver not in DRIVERS:
+        msg = 'Unsupported network driver: {}, expected one of {}'
+        raise ValueError(msg.format(driver, DRIVERS))
+    return driver
+
+
+def check_reachable_from_host(driver, purpose):
+    '''
+    The host cannot reach the nodes of a macvlan or ipvlan network: the kernel does not pass
+    traffic between a parent interface and its children, with or without a dummy parent.
+    Raises ValueError if the purpose (e.g. 'ssh') needs to connect to the nodes from the host.
+    '''
+    if driver != 'bridge':
+        msg = '{} needs to reach the nodes from the host, not possible with the {} network driver'
+        raise ValueError(msg.format(purpose, driver))
+
+
+def driver_options(profile_network=None):
+    '''
+    Options of the network driver for a cluster: 'mtu' and 'driver_opts' of the networking
+    configuration, overridden by the 'network' entry of the profile. Docker wants strings.
+
+    The MTU is an option of the bridge driver only, macvlan and ipvlan networks have the MTU of
+    their parent. For these, 'parent' (and 'ipvlan_mode') are driver options instead.
+    '''
+    sources = (main_config.get_config()['networking'], profile_network or {})
+    driver = network_driver(profile_network)
+
+    options = {}
+    for source in sources:
+        for (key, value) in (source.get('driver_opts') or {}).items():
+            options[key] = str(value)
+        if driver == 'bridge' and source.get('mtu') is not None:
+            options[MTU_OPTION] = str(source['mtu'])
+
+        if driver != 'bridge' and source.get('parent'):
+            options['parent'] = str(source['parent'])
+        if driver == 'ipvlan' and source.get('ipvlan_mode'):
+            options['ipvlan_mode'] = str(source['ipvlan_mode'])
+
+    return options
 
 
 class ClusterNetwork(object):
@@ -33,10 +286,13 @@ class ClusterNetwork(object):
     (docker.models.networks.Network).
     '''
 
-    def __init__(self, subnet, cluster_name):
+    def __init__(self, subnet, cluster_name, driver_opts=None, driver='bridge', data=False):
         self.subnet = subnet
         self.all_ip_addresses = list(self.subnet.hosts())
         self.cluster_name = cluster_name
+        self.driver_opts = driver_opts or {}
+        self.driver = driver
+        self.data = data
         self.__docker_network = None
         self.log = logging.getLogger()
 
@@ -85,13 +341,15 @@ class ClusterNetwork(object):
         '''
         Name of the network that matches the specified cluster name.
         '''
+        if self.data:
+            return DockerNaming.create_data_network_name(self.cluster_name)
         return DockerNaming.create_network_name(self.cluster_name)
 
     def as_dict(self):
         '''
         Returns a dictionary representation for the network, to be used as a cluster spec entry.
         '''
-        return {
+        network_dict = {
             'name': self.network_name,
             'address': self.ip_address(),
             'subnet': str([net for net in self.subnet][0]),  # e.g. '17.30.0.0'
@@ -102,6 +360,16 @@ class ClusterNetwork(object):
             'gateway_ip': self.gateway_ip()
         }
 
+        # only tuned networks record their driver and options
+        if self.driver != 'bridge':
+            network_dict['driver'] = self.driver
+        if self.driver_opts:
+            network_dict['driver_opts'] = dict(self.driver_opts)
+        if MTU_OPTION in self.driver_opts:
+            network_dict['mtu'] = int(self.driver_opts[MTU_OPTION])
+
+        return network_dict
+
     def __str__(self):
         return self.ip_address()
 
@@ -132,19 +400,14 @@ class ClusterNetwork(object):
         Returns a generator of ClusterNetwork, based on the subnet generator for all possible
         subnets given the supernet and cidr_bits.
         '''
-        # python2 wants unicode, python3 does not like using decode
-        # this works on both
-        if hasattr(supernet, 'decode'):
-            supernet = supernet.decode('unicode-escape')
-
         # https://docs.python.org/3/library/ipaddress.html
-        super_network = ipaddress.ip_network(supernet)
-        logging.getLogger().debug('super network %s ' % super_network)
-        possible_subnets = super_network.subnets(new_prefix=cidr_bits)
+        for pool in supernet_pools(supernet, cidr_bits):
+            logging.getLogger().debug('super network %s ' % pool.network)
+            possible_subnets = pool.network.subnets(new_prefix=pool.cidr_bits)
 
-        # this will turn this function into a generator that yields instances of this class
-        for subnet in possible_subnets:
-            yield ClusterNetwork(subnet, cluster_name)
+            # this will turn this function into a generator that yields instances of this class
+            for subnet in possible_subnets:
+                yield ClusterNetwork(subnet, cluster_name)
 
 
 class DockerClusterNetwork(ClusterNetwork):
@@ -156,7 +419,10 @@ class DockerClusterNetwork(ClusterNetwork):
     def __init__(self, cluster_network, docker_network):
         subnet = cluster_network.subnet
         cluster_name = cluster_network.cluster_name
-        super(DockerClusterNetwork, self).__init__(subnet, cluster_name)
+        driver_opts = cluster_network.driver_opts
+        driver = cluster_network.driver
+        super(DockerClusterNetwork, self).__init__(subnet, cluster_name, driver_opts, driver,
+                                                   cluster_network.data)
         self.docker_network = docker_network
 
         self.log = logging.getLogger()
@@ -212,17 +478,65 @@ class DockerClusterNetworkFactory:
     '''
     Creates instances of DockerClusterNetwork.
 
-    It works by attempting to create a Docker network with a subnet range within a specified
-    supernet. If the subnet is taken, the attempt fails but no exception is returned to the caller
-    yet. Instead, the next subnets are tried iteratively.
+    It works by attempting to create a Docker network with a free subnet of the pools of a
+    supernet configuration, see supernet_pools(). The subnets of the existing Docker networks are
+    queried once to index the free space of the pools. If a subnet is taken anyway (e.g. by
+    another Docker client), the attempt fails but no exception is returned to the caller yet.
+    Instead, the next free subnets are tried iteratively.
 
-    This continues until a subnet is successfully created or all subnets are tried. In the latter
-    scenario, the request fails and NoNetworkSubnetsAvaialble is raised to the caller.
+    This continues until a subnet is successfully created or all free subnets are tried. In the
+    latter scenario, the request fails and NoNetworkSubnetsAvaialble is raised to the caller.
     '''
 
-    def __init__(self, supernet=SUPERNET, cidr_bits=CIDR_BITS):
+    def __init__(self, supernet=SUPERNET, cidr_bits=CIDR_BITS, data=False):
         self.supernet = supernet
         self.cidr_bits = cidr_bits
+        self.data = data
+        self.pools = supernet_pools(supernet, cidr_bits)
+
+    def free_subnet_indexes(self, docker_networks=None):
+        '''
+        An index of the free space of each pool, as a list in the order of the pools.
+        The existing Docker networks are queried unless they are given.
+        '''
+        if docker_networks is None:
+            docker_networks = DockerNetworking.all_docker_networks()
+        taken_subnets = DockerNetworking.subnets_in_use(docker_networks)
+        return [FreeSubnetIndex(pool, taken_subnets) for pool in self.pools]
+
+    def network_name(self, cluster_name):
+        '''
+        Name of the network of a cluster that is created by this factory.
+        '''
+        if self.data:
+            return DockerNaming.create_data_network_name(cluster_name)
+        return DockerNaming.create_network_name(cluster_name)
+
+    def create_in_pools(self, cluster_name, driver_opts, driver, indexes, host_count=None):
+        '''
+        Creates the network with the first free subnet of the smallest pools that fit
+        host_count addresses. The subnet is taken from the indexes, which are in the order of
+        the pools. Returns DockerClusterNetwork instance, or None if all the fitting pools are
+        full.
+        '''
+        for pool in fitting_pools(self.pools, host_count):
+            index = indexes[self.pools.index(pool)]
+            subnet = index.next_free()
+            while subnet is not None:
+                index.take(subnet)
+                candidate = ClusterNetwork(subnet, cluster_name, driver_opts, driver, self.data)
+                try:
+                    docker_network = DockerNetworking.create_network(candidate)
+                    return DockerClusterNetwork(candidate, docker_network)
+                except NetworkSubnetTaken:
+                    # taken after the query, keep trying
+                    subnet = index.next_free()
+
+        return None
+
+    def no_subnets_error(self):
+        msg = 'No more subnets available for network %s'
+        return NoNetworkSubnetsAvaialble(msg % ', '.join([str(pool) for pool in self.pools]))
 
     def validate_network_name(self, network_name):
         '''
@@ -267,10 +581,14 @@ class DockerClusterNetworkFactory:
         docker_cluster_network = DockerClusterNetwork(cluster_network, docker_network)
         return docker_cluster_network
 
-    def create(self, cluster_name):
+    def create(self, cluster_name, driver_opts=None, driver='bridge', host_count=None):
         '''
-        Calls 'attempt_create' iteratively until a network is created, or until
-        all possible subnets have been exhausted. Returns DockerClusterNetwork instance
+        Creates the network of a cluster with a free subnet, trying the subnets until a network
+        is created, or until all free subnets have been exhausted. Returns DockerClusterNetwork
+        instance. The network is created with the driver and its options, if any.
+
+        The subnet is the smallest that fits host_count addresses, if given.
+        See fitting_pools(), NetworkSubnetTooSmall is raised if no pool fits.
 
         If the cluster_name exists, NameExistsException is raised immediately, and no further
         attempts are made.
@@ -278,27 +596,67 @@ class DockerClusterNetworkFactory:
         If it is not possible to create a network (all IP ranges for the specified main network
         are taken) then NoNetworkSubnetsAvaialble is raised to the caller.
         '''
-        docker_cluster_network = None
-        cluster_network_candidates = self.cluster_network_candidates(cluster_name)
+        # validate name to have one less reason that network creation fails
+        network_name = self.network_name(cluster_name)
+        docker_networks = DockerNetworking.all_docker_networks()
+        if network_name in [network.name for network in docker_networks]:
+            raise NameExistsException('Network name is already in use: %s' % network_name)
 
-        while docker_cluster_network is None:
+        indexes = self.free_subnet_indexes(docker_networks)
+        docker_cluster_network = self.create_in_pools(cluster_name, driver_opts, driver, indexes,
+                                                      host_count)
+        if docker_cluster_network is None:
+            raise self.no_subnets_error()
 
-            try:
-                cluster_network_candidate = next(cluster_network_candidates)
-                docker_cluster_network = self.attempt_create(cluster_network_candidate)
-            except NetworkSubnetTaken:
-                # this subnet is taken, keep trying before giving up
+        return docker_cluster_network
+
+    def create_many(self, cluster_names, driver_opts_list=None, drivers=None, host_counts=None):
+        '''
+        Creates the networks of many clusters with a single index of the free subnets, the
+        existing Docker networks are only queried once. The driver options, the driver and the
+        number of addresses of each network can be given in lists that match the names.
+
+        Returns a list with an item for each cluster name, in order: the DockerClusterNetwork
+        instance, or the exception that prevented its creation (NameExistsException,
+        NoNetworkSubnetsAvaialble, NetworkSubnetTooSmall), so that the other networks are still
+        created.
+        '''
+        existing_networks = DockerNetworking.all_docker_networks()
+        used_names = set([network.name for network in existing_networks])
+
+        # shared by all the clusters, a subnet is never tried twice
+        indexes = self.free_subnet_indexes(existing_networks)
+
+        if driver_opts_list is None:
+            driver_opts_list = [None] * len(cluster_names)
+        if drivers is None:
+            drivers = ['bridge'] * len(cluster_names)
+        if host_counts is None:
+            host_counts = [None] * len(cluster_names)
+
+        results = []
+        for (cluster_name, driver_opts, driver, host_count) in zip(cluster_names, driver_opts_list,
+                                                                   drivers, host_counts):
+            network_name = self.network_name(cluster_name)
+            if network_name in used_names:
+                msg = 'Network name is already in use: %s'
+                results.append(NameExistsException(msg % network_name))
                 continue
 
-            except StopIteration:
-                # there are no more subnets to try, give up
-                msg = 'No more subnets available for network %s and CIDR bits %s'
-                raise NoNetworkSubnetsAvaialble(msg % (str(self.supernet),
-                                                       str(self.cidr_bits)))
+            try:
+                docker_cluster_network = self.create_in_pools(cluster_name, driver_opts, driver,
+                                                              indexes, host_count)
+            except NetworkSubnetTooSmall as e:
+                results.append(e)
+                continue
 
-            # note the lack of 'except NameExistsException'
+            if docker_cluster_network is None:
+                results.append(self.no_subnets_error())
+            else:
+                used_names.add(network_name)
+                results.append(docker_cluster_network)
 
-        return docker_cluster_network
+        return results
 
     @classmethod
     def from_existing(cls, cluster_name):
@@ -309,7 +667,9 @@ class DockerClusterNetworkFactory:
         '''
         docker_network = DockerNetworking.find_network(cluster_name)
         subnet = DockerNetworking.get_subnet(docker_network)
-        cluster_network = ClusterNetwork(subnet, cluster_name)
+        driver_opts = docker_network.attrs.get('Options') or {}
+        driver = docker_network.attrs.get('Driver') or 'bridge'
+        cluster_network = ClusterNetwork(subnet, cluster_name, driver_opts, driver)
         return DockerClusterNetwork(cluster_network, docker_network)
 
 
@@ -16,22 +16,36 @@ from dcluster.cli import manage as manage_cli
 from dcluster.cli import ssh as ssh_cli
 from dcluster.cli import init as init_cli
 from dcluster.cli import ansible as ansible_cli
+from dcluster.cli import service as service_cli
 
 
-def processRequest():
+def build_parser():
     '''
-    Handle 'dcluster' requests using argparse and subparsers for each subcommand.
+    The parser of 'dcluster' requests, with subparsers for each subcommand. The subcommand is
+    stored in 'command' and its function in 'func'.
     '''
 
     # top level parser
     desc = 'dcluster: deploy clusters of Docker containers'
     parser = argparse.ArgumentParser(prog='dcluster', description=desc)
-    subparsers = parser.add_subparsers(help='Run dcluster <command> for additional help')
+    subparsers = parser.add_subparsers(help='Run dcluster <command> for additional help',
+                                       dest='command')
 
     # below we create subparsers for the subcommands
     create_parser = subparsers.add_parser('create', help='create a cluster')
     create_cli.configure_parser(create_parser)
 
+    create_many_parser = subparsers.add_parser('create-many',
+                                               help='create many clusters from a manifest')
+    create_cli.configure_create_many_parser(create_many_parser)
+
+    clone_parser = subparsers.add_parser('clone', help='create a cluster from a snapshot')
+    create_cli.configure_clone_parser(clone_parser)
+
+    msg = 'change the number of compute nodes of a running cluster'
+    scale_parser = subparsers.add_parser('scale', help=msg)
+    create_cli.configure_scale_parser(scale_parser)
+
     show_parser = subparsers.add_parser('show', help='show details of a cluster')
     display_cli.configure_show_parser(show_parser)
 
@@ -47,18 +61,63 @@ def processRequest():
     start_parser = subparsers.add_parser('start', help='start a stopped cluster')
     manage_cli.configure_start_parser(start_parser)
 
+    pause_parser = subparsers.add_parser('pause', help='freeze all the nodes of a running cluster')
+    manage_cli.configure_pause_parser(pause_parser)
+
+    unpause_parser = subparsers.add_parser('unpause', help='resume a paused cluster')
+    manage_cli.configure_unpause_parser(unpause_parser)
+
     rm_parser = subparsers.add_parser('rm', help='remove a running or stopped cluster')
     manage_cli.configure_rm_parser(rm_parser)
 
+    msg = 'save the nodes of a cluster as images, to be cloned later'
+    snapshot_parser = subparsers.add_parser('snapshot', help=msg)
+    manage_cli.configure_snapshot_parser(snapshot_parser)
+
+    msg = 'remove networks, volumes and files left behind by removed clusters'
+    gc_parser = subparsers.add_parser('gc', help=msg)
+    manage_cli.configure_gc_parser(gc_parser)
+
+    msg = 'emulate the latency, bandwidth and loss of an interconnect in a cluster'
+    netem_parser = subparsers.add_parser('netem', help=msg)
+    manage_cli.configure_netem_parser(netem_parser)
+
+    msg = 'measure the network or the volumes of a cluster'
+    bench_parser = subparsers.add_parser('bench', help=msg)
+    manage_cli.configure_bench_parser(bench_parser)
+
+    exec_parser = subparsers.add_parser('exec', help='run a command on the nodes of a cluster')
+    manage_cli.configure_exec_parser(exec_parser)
+
+    msg = 'serve the commands of the CLI from a long-running process'
+    serve_parser = subparsers.add_parser('serve', help=msg)
+    service_cli.configure_serve_parser(serve_parser)
+
+    msg = 'follow the events of Docker to keep the records of the clusters current'
+    watch_parser = subparsers.add_parser('watch', help=msg)
+    manage_cli.configure_watch_parser(watch_parser)
+
     list_parser = subparsers.add_parser('list', help='list current clusters')
     display_cli.configure_list_parser(list_parser)
 
+    stats_parser = subparsers.add_parser('stats', help='show aggregate usage of a cluster')
+    display_cli.configure_stats_parser(stats_parser)
+
     ansible_parser = subparsers.add_parser('ansible', help='run ansible playbooks on a cluster')
     ansible_cli.configure_ansible_parser(ansible_parser)
 
     init_parser = subparsers.add_parser('init', help='setup dcluster dependencies')
     init_cli.configure_init_parser(init_parser)
 
+    return parser
+
+
+def processRequest():
+    '''
+    Handle 'dcluster' requests using argparse and subparsers for each subcommand.
+    '''
+    parser = build_parser()
+
     # show help if no subcommand is given
     if len(sys.argv) == 1:
         parser.print_help(sys.stderr)
@@ -67,6 +126,12 @@ def processRequest():
     # activate parsing and sub-command function call
     # note: we expect args.func(args) to succeed, since we are making sure we have subcommands
     args = parser.parse_args()
+
+    # a running service does the work if it can (dcluster serve)
+    exit_code = service_cli.call_service(args, sys.argv[1:])
+    if exit_code is not None:
+        sys.exit(exit_code)
+
     args.func(args)
 
 
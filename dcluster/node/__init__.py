@@ -6,4 +6,8 @@ BasicPlannedNode = namedtuple('BasicPlannedNode', 'hostname, container, image, i
 
 # node details for the 'default' plan when creating a cluster
 DefaultPlannedNode = namedtuple('DefaultPlannedNode', 'hostname, container, image, ip_address, \
-                                role, hostname_alias, volumes, static_text, systemctl')
+                                role, hostname_alias, volumes, static_text, systemctl, resources, \
+                                shm_size, ipc, data_ip_address')
+
+# optional fields, keep them last so that nodes can still be created with positional arguments
+DefaultPlannedNode.__new__.__defaults__ = (None, None, None, None)
@@ -1,10 +1,16 @@
+import docker
+
 from operator import attrgetter
 
 from . import BasicPlannedNode
 
+from dcluster.infra import caches, netem
 from dcluster.infra.docker_facade import DockerContainers, DockerNetworking
 from dcluster.util import logger
 
+# configures yum or dnf to use the package cache mounted at $DCLUSTER_PACKAGE_CACHE
+KEEPCACHE_COMMAND = '/bin/bash /dcluster/package-cache.sh'
+
 
 def planned_from_docker(docker_container, docker_network):
     '''
@@ -73,6 +79,57 @@ class DeployedNode(logger.LoggerMixin):
         '''
         return self.planned.role
 
+    @property
+    def is_paused(self):
+        '''
+        True iff the container of the node is frozen.
+        '''
+        return DockerContainers.is_paused(self.docker_container)
+
+    @property
+    def can_exec(self):
+        '''
+        True iff commands can run in the container of the node (running, not paused).
+        '''
+        return DockerContainers.can_exec(self.docker_container)
+
+    def pause(self):
+        '''
+        Freezes all processes of the node using the cgroup freezer (docker pause).
+        '''
+        self.logger.debug('Pausing {}'.format(self.docker_container.name))
+        self.docker_container.pause()
+
+    def unpause(self):
+        '''
+        Thaws all processes of a paused node (docker unpause).
+        '''
+        self.logger.debug('Unpausing {}'.format(self.docker_container.name))
+        self.docker_container.unpause()
+
+    def cpu_usage_usec(self):
+        '''
+        Total CPU time consumed by the node, in microseconds.
+        '''
+        return DockerContainers.cpu_usage_usec(self.docker_container)
+
+    def memory_usage(self):
+        '''
+        Memory used by the node, in bytes.
+        '''
+        return DockerContainers.memory_usage(self.docker_container)
+
+    def commit(self, repository, tag, labels=None):
+        '''
+        Commits the container of the node to a new image (docker commit), the container is
+        paused while committing. Returns the image.
+        '''
+        changes = [
+            'LABEL {}={}'.format(key, value)
+            for (key, value) in sorted((labels or {}).items())
+        ]
+        return self.docker_container.commit(repository=repository, tag=tag, changes=changes)
+
     def inject_public_ssh_key(self, ssh_target_path, public_key):
         '''
         Injects the SSH public_key (provided as string), and injects it to the node container.
@@ -88,6 +145,90 @@ class DeployedNode(logger.LoggerMixin):
 
         self.docker_container.exec_run(run_cmd)
 
+    def keep_package_cache(self):
+        '''
+        Configures yum (or dnf) to keep the downloaded packages, so that they are stored in the
+        package cache.
+        '''
+        run_cmd = KEEPCACHE_COMMAND
+
+        log_msg = 'Run in docker container %s: %s'
+        self.logger.debug(log_msg % (self.docker_container.name, run_cmd))
+
+        self.docker_container.exec_run(run_cmd)
+
+    def compiler_cache_stats(self):
+        '''
+        Statistics of the compiler cache as seen by the node (ccache -s), None if not available,
+        e.g. the node is paused or stopped.
+        '''
+        if not self.can_exec:
+            return None
+
+        try:
+            (exit_code, output) = self.docker_container.exec_run('ccache -s')
+        except docker.errors.APIError as e:
+            # the node may have been paused or stopped since it was inspected
+            self.logger.debug('No ccache stats in {}: {}'.format(self.docker_container.name, e))
+            return None
+
+        if exit_code != 0:
+            self.logger.debug('No ccache stats in {}: {}'.format(self.docker_container.name,
+                                                                 output))
+            return None
+        return caches.parse_ccache_stats(output.decode('utf-8', 'replace'))
+
+    def exec_command(self, command, detach=False):
+        '''
+        Runs a command (string or list) in the container of the node, returns a pair
+        (exit_code, output) where output is the combined stdout and stderr as text.
+        With detach, returns (None, '') without waiting for the command.
+        '''
+        if detach:
+            self.docker_container.exec_run(command, detach=True)
+            return (None, '')
+
+        (exit_code, output) = self.docker_container.exec_run(command)
+        return (exit_code, output.decode('utf-8', 'replace'))
+
+    def has_command(self, command_name):
+        '''
+        True if the command is found in the PATH of the container of the node.
+        '''
+        (exit_code, _) = self.exec_command(['sh', '-c', 'command -v {}'.format(command_name)])
+        return exit_code == 0
+
+    def address_in(self, network_name):
+        '''
+        The IP address of the node in a Docker network, None if the node is not attached to it.
+        '''
+        container_networks = self.docker_container.attrs['NetworkSettings']['Networks']
+        if network_name not in container_networks:
+            return None
+        return container_networks[network_name]['IPAddress']
+
+    def emulate(self, network_name, settings):
+        '''
+        Applies interconnect emulation settings (see infra.netem) to the interface of the node in
+        a Docker network, no settings remove the emulation. Requires NET_ADMIN and tc.
+        '''
+        ip_address = self.address_in(network_name)
+        (exit_code, ip_output) = self.exec_command('ip -o -4 addr show')
+        interface = None
+        if exit_code == 0 and ip_address is not None:
+            interface = netem.interface_for_address(ip_output, ip_address)
+        if interface is None:
+            msg = 'No interface for {} in {}: {}'
+            raise netem.EmulationFailure(msg.format(network_name, self.hostname, ip_output))
+
+        for command in netem.tc_commands(interface, settings):
+            (exit_code, output) = self.exec_command(command)
+            if exit_code != 0 and settings:
+                msg = 'Failed to run {} in {}: {}'
+                raise netem.EmulationFailure(msg.format(command, self.hostname, output))
+
+        self.logger.debug('Emulation of {} in {}: {}'.format(interface, self.hostname, settings))
+
     def needs_init_fix(self):
         return DockerContainers.has_sys_admin_cap(self.docker_container)
 
@@ -1,6 +1,7 @@
 from . import BasicPlannedNode, DefaultPlannedNode
 
 from dcluster.config import main_config
+from dcluster.infra import caches
 from dcluster.infra.docker_facade import DockerNaming
 from dcluster.util import dyaml
 
@@ -20,7 +21,7 @@ class BasicNodePlanner(object):
         '''
         head_ip = self.cluster_network.head_ip()
         head_hostname = plan_data['head']['hostname']
-        head_image = plan_data['head']['image']
+        head_image = self.node_image(plan_data, 'head', head_hostname)
 
         head_plan = self.create_node_plan(plan_data['name'], head_hostname, head_ip,
                                           head_image, 'head')
@@ -32,11 +33,19 @@ class BasicNodePlanner(object):
         Creates an instance of BasicPlannedNode for one of the compute nodes in the cluster.
         '''
         compute_hostname = self.create_compute_hostname(plan_data, index)
-        compute_image = plan_data['compute']['image']
+        compute_image = self.node_image(plan_data, 'compute', compute_hostname)
         compute_plan = self.create_node_plan(plan_data['name'], compute_hostname, compute_ip,
                                              compute_image, 'compute')
         return compute_plan
 
+    def node_image(self, plan_data, role, hostname):
+        '''
+        Returns the image of a node. The request may override the image of the profile with an
+        'images' dictionary, keyed by hostname or by role (the hostname takes precedence).
+        '''
+        images = plan_data.get('images') or {}
+        return images.get(hostname, images.get(role, plan_data[role]['image']))
+
     def create_node_plan(self, cluster_name, hostname, ip_address, image, role):
         '''
         Creates an instance of BasicPlannedNode for some node of the cluster.
@@ -71,9 +80,11 @@ class DefaultNodePlanner(BasicNodePlanner):
     proper indentation for a later renderization.
     '''
 
-    def __init__(self, cluster_network):
+    def __init__(self, cluster_network, data_network=None, data_ips=None):
         super(DefaultNodePlanner, self).__init__(cluster_network)
         self.basic = super(DefaultNodePlanner, self)
+        self.data_network = data_network
+        self.data_ips = data_ips
 
     def create_head_plan(self, plan_data):
         '''
@@ -81,7 +92,11 @@ class DefaultNodePlanner(BasicNodePlanner):
         '''
         # reuse BasicPlannedNode for the basic details
         basic_planned_head = self.basic.create_head_plan(plan_data)
-        return self.extend_plan(plan_data, basic_planned_head)
+        head_plan = self.extend_plan(plan_data, basic_planned_head)
+
+        if self.data_network is not None:
+            head_plan = head_plan._replace(data_ip_address=self.data_network.head_ip())
+        return head_plan
 
     def create_compute_plan(self, plan_data, index, compute_ip):
         '''
@@ -89,7 +104,17 @@ class DefaultNodePlanner(BasicNodePlanner):
         '''
         # reuse BasicPlannedNode for the basic details
         basic_planned_compute = self.basic.create_compute_plan(plan_data, index, compute_ip)
-        return self.extend_plan(plan_data, basic_planned_compute)
+        compute_plan = self.extend_plan(plan_data, basic_planned_compute)
+
+        if self.data_network is not None:
+            # a cluster that is scaled keeps the data addresses of its nodes (see infra.ipam),
+            # a new cluster uses the same positions in both networks
+            if self.data_ips is not None:
+                data_ip = self.data_ips[index]
+            else:
+                data_ip = self.data_network.compute_ips(index + 1)[index]
+            compute_plan = compute_plan._replace(data_ip_address=data_ip)
+        return compute_plan
 
     def extend_plan(self, plan_data, basic_planned_node):
         '''
@@ -113,18 +138,52 @@ class DefaultNodePlanner(BasicNodePlanner):
             volumes.extend(plan_data[role]['shared_volumes'])
         if 'docker_volumes' in plan_data[role]:
             volumes.extend(plan_data[role]['docker_volumes'])
+
+        # host-wide caches shared with other clusters
+        for cache_volume in caches.cache_volumes(plan_data, basic_planned_node.image):
+            volumes.append('{}:{}'.format(cache_volume.name, cache_volume.mount))
         extended_dict['volumes'] = volumes
 
         # the static text needs to be indented to show up properly
         static_text = ''
-        if 'static' in plan_data[role]:
-            static_without_offset = plan_data[role]['static']
+        static_without_offset = plan_data[role].get('static')
+
+        # the caches may need environment variables, e.g. CCACHE_DIR
+        cache_environment = caches.cache_environment(plan_data)
+        if cache_environment:
+            static_without_offset = caches.add_environment(static_without_offset,
+                                                           cache_environment)
+
+        if static_without_offset:
             static_text = dyaml.dump_with_offset_indent(static_without_offset, 4)
         extended_dict['static_text'] = static_text
 
+        # per-role resource limits, e.g. {'cpus': 2, 'memory': '2g'}
+        extended_dict['resources'] = plan_data[role].get('resources', None)
+
+        # size of /dev/shm, e.g. '4g'
+        extended_dict['shm_size'] = plan_data[role].get('shm_size', None)
+
+        # share the IPC namespace of the head, so that shared-memory transports work between nodes
+        extended_dict['ipc'] = self.ipc_mode(plan_data, role)
+
         # will container run systemctl?
         extended_dict['systemctl'] = False
         if plan_data[role].get('systemctl', False):
             extended_dict['systemctl'] = True
 
         return DefaultPlannedNode(**extended_dict)
+
+    def ipc_mode(self, plan_data, role):
+        '''
+        With 'ipc: shared' in the profile, the head is shareable and the other nodes join its IPC
+        namespace (and its /dev/shm). Returns None for the default private namespace.
+        '''
+        if plan_data.get('ipc') != 'shared':
+            return None
+
+        if role == 'head':
+            return 'shareable'
+
+        head_hostname = plan_data['head']['hostname']
+        return 'container:' + DockerNaming.create_container_name(plan_data['name'], head_hostname)
@@ -1,5 +1,6 @@
 from .deploy import DockerComposeDeployer
 from .render import JinjaRenderer
+from .transaction import CreationTransaction
 
 from dcluster.config import main_config
 
@@ -13,4 +14,4 @@ def get_renderer(creation_request):
     return JinjaRenderer(templates_dir)
 
 
-__all__ = ['DockerComposeDeployer']
+__all__ = ['DockerComposeDeployer', 'CreationTransaction']
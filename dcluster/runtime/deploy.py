@@ -19,10 +19,20 @@ class DockerComposeDeployer(logger.LoggerMixin):
     def __init__(self, compose_path):
         self.compose_path = compose_path
 
-    def deploy(self, compose_definition):
+    def deploy(self, compose_definition, before_start=None, recreate=True):
         '''
         Calls docker-compose with the contents of a compose file as input.
+
+        If before_start is given, the containers and volumes are created first, before_start is
+        called, and then the containers are started.
+
+        Without recreate, the existing containers are kept as they are, only the containers of
+        new nodes are created, and the containers of nodes that are no longer in the file are
+        removed (used to scale a cluster).
         '''
+        recreate_args = '--force-recreate'
+        if not recreate:
+            recreate_args = '--no-recreate --remove-orphans'
 
         # save definition in file
         fs_util.create_dir_dont_complain(self.compose_path)
@@ -34,7 +44,17 @@ class DockerComposeDeployer(logger.LoggerMixin):
         # note: apparently, using docker-compose.yml and removing '-f' fails to
         # to acknowledge the --force-recreate option
         #
-        cmd = 'docker-compose --no-ansi -f docker-cluster.yml up -d --force-recreate'
+        # --compatibility applies the resource limits under 'deploy' without swarm mode
+        if before_start is None:
+            self.__compose('up -d ' + recreate_args)
+            return
+
+        self.__compose('up --no-start ' + recreate_args)
+        before_start()
+        self.__compose('start')
+
+    def __compose(self, compose_args):
+        cmd = 'docker-compose --no-ansi --compatibility -f docker-cluster.yml ' + compose_args
         run = runit.execute(cmd, cwd=self.compose_path, env=os.environ)
 
         # always show the output of the docker-compose call
@@ -45,6 +65,21 @@ class DockerComposeDeployer(logger.LoggerMixin):
             # return code is different than 0, something went wrong
             raise ComposeFailure('docker-compose command failed, check output')
 
+    def teardown(self):
+        '''
+        Calls docker-compose down to remove the containers and volumes created by deploy().
+        Does nothing if the compose file was never written.
+        '''
+        definition_file = os.path.join(self.compose_path, 'docker-cluster.yml')
+        if not os.path.isfile(definition_file):
+            return
+
+        cmd = 'docker-compose --no-ansi -f docker-cluster.yml down -v --remove-orphans'
+        run = runit.execute(cmd, cwd=self.compose_path, env=os.environ)
+
+        if run[2]:
+            raise ComposeFailure('docker-compose down failed: {}'.format(run[1]))
+
     def a_container_has_exited(self):
         '''
         Calls docker-compose ps to check if a container has already exited
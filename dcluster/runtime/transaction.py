@@ -0,0 +1,74 @@
+'''
+Journal of the steps taken while creating a cluster, so that a failed creation can be undone.
+'''
+
+from collections import namedtuple
+
+from dcluster.util import logger
+
+# a completed step and the function that undoes it
+JournalEntry = namedtuple('JournalEntry', 'description, undo')
+
+
+class CreationTransaction(logger.LoggerMixin):
+    '''
+    Records an undo function for each Docker object or file created for a cluster. If the
+    transaction is used as a context manager and an exception is raised, the recorded steps are
+    undone in reverse order, unless keep_on_failure is set (useful for debugging).
+
+    The exception is always propagated to the caller.
+    '''
+
+    def __init__(self, cluster_name, keep_on_failure=False):
+        self.cluster_name = cluster_name
+        self.keep_on_failure = keep_on_failure
+        self.journal = []
+
+    def record(self, description, undo):
+        '''
+        Adds a step to the journal, undo is a function without arguments.
+        '''
+        self.logger.debug('Cluster {}: {}'.format(self.cluster_name, description))
+        self.journal.append(JournalEntry(description, undo))
+
+    def rollback(self):
+        '''
+        Undoes the recorded steps in reverse order. A step that cannot be undone is logged,
+        the remaining steps are still attempted. Returns the descriptions of the failed steps.
+        '''
+        failed = []
+        while self.journal:
+            entry = self.journal.pop()
+            self.logger.info('Rolling back: {}'.format(entry.description))
+            try:
+                entry.undo()
+            except Exception as e:
+                self.logger.error('Could not roll back "{}": {}'.format(entry.description, e))
+                failed.append(entry.description)
+
+        return failed
+
+    def commit(self):
+        '''
+        Forget the journal, the cluster is complete.
+        '''
+        self.journal = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+
+        elif self.keep_on_failure:
+            msg = 'Creation of cluster {} failed, keeping the partial cluster'
+            self.logger.warning(msg.format(self.cluster_name))
+
+        else:
+            msg = 'Creation of cluster {} failed, rolling back'
+            self.logger.warning(msg.format(self.cluster_name))
+            self.rollback()
+
+        # never swallow the exception
+        return False
@@ -0,0 +1,44 @@
+from dcluster.tests.test_dcluster import DclusterTest
+
+from dcluster.main import build_parser
+
+
+class TestExecParser(DclusterTest):
+
+    def setUp(self):
+        self.parser = build_parser()
+
+    def test_all_nodes(self):
+        # when
+        args = self.parser.parse_args(['exec', 'mycluster', '--', 'rpm', '-q', 'slurm'])
+
+        # then the subcommand is not replaced by the command
+        self.assertEqual(args.command, 'exec')
+        self.assertEqual(args.exec_command, ['rpm', '-q', 'slurm'])
+        self.assertIsNone(args.hostnames)
+
+    def test_nodes_before_command(self):
+        # when
+        args = self.parser.parse_args(['exec', 'mycluster', '--node', 'node001',
+                                       '--node=node002', '--', 'hostname'])
+
+        # then
+        self.assertEqual(args.exec_command, ['hostname'])
+        self.assertEqual(args.hostnames, ['node001', 'node002'])
+
+    def test_node_options_of_command_are_kept(self):
+        # when
+        args = self.parser.parse_args(['exec', 'mycluster', '--node', 'node001', '--',
+                                       'mytool', '--node', 'x'])
+
+        # then
+        self.assertEqual(args.exec_command, ['mytool', '--node', 'x'])
+        self.assertEqual(args.hostnames, ['node001'])
+
+    def test_without_separator(self):
+        # when
+        args = self.parser.parse_args(['exec', 'mycluster', '--node', 'node001', 'ls', '-l'])
+
+        # then
+        self.assertEqual(args.exec_command, ['ls', '-l'])
+        self.assertEqual(args.hostnames, ['node001'])
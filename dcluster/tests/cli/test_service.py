@@ -0,0 +1,168 @@
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+from dcluster.tests.test_dcluster import DclusterTest
+
+from dcluster.cli import service
+from dcluster.util import parallel
+
+
+def show_cluster(args):
+    sys.stdout.write(u'cluster {}\n'.format(args.cluster_name))
+
+
+def fail(args):
+    raise ValueError('Cluster {} is not running'.format(args.cluster_name))
+
+
+def exit_with_code(args):
+    sys.exit(3)
+
+
+def parser_stub():
+    parser = argparse.ArgumentParser(prog='dcluster')
+    subparsers = parser.add_subparsers(dest='command')
+    for (command, func) in (('show', show_cluster), ('stop', fail), ('exec', exit_with_code),
+                            ('ssh', show_cluster)):
+        subparser = subparsers.add_parser(command)
+        subparser.add_argument('cluster_name')
+        subparser.set_defaults(func=func)
+    return parser
+
+
+class ConnectionStub(object):
+
+    def __init__(self):
+        self.messages = []
+
+    def send(self, message):
+        self.messages.append(message)
+
+
+class TestDclusterService(DclusterTest):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.workdir, 'dcluster.sock')
+        self.parser = parser_stub()
+        self.service = service.DclusterService(self.parser, self.socket_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def call(self, argv):
+        '''
+        Calls the service with one request, returns the exit code and the output of the caller.
+        '''
+        server = self.service.listen()
+
+        def answer_once():
+            (sock, _) = server.accept()
+            self.service.handle(sock)
+
+        worker = threading.Thread(target=answer_once)
+        worker.start()
+
+        (stdout, stderr) = (sys.stdout, sys.stderr)
+        (sys.stdout, sys.stderr) = (io.StringIO(), io.StringIO())
+        try:
+            with service.routed_output():
+                exit_code = service.call_service(self.parser.parse_args(argv), argv,
+                                                 self.socket_path)
+            output = (sys.stdout.getvalue(), sys.stderr.getvalue())
+        finally:
+            (sys.stdout, sys.stderr) = (stdout, stderr)
+            worker.join()
+            server.close()
+
+        return (exit_code, output)
+
+    def test_output_goes_to_caller(self):
+        # when
+        (exit_code, (stdout, _)) = self.call(['show', 'mycluster'])
+
+        # then
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(stdout, 'cluster mycluster\n')
+
+    def test_output_of_workers_goes_to_caller(self):
+        # given the thread of a request
+        connection = ConnectionStub()
+        stream = service.ThreadStream('stdout', io.StringIO())
+        service.set_current_connection(connection)
+
+        # when
+        try:
+            parallel.map_concurrently(stream.write, [u'head', u'node001', u'node002'])
+        finally:
+            service.set_current_connection(None)
+
+        # then
+        result = sorted(message['stdout'] for message in connection.messages)
+        self.assertEqual(result, ['head', 'node001', 'node002'])
+        self.assertEqual(stream.original.getvalue(), '')
+
+    def test_error_goes_to_caller(self):
+        # when
+        (exit_code, (_, stderr)) = self.call(['stop', 'mycluster'])
+
+        # then
+        self.assertEqual(exit_code, 1)
+        self.assertIn('ValueError: Cluster mycluster is not running', stderr)
+
+    def test_exit_code_goes_to_caller(self):
+        # when
+        (exit_code, _) = self.call(['exec', 'mycluster'])
+
+        # then
+        self.assertEqual(exit_code, 3)
+
+    def test_socket_is_private(self):
+        # when
+        server = self.service.listen()
+        server.close()
+
+        # then
+        self.assertEqual(os.stat(self.socket_path).st_mode & 0o777, 0o600)
+
+    def test_not_served_without_service(self):
+        # when
+        result = service.call_service(self.parser.parse_args(['show', 'mycluster']),
+                                      ['show', 'mycluster'], self.socket_path)
+
+        # then the CLI runs the command
+        self.assertIsNone(result)
+
+    def test_ssh_is_not_served(self):
+        # given
+        self.service.listen().close()
+
+        # when
+        result = service.call_service(self.parser.parse_args(['ssh', 'mycluster']),
+                                      ['ssh', 'mycluster'], self.socket_path)
+
+        # then
+        self.assertIsNone(result)
+
+    def test_create_with_playbooks_is_not_served(self):
+        # given
+        args = argparse.Namespace(command='create', playbooks=['slurm'])
+
+        # then
+        self.assertFalse(service.is_served(args))
+
+    def test_paths_relative_to_caller(self):
+        # given
+        args = argparse.Namespace(workpath='work', profile_path=['profiles', '/etc/profiles'])
+
+        # when
+        service.absolute_paths(args, '/home/user')
+
+        # then
+        self.assertEqual(args.workpath, '/home/user/work')
+        self.assertEqual(args.profile_path, ['/home/user/profiles', '/etc/profiles'])
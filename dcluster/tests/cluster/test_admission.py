@@ -0,0 +1,180 @@
+import os
+import shutil
+import tempfile
+
+from dcluster.tests.test_dcluster import DclusterTest
+
+from dcluster.cluster import admission
+
+GB = 1024 ** 3
+
+
+def policy_stub():
+    return {
+        'memory_overcommit': 1.0,
+        'cpu_overcommit': 2.0,
+        'reserved_memory': '1g',
+        'default_node_memory': '512m',
+        'default_node_cpus': 0.5,
+        'poll_interval': 5
+    }
+
+
+def capacity_stub(committed_memory=0, memory_available=16 * GB, committed_cpus=0.0):
+    return admission.HostCapacity(memory_total=16 * GB, memory_available=memory_available,
+                                  cpus=4, committed_memory=committed_memory,
+                                  committed_cpus=committed_cpus)
+
+
+class TestEstimateFootprint(DclusterTest):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        history_file = os.path.join(self.workdir, 'history.json')
+        self.history = admission.UsageHistory(history_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_with_limits(self):
+        # given
+        cluster_config = {
+            'head': {'image': 'centos7:ssh', 'resources': {'cpus': 1, 'memory': '1g'}},
+            'compute': {'image': 'centos7:ssh', 'resources': {'cpus': 2, 'memory': '2g'}}
+        }
+
+        # when
+        result = admission.estimate_footprint(cluster_config, 3, self.history, policy_stub())
+
+        # then
+        self.assertEqual(result, admission.Footprint(7 * GB, 7.0))
+
+    def test_with_history_and_defaults(self):
+        # given a measured image for compute, nothing for head
+        self.history.record('centos7:compute', GB)
+        cluster_config = {
+            'head': {'image': 'centos7:head'},
+            'compute': {'image': 'centos7:compute'}
+        }
+
+        # when
+        result = admission.estimate_footprint(cluster_config, 2, self.history, policy_stub())
+
+        # then
+        self.assertEqual(result, admission.Footprint(GB // 2 + 2 * GB, 1.5))
+
+    def test_history_is_persisted(self):
+        # given
+        self.history.record('centos7:ssh', GB)
+        self.history.record('centos7:ssh', 2 * GB)
+        self.history.save()
+
+        # when
+        result = admission.UsageHistory(self.history.filename).estimate('centos7:ssh')
+
+        # then moving average
+        self.assertEqual(result, int(1.5 * GB))
+
+
+class TestAdmissionController(DclusterTest):
+
+    def setUp(self):
+        self.now = 0.0
+        self.capacities = []
+        self.controller = admission.AdmissionController(policy_stub(), self.probe,
+                                                        clock=self.clock, sleep=self.sleep)
+
+    def test_admit(self):
+        footprint = admission.Footprint(4 * GB, 2)
+        result = self.controller.decide(footprint, capacity_stub())
+        self.assertEqual(result.verdict, admission.ADMIT)
+
+    def test_reject_when_it_never_fits(self):
+        footprint = admission.Footprint(16 * GB, 2)
+        result = self.controller.decide(footprint, capacity_stub())
+        self.assertEqual(result.verdict, admission.REJECT)
+
+    def test_queue_when_memory_is_committed(self):
+        footprint = admission.Footprint(4 * GB, 2)
+        result = self.controller.decide(footprint, capacity_stub(committed_memory=12 * GB))
+        self.assertEqual(result.verdict, admission.QUEUE)
+
+    def test_queue_when_cpus_are_committed(self):
+        footprint = admission.Footprint(4 * GB, 2)
+        result = self.controller.decide(footprint, capacity_stub(committed_cpus=7.0))
+        self.assertEqual(result.verdict, admission.QUEUE)
+
+    def test_queued_then_admitted(self):
+        # given that the host frees memory after the first probe
+        self.capacities = [capacity_stub(committed_memory=12 * GB), capacity_stub()]
+
+        # when
+        result = self.controller.admit(admission.Footprint(4 * GB, 2), wait=60)
+
+        # then
+        self.assertEqual(result.verdict, admission.ADMIT)
+        self.assertEqual(self.now, 5)
+
+    def test_rejected_after_waiting(self):
+        # given a host that stays busy
+        self.capacities = [capacity_stub(committed_memory=12 * GB)] * 10
+
+        # then
+        with self.assertRaises(admission.AdmissionRejected):
+            self.controller.admit(admission.Footprint(4 * GB, 2), wait=12)
+
+        self.assertEqual(self.now, 12)
+
+    def probe(self):
+        return self.capacities.pop(0)
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestReservations(DclusterTest):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.reservations = admission.Reservations(os.path.join(self.workdir, 'reservations.json'),
+                                                   os.path.join(self.workdir, 'admission.lock'))
+        self.controller = admission.AdmissionController(policy_stub(), capacity_stub,
+                                                        sleep=lambda seconds: None,
+                                                        reservations=self.reservations)
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_concurrent_admissions_cannot_overcommit(self):
+        # given two clusters that fit the host alone, but not together
+        footprint = admission.Footprint(10 * GB, 2)
+        self.controller.admit(footprint, wait=0, cluster_name='first')
+
+        # then the second one waits for the first one to be deployed
+        with self.assertRaises(admission.AdmissionRejected):
+            self.controller.admit(footprint, wait=0, cluster_name='second')
+
+    def test_removed_reservation_frees_capacity(self):
+        # given
+        footprint = admission.Footprint(10 * GB, 2)
+        self.controller.admit(footprint, wait=0, cluster_name='first')
+
+        # when
+        self.reservations.remove('first')
+
+        # then
+        result = self.controller.admit(footprint, wait=0, cluster_name='second')
+        self.assertEqual(result.verdict, admission.ADMIT)
+
+    def test_reservations_of_dead_processes_are_ignored(self):
+        # given a reservation of a process that is gone
+        self.reservations.write({'gone': {'memory': 10 * GB, 'cpus': 2, 'pid': 2 ** 22 + 1}})
+
+        # when
+        result = self.reservations.pending()
+
+        # then
+        self.assertEqual(result, admission.Footprint(0, 0))
@@ -0,0 +1,163 @@
+import os
+import shutil
+import socket
+import tempfile
+import threading
+
+from dcluster.tests.test_dcluster import DclusterTest
+
+from dcluster.cluster import bench, bench_agent
+
+
+class TestNodePairs(DclusterTest):
+
+    def setUp(self):
+        self.hostnames = ['node002', 'head', 'node001']
+
+    def test_head(self):
+        result = bench.node_pairs(self.hostnames, 'head')
+        self.assertEqual(result, [('node001', 'head'), ('node002', 'head')])
+
+    def test_ring(self):
+        result = bench.node_pairs(self.hostnames, 'ring')
+        expected = [('head', 'node001'), ('node001', 'node002'), ('node002', 'head')]
+        self.assertEqual(result, expected)
+
+    def test_all(self):
+        result = bench.node_pairs(self.hostnames, 'all')
+        self.assertEqual(len(result), 6)
+        self.assertNotIn(('head', 'head'), result)
+
+    def test_all_sampled(self):
+        # when
+        result = bench.node_pairs(self.hostnames, 'all', sample=2, seed=1)
+
+        # then the sample is repeatable
+        self.assertEqual(len(result), 2)
+        self.assertEqual(result, bench.node_pairs(self.hostnames, 'all', sample=2, seed=1))
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            bench.node_pairs(self.hostnames, 'star')
+
+
+class TestVolumePaths(DclusterTest):
+
+    def test_writable_volumes_of_the_cluster(self):
+        # given
+        mounts = [
+            {'Destination': '/dcluster', 'RW': True},
+            {'Destination': '/sys/fs/cgroup', 'RW': False},
+            {'Destination': '/var/lib/mysql', 'RW': True},
+            {'Destination': '/etc/dcluster/mpi', 'RW': False},
+            {'Destination': '/opt/intel', 'RW': False},
+            {'Destination': '/home', 'RW': True}
+        ]
+
+        # when
+        result = bench.volume_paths(mounts)
+
+        # then
+        self.assertEqual(result, ['/home', '/var/lib/mysql'])
+
+
+class TestParseAgentOutput(DclusterTest):
+
+    def test_last_line(self):
+        result = bench.parse_agent_output(0, 'warning\n{"served": 2}\n')
+        self.assertEqual(result, {'served': 2})
+
+    def test_failure(self):
+        with self.assertRaises(ValueError):
+            bench.parse_agent_output(127, 'No Python found\n')
+
+
+class TestFormatNetResults(DclusterTest):
+
+    def test_matrices(self):
+        # given
+        results = [
+            bench.NetResult('node001', 'head', {'p50': 52.34}, 9.5, None),
+            bench.NetResult('node002', 'head', None, None, 'Agent failed')
+        ]
+
+        # when
+        result = bench.format_net_results(results)
+
+        # then
+        expected = '''Round trip, median (us):
+                  head    node001    node002
+head
+node001           52.3
+node002              x
+
+Throughput (Gb/s):
+                  head    node001    node002
+head
+node001           9.50
+node002              x
+
+node002 -> head: Agent failed'''
+        self.assertEqual(result, expected)
+
+
+class TestAgent(DclusterTest):
+    '''
+    Runs the agent locally.
+    '''
+
+    def test_client_and_server(self):
+        # given a server on a free port
+        probe = socket.socket()
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+        probe.close()
+
+        served = []
+        server = threading.Thread(target=lambda: served.append(bench_agent.serve(port, 0.5)))
+        server.start()
+
+        # when
+        result = bench_agent.client('127.0.0.1', port, 20, 0.1)
+        server.join()
+
+        # then
+        self.assertTrue(0 < result['latency_us']['min'] <= result['latency_us']['p99'])
+        self.assertTrue(result['throughput_gbps'] > 0)
+        self.assertEqual(served, [{'served': 2}])
+
+    def test_server_exits_after_connections(self):
+        # given a server on a free port, with a timeout longer than the test
+        probe = socket.socket()
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+        probe.close()
+
+        served = []
+        server = threading.Thread(target=lambda: served.append(bench_agent.serve(port, 60, 1)))
+        server.start()
+
+        # when
+        bench_agent.client('127.0.0.1', port, 20, 0)
+        server.join(10)
+
+        # then the port is free for the server of the next pair
+        self.assertFalse(server.is_alive())
+        self.assertEqual(served, [{'served': 1}])
+
+    def test_disk(self):
+        # given
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+
+        # when
+        result = bench_agent.disk(path, 1024 * 1024, 0.1)
+
+        # then the test file is removed
+        self.assertTrue(result['seq_write_mbps'] > 0)
+        self.assertTrue(result['rand_write_iops'] > 0)
+        self.assertEqual(os.listdir(path), [])
+
+    def test_parse_size(self):
+        self.assertEqual(bench_agent.parse_size('256m'), 256 * 1024 * 1024)
+        self.assertEqual(bench_agent.parse_size('4096'), 4096)
@@ -0,0 +1,133 @@
+import os
+import shutil
+import socket
+import struct
+import tempfile
+
+from dcluster.tests.test_dcluster import DclusterTest
+
+from dcluster.cluster import dns, dns_agent
+from dcluster.node import DefaultPlannedNode
+
+
+def planned_node(hostname, ip_address, role='compute', data_ip_address=None):
+    return DefaultPlannedNode(hostname, 'mycluster-' + hostname, 'centos7:ssh', ip_address, role,
+                              '', [], '', False, None, None, None, data_ip_address)
+
+
+def query_for(name, qtype=dns_agent.TYPE_A):
+    header = struct.pack('!HHHHHH', 0x1234, 0x0100, 1, 0, 0, 0)
+    return header + dns_agent.encode_name(name) + struct.pack('!HH', qtype, dns_agent.CLASS_IN)
+
+
+def rcode_and_answer(response):
+    '''
+    The rcode of a response and the rdata of its first answer (None if no answers).
+    '''
+    (flags, _, answer_count) = struct.unpack('!HHH', response[2:8])
+    if answer_count == 0:
+        return (flags & 0xf, None)
+
+    # the answer is a pointer to the question, its type, class, TTL and length, then the rdata
+    (_, _, question_end) = dns_agent.parse_question(response)
+    (rdata_length,) = struct.unpack('!H', response[question_end + 10:question_end + 12])
+    return (flags & 0xf, response[question_end + 12:question_end + 12 + rdata_length])
+
+
+class TestDnsRecords(DclusterTest):
+
+    def setUp(self):
+        self.cluster_specs = {
+            'nodes': {
+                '172.30.0.253': planned_node('head', '172.30.0.253', 'head', '172.31.0.253'),
+                '172.30.0.10': planned_node('node010', '172.30.0.10',
+                                            data_ip_address='172.31.0.10'),
+                '172.30.0.2': planned_node('node002', '172.30.0.2', data_ip_address='172.31.0.2')
+            },
+            'network': {'gateway_ip': '172.30.0.254'}
+        }
+
+    def test_hosts_file(self):
+        # when
+        result = dns.hosts_file(self.cluster_specs)
+
+        # then in order of address
+        expected = '''172.30.0.2 node002
+172.30.0.10 node010
+172.30.0.253 head
+172.30.0.254 gateway
+172.31.0.2 node002-data
+172.31.0.10 node010-data
+172.31.0.253 head-data
+'''
+        self.assertEqual(result, expected)
+
+    def test_cluster_domain(self):
+        self.assertEqual(dns.cluster_domain('My_Cluster'), 'my-cluster.dcluster')
+
+    def test_upstream_nameservers(self):
+        # given a stub resolver, and the file with the actual nameservers
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        stub = os.path.join(path, 'stub.conf')
+        with open(stub, 'w') as f:
+            f.write('nameserver 127.0.0.53\nsearch example.com\n')
+        actual = os.path.join(path, 'actual.conf')
+        with open(actual, 'w') as f:
+            f.write('# from DHCP\nnameserver 10.0.0.2\nnameserver ::1\nnameserver 10.0.0.3\n')
+
+        # when
+        result = dns.upstream_nameservers((stub, actual))
+
+        # then
+        self.assertEqual(result, ['10.0.0.2', '10.0.0.3'])
+
+
+class TestResponder(DclusterTest):
+    '''
+    Answers queries with the records of the agent, without sockets.
+    '''
+
+    def setUp(self):
+        self.dns_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dns_dir)
+        self.write_hosts('172.30.0.1 node001 node001-ib\n172.30.0.253 head\n')
+        self.records = dns_agent.Records(self.dns_dir, 'mycluster.dcluster')
+
+    def write_hosts(self, contents):
+        dns.write_atomically(os.path.join(self.dns_dir, 'hosts'), contents)
+
+    def test_short_and_qualified_names(self):
+        for name in ('node001', 'node001.mycluster.dcluster', 'NODE001-ib'):
+            response = self.records.answer(query_for(name))
+            self.assertEqual(rcode_and_answer(response), (0, socket.inet_aton('172.30.0.1')))
+
+    def test_unknown_name_of_the_cluster(self):
+        response = self.records.answer(query_for('node002.mycluster.dcluster'))
+        self.assertEqual(rcode_and_answer(response), (dns_agent.RCODE_NXDOMAIN, None))
+
+    def test_other_names_are_forwarded(self):
+        self.assertIsNone(self.records.answer(query_for('example.com')))
+
+    def test_no_records_of_other_types(self):
+        response = self.records.answer(query_for('node001', 28))
+        self.assertEqual(rcode_and_answer(response), (0, None))
+
+    def test_reverse(self):
+        # when
+        response = self.records.answer(query_for('1.0.30.172.in-addr.arpa', dns_agent.TYPE_PTR))
+
+        # then
+        expected = dns_agent.encode_name('node001.mycluster.dcluster')
+        self.assertEqual(rcode_and_answer(response), (0, expected))
+
+    def test_records_are_updated_in_place(self):
+        # given a responder that already answered
+        self.records.answer(query_for('node001'))
+
+        # when the cluster is scaled
+        self.write_hosts('172.30.0.1 node001\n172.30.0.2 node002\n172.30.0.253 head\n')
+        response = self.records.answer(query_for('node002'))
+
+        # then
+        self.assertEqual(rcode_and_answer(response), (0, socket.inet_aton('172.30.0.2')))
@@ -0,0 +1,72 @@
+from dcluster.tests.test_dcluster import DclusterTest
+
+from dcluster.cluster import idle
+
+
+class FakeClock(object):
+    '''
+    A clock that only advances when sleeping.
+    '''
+
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class ClusterStub(object):
+    '''
+    Consumes CPU time at a constant rate, given in percent of one CPU.
+    '''
+
+    def __init__(self, name, percent, clock):
+        self.name = name
+        self.percent = percent
+        self.clock = clock
+
+    def cpu_usage_usec(self):
+        return int(self.clock.now * 1000000 * self.percent / 100)
+
+
+class TestIdleDetector(DclusterTest):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.detector = idle.IdleDetector(threshold=5, window=600, interval=30,
+                                          clock=self.clock.time, sleep=self.clock.sleep)
+
+    def test_only_idle_clusters_are_found(self):
+        # given
+        quiet = ClusterStub('quiet', 1, self.clock)
+        busy = ClusterStub('busy', 50, self.clock)
+
+        # when
+        result = self.detector.find_idle([quiet, busy])
+
+        # then
+        self.assertEqual([c.name for c in result], ['quiet'])
+
+    def test_samples_the_whole_window(self):
+        # given
+        quiet = ClusterStub('quiet', 1, self.clock)
+
+        # when
+        self.detector.find_idle([quiet])
+
+        # then
+        self.assertEqual(self.clock.now, 600)
+
+    def test_stops_early_when_nothing_is_idle(self):
+        # given
+        busy = ClusterStub('busy', 50, self.clock)
+
+        # when
+        result = self.detector.find_idle([busy])
+
+        # then
+        self.assertEqual(result, [])
+        self.assertEqual(self.clock.now, 30)
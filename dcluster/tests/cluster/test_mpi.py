@@ -0,0 +1,131 @@
+import os
+import shutil
+import tempfile
+
+from dcluster.cluster import mpi
+from dcluster.node import DefaultPlannedNode
+from dcluster.tests.test_dcluster import DclusterTest
+
+
+def planned_node(hostname, ip_address, role, resources=None):
+    return DefaultPlannedNode(hostname=hostname, container='mycluster-' + hostname,
+                              image='centos7:ssh', ip_address=ip_address, role=role,
+                              hostname_alias='', volumes=[], static_text='', systemctl=False,
+                              resources=resources)
+
+
+def cluster_specs_stub(compute_resources):
+    '''
+    A head and three compute nodes, the IP addresses are not in alphabetical order.
+    '''
+    nodes = [
+        planned_node('head', '172.30.0.253', 'head'),
+        planned_node('node001', '172.30.0.2', 'compute', compute_resources[0]),
+        planned_node('node002', '172.30.0.10', 'compute', compute_resources[1]),
+        planned_node('node003', '172.30.0.3', 'compute', compute_resources[2])
+    ]
+    return {'name': 'mycluster', 'nodes': {node.ip_address: node for node in nodes}}
+
+
+class TestParseCpuset(DclusterTest):
+
+    def test_ranges_and_single(self):
+        self.assertEqual(mpi.parse_cpuset('0-3,8'), [0, 1, 2, 3, 8])
+
+    def test_numa_order_is_kept(self):
+        self.assertEqual(mpi.parse_cpuset('8-9,0-1'), [8, 9, 0, 1])
+
+
+class TestNodeSlots(DclusterTest):
+
+    def test_cpuset_wins(self):
+        self.assertEqual(mpi.node_slots({'cpus': 2, 'cpuset': '0-3'}), 4)
+
+    def test_cpu_limit(self):
+        self.assertEqual(mpi.node_slots({'cpus': 2.5}), 2)
+
+    def test_no_resources(self):
+        self.assertEqual(mpi.node_slots(None), 1)
+
+
+class TestMpiFiles(DclusterTest):
+
+    def test_cpu_limits(self):
+        # given
+        cluster_specs = cluster_specs_stub([{'cpus': 2}, {'cpus': 2}, None])
+
+        # when
+        result = mpi.mpi_files(cluster_specs)
+
+        # then ordered by IP address, no rankfile without cpusets
+        self.assertEqual(result['hostfile.openmpi'],
+                         'node001 slots=2\nnode003 slots=1\nnode002 slots=2\n')
+        self.assertEqual(result['hostfile.mpich'], 'node001:2\nnode003:1\nnode002:2\n')
+        self.assertNotIn('rankfile', result)
+        self.assertIn('DCLUSTER_MPI_NP=5\n', result['mpi.env'])
+
+    def test_cpusets(self):
+        # given
+        cluster_specs = cluster_specs_stub([{'cpuset': '0-1'}, {'cpuset': '4-5'},
+                                            {'cpuset': '2,3'}])
+
+        # when
+        result = mpi.mpi_files(cluster_specs)
+
+        # then
+        expected = '''rank 0=node001 slot=0
+rank 1=node001 slot=1
+rank 2=node003 slot=2
+rank 3=node003 slot=3
+rank 4=node002 slot=4
+rank 5=node002 slot=5
+'''
+        self.assertEqual(result['rankfile'], expected)
+        self.assertIn('DCLUSTER_MPI_RANKFILE=/etc/dcluster/mpi/rankfile\n', result['mpi.env'])
+
+    def test_head_only(self):
+        # given
+        cluster_specs = {'nodes': {'172.30.0.253': planned_node('head', '172.30.0.253', 'head')}}
+
+        # when
+        result = mpi.mpi_files(cluster_specs)
+
+        # then
+        self.assertEqual(result['hostfile.openmpi'], 'head slots=1\n')
+
+
+class TestMpiFilesWithDataNetwork(DclusterTest):
+
+    def test_data_hostnames(self):
+        # given
+        node = planned_node('node001', '172.30.0.1', 'compute', {'cpus': 2})
+        node = node._replace(data_ip_address='172.31.0.1')
+        cluster_specs = {'nodes': {node.ip_address: node}}
+
+        # when
+        result = mpi.mpi_files(cluster_specs)
+
+        # then
+        self.assertEqual(result['hostfile.openmpi'], 'node001-data slots=2\n')
+
+
+class TestWriteMpiFiles(DclusterTest):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_write(self):
+        # given
+        mpi_dir = os.path.join(self.tmp_dir, 'mycluster', 'mpi')
+        cluster_specs = cluster_specs_stub([None, None, None])
+
+        # when
+        result = mpi.write_mpi_files(cluster_specs, mpi_dir)
+
+        # then
+        filenames = sorted([os.path.basename(path) for path in result])
+        self.assertEqual(filenames, ['hostfile.mpich', 'hostfile.openmpi', 'mpi.env'])
+        self.assertTrue(all([os.path.isfile(path) for path in result]))
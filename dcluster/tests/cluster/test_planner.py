@@ -3,6 +3,7 @@ Unit tests for cluster.plan_basic
 '''
 import os
 
+from dcluster.config import main_config
 from dcluster.node import DefaultPlannedNode
 from dcluster.cluster.planner import DefaultClusterPlan
 
@@ -72,10 +73,11 @@ class TestBuildSpecsOfDefaultClusterPlan(DclusterTest):
                 'gateway_ip': '172.30.0.254'
             },
             'template': 'cluster-default.yml.j2',
+            'mpi_dir': os.path.join(main_config.composer_workpath(cluster_name), 'mpi'),
             'volumes': [],
+            'cgroup_parent': 'dcluster-mycluster.slice',
         }
 
-        from dcluster.config import main_config
         print(main_config.get_config())
 
         self.verify_bootstrap_dir(result)
@@ -122,7 +124,9 @@ class TestBuildSpecsOfDefaultClusterPlan(DclusterTest):
                 'gateway_ip': '172.30.1.126'
             },
             'template': 'cluster-default.yml.j2',
+            'mpi_dir': os.path.join(main_config.composer_workpath(cluster_name), 'mpi'),
             'volumes': [],
+            'cgroup_parent': 'dcluster-mycluster.slice',
         }
         self.assertTrue(result.get('bootstrap_dir'))  # bootstrap_dir exists and is not empty
         del result['bootstrap_dir']
@@ -178,7 +182,9 @@ class TestBuildSpecsOfDefaultClusterPlan(DclusterTest):
                 'gateway_ip': '172.30.0.254'
             },
             'template': 'cluster-default.yml.j2',
+            'mpi_dir': os.path.join(main_config.composer_workpath(cluster_name), 'mpi'),
             'volumes': [],
+            'cgroup_parent': 'dcluster-mycluster.slice',
         }
         self.verify_bootstrap_dir(result)
         del result['bootstrap_dir']
@@ -254,7 +260,9 @@ class TestBuildSpecsOfDefaultClusterPlan(DclusterTest):
                 'gateway_ip': '172.30.0.254'
             },
             'template': 'cluster-default.yml.j2',
+            'mpi_dir': os.path.join(main_config.composer_workpath(cluster_name), 'mpi'),
             'volumes': [],
+            'cgroup_parent': 'dcluster-mycluster.slice',
         }
         self.verify_bootstrap_dir(result)
         del result['bootstrap_dir']
@@ -327,9 +335,9 @@ class TestBuildSpecsOfDefaultClusterPlan(DclusterTest):
           - slurmd
         expose:
           - '6818'
-        shm_size: 4g
       ''',
-                    systemctl=False),
+                    systemctl=False,
+                    shm_size='4g'),
                 '172.30.0.2': DefaultPlannedNode(
                     hostname='node002',
                     hostname_alias='node002-ice1-1',
@@ -350,9 +358,9 @@ class TestBuildSpecsOfDefaultClusterPlan(DclusterTest):
           - slurmd
         expose:
           - '6818'
-        shm_size: 4g
       ''',
-                    systemctl=False),
+                    systemctl=False,
+                    shm_size='4g'),
                 '172.30.0.3': DefaultPlannedNode(
                     hostname='node003',
                     hostname_alias='node003-ice1-1',
@@ -373,9 +381,9 @@ class TestBuildSpecsOfDefaultClusterPlan(DclusterTest):
           - slurmd
         expose:
           - '6818'
-        shm_size: 4g
       ''',
-                    systemctl=False)
+                    systemctl=False,
+                    shm_size='4g')
             },
             'network': {
                 'name': 'dcluster-mycluster',
@@ -388,6 +396,7 @@ class TestBuildSpecsOfDefaultClusterPlan(DclusterTest):
                 'gateway_ip': '172.30.0.254'
             },
             'template': 'cluster-default.yml.j2',
+            'mpi_dir': os.path.join(main_config.composer_workpath(cluster_name), 'mpi'),
             'volumes': [
                 'var_lib_mysql',
                 'etc_munge',
@@ -395,6 +404,11 @@ class TestBuildSpecsOfDefaultClusterPlan(DclusterTest):
                 'slurm_jobdir',
                 'var_log_slurm'
             ],
+            'cgroup_parent': 'dcluster-mycluster.slice',
+            'slurm': {
+                'controller': 'head',
+                'node_roles': ['compute']
+            }
         }
         self.verify_bootstrap_dir(result)
         del result['bootstrap_dir']
@@ -436,3 +450,98 @@ class TestCreateDefaultClusterPlan(DclusterTest):
 
         print(result)
         self.assertEqual(result, expected)
+
+
+class TestComputeAddressesOfDefaultClusterPlan(DclusterTest):
+
+    def test_given_compute_addresses(self):
+        # given the addresses of a scaled cluster, node002 was removed earlier
+        creation_request = basic_stubs.default_request_stub('test', 2)
+        simple_config = basic_stubs.simple_config()
+        cluster_network = infra_stubs.network_stub('test', u'172.30.0.0/24')
+        compute_ips = ['172.30.0.1', '172.30.0.3']
+
+        # when
+        cluster_plan = DefaultClusterPlan.create(creation_request, simple_config, cluster_network,
+                                                 compute_ips=compute_ips)
+        result = cluster_plan.build_specs()
+
+        # then
+        hostnames = {ip: node.hostname for (ip, node) in result['nodes'].items()}
+        expected = {'172.30.0.253': 'head', '172.30.0.1': 'node001', '172.30.0.3': 'node002'}
+        self.assertEqual(hostnames, expected)
+
+
+class TestCpusetSpecsOfDefaultClusterPlan(DclusterTest):
+
+    def test_list_of_cpusets(self):
+        # given a list of two cpusets for three compute nodes
+        cluster_name = 'mycluster'
+        cluster_plan = extended_stubs.basic_slurm_cluster_plan_stub(cluster_name,
+                                                                    u'172.30.0.0/24', 3)
+        cluster_plan.plan_data['compute']['resources'] = {'cpus': 2, 'cpuset': ['0-1', '2-3']}
+
+        # when
+        result = cluster_plan.build_specs()
+
+        # then the cpusets are assigned in order of IP address, and reused
+        cpusets = [result['nodes'][ip].resources['cpuset']
+                   for ip in ('172.30.0.1', '172.30.0.2', '172.30.0.3')]
+        self.assertEqual(cpusets, ['0-1', '2-3', '0-1'])
+
+
+class TestEmulationSpecsOfDefaultClusterPlan(DclusterTest):
+
+    def test_emulation_of_the_management_network(self):
+        # given
+        cluster_name = 'mycluster'
+        cluster_plan = extended_stubs.basic_slurm_cluster_plan_stub(cluster_name,
+                                                                    u'172.30.0.0/24', 1)
+        cluster_plan.plan_data['network'] = {'emulation': {'delay': '50us', 'rate': '10gbit'}}
+
+        # when
+        result = cluster_plan.build_specs()
+
+        # then
+        expected = {'dcluster-mycluster': {'delay': '50us', 'rate': '10gbit'}}
+        self.assertEqual(result['emulation'], expected)
+
+    def test_no_emulation(self):
+        # given
+        cluster_name = 'mycluster'
+        cluster_plan = extended_stubs.basic_slurm_cluster_plan_stub(cluster_name,
+                                                                    u'172.30.0.0/24', 1)
+
+        # when
+        result = cluster_plan.build_specs()
+
+        # then
+        self.assertNotIn('emulation', result)
+
+
+class TestDnsSpecsOfDefaultClusterPlan(DclusterTest):
+
+    def test_dns_responder_on_the_head(self):
+        # given
+        cluster_plan = extended_stubs.basic_slurm_cluster_plan_stub('mycluster',
+                                                                    u'172.30.0.0/24', 1)
+        cluster_plan.plan_data['dns'] = True
+
+        # when
+        result = cluster_plan.build_specs()
+
+        # then
+        self.assertEqual(result['dns']['server'], '172.30.0.253')
+        self.assertEqual(result['dns']['domain'], 'mycluster.dcluster')
+        self.assertTrue(result['dns']['dir'].endswith('mycluster/dns'))
+
+    def test_no_dns(self):
+        # given
+        cluster_plan = extended_stubs.basic_slurm_cluster_plan_stub('mycluster',
+                                                                    u'172.30.0.0/24', 1)
+
+        # when
+        result = cluster_plan.build_specs()
+
+        # then
+        self.assertNotIn('dns', result)
@@ -0,0 +1,36 @@
+from dcluster.tests.test_dcluster import DclusterTest
+
+from dcluster.cluster import request
+
+
+class TestRequestsFromManifest(DclusterTest):
+
+    def test_defaults_and_replicas(self):
+        # given
+        manifest = {
+            'defaults': {'profile': 'simple', 'compute_count': 2},
+            'clusters': [
+                {'name': 'train', 'replicas': 3},
+                {'name': 'ci', 'profile': 'slurm', 'compute_count': 4, 'memory_max': '8g'}
+            ]
+        }
+
+        # when
+        result = request.requests_from_manifest(manifest, ['/opt/profiles'])
+
+        # then
+        self.assertEqual([r.name for r in result], ['train-01', 'train-02', 'train-03', 'ci'])
+        self.assertEqual(result[0].compute_count, 2)
+        self.assertEqual(result[0].profile_paths, ['/opt/profiles'])
+        self.assertEqual(result[3].profile, 'slurm')
+        self.assertEqual(result[3].compute_count, 4)
+        self.assertEqual(result[3].cgroup_limits['memory_max'], '8g')
+
+    def test_unknown_key(self):
+        manifest = {'clusters': [{'name': 'ci', 'computes': 4}]}
+        with self.assertRaises(ValueError):
+            request.requests_from_manifest(manifest)
+
+    def test_replica_names_are_padded(self):
+        result = request.replica_names('ci', 100)
+        self.assertEqual((result[0], result[-1]), ('ci-001', 'ci-100'))
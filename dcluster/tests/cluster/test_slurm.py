@@ -0,0 +1,94 @@
+import io
+import tarfile
+
+from dcluster.config import main_config
+from dcluster.runtime import render
+
+from dcluster.node import DefaultPlannedNode
+from dcluster.cluster import slurm
+from dcluster.tests.test_dcluster import DclusterTest
+
+
+def planned_node(hostname, ip_address, role, resources=None):
+    return DefaultPlannedNode(hostname=hostname, container='mycluster-' + hostname,
+                              image='rhel76-slurm:v2', ip_address=ip_address, role=role,
+                              hostname_alias='', volumes=[], static_text='', systemctl=False,
+                              resources=resources)
+
+
+class TestCompressHostlist(DclusterTest):
+
+    def test_consecutive(self):
+        result = slurm.compress_hostlist(['node001', 'node002', 'node003'])
+        self.assertEqual(result, 'node[001-003]')
+
+    def test_gap_and_unordered(self):
+        result = slurm.compress_hostlist(['node005', 'node002', 'node001', 'node003'])
+        self.assertEqual(result, 'node[001-003,005]')
+
+    def test_single(self):
+        self.assertEqual(slurm.compress_hostlist(['node001']), 'node001')
+
+    def test_without_number(self):
+        result = slurm.compress_hostlist(['login', 'gpu01', 'gpu02'])
+        self.assertEqual(result, 'login,gpu[01-02]')
+
+
+class TestSlurmConf(DclusterTest):
+
+    def setUp(self):
+        self.maxDiff = None
+        self.renderer = render.JinjaRenderer(main_config.paths('templates'))
+
+    def test_render(self):
+        # given a head and three compute nodes, the last one with different hardware
+        compute_resources = {'cpus': 2, 'memory': '2g'}
+        cluster_specs = {
+            'name': 'mycluster',
+            'nodes': {
+                '172.30.0.253': planned_node('head', '172.30.0.253', 'head'),
+                '172.30.0.1': planned_node('node001', '172.30.0.1', 'compute', compute_resources),
+                '172.30.0.2': planned_node('node002', '172.30.0.2', 'compute', compute_resources),
+                '172.30.0.3': planned_node('node003', '172.30.0.3', 'compute', {'cpus': 1.5})
+            },
+            'slurm': {
+                'node_roles': ['compute'],
+                'options': {'SchedulerType': 'sched/builtin'}
+            }
+        }
+
+        # when
+        result = slurm.render_slurm_conf(cluster_specs, self.renderer)
+
+        # then
+        lines = result.splitlines()
+        self.assertIn('ClusterName=mycluster', lines)
+        self.assertIn('SlurmctldHost=head(172.30.0.253)', lines)
+        self.assertIn('SchedulerType=sched/builtin', lines)
+        self.assertNotIn('SchedulerType=sched/backfill', lines)
+        self.assertIn('NodeName=node[001-002] CPUs=2 RealMemory=2048 State=UNKNOWN', lines)
+        self.assertIn('NodeName=node003 CPUs=1 State=UNKNOWN', lines)
+        partition = 'PartitionName=compute Nodes=node[001-003] Default=YES'
+        self.assertIn(partition + ' MaxTime=INFINITE State=UP', lines)
+
+
+class TestConfigArchive(DclusterTest):
+
+    def test_owners_and_modes(self):
+        # given
+        users = slurm.parse_passwd('root:x:0:0:root:/root:/bin/bash\n'
+                                   'munge:x:998:995:Runs Uid:/var/run/munge:/sbin/nologin\n'
+                                   'slurm:x:990:990::/home/slurm:/bin/bash\n')
+
+        # when
+        archive = slurm.config_archive('ClusterName=mycluster\n', b'k' * 1024, users)
+
+        # then
+        with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+            members = {member.name: member for member in tar.getmembers()}
+
+        self.assertEqual(members['etc/slurm/slurm.conf'].uid, 990)
+        self.assertEqual(members['etc/munge/munge.key'].uid, 998)
+        self.assertEqual(members['etc/munge/munge.key'].gid, 995)
+        self.assertEqual(members['etc/munge/munge.key'].mode, 0o400)
+        self.assertEqual(members['etc/munge/munge.key'].size, 1024)
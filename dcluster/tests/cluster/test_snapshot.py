@@ -0,0 +1,40 @@
+from dcluster.tests.test_dcluster import DclusterTest
+
+from dcluster.cluster import snapshot
+
+
+class TestCloneRequest(DclusterTest):
+
+    def setUp(self):
+        self.manifest = {
+            'tag': 'mytag',
+            'source': 'mycluster',
+            'profile': 'slurm',
+            'compute_count': 2,
+            'nodes': {
+                'head': {'role': 'head', 'image': 'dcluster-snapshot:mytag-head'},
+                'node001': {'role': 'compute', 'image': 'dcluster-snapshot:mytag-node001'},
+                'node002': {'role': 'compute', 'image': 'dcluster-snapshot:mytag-node002'}
+            }
+        }
+
+    def test_clone_request(self):
+        # when
+        result = snapshot.clone_request(self.manifest, 'newcluster')
+
+        # then
+        self.assertEqual(result.name, 'newcluster')
+        self.assertEqual(result.profile, 'slurm')
+        self.assertEqual(result.compute_count, 2)
+        self.assertEqual(result.playbooks, [])
+        self.assertEqual(result.images, {
+            'head': 'dcluster-snapshot:mytag-head',
+            'compute': 'dcluster-snapshot:mytag-node001',
+            'node001': 'dcluster-snapshot:mytag-node001',
+            'node002': 'dcluster-snapshot:mytag-node002'
+        })
+
+    def test_profile_is_required(self):
+        self.manifest['profile'] = None
+        with self.assertRaises(ValueError):
+            snapshot.clone_request(self.manifest, 'newcluster')
@@ -0,0 +1,75 @@
+from collections import namedtuple
+
+from dcluster.tests.test_dcluster import DclusterTest
+from dcluster.tests.stubs import infra_stubs
+
+from dcluster.cluster import format, state
+from dcluster.cluster.blueprint import ClusterBlueprint
+from dcluster.node import BasicPlannedNode
+
+ContainerStub = namedtuple('ContainerStub', 'name, id')
+
+
+class DeployedNodeStub(object):
+
+    def __init__(self, hostname, ip_address, role):
+        self.planned = BasicPlannedNode(hostname, 'mycluster-' + hostname, 'centos7:ssh',
+                                        ip_address, role)
+        self.hostname = hostname
+        self.ip_address = ip_address
+        self.role = role
+        self.container = ContainerStub('mycluster-' + hostname, 'id-' + hostname)
+
+
+class TestClusterState(DclusterTest):
+
+    def setUp(self):
+        cluster_network = infra_stubs.network_stub('mycluster', u'172.30.0.0/24')
+        cluster_specs = {
+            'name': 'mycluster',
+            'nodes': {
+                '172.30.0.253': DeployedNodeStub('head', '172.30.0.253', 'head'),
+                '172.30.0.1': DeployedNodeStub('node001', '172.30.0.1', 'compute')
+            },
+            'network': {
+                'name': cluster_network.network_name,
+                'subnet': cluster_network.subnet
+            }
+        }
+        self.deployed_cluster = ClusterBlueprint(cluster_network, cluster_specs)
+
+    def test_from_cluster(self):
+        # when
+        result = state.from_cluster(self.deployed_cluster, state.STOPPED, 'simple')
+
+        # then
+        self.assertEqual(result['status'], 'stopped')
+        self.assertEqual(result['profile'], 'simple')
+        self.assertEqual(result['network']['subnet'], '172.30.0.0/24')
+        self.assertEqual(result['network']['gateway_ip'], '172.30.0.254')
+        expected = {
+            'hostname': 'node001',
+            'ip_address': '172.30.0.1',
+            'role': 'compute',
+            'container': 'mycluster-node001',
+            'container_id': 'id-node001',
+            'image': 'centos7:ssh',
+            'status': 'exited',
+            'health': None
+        }
+        self.assertEqual(result['nodes'][1], expected)
+        self.assertEqual(result['health'], 'down')
+
+    def test_cached_cluster_is_shown_as_deployed(self):
+        # given
+        cluster_state = state.from_cluster(self.deployed_cluster)
+        formatter = format.TextFormatterBasic()
+
+        # when
+        result = state.CachedCluster(cluster_state)
+
+        # then
+        self.assertEqual(result.format(formatter), self.deployed_cluster.format(formatter))
+        self.assertEqual(result.node_by_name('node001').container_id, 'id-node001')
+        self.assertTrue(result.has_node('head'))
+        self.assertFalse(result.has_node('node002'))
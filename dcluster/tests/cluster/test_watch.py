@@ -0,0 +1,182 @@
+from dcluster.tests.test_dcluster import DclusterTest
+
+from dcluster.cluster import state, watch
+from dcluster.infra.docker_facade import CLUSTER_LABEL, ROLE_LABEL
+
+
+def node_state(hostname, ip_address, role='compute'):
+    return {
+        'hostname': hostname,
+        'ip_address': ip_address,
+        'role': role,
+        'container': 'mycluster-' + hostname,
+        'container_id': 'id-' + hostname,
+        'image': 'centos7:ssh',
+        'status': state.RUNNING,
+        'health': None
+    }
+
+
+def container_event(action, hostname, **attributes):
+    attributes.update({CLUSTER_LABEL: 'mycluster', ROLE_LABEL: 'compute'})
+    return {
+        'Type': 'container',
+        'Action': action,
+        'Actor': {'ID': 'id-' + hostname, 'Attributes': attributes}
+    }
+
+
+def network_event(action, hostname):
+    return {
+        'Type': 'network',
+        'Action': action,
+        'Actor': {'ID': 'id-network', 'Attributes': {'name': 'dcluster-mycluster',
+                                                     'container': 'id-' + hostname}}
+    }
+
+
+def container_attrs(hostname, ip_address, running=True, oom_killed=False):
+    return {
+        'Id': 'id-' + hostname,
+        'Name': '/mycluster-' + hostname,
+        'Config': {'Hostname': hostname, 'Image': 'centos7:ssh',
+                   'Labels': {CLUSTER_LABEL: 'mycluster', ROLE_LABEL: 'compute'}},
+        'State': {'Running': running, 'Paused': False, 'OOMKilled': oom_killed},
+        'NetworkSettings': {'Networks': {'dcluster-mycluster': {'IPAddress': ip_address}}}
+    }
+
+
+class TestStateWatcher(DclusterTest):
+
+    def setUp(self):
+        self.cluster_state = {
+            'name': 'mycluster',
+            'status': state.RUNNING,
+            'health': state.HEALTHY,
+            'network': {'name': 'dcluster-mycluster', 'subnet': '172.30.0.0/24'},
+            'nodes': [node_state('head', '172.30.0.253', 'head'),
+                      node_state('node001', '172.30.0.1')]
+        }
+        self.inspected = {}
+        self.watcher = watch.StateWatcher(inspect=self.inspected.get, clock=lambda: 10.0)
+
+    def test_cluster_of_container_event(self):
+        # when
+        result = watch.cluster_of_event(container_event('die', 'node001'))
+
+        # then
+        self.assertEqual(result, 'mycluster')
+
+    def test_cluster_of_network_event(self):
+        # when
+        result = watch.cluster_of_event(network_event('disconnect', 'node001'))
+
+        # then
+        self.assertEqual(result, 'mycluster')
+
+    def test_other_containers_are_ignored(self):
+        # given
+        event = {'Type': 'container', 'Action': 'die', 'Actor': {'ID': 'x', 'Attributes': {}}}
+
+        # when
+        result = watch.cluster_of_event(event)
+
+        # then
+        self.assertIsNone(result)
+
+    def test_die_after_oom_is_oom_killed(self):
+        # given
+        self.watcher.apply(self.cluster_state, container_event('oom', 'node001'))
+
+        # when
+        result = self.watcher.apply(self.cluster_state,
+                                    container_event('die', 'node001', exitCode='137'))
+
+        # then
+        expected = [
+            watch.HealthTransition(10.0, 'mycluster', 'node001', 'running', 'oom-killed',
+                                   'exit code 137'),
+            watch.HealthTransition(10.0, 'mycluster', None, 'healthy', 'degraded', None)
+        ]
+        self.assertEqual(result, expected)
+        self.assertEqual(self.cluster_state['nodes'][1]['status'], state.OOM_KILLED)
+        self.assertEqual(self.cluster_state['status'], state.RUNNING)
+
+    def test_die_without_oom_is_exited(self):
+        # when
+        self.watcher.apply(self.cluster_state, container_event('die', 'node001', exitCode='0'))
+
+        # then
+        self.assertEqual(self.cluster_state['nodes'][1]['status'], state.EXITED)
+
+    def test_all_nodes_died_cluster_is_down(self):
+        # when
+        self.watcher.apply(self.cluster_state, container_event('die', 'node001'))
+        result = self.watcher.apply(self.cluster_state, container_event('die', 'head'))
+
+        # then
+        self.assertEqual(result[-1].current, state.DOWN)
+        self.assertEqual(self.cluster_state['status'], state.STOPPED)
+
+    def test_destroy_removes_node(self):
+        # when
+        result = self.watcher.apply(self.cluster_state, container_event('destroy', 'node001'))
+
+        # then
+        self.assertEqual([node['hostname'] for node in self.cluster_state['nodes']], ['head'])
+        self.assertEqual(result[0].current, watch.REMOVED)
+        self.assertEqual(self.cluster_state['health'], state.HEALTHY)
+
+    def test_disconnect_and_connect(self):
+        # when
+        self.watcher.apply(self.cluster_state, network_event('disconnect', 'node001'))
+        disconnected = self.cluster_state['nodes'][1]['status']
+        self.watcher.apply(self.cluster_state, network_event('connect', 'node001'))
+
+        # then
+        self.assertEqual(disconnected, state.DISCONNECTED)
+        self.assertEqual(self.cluster_state['nodes'][1]['status'], state.RUNNING)
+        self.assertEqual(self.cluster_state['health'], state.HEALTHY)
+
+    def test_unhealthy_node_degrades_cluster(self):
+        # when
+        result = self.watcher.apply(self.cluster_state,
+                                    container_event('health_status: unhealthy', 'node001'))
+
+        # then
+        self.assertEqual(self.cluster_state['nodes'][1]['health'], 'unhealthy')
+        self.assertEqual(result[-1].current, state.DEGRADED)
+
+    def test_start_of_new_node_adds_it(self):
+        # given
+        self.inspected['id-node002'] = container_attrs('node002', '172.30.0.2')
+
+        # when
+        result = self.watcher.apply(self.cluster_state, container_event('start', 'node002'))
+
+        # then
+        self.assertEqual(result[0].detail, 'added')
+        self.assertEqual(self.cluster_state['nodes'][2]['ip_address'], '172.30.0.2')
+        self.assertEqual(self.cluster_state['nodes'][2]['container'], 'mycluster-node002')
+
+    def test_repeated_event_has_no_transitions(self):
+        # when
+        result = self.watcher.apply(self.cluster_state, container_event('start', 'node001'))
+
+        # then
+        self.assertEqual(result, [])
+
+    def test_reconcile(self):
+        # given the head was killed, node001 removed and node002 created while not watching
+        containers = [container_attrs('head', '', running=False, oom_killed=True),
+                      container_attrs('node002', '172.30.0.2')]
+        self.inspected['id-node002'] = containers[1]
+
+        # when
+        self.watcher.reconcile(self.cluster_state, containers)
+
+        # then
+        result = [(node['hostname'], node['status']) for node in self.cluster_state['nodes']]
+        self.assertEqual(result, [('head', 'oom-killed'), ('node002', 'running')])
+        self.assertEqual(self.cluster_state['nodes'][0]['ip_address'], '172.30.0.253')
+        self.assertEqual(self.cluster_state['health'], state.DEGRADED)
@@ -0,0 +1,101 @@
+import os
+import shutil
+import tempfile
+
+from dcluster.tests.test_dcluster import DclusterTest
+
+from dcluster.dansible import image_cache
+
+GB = 1024 ** 3
+
+
+class TestPlaybookDigest(DclusterTest):
+
+    def setUp(self):
+        self.playbook_dir = tempfile.mkdtemp()
+        self.write('playbook.yml', '- hosts: all')
+        self.write('roles/repo/tasks/main.yml', '- yum: name=*')
+
+    def tearDown(self):
+        shutil.rmtree(self.playbook_dir)
+
+    def test_same_content_same_digest(self):
+        first = image_cache.playbook_digest(self.playbook_dir)
+        second = image_cache.playbook_digest(self.playbook_dir)
+        self.assertEqual(first, second)
+
+    def test_changed_content_changes_digest(self):
+        # given
+        before = image_cache.playbook_digest(self.playbook_dir)
+
+        # when
+        self.write('roles/repo/tasks/main.yml', '- yum: name=* state=latest')
+
+        # then
+        self.assertNotEqual(image_cache.playbook_digest(self.playbook_dir), before)
+
+    def test_key_depends_on_extra_vars_and_image(self):
+        key = image_cache.cache_key(['abc'], ['a=1'], 'head', 'sha256:1')
+        self.assertNotEqual(key, image_cache.cache_key(['abc'], ['a=2'], 'head', 'sha256:1'))
+        self.assertNotEqual(key, image_cache.cache_key(['abc'], ['a=1'], 'head', 'sha256:2'))
+
+    def write(self, relative_path, content):
+        full_path = os.path.join(self.playbook_dir, relative_path)
+        if not os.path.isdir(os.path.dirname(full_path)):
+            os.makedirs(os.path.dirname(full_path))
+        with open(full_path, 'w') as f:
+            f.write(content)
+
+
+class TestImageCacheIndex(DclusterTest):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.workdir, 'index.json')
+        self.now = 0
+        self.index = image_cache.ImageCacheIndex(self.filename, '3g', 10, clock=self.clock)
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_lookup_is_persisted(self):
+        # given
+        self.index.add('key1', 'dcluster-cache:head-key1', GB)
+        self.index.save()
+
+        # when
+        index = image_cache.ImageCacheIndex(self.filename, '3g', 10)
+
+        # then
+        self.assertEqual(index.lookup('key1'), 'dcluster-cache:head-key1')
+        self.assertEqual(index.lookup('key2'), None)
+
+    def test_least_recently_used_is_evicted(self):
+        # given
+        self.add('key1')
+        self.add('key2')
+        self.add('key3')
+        self.now += 1
+        self.index.lookup('key1')
+
+        # when over the size limit
+        result = self.add('key4')
+
+        # then
+        self.assertEqual(result, ['image-key2'])
+        self.assertEqual(sorted(self.index.entries.keys()), ['key1', 'key3', 'key4'])
+
+    def test_max_entries(self):
+        # given
+        index = image_cache.ImageCacheIndex(self.filename, None, 1, clock=self.clock)
+        index.add('key1', 'image-key1', GB)
+
+        # then
+        self.assertEqual(index.add('key2', 'image-key2', GB), ['image-key1'])
+
+    def add(self, key):
+        self.now += 1
+        return self.index.add(key, 'image-' + key, GB)
+
+    def clock(self):
+        return self.now
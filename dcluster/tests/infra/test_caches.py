@@ -0,0 +1,147 @@
+from dcluster.tests.test_dcluster import DclusterTest
+
+from dcluster.infra import caches
+
+
+class TestImageFamily(DclusterTest):
+
+    def test_repository_and_tag(self):
+        self.assertEqual(caches.image_family('centos:7.7.1908'), 'centos')
+
+    def test_registry_and_namespace(self):
+        self.assertEqual(caches.image_family('registry:5000/hpc/centos7:build'), 'centos7')
+
+    def test_no_tag(self):
+        self.assertEqual(caches.image_family('rhel76-slurm'), 'rhel76-slurm')
+
+
+class TestCacheVolumes(DclusterTest):
+
+    def test_enabled_by_profile(self):
+        # given
+        plan_data = {'package_cache': True}
+
+        # when
+        result = caches.cache_volumes(plan_data, 'centos7:ssh')
+
+        # then
+        expected = [caches.CacheVolume('packages', 'dcluster-packages-centos7',
+                                       '/var/cache/dcluster/packages')]
+        self.assertEqual(result, expected)
+
+    def test_same_family_shares_volume(self):
+        # given
+        plan_data = {'package_cache': True}
+
+        # when
+        ssh_volumes = caches.cache_volumes(plan_data, 'centos7:ssh')
+        slurm_volumes = caches.cache_volumes(plan_data, 'centos7:slurm')
+
+        # then
+        self.assertEqual(ssh_volumes, slurm_volumes)
+
+    def test_disabled_by_profile(self):
+        self.assertEqual(caches.cache_volumes({'package_cache': False}, 'centos7:ssh'), [])
+
+    def test_disabled_by_default(self):
+        self.assertEqual(caches.cache_volumes({}, 'centos7:ssh'), [])
+
+
+class TestCacheEnvironment(DclusterTest):
+
+    def test_compiler_cache(self):
+        # given
+        plan_data = {'compiler_cache': True}
+
+        # when
+        result = caches.cache_environment(plan_data)
+
+        # then
+        self.assertEqual(result, {'CCACHE_DIR': '/var/cache/ccache', 'CCACHE_MAXSIZE': '5G'})
+
+    def test_package_cache(self):
+        # given
+        plan_data = {'package_cache': True}
+
+        # when
+        result = caches.cache_environment(plan_data)
+
+        # then the bootstrap script finds the mount of the cache
+        self.assertEqual(result, {'DCLUSTER_PACKAGE_CACHE': '/var/cache/dcluster/packages'})
+
+    def test_add_to_dict_environment(self):
+        # given
+        static = {'command': ['slurmd'], 'environment': {'SLURM_USER': 'slurm'}}
+
+        # when
+        result = caches.add_environment(static, {'CCACHE_DIR': '/var/cache/ccache'})
+
+        # then the original is not modified
+        expected = {'SLURM_USER': 'slurm', 'CCACHE_DIR': '/var/cache/ccache'}
+        self.assertEqual(result['environment'], expected)
+        self.assertEqual(static['environment'], {'SLURM_USER': 'slurm'})
+
+    def test_add_to_list_environment(self):
+        # given
+        static = {'environment': ['SLURM_USER=slurm']}
+
+        # when
+        result = caches.add_environment(static, {'CCACHE_DIR': '/var/cache/ccache'})
+
+        # then
+        expected = ['SLURM_USER=slurm', 'CCACHE_DIR=/var/cache/ccache']
+        self.assertEqual(result['environment'], expected)
+
+
+class TestMountedCaches(DclusterTest):
+
+    def test_cache_and_other_mounts(self):
+        # given
+        mounts = [
+            {'Type': 'bind', 'Destination': '/dcluster'},
+            {'Type': 'volume', 'Name': 'mycluster_etc_slurm'},
+            {'Type': 'volume', 'Name': 'dcluster-ccache-centos7'}
+        ]
+
+        # when
+        result = caches.mounted_caches(mounts)
+
+        # then
+        self.assertEqual(result, ['ccache'])
+
+
+class TestParseCcacheStats(DclusterTest):
+
+    def test_ccache_3(self):
+        # given
+        output = '''cache directory                     /var/cache/ccache
+primary config                      /var/cache/ccache/ccache.conf
+cache hit (direct)                    30
+cache hit (preprocessed)              10
+cache miss                            10
+files in cache                       120
+'''
+
+        # when
+        result = caches.parse_ccache_stats(output)
+
+        # then
+        self.assertEqual(result, {'hits': 40, 'misses': 10, 'hit_rate': 80.0})
+
+    def test_ccache_4(self):
+        # given
+        output = '''Cacheable calls:   20 / 20 (100.0%)
+  Hits:            15 / 20 (75.00%)
+    Direct:        15 / 15 (100.0%)
+  Misses:           5 / 20 (25.00%)
+'''
+
+        # when
+        result = caches.parse_ccache_stats(output)
+
+        # then
+        self.assertEqual(result, {'hits': 15, 'misses': 5, 'hit_rate': 75.0})
+
+    def test_empty_cache(self):
+        result = caches.parse_ccache_stats('cache miss 0\n')
+        self.assertEqual(result['hit_rate'], None)
@@ -0,0 +1,120 @@
+import os
+import shutil
+import tempfile
+
+from dcluster.tests.test_dcluster import DclusterTest
+
+from dcluster.infra import cgroups
+
+
+class TestExpandSlice(DclusterTest):
+
+    def test_simple_name(self):
+        result = cgroups.expand_slice('dcluster-mycluster.slice')
+        self.assertEqual(result, 'dcluster.slice/dcluster-mycluster.slice')
+
+    def test_name_with_dashes(self):
+        result = cgroups.expand_slice('dcluster-my-cluster.slice')
+        expected = 'dcluster.slice/dcluster-my.slice/dcluster-my-cluster.slice'
+        self.assertEqual(result, expected)
+
+    def test_not_a_slice(self):
+        with self.assertRaises(ValueError):
+            cgroups.expand_slice('dcluster/mycluster')
+
+
+class TestMergeLimits(DclusterTest):
+
+    def test_user_overrides_profile(self):
+        # given
+        profile_limits = {'cpu_max': 4, 'memory_max': '8g'}
+        user_limits = {'cpu_max': 2, 'memory_max': None, 'weight': None}
+
+        # when
+        result = cgroups.merge_limits(profile_limits, user_limits)
+
+        # then
+        self.assertEqual(result, {'cpu_max': 2, 'memory_max': '8g'})
+
+    def test_no_limits(self):
+        self.assertEqual(cgroups.merge_limits(None, None), {})
+
+
+class TestClusterCgroup(DclusterTest):
+    '''
+    Uses a temporary directory as cgroup root to simulate the unified hierarchy.
+    '''
+
+    def setUp(self):
+        self.cgroup_root = tempfile.mkdtemp()
+        with open(os.path.join(self.cgroup_root, 'cgroup.controllers'), 'w') as cf:
+            cf.write('cpu memory pids')
+
+        self.cluster_cgroup = cgroups.ClusterCgroup('mycluster', 'cgroupfs', self.cgroup_root)
+        os.makedirs(self.cluster_cgroup.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.cgroup_root)
+
+    def test_path_cgroupfs(self):
+        expected = os.path.join(self.cgroup_root, 'dcluster-mycluster.slice')
+        self.assertEqual(self.cluster_cgroup.path, expected)
+
+    def test_path_systemd(self):
+        cluster_cgroup = cgroups.ClusterCgroup('mycluster', 'systemd', '/sys/fs/cgroup')
+        expected = '/sys/fs/cgroup/dcluster.slice/dcluster-mycluster.slice'
+        self.assertEqual(cluster_cgroup.path, expected)
+
+    def test_clusters_with_dashes_have_disjoint_slices_systemd(self):
+        # given
+        cgroup_a = cgroups.ClusterCgroup('a', 'systemd', '/sys/fs/cgroup')
+        cgroup_a_b = cgroups.ClusterCgroup('a-b', 'systemd', '/sys/fs/cgroup')
+
+        # then neither slice is under the other
+        self.assertEqual(cgroup_a_b.name, 'dcluster-a\\x2db.slice')
+        self.assertEqual(cgroup_a.path, '/sys/fs/cgroup/dcluster.slice/dcluster-a.slice')
+        self.assertEqual(cgroup_a_b.path, '/sys/fs/cgroup/dcluster.slice/dcluster-a\\x2db.slice')
+        self.assertFalse(cgroup_a_b.path.startswith(cgroup_a.path + '/'))
+
+    def test_find_escaped_cluster_cgroups(self):
+        # given
+        os.makedirs(cgroups.ClusterCgroup('my-cluster', 'cgroupfs', self.cgroup_root).path)
+
+        # when
+        found = cgroups.find_cluster_cgroups('cgroupfs', self.cgroup_root)
+
+        # then
+        result = sorted((c.cluster_name, c.name) for c in found)
+        expected = [('my-cluster', 'dcluster-my\\x2dcluster.slice'),
+                    ('mycluster', 'dcluster-mycluster.slice')]
+        self.assertEqual(result, expected)
+
+    def test_apply_limits(self):
+        # when
+        self.cluster_cgroup.apply_limits({'cpu_max': 1.5, 'memory_max': '1g', 'weight': 50})
+
+        # then
+        self.assertEqual(self.read('cpu.max'), '150000 100000')
+        self.assertEqual(self.read('memory.max'), str(1024 ** 3))
+        self.assertEqual(self.read('cpu.weight'), '50')
+
+    def test_usage(self):
+        # given
+        self.write('cpu.stat', 'usage_usec 2500000\nuser_usec 2000000\nsystem_usec 500000\n')
+        self.write('memory.current', '1048576\n')
+
+        # when
+        usage = self.cluster_cgroup.usage()
+
+        # then
+        self.assertEqual(usage['cpu_usage_usec'], 2500000)
+        self.assertEqual(usage['memory_current'], 1048576)
+        self.assertEqual(usage['memory_peak'], None)
+
+    def read(self, filename):
+        with open(os.path.join(self.cluster_cgroup.path, filename), 'r') as cf:
+            return cf.read()
+
+    def write(self, filename, contents):
+        with open(os.path.join(self.cluster_cgroup.path, filename), 'w') as cf:
+            cf.write(contents)
@@ -0,0 +1,113 @@
+from dcluster.tests.test_dcluster import DclusterTest
+
+from dcluster.infra import gc
+
+
+def container_stub(name, network_name, labels=None, volumes=()):
+    return {
+        'Names': ['/' + name],
+        'Labels': labels or {},
+        'Mounts': [{'Type': 'volume', 'Name': volume} for volume in volumes],
+        'NetworkSettings': {'Networks': {network_name: {}}}
+    }
+
+
+def volume_stub(name, labels, size=1024):
+    return {'Name': name, 'Labels': labels, 'UsageData': {'Size': size, 'RefCount': 0}}
+
+
+class TestFindOrphans(DclusterTest):
+
+    def setUp(self):
+        # cluster 'alive' has a running head, 'dead' was removed without its network and volumes
+        docker_df = {
+            'Containers': [
+                container_stub('alive-head', 'dcluster-alive',
+                               labels={'bull.com.dcluster.cluster': 'alive'},
+                               volumes=['alive_etc_munge']),
+                container_stub('other', 'bridge')
+            ],
+            'Volumes': [
+                volume_stub('alive_etc_munge', {'bull.com.dcluster.cluster': 'alive'}),
+                volume_stub('dead_etc_munge', {'bull.com.dcluster.cluster': 'dead'}),
+                volume_stub('dead_etc_slurm', {'com.docker.compose.project': 'dead'}, size=-1),
+                volume_stub('yum_cache', {'bull.com.dcluster.cache': 'yum'}),
+                volume_stub('unrelated', {})
+            ]
+        }
+        docker_networks = [
+            {'Name': 'bridge', 'Id': 'id0'},
+            {'Name': 'dcluster-alive', 'Id': 'id1'},
+            {'Name': 'dcluster-dead', 'Id': 'id2'}
+        ]
+        workpath_dirs = {
+            'alive': ('/work/clusters/alive', 100),
+            'dead': ('/work/clusters/dead', 200),
+        }
+        self.snapshot = gc.build_snapshot(docker_df, docker_networks, workpath_dirs, [])
+
+    def test_live_clusters(self):
+        self.assertEqual(self.snapshot.live_clusters, set(['alive']))
+
+    def test_orphans(self):
+        # when
+        result = gc.find_orphans(self.snapshot)
+
+        # then
+        names = [(resource.kind, resource.name) for resource in result]
+        self.assertEqual(names, [('network', 'dcluster-dead'),
+                                 ('volume', 'dead_etc_munge'),
+                                 ('volume', 'dead_etc_slurm'),
+                                 ('workpath', '/work/clusters/dead')])
+
+    def test_freed_size(self):
+        result = gc.freed_size(gc.find_orphans(self.snapshot))
+        self.assertEqual(result, 1024 + 200)
+
+    def test_systemd_slice_with_live_child_is_kept(self):
+        # given 'my' is gone but its slice contains the slice of 'my-cluster'
+        resources = [
+            gc.Resource(gc.CGROUP, None, '/cg/dcluster.slice/dcluster-my.slice', 'my', None),
+            gc.Resource(gc.CGROUP, None,
+                        '/cg/dcluster.slice/dcluster-my.slice/dcluster-my-cluster.slice',
+                        'my-cluster', None)
+        ]
+        snapshot = gc.Snapshot(resources, set(['my-cluster']), set())
+
+        # then
+        self.assertEqual(gc.find_orphans(snapshot), [])
+
+
+class TestGarbageCollector(DclusterTest):
+
+    def setUp(self):
+        self.removed = []
+        resources = [
+            gc.Resource(gc.NETWORK, 'id1', 'dcluster-dead', 'dead', None),
+            gc.Resource(gc.VOLUME, 'dead_busy', 'dead_busy', 'dead', 10)
+        ]
+        self.collector = gc.GarbageCollector(lambda: gc.Snapshot(resources, set(), set()),
+                                             self.remove)
+
+    def test_dry_run_removes_nothing(self):
+        (removed, failed) = self.collector.collect(dry_run=True)
+        self.assertEqual(len(removed), 2)
+        self.assertEqual(self.removed, [])
+
+    def test_failures_are_reported(self):
+        (removed, failed) = self.collector.collect()
+        self.assertEqual([r.name for r in removed], ['dcluster-dead'])
+        self.assertEqual([r.name for (r, _) in failed], ['dead_busy'])
+
+    def remove(self, resource):
+        if resource.kind == gc.VOLUME:
+            raise ValueError('volume is in use')
+        self.removed.append(resource)
+
+
+class TestClusterOfNetwork(DclusterTest):
+
+    def test_management_and_data_networks(self):
+        self.assertEqual(gc.cluster_of_network('dcluster-mycluster'), 'mycluster')
+        self.assertEqual(gc.cluster_of_network('dclusterdata-mycluster'), 'mycluster')
+        self.assertEqual(gc.cluster_of_network('bridge'), None)
@@ -0,0 +1,87 @@
+import os
+
+from dcluster.tests.test_dcluster import DclusterTest
+from dcluster.tests.stubs import infra_stubs
+
+from dcluster.infra import ipam
+
+
+class TestClusterIpam(DclusterTest):
+
+    def setUp(self):
+        cluster_network = infra_stubs.network_stub('test', u'172.30.0.0/29')
+        self.cluster_ipam = ipam.ClusterIpam.for_network(cluster_network)
+
+    def test_gateway_and_head_are_reserved(self):
+        self.assertEqual(self.cluster_ipam.used_addresses(), ['172.30.0.5', '172.30.0.6'])
+        self.assertEqual(self.cluster_ipam.free_count(), 4)
+
+    def test_allocate_lowest(self):
+        # when
+        result = self.cluster_ipam.allocate_many(3)
+
+        # then
+        self.assertEqual(result, ['172.30.0.1', '172.30.0.2', '172.30.0.3'])
+
+    def test_release_and_reuse(self):
+        # given
+        self.cluster_ipam.allocate_many(3)
+
+        # when
+        self.cluster_ipam.release('172.30.0.2')
+        result = self.cluster_ipam.allocate()
+
+        # then the hole is filled before the addresses above it
+        self.assertEqual(result, '172.30.0.2')
+        self.assertEqual(self.cluster_ipam.allocate(), '172.30.0.4')
+
+    def test_reserved_cannot_be_released(self):
+        with self.assertRaises(ValueError):
+            self.cluster_ipam.release('172.30.0.6')
+
+    def test_outside_subnet(self):
+        with self.assertRaises(ValueError):
+            self.cluster_ipam.reserve('172.30.1.1')
+
+    def test_exhausted(self):
+        # given
+        self.cluster_ipam.allocate_many(4)
+
+        # then
+        with self.assertRaises(ipam.AddressesExhausted):
+            self.cluster_ipam.allocate()
+
+    def test_not_enough_takes_nothing(self):
+        # given
+        self.cluster_ipam.allocate()
+
+        # when
+        with self.assertRaises(ipam.AddressesExhausted):
+            self.cluster_ipam.allocate_many(4)
+
+        # then
+        self.assertEqual(self.cluster_ipam.free_count(), 3)
+
+    def test_round_trip(self):
+        # given
+        self.cluster_ipam.allocate_many(2)
+        self.cluster_ipam.release('172.30.0.1')
+
+        # when
+        result = ipam.ClusterIpam.from_dict(self.cluster_ipam.as_dict())
+
+        # then
+        self.assertEqual(result.used_addresses(), ['172.30.0.2', '172.30.0.5', '172.30.0.6'])
+        with self.assertRaises(ValueError):
+            result.release('172.30.0.5')
+
+
+class TestIpamPath(DclusterTest):
+
+    def test_data_network_has_its_own_record(self):
+        # when
+        result = ipam.ipam_path('mycluster', data=True)
+
+        # then
+        self.assertEqual(os.path.basename(result), 'ipam-data.json')
+        self.assertEqual(os.path.dirname(result), os.path.dirname(ipam.ipam_path('mycluster')))
@@ -0,0 +1,52 @@
+import json
+
+from dcluster.tests.test_dcluster import DclusterTest
+
+from dcluster.infra import netbench
+
+
+class TestParsePing(DclusterTest):
+
+    def test_iputils(self):
+        output = '''20 packets transmitted, 20 received, 0% packet loss, time 3805ms
+rtt min/avg/max/mdev = 0.041/0.063/0.102/0.015 ms
+'''
+        self.assertEqual(netbench.parse_ping(output), 0.063)
+
+    def test_busybox(self):
+        output = 'round-trip min/avg/max = 0.052/0.080/0.133 ms\n'
+        self.assertEqual(netbench.parse_ping(output), 0.080)
+
+    def test_no_summary(self):
+        self.assertEqual(netbench.parse_ping('ping: bad address'), None)
+
+
+class TestParseIperf3(DclusterTest):
+
+    def test_received(self):
+        report = {'end': {'sum_received': {'bits_per_second': 25.5e9}}}
+        self.assertEqual(netbench.parse_iperf3(json.dumps(report)), 25.5)
+
+    def test_error(self):
+        with self.assertRaises(ValueError):
+            netbench.parse_iperf3(json.dumps({'error': 'unable to connect to server'}))
+
+
+class TestFormatResults(DclusterTest):
+
+    def test_table(self):
+        # given
+        results = [
+            netbench.BenchResult('bridge', 0.063, 25.5, None),
+            netbench.BenchResult('macvlan', None, None, 'no parent')
+        ]
+
+        # when
+        lines = netbench.format_results(results).splitlines()
+
+        # then
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].startswith('bridge'))
+        self.assertIn('0.063', lines[1])
+        self.assertIn('25.50', lines[1])
+        self.assertTrue(lines[2].endswith('no parent'))
@@ -0,0 +1,120 @@
+from dcluster.tests.test_dcluster import DclusterTest
+
+from dcluster.infra import netem
+
+
+class TestEmulationSettings(DclusterTest):
+
+    def test_no_emulation(self):
+        self.assertEqual(netem.emulation_settings(None), None)
+        self.assertEqual(netem.emulation_settings(True), None)
+        self.assertEqual(netem.emulation_settings({'mtu': 9000}), None)
+
+    def test_empty_emulation(self):
+        self.assertEqual(netem.emulation_settings({'emulation': None}), None)
+        self.assertEqual(netem.emulation_settings({'emulation': {}}), {})
+
+    def test_settings_are_strings(self):
+        # given
+        profile_network = {'emulation': {'delay': '50us', 'loss': 0.1, 'jitter': None}}
+
+        # when
+        result = netem.emulation_settings(profile_network)
+
+        # then
+        self.assertEqual(result, {'delay': '50us', 'loss': '0.1'})
+
+    def test_unknown_setting(self):
+        with self.assertRaises(ValueError):
+            netem.emulation_settings({'emulation': {'latency': '50us'}})
+
+    def test_bad_rate(self):
+        with self.assertRaises(ValueError):
+            netem.emulation_settings({'emulation': {'rate': '10 gigabits'}})
+
+
+class TestTcCommands(DclusterTest):
+
+    def test_netem_and_tbf(self):
+        # given
+        settings = {'delay': '50us', 'jitter': '10us', 'loss': '0.01%', 'rate': '10gbit'}
+
+        # when
+        result = netem.tc_commands('eth0', settings)
+
+        # then 10ms of 10gbit in the bucket
+        expected = [
+            'tc qdisc replace dev eth0 root handle 1: netem delay 50us 10us loss 0.01%',
+            'tc qdisc replace dev eth0 parent 1:1 handle 10: tbf rate 10gbit burst 12500000 '
+            'latency 50ms'
+        ]
+        self.assertEqual(result, expected)
+
+    def test_rate_only(self):
+        # given
+        settings = {'rate': '1mbit'}
+
+        # when
+        result = netem.tc_commands('eth1', settings)
+
+        # then the bucket holds at least a frame
+        expected = [
+            'tc qdisc replace dev eth1 root handle 1: netem',
+            'tc qdisc replace dev eth1 parent 1:1 handle 10: tbf rate 1mbit burst 1540 '
+            'latency 50ms'
+        ]
+        self.assertEqual(result, expected)
+
+    def test_jitter_needs_delay(self):
+        result = netem.tc_commands('eth0', {'jitter': '10us'})
+        self.assertEqual(result, ['tc qdisc replace dev eth0 root handle 1: netem'])
+
+    def test_clear(self):
+        self.assertEqual(netem.tc_commands('eth0', {}), ['tc qdisc del dev eth0 root'])
+
+
+class TestParseRate(DclusterTest):
+
+    def test_bits_and_bytes(self):
+        self.assertEqual(netem.parse_rate('10gbit'), 10e9)
+        self.assertEqual(netem.parse_rate('125MBps'), 1e9)
+        self.assertEqual(netem.parse_rate('1.5kbit'), 1500)
+
+    def test_bad_rate(self):
+        with self.assertRaises(ValueError):
+            netem.parse_rate('fast')
+
+
+class TestInterfaceForAddress(DclusterTest):
+
+    def setUp(self):
+        self.ip_output = '''1: lo    inet 127.0.0.1/8 scope host lo\\       valid_lft forever
+52: eth0@if53    inet 172.30.0.1/24 brd 172.30.0.255 scope global eth0\\       valid_lft forever
+54: eth1@if55    inet 172.31.0.1/24 brd 172.31.0.255 scope global eth1\\       valid_lft forever
+'''
+
+    def test_management_and_data(self):
+        self.assertEqual(netem.interface_for_address(self.ip_output, '172.30.0.1'), 'eth0')
+        self.assertEqual(netem.interface_for_address(self.ip_output, '172.31.0.1'), 'eth1')
+
+    def test_missing(self):
+        self.assertEqual(netem.interface_for_address(self.ip_output, '172.30.0.10'), None)
+
+
+class TestFormatProbe(DclusterTest):
+
+    def test_table(self):
+        # given
+        results = [
+            netem.ProbeResult('node001', 0.1234, 9.4, None),
+            netem.ProbeResult('node002', None, None, 'iperf3 failed')
+        ]
+
+        # when
+        result = netem.format_probe(results)
+
+        # then
+        expected = '''node            rtt (ms) throughput (Gb/s)
+node001            0.123             9.400
+node002                -                 -  iperf3 failed'''
+        self.assertEqual(result, expected)
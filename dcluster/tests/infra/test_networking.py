@@ -1,3 +1,4 @@
+import ipaddress
 import random
 import string
 
@@ -67,6 +68,77 @@ class TestClusterNetwork(DclusterTest):
         return networking.ClusterNetwork.from_first_subnet(supernet, cidr_bits, name)
 
 
+class TestDriverOptions(DclusterTest):
+
+    def test_default_config(self):
+        self.assertEqual(networking.driver_options(), {})
+
+    def test_profile_mtu_and_options(self):
+        # given
+        profile_network = {
+            'mtu': 9000,
+            'driver_opts': {'com.docker.network.bridge.enable_icc': 'true'}
+        }
+
+        # when
+        result = networking.driver_options(profile_network)
+
+        # then Docker wants strings
+        expected = {
+            'com.docker.network.driver.mtu': '9000',
+            'com.docker.network.bridge.enable_icc': 'true'
+        }
+        self.assertEqual(result, expected)
+
+    def test_recorded_in_dict(self):
+        # given
+        driver_opts = networking.driver_options({'mtu': 9000})
+        subnet = next(networking.ClusterNetwork.generator(u'172.30.0.0/16', 24, 'test')).subnet
+
+        # when
+        result = networking.ClusterNetwork(subnet, 'test', driver_opts).as_dict()
+
+        # then
+        self.assertEqual(result['mtu'], 9000)
+        self.assertEqual(result['driver_opts'], {'com.docker.network.driver.mtu': '9000'})
+
+    def test_macvlan_parent(self):
+        # given
+        profile_network = {'driver': 'macvlan', 'parent': 'eth1'}
+
+        # when
+        driver = networking.network_driver(profile_network)
+        options = networking.driver_options(profile_network)
+
+        # then
+        self.assertEqual(driver, 'macvlan')
+        self.assertEqual(options, {'parent': 'eth1'})
+
+    def test_ipvlan_mode(self):
+        options = networking.driver_options({'driver': 'ipvlan'})
+        self.assertEqual(options, {'ipvlan_mode': 'l2'})
+
+    def test_unsupported_driver(self):
+        with self.assertRaises(ValueError):
+            networking.network_driver({'driver': 'overlay'})
+
+    def test_no_mtu_for_macvlan(self):
+        # when
+        options = networking.driver_options({'driver': 'macvlan', 'parent': 'eth1', 'mtu': 9000})
+
+        # then the network has the MTU of its parent
+        self.assertEqual(options, {'parent': 'eth1'})
+
+    def test_macvlan_not_reachable_from_host(self):
+        networking.check_reachable_from_host('bridge', 'ssh')
+        with self.assertRaises(ValueError):
+            networking.check_reachable_from_host('macvlan', 'ssh')
+
+    def test_not_recorded_without_options(self):
+        cluster_network = networking.ClusterNetwork.from_first_subnet(u'172.30.0.0/16', 24, 'test')
+        self.assertNotIn('mtu', cluster_network.as_dict())
+
+
 class TestValidateNameIsAvailable(DclusterTest):
 
     def setUp(self):
@@ -85,3 +157,140 @@ class TestValidateNameIsAvailable(DclusterTest):
         # this should return the valid name
         result = self.creator.validate_network_name(random_name)
         self.assertEqual(result, random_name)
+
+
+class TestDataNetwork(DclusterTest):
+
+    def test_name_is_not_a_management_network(self):
+        # given
+        subnet = next(networking.ClusterNetwork.generator(u'172.31.0.0/16', 24, 'test')).subnet
+        data_network = networking.ClusterNetwork(subnet, 'mycluster', data=True)
+
+        # when
+        network_name = data_network.network_name
+
+        # then
+        self.assertEqual(network_name, 'dclusterdata-mycluster')
+        self.assertFalse(networking.DockerNaming.is_dcluster_network(network_name))
+        cluster_name = networking.DockerNaming.deduce_data_cluster_name(network_name)
+        self.assertEqual(cluster_name, 'mycluster')
+
+
+class TestSupernetPools(DclusterTest):
+
+    def test_single_supernet(self):
+        # when
+        pools = networking.supernet_pools(u'172.30.0.0/16', 24)
+
+        # then
+        self.assertEqual([str(pool) for pool in pools], ['172.30.0.0/16:/24'])
+        self.assertEqual(pools[0].host_count, 254)
+
+    def test_list_of_pools(self):
+        # given
+        supernet = [
+            {'supernet': u'172.29.0.0/16', 'cidr_bits': 26},
+            u'172.30.0.0/16'
+        ]
+
+        # when
+        pools = networking.supernet_pools(supernet, 24)
+
+        # then
+        self.assertEqual([str(pool) for pool in pools], ['172.29.0.0/16:/26', '172.30.0.0/16:/24'])
+
+    def test_subnets_larger_than_supernet(self):
+        with self.assertRaises(ValueError):
+            networking.supernet_pools(u'172.30.0.0/24', 16)
+
+    def test_generator_over_pools(self):
+        # given
+        supernet = [
+            {'supernet': u'172.29.0.0/25', 'cidr_bits': 26},
+            {'supernet': u'172.30.0.0/23', 'cidr_bits': 24}
+        ]
+
+        # when
+        generator = networking.ClusterNetwork.generator(supernet, 24, 'test')
+
+        # then
+        expected = ['172.29.0.0/26', '172.29.0.64/26', '172.30.0.0/24', '172.30.1.0/24']
+        self.assertEqual([str(cluster_network) for cluster_network in generator], expected)
+
+
+class TestFittingPools(DclusterTest):
+
+    def setUp(self):
+        self.pools = networking.supernet_pools([
+            {'supernet': u'172.30.0.0/16', 'cidr_bits': 24},
+            {'supernet': u'172.29.0.0/16', 'cidr_bits': 26},
+            {'supernet': u'172.28.0.0/16', 'cidr_bits': 24}
+        ], 24)
+
+    def test_tiny_cluster_gets_small_subnet_first(self):
+        # given head, gateway and 4 compute nodes
+        host_count = networking.address_count(4)
+
+        # when
+        result = networking.fitting_pools(self.pools, host_count)
+
+        # then same sizes keep the configured order
+        self.assertEqual([str(pool) for pool in result],
+                         ['172.29.0.0/16:/26', '172.30.0.0/16:/24', '172.28.0.0/16:/24'])
+
+    def test_larger_cluster_skips_small_subnets(self):
+        result = networking.fitting_pools(self.pools, networking.address_count(62))
+        self.assertEqual([str(pool) for pool in result], ['172.30.0.0/16:/24', '172.28.0.0/16:/24'])
+
+    def test_unknown_size_keeps_order(self):
+        result = networking.fitting_pools(self.pools)
+        self.assertEqual(result, self.pools)
+
+    def test_too_large(self):
+        with self.assertRaises(networking.NetworkSubnetTooSmall):
+            networking.fitting_pools(self.pools, networking.address_count(253))
+
+
+class TestFreeSubnetIndex(DclusterTest):
+
+    def setUp(self):
+        self.pool = networking.SubnetPool(u'172.30.0.0/16', 24)
+
+    def test_empty_pool(self):
+        index = networking.FreeSubnetIndex(self.pool)
+        self.assertEqual(str(index.next_free()), '172.30.0.0/24')
+        self.assertEqual(index.free_count(), 256)
+
+    def test_skips_taken_subnets(self):
+        # given the first subnets are taken, some by networks of other sizes
+        taken = [
+            ipaddress.ip_network(u'172.30.0.0/24'),
+            ipaddress.ip_network(u'172.30.1.64/26'),
+            ipaddress.ip_network(u'172.30.2.0/23'),
+            ipaddress.ip_network(u'10.0.0.0/8'),
+            ipaddress.ip_network(u'fd00::/64')
+        ]
+
+        # when
+        index = networking.FreeSubnetIndex(self.pool, taken)
+
+        # then
+        self.assertEqual(str(index.next_free()), '172.30.4.0/24')
+        self.assertEqual(index.free_count(), 252)
+
+    def test_take(self):
+        # given
+        index = networking.FreeSubnetIndex(self.pool)
+
+        # when
+        for _ in range(3):
+            index.take(index.next_free())
+
+        # then
+        self.assertEqual(str(index.next_free()), '172.30.3.0/24')
+        self.assertEqual(index.free_count(), 253)
+
+    def test_full(self):
+        index = networking.FreeSubnetIndex(self.pool, [ipaddress.ip_network(u'172.0.0.0/8')])
+        self.assertEqual(index.next_free(), None)
+        self.assertEqual(index.free_count(), 0)
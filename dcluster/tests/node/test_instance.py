@@ -0,0 +1,90 @@
+import collections
+
+import docker
+
+from dcluster.tests.test_dcluster import DclusterTest
+
+from dcluster.infra.docker_facade import ROLE_LABEL
+from dcluster.node.instance import DeployedNode
+
+ImageStub = collections.namedtuple('ImageStub', 'tags')
+NetworkStub = collections.namedtuple('NetworkStub', 'name')
+
+
+class ContainerStub(object):
+
+    def __init__(self, running=True, paused=False, exec_error=None, exit_code=0):
+        self.name = 'mycluster-node001'
+        self.image = ImageStub(['centos7:build'])
+        self.attrs = {
+            'Config': {'Hostname': 'node001', 'Labels': {ROLE_LABEL: 'compute'}},
+            'State': {'Running': running, 'Paused': paused},
+            'NetworkSettings': {'Networks': {'dcluster-mycluster': {'IPAddress': '172.30.0.1'}}}
+        }
+        self.exec_error = exec_error
+        self.exit_code = exit_code
+        self.commands = []
+
+    def exec_run(self, command):
+        self.commands.append(command)
+        if self.exec_error is not None:
+            raise self.exec_error
+        return (self.exit_code, b'cache hit (direct) 3\ncache miss 1\n')
+
+
+class TestCompilerCacheStats(DclusterTest):
+
+    def node(self, container):
+        return DeployedNode(container, NetworkStub('dcluster-mycluster'))
+
+    def test_running_node(self):
+        # when
+        result = self.node(ContainerStub()).compiler_cache_stats()
+
+        # then
+        self.assertEqual(result, {'hits': 3, 'misses': 1, 'hit_rate': 75.0})
+
+    def test_paused_node_is_skipped(self):
+        # given
+        container = ContainerStub(paused=True)
+
+        # when
+        result = self.node(container).compiler_cache_stats()
+
+        # then
+        self.assertIsNone(result)
+        self.assertEqual(container.commands, [])
+
+    def test_exec_conflict_is_no_stats(self):
+        # given the node was paused after it was inspected
+        container = ContainerStub(exec_error=docker.errors.APIError('Container is paused'))
+
+        # when
+        result = self.node(container).compiler_cache_stats()
+
+        # then
+        self.assertIsNone(result)
+
+
+class TestHasCommand(DclusterTest):
+
+    def test_command_found(self):
+        # given
+        container = ContainerStub()
+
+        # when
+        result = DeployedNode(container, NetworkStub('dcluster-mycluster')).has_command('ping')
+
+        # then
+        self.assertTrue(result)
+        self.assertEqual(container.commands, [['sh', '-c', 'command -v ping']])
+
+    def test_command_not_found(self):
+        # given
+        container = ContainerStub(exit_code=127)
+
+        # when
+        result = DeployedNode(container, NetworkStub('dcluster-mycluster')).has_command('iperf3')
+
+        # then
+        self.assertFalse(result)
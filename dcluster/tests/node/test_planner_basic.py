@@ -57,3 +57,30 @@ class CreateBasicComputeNode(DclusterTest):
                                     ip_address='172.30.0.2',
                                     role='compute')
         self.assertEqual(result, expected)
+
+
+class CreateNodeWithImageOverride(DclusterTest):
+
+    def setUp(self):
+        cluster_name = 'mycluster'
+        subnet_str = u'172.30.0.0/24'
+        compute_count = 3
+        self.plan_data = basic_stubs.user_plan_data_stub(cluster_name, compute_count)
+        self.node_planner = basic_stubs.basic_node_planner_stub(cluster_name, subnet_str)
+
+    def test_hostname_takes_precedence_over_role(self):
+        # given images from a snapshot
+        self.plan_data['images'] = {
+            'compute': 'dcluster-snapshot:mytag-node001',
+            'node002': 'dcluster-snapshot:mytag-node002'
+        }
+
+        # when
+        first = self.node_planner.create_compute_plan(self.plan_data, 0, '172.30.0.1')
+        second = self.node_planner.create_compute_plan(self.plan_data, 1, '172.30.0.2')
+        head = self.node_planner.create_head_plan(self.plan_data)
+
+        # then
+        self.assertEqual(first.image, 'dcluster-snapshot:mytag-node001')
+        self.assertEqual(second.image, 'dcluster-snapshot:mytag-node002')
+        self.assertEqual(head.image, 'centos:7.7.1908')
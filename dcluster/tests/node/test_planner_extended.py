@@ -1,5 +1,6 @@
 from dcluster.tests.test_dcluster import DclusterTest
-from dcluster.tests.stubs import extended_stubs
+from dcluster.node.planner import DefaultNodePlanner
+from dcluster.tests.stubs import extended_stubs, infra_stubs
 
 
 class CreateExtendedHeadPlan(DclusterTest):
@@ -52,6 +53,101 @@ class CreateExtendedHeadPlan(DclusterTest):
                 'slurm_jobdir:/data',
                 'var_log_slurm:/var/log/slurm'
             ],
-            'systemctl': False
+            'systemctl': False,
+            'resources': None,
+            'shm_size': None,
+            'ipc': None,
+            'data_ip_address': None
         }
         self.assertEqual(dict(result._asdict()), expected)
+
+
+class CreateExtendedPlanWithPackageCache(DclusterTest):
+    '''
+    Unit tests for node.planner.DefaultNodePlanner when the profile enables the package cache
+    '''
+
+    def test_create_head_plan(self):
+        # given
+        cluster_name = 'mycluster'
+        subnet_str = u'172.30.0.0/24'
+        plan_data = extended_stubs.slurm_plan_data_stub(cluster_name, 3)
+        plan_data['package_cache'] = True
+
+        # under test
+        node_planner = extended_stubs.extended_node_planner_stub(cluster_name, subnet_str)
+
+        # when
+        result = node_planner.create_head_plan(plan_data)
+
+        # then the cache of the image family is mounted last
+        expected = 'dcluster-packages-rhel76-slurm:/var/cache/dcluster/packages'
+        self.assertEqual(result.volumes[-1], expected)
+
+
+class CreateExtendedPlanWithSharedIpc(DclusterTest):
+    '''
+    Unit tests for node.planner.DefaultNodePlanner when the profile shares the IPC of the head
+    '''
+
+    def test_create_head_and_compute_plans(self):
+        # given
+        cluster_name = 'mycluster'
+        subnet_str = u'172.30.0.0/24'
+        plan_data = extended_stubs.slurm_plan_data_stub(cluster_name, 3)
+        plan_data['ipc'] = 'shared'
+
+        # under test
+        node_planner = extended_stubs.extended_node_planner_stub(cluster_name, subnet_str)
+
+        # when
+        head_plan = node_planner.create_head_plan(plan_data)
+        compute_plan = node_planner.create_compute_plan(plan_data, 0, '172.30.0.1')
+
+        # then
+        self.assertEqual(head_plan.ipc, 'shareable')
+        self.assertEqual(compute_plan.ipc, 'container:mycluster-head')
+        self.assertEqual(compute_plan.shm_size, '4g')
+
+
+class CreateExtendedPlanWithDataNetwork(DclusterTest):
+    '''
+    Unit tests for node.planner.DefaultNodePlanner when the cluster has a data network
+    '''
+
+    def test_data_addresses(self):
+        # given
+        cluster_name = 'mycluster'
+        plan_data = extended_stubs.slurm_plan_data_stub(cluster_name, 3)
+        data_network = infra_stubs.network_stub(cluster_name, u'172.31.0.0/24')
+
+        # under test
+        cluster_network = infra_stubs.network_stub(cluster_name, u'172.30.0.0/24')
+        node_planner = DefaultNodePlanner(cluster_network, data_network)
+
+        # when
+        head_plan = node_planner.create_head_plan(plan_data)
+        compute_plan = node_planner.create_compute_plan(plan_data, 1, '172.30.0.2')
+
+        # then same positions in both networks
+        self.assertEqual(head_plan.data_ip_address, '172.31.0.253')
+        self.assertEqual(compute_plan.ip_address, '172.30.0.2')
+        self.assertEqual(compute_plan.data_ip_address, '172.31.0.2')
+
+    def test_given_data_addresses(self):
+        # given a scaled cluster, its nodes keep their data addresses
+        cluster_name = 'mycluster'
+        plan_data = extended_stubs.slurm_plan_data_stub(cluster_name, 3)
+        data_network = infra_stubs.network_stub(cluster_name, u'172.31.0.0/24')
+        data_ips = ['172.31.0.1', '172.31.0.4', '172.31.0.3']
+
+        # under test
+        cluster_network = infra_stubs.network_stub(cluster_name, u'172.30.0.0/24')
+        node_planner = DefaultNodePlanner(cluster_network, data_network, data_ips)
+
+        # when
+        compute_plan = node_planner.create_compute_plan(plan_data, 1, '172.30.0.2')
+
+        # then
+        self.assertEqual(compute_plan.ip_address, '172.30.0.2')
+        self.assertEqual(compute_plan.data_ip_address, '172.31.0.4')
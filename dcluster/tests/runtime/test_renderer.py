@@ -283,3 +283,193 @@ class TestJinjaRenderer(DclusterTest):
         # then matches a saved file
         expected = self.resources.expected_render_extended_simplified
         self.assertEqual(result, expected)
+
+    def test_render_shared_ipc(self):
+        # given a head with shareable IPC, and a compute node that joins it
+        cluster_specs = {
+            'nodes': {
+                '172.30.0.253': {
+                    'hostname': 'head',
+                    'container': 'mycluster-head',
+                    'image': 'centos7:ssh',
+                    'ip_address': '172.30.0.253',
+                    'role': 'head',
+                    'shm_size': '4g',
+                    'ipc': 'shareable'
+                },
+                '172.30.0.1': {
+                    'hostname': 'node001',
+                    'container': 'mycluster-node001',
+                    'image': 'centos7:ssh',
+                    'ip_address': '172.30.0.1',
+                    'role': 'compute',
+                    'shm_size': '4g',
+                    'ipc': 'container:mycluster-head'
+                }
+            },
+            'network': {
+                'name': 'dcluster-mycluster',
+                'address': '172.30.0.0/24',
+                'gateway': 'gateway',
+                'gateway_ip': '172.30.0.254'
+            },
+            'bootstrap_dir': '/home/giacomo/dcluster/bootstrap'
+        }
+        template_filename = 'cluster-default.yml.j2'
+
+        # when
+        result = self.renderer.render_blueprint(cluster_specs, template_filename)
+
+        # then the compute node uses the /dev/shm of the head, and starts after it
+        head_part = result[result.index('mycluster-head:'):result.index('mycluster-node001:')]
+        compute_part = result[result.index('mycluster-node001:'):]
+        self.assertIn('        ipc: shareable\n', head_part)
+        self.assertIn('        shm_size: 4g\n', head_part)
+        self.assertIn('        ipc: container:mycluster-head\n', compute_part)
+        self.assertIn('        depends_on:\n            - mycluster-head\n', compute_part)
+        self.assertNotIn('shm_size', compute_part)
+
+    def test_render_data_network(self):
+        # given nodes with addresses in the management and data networks
+        cluster_specs = {
+            'nodes': {
+                '172.30.0.253': {
+                    'hostname': 'head',
+                    'container': 'mycluster-head',
+                    'image': 'centos7:ssh',
+                    'ip_address': '172.30.0.253',
+                    'data_ip_address': '172.31.0.253',
+                    'role': 'head'
+                },
+                '172.30.0.1': {
+                    'hostname': 'node001',
+                    'container': 'mycluster-node001',
+                    'image': 'centos7:ssh',
+                    'ip_address': '172.30.0.1',
+                    'data_ip_address': '172.31.0.1',
+                    'role': 'compute'
+                }
+            },
+            'network': {
+                'name': 'dcluster-mycluster',
+                'address': '172.30.0.0/24',
+                'gateway': 'gateway',
+                'gateway_ip': '172.30.0.254'
+            },
+            'data_network': {
+                'name': 'dclusterdata-mycluster',
+                'address': '172.31.0.0/24'
+            },
+            'bootstrap_dir': '/home/giacomo/dcluster/bootstrap'
+        }
+        template_filename = 'cluster-default.yml.j2'
+
+        # when
+        result = self.renderer.render_blueprint(cluster_specs, template_filename)
+
+        # then each node is in both networks, and the data addresses have their own names
+        self.assertIn('''            dclusterdata-mycluster:
+                ipv4_address: 172.31.0.1
+''', result)
+        self.assertIn('            node001-data: 172.31.0.1\n', result)
+        self.assertIn('            head-data: 172.31.0.253\n', result)
+        self.assertIn('''  dclusterdata-mycluster:
+    external:
+        name: dclusterdata-mycluster
+''', result)
+
+    def test_render_emulation(self):
+        # given a cluster with interconnect emulation, and a node that runs systemd
+        cluster_specs = {
+            'nodes': {
+                '172.30.0.253': {
+                    'hostname': 'head',
+                    'container': 'mycluster-head',
+                    'image': 'centos7:ssh',
+                    'ip_address': '172.30.0.253',
+                    'role': 'head',
+                    'systemctl': True
+                },
+                '172.30.0.1': {
+                    'hostname': 'node001',
+                    'container': 'mycluster-node001',
+                    'image': 'centos7:ssh',
+                    'ip_address': '172.30.0.1',
+                    'role': 'compute'
+                }
+            },
+            'network': {
+                'name': 'dcluster-mycluster',
+                'address': '172.30.0.0/24',
+                'gateway': 'gateway',
+                'gateway_ip': '172.30.0.254'
+            },
+            'emulation': {
+                'dcluster-mycluster': {'delay': '50us'}
+            },
+            'bootstrap_dir': '/home/giacomo/dcluster/bootstrap'
+        }
+        template_filename = 'cluster-default.yml.j2'
+
+        # when
+        result = self.renderer.render_blueprint(cluster_specs, template_filename)
+
+        # then all nodes can run tc
+        head_part = result[result.index('mycluster-head:'):result.index('mycluster-node001:')]
+        compute_part = result[result.index('mycluster-node001:'):]
+        self.assertIn('        cap_add:\n            - SYS_ADMIN\n            - NET_ADMIN\n',
+                      head_part)
+        self.assertIn('        cap_add:\n            - NET_ADMIN\n', compute_part)
+
+    def test_render_dns(self):
+        # given a cluster with a DNS responder on the head
+        cluster_specs = {
+            'nodes': {
+                '172.30.0.253': {
+                    'hostname': 'head',
+                    'container': 'mycluster-head',
+                    'image': 'centos7:ssh',
+                    'ip_address': '172.30.0.253',
+                    'role': 'head'
+                },
+                '172.30.0.1': {
+                    'hostname': 'node001',
+                    'container': 'mycluster-node001',
+                    'image': 'centos7:ssh',
+                    'ip_address': '172.30.0.1',
+                    'role': 'compute'
+                }
+            },
+            'network': {
+                'name': 'dcluster-mycluster',
+                'address': '172.30.0.0/24',
+                'gateway': 'gateway',
+                'gateway_ip': '172.30.0.254'
+            },
+            'dns': {
+                'dir': '/home/giacomo/.dcluster/clusters/mycluster/dns',
+                'server': '172.30.0.253',
+                'domain': 'mycluster.dcluster'
+            },
+            'bootstrap_dir': '/home/giacomo/dcluster/bootstrap'
+        }
+        template_filename = 'cluster-default.yml.j2'
+
+        # when
+        result = self.renderer.render_blueprint(cluster_specs, template_filename)
+
+        # then the nodes only know the gateway statically, the records are mounted on the head
+        head_part = result[result.index('mycluster-head:'):result.index('mycluster-node001:')]
+        compute_part = result[result.index('mycluster-node001:'):]
+        expected = '''        dns:
+            - 172.30.0.253
+        dns_search:
+            - mycluster.dcluster
+        extra_hosts:
+            gateway: 172.30.0.254
+'''
+        self.assertIn(expected, head_part)
+        self.assertIn(expected, compute_part)
+        self.assertIn('- /home/giacomo/.dcluster/clusters/mycluster/dns:/etc/dcluster/dns:ro',
+                      head_part)
+        self.assertNotIn('/etc/dcluster/dns', compute_part)
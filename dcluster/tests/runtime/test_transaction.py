@@ -0,0 +1,55 @@
+from dcluster.tests.test_dcluster import DclusterTest
+
+from dcluster.runtime import transaction
+
+
+class TestCreationTransaction(DclusterTest):
+
+    def setUp(self):
+        self.undone = []
+
+    def test_rollback_in_reverse_order(self):
+        # when
+        with self.assertRaises(ValueError):
+            with transaction.CreationTransaction('mycluster') as tx:
+                tx.record('network', lambda: self.undone.append('network'))
+                tx.record('containers', lambda: self.undone.append('containers'))
+                raise ValueError('compose failed')
+
+        # then
+        self.assertEqual(self.undone, ['containers', 'network'])
+
+    def test_failed_undo_does_not_stop_rollback(self):
+        # given
+        tx = transaction.CreationTransaction('mycluster')
+        tx.record('network', lambda: self.undone.append('network'))
+        tx.record('containers', self.fail_to_undo)
+
+        # when
+        result = tx.rollback()
+
+        # then
+        self.assertEqual(result, ['containers'])
+        self.assertEqual(self.undone, ['network'])
+
+    def test_keep_on_failure(self):
+        # when
+        with self.assertRaises(ValueError):
+            with transaction.CreationTransaction('mycluster', keep_on_failure=True) as tx:
+                tx.record('network', lambda: self.undone.append('network'))
+                raise ValueError('compose failed')
+
+        # then
+        self.assertEqual(self.undone, [])
+
+    def test_success_is_not_rolled_back(self):
+        # when
+        with transaction.CreationTransaction('mycluster') as tx:
+            tx.record('network', lambda: self.undone.append('network'))
+
+        # then
+        self.assertEqual(self.undone, [])
+        self.assertEqual(tx.journal, [])
+
+    def fail_to_undo(self):
+        raise OSError('busy')
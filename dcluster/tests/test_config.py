@@ -1,4 +1,6 @@
 import os
+import shutil
+import tempfile
 
 from dcluster.tests.test_dcluster import DclusterTest
 
@@ -42,3 +44,32 @@ class ConfigTest(DclusterTest):
         # then
         expected = os.path.join(workpath, 'clusters/mycluster')
         self.assertEqual(composer_workpath, expected)
+
+    def test_profiles_are_read_again_when_files_change(self):
+        # given
+        profile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, profile_dir)
+        profile_file = os.path.join(profile_dir, 'mine.yml')
+        with open(profile_file, 'w') as mine:
+            mine.write('mine:\n  extend: simple\n  template: first.yml.j2\n')
+        first = profile_config.cluster_config_for_profile('mine', [profile_dir])
+
+        # when
+        with open(profile_file, 'w') as mine:
+            mine.write('mine:\n  extend: simple\n  template: second-template.yml.j2\n')
+        second = profile_config.cluster_config_for_profile('mine', [profile_dir])
+
+        # then
+        self.assertEqual(first['template'], 'first.yml.j2')
+        self.assertEqual(second['template'], 'second-template.yml.j2')
+
+    def test_service_socket_from_environment(self):
+        # given
+        self.addCleanup(os.environ.pop, 'DCLUSTER_SOCKET', None)
+        os.environ['DCLUSTER_SOCKET'] = '/tmp/other.sock'
+
+        # when
+        socket_path = main_config.service_socket()
+
+        # then
+        self.assertEqual(socket_path, '/tmp/other.sock')
@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+
+from dcluster.tests.test_dcluster import DclusterTest
+
+from dcluster.util import lock
+
+
+class TestFileLock(DclusterTest):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.lock_path = os.path.join(self.workdir, 'locks', 'subnet.lock')
+        self.now = 0.0
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_exclusive_lock_times_out_and_reports_holder(self):
+        # given
+        with lock.FileLock(self.lock_path):
+
+            # then
+            other = lock.FileLock(self.lock_path, timeout=1, clock=self.clock, sleep=self.sleep)
+            with self.assertRaises(lock.LockTimeout) as cm:
+                other.acquire()
+
+        self.assertIn('pid {}'.format(os.getpid()), str(cm.exception))
+        self.assertAlmostEqual(self.now, 1.0)
+
+    def test_lock_is_released(self):
+        # given
+        with lock.FileLock(self.lock_path):
+            pass
+
+        # then acquired immediately
+        with lock.FileLock(self.lock_path, timeout=0):
+            pass
+
+    def test_shared_locks(self):
+        # given
+        with lock.FileLock(self.lock_path, shared=True):
+
+            # then another shared holder is allowed, but not an exclusive one
+            with lock.FileLock(self.lock_path, timeout=0, shared=True):
+                pass
+
+            with self.assertRaises(lock.LockTimeout):
+                lock.FileLock(self.lock_path, timeout=0).acquire()
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
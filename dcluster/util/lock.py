@@ -0,0 +1,158 @@
+'''
+Advisory file locks, so that concurrent dcluster processes do not step on each other.
+
+A lock is a file that is locked with flock(). An exclusive holder writes its identity to the file,
+so that a process waiting for the lock can report who holds it.
+'''
+
+import errno
+import fcntl
+import json
+import os
+import socket
+import sys
+import time
+
+from . import fs as fs_util
+from . import logger
+
+
+class LockTimeout(Exception):
+    '''
+    Raised when a lock could not be acquired within its timeout.
+    '''
+    pass
+
+
+def is_held(path):
+    '''
+    Whether some process holds an exclusive lock on the file, without waiting for it.
+    '''
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except (IOError, OSError):
+        return False
+
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        return False
+    except (IOError, OSError) as e:
+        if e.errno not in (errno.EAGAIN, errno.EACCES):
+            raise
+        return True
+    finally:
+        os.close(fd)
+
+
+class FileLock(logger.LoggerMixin):
+    '''
+    An advisory lock on a file, to be used as a context manager. The lock is exclusive unless
+    shared=True, a shared lock can be held by many processes at the same time but excludes the
+    exclusive holders.
+
+    If timeout is None, waits forever. Otherwise, LockTimeout is raised after timeout seconds.
+    '''
+
+    # seconds between attempts to acquire the lock
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, path, timeout=None, shared=False, clock=time.time, sleep=time.sleep):
+        self.path = path
+        self.timeout = timeout
+        self.shared = shared
+        self.clock = clock
+        self.sleep = sleep
+        self.fd = None
+
+    def acquire(self):
+        '''
+        Blocks until the lock is acquired, or raises LockTimeout.
+        '''
+        fs_util.create_dir_dont_complain(os.path.dirname(self.path))
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+
+        mode = fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX
+        deadline = None
+        if self.timeout is not None:
+            deadline = self.clock() + self.timeout
+
+        waiting = False
+        while True:
+            try:
+                fcntl.flock(self.fd, mode | fcntl.LOCK_NB)
+                break
+            except (IOError, OSError) as e:
+                if e.errno not in (errno.EAGAIN, errno.EACCES):
+                    self.__close()
+                    raise
+
+            if not waiting:
+                self.logger.info('Waiting for lock {}, held by {}'.format(self.path,
+                                                                          self.holder()))
+                waiting = True
+
+            interval = self.POLL_INTERVAL
+            if deadline is not None:
+                remaining = deadline - self.clock()
+                if remaining <= 0:
+                    msg = 'Timed out after {}s waiting for lock {}, held by {}'
+                    holder = self.holder()
+                    self.__close()
+                    raise LockTimeout(msg.format(self.timeout, self.path, holder))
+                interval = min(interval, remaining)
+
+            self.sleep(interval)
+
+        if not self.shared:
+            self.__write_holder()
+
+        self.logger.debug('Acquired lock {}'.format(self.path))
+        return self
+
+    def release(self):
+        if self.fd is None:
+            return
+
+        if not self.shared:
+            # do not let the next process report us as the holder
+            os.ftruncate(self.fd, 0)
+
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+        self.__close()
+        self.logger.debug('Released lock {}'.format(self.path))
+
+    def holder(self):
+        '''
+        Description of the exclusive holder of the lock, as written in the lock file.
+        '''
+        try:
+            with open(self.path, 'r') as lock_file:
+                info = json.load(lock_file)
+        except (IOError, OSError, ValueError):
+            return 'unknown (shared or starting)'
+
+        return 'pid {} on {} since {} ({})'.format(info['pid'], info['host'], info['since'],
+                                                   info['command'])
+
+    def __write_holder(self):
+        info = {
+            'pid': os.getpid(),
+            'host': socket.gethostname(),
+            'since': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'command': ' '.join(sys.argv)
+        }
+        os.ftruncate(self.fd, 0)
+        os.lseek(self.fd, 0, os.SEEK_SET)
+        os.write(self.fd, json.dumps(info).encode('utf-8'))
+
+    def __close(self):
+        os.close(self.fd)
+        self.fd = None
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+        return False
@@ -0,0 +1,82 @@
+'''
+Utility functions for running independent tasks concurrently, e.g. Docker API calls on each node
+of a cluster. Uses a pool of threads, the tasks are expected to be I/O bound.
+'''
+
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+
+from . import logger
+
+# do not open too many connections to Docker at the same time
+DEFAULT_MAX_WORKERS = 16
+
+# outcome of a task: the result is None if there was an error
+TaskResult = namedtuple('TaskResult', 'item, result, error')
+
+# pairs (capture, restore) of the per-thread state that the workers inherit from the caller
+_thread_contexts = []
+
+
+def register_thread_context(capture, restore):
+    '''
+    Per-thread state that the tasks see as in the calling thread, e.g. where the output of a
+    request of the service goes: capture() is called in the calling thread, and restore(value)
+    in the worker around each task.
+    '''
+    _thread_contexts.append((capture, restore))
+
+
+def restore_thread_contexts(values):
+    for ((_, restore), value) in zip(_thread_contexts, values):
+        restore(value)
+
+
+def run_concurrently(func, items, max_workers=None):
+    '''
+    Calls func(item) for each item concurrently, returns a list of TaskResult in the same order
+    as the items. Exceptions are not propagated, they are stored in TaskResult.error.
+    '''
+    log = logger.logger_for_me(run_concurrently)
+
+    items = list(items)
+    if not items:
+        return []
+
+    if max_workers is None:
+        max_workers = DEFAULT_MAX_WORKERS
+    pool_size = max(1, min(max_workers, len(items)))
+
+    caller_contexts = [capture() for (capture, _) in _thread_contexts]
+
+    def task(item):
+        worker_contexts = [capture() for (capture, _) in _thread_contexts]
+        restore_thread_contexts(caller_contexts)
+        try:
+            return TaskResult(item, func(item), None)
+        except Exception as e:
+            log.debug('Task failed for {}: {}'.format(item, e))
+            return TaskResult(item, None, e)
+        finally:
+            restore_thread_contexts(worker_contexts)
+
+    pool = ThreadPool(pool_size)
+    try:
+        return pool.map(task, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def map_concurrently(func, items, max_workers=None):
+    '''
+    Calls func(item) for each item concurrently, returns the list of results in the same order
+    as the items. If a task fails, the first error is raised after all tasks have finished.
+    '''
+    task_results = run_concurrently(func, items, max_workers)
+
+    for task_result in task_results:
+        if task_result.error is not None:
+            raise task_result.error
+
+    return [task_result.result for task_result in task_results]
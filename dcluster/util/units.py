@@ -0,0 +1,57 @@
+'''
+Utility functions for quantities expressed with units, e.g. memory sizes such as '8g'.
+'''
+
+# multipliers for size suffixes, follows the convention of Docker (powers of 1024)
+SIZE_SUFFIXES = {
+    'b': 1,
+    'k': 1024,
+    'm': 1024 ** 2,
+    'g': 1024 ** 3,
+    't': 1024 ** 4
+}
+
+
+def parse_size(size):
+    '''
+    Converts a size to bytes. The size can be an integer (bytes), or a string with an optional
+    suffix, e.g. '512m', '8g', '8G', '8gb'. Returns None if size is None.
+
+    Raises ValueError if the size cannot be understood.
+    '''
+    if size is None:
+        return None
+
+    if isinstance(size, int):
+        return size
+
+    size_str = str(size).strip().lower()
+    if size_str.endswith('b') and len(size_str) > 1 and size_str[-2] in SIZE_SUFFIXES:
+        # allow 'gb', 'mb', etc
+        size_str = size_str[:-1]
+
+    multiplier = 1
+    if size_str and size_str[-1] in SIZE_SUFFIXES:
+        multiplier = SIZE_SUFFIXES[size_str[-1]]
+        size_str = size_str[:-1]
+
+    try:
+        return int(float(size_str) * multiplier)
+    except ValueError:
+        raise ValueError('Could not understand size: {}'.format(size))
+
+
+def format_size(size_bytes):
+    '''
+    Human-readable representation of a size in bytes, e.g. 1536 -> '1.5K'.
+    '''
+    if size_bytes is None:
+        return '-'
+
+    value = float(size_bytes)
+    for suffix in ('B', 'K', 'M', 'G'):
+        if abs(value) < 1024:
+            return '{:.1f}{}'.format(value, suffix)
+        value = value / 1024
+
+    return '{:.1f}T'.format(value)
@@ -0,0 +1,18 @@
+#!/bin/bash
+
+#
+# Local benchmark of the network drivers (bridge, macvlan, ipvlan): latency and throughput
+# between two containers. Creates and removes real Docker networks and containers.
+# See dcluster/infra/netbench.py
+#
+# Usage: network-benchmark.sh [--drivers bridge macvlan] [--image networkstatic/iperf3]
+#                             [--parent eth0] [--seconds 5] [--pings 20]
+#
+
+# Calculate directory local to script
+SCRIPTS_DIR="$( cd "$( dirname "$0" )" && pwd )"
+PYTHON=$(${SCRIPTS_DIR}/find-python.sh)
+
+cd $SCRIPTS_DIR/..
+
+PYTHONPATH=. $PYTHON -m dcluster.infra.netbench "$@"